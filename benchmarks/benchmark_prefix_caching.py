@@ -1,7 +1,15 @@
 import argparse
+import contextlib
+import gc
+import random
 import time
+from typing import List
+
+import numpy as np
+import torch
 
 from vllm import LLM, SamplingParams
+from vllm.distributed import destroy_model_parallel
 
 PROMPT = "You are a helpful assistant in recognizes the content of tables in markdown format. Here is a table as fellows. You need to answer my question about the table.\n# Table\n|Opening|Opening|Sl. No.|Film|Cast|Director|Music Director|Notes|\n|----|----|----|----|----|----|----|----|\n|J A N|9|1|Agni Pushpam|Jayabharathi, Kamalahasan|Jeassy|M. K. Arjunan||\n|J A N|16|2|Priyamvada|Mohan Sharma, Lakshmi, KPAC Lalitha|K. S. Sethumadhavan|V. Dakshinamoorthy||\n|J A N|23|3|Yakshagaanam|Madhu, Sheela|Sheela|M. S. Viswanathan||\n|J A N|30|4|Paalkkadal|Sheela, Sharada|T. K. Prasad|A. T. Ummer||\n|F E B|5|5|Amma|Madhu, Srividya|M. Krishnan Nair|M. K. Arjunan||\n|F E B|13|6|Appooppan|Thikkurissi Sukumaran Nair, Kamal Haasan|P. Bhaskaran|M. S. Baburaj||\n|F E B|20|7|Srishti|Chowalloor Krishnankutty, Ravi Alummoodu|K. T. Muhammad|M. S. Baburaj||\n|F E B|20|8|Vanadevatha|Prem Nazir, Madhubala|Yusufali Kechery|G. Devarajan||\n|F E B|27|9|Samasya|Madhu, Kamalahaasan|K. Thankappan|Shyam||\n|F E B|27|10|Yudhabhoomi|K. P. Ummer, Vidhubala|Crossbelt Mani|R. K. Shekhar||\n|M A R|5|11|Seemantha Puthran|Prem Nazir, Jayabharathi|A. B. Raj|M. K. Arjunan||\n|M A R|12|12|Swapnadanam|Rani Chandra, Dr. Mohandas|K. G. George|Bhaskar Chandavarkar||\n|M A R|19|13|Thulavarsham|Prem Nazir, sreedevi, Sudheer|N. Sankaran Nair|V. Dakshinamoorthy||\n|M A R|20|14|Aruthu|Kaviyoor Ponnamma, Kamalahasan|Ravi|G. Devarajan||\n|M A R|26|15|Swimming Pool|Kamal Haasan, M. G. Soman|J. Sasikumar|M. K. Arjunan||\n\n# Question\nWhat' s the content in the (1,1) cells\n"  # noqa: E501
 
@@ -15,7 +23,72 @@ def test_prefix(llm=None, sampling_params=None, prompts=None):
     print(f"cost time {end_time - start_time}")
 
 
+def cleanup():
+    destroy_model_parallel()
+    with contextlib.suppress(AssertionError):
+        torch.distributed.destroy_process_group()
+    gc.collect()
+    torch.cuda.empty_cache()
+
+
+def sample_shared_prefix_prompts(args) -> List[List[int]]:
+    """Samples prompts made of one of a few shared prefixes followed by a
+    unique suffix, in random order."""
+    random.seed(args.seed)
+    prefixes = [[random.randint(100, 20000) for _ in range(args.prefix_len)]
+                for _ in range(args.num_prefixes)]
+    return [
+        random.choice(prefixes) +
+        [random.randint(100, 20000) for _ in range(args.suffix_len)]
+        for _ in range(args.num_prompts)
+    ]
+
+
+def compare_admission(args):
+    """Reports the prefix cache hit rate and the time to first token with
+    arrival order admission and with prefix-aware admission."""
+    prompt_token_ids = sample_shared_prefix_prompts(args)
+    sampling_params = SamplingParams(temperature=0, max_tokens=args.output_len)
+
+    for prefix_aware_admission in [False, True]:
+        llm = LLM(model=args.model,
+                  tokenizer_mode='auto',
+                  trust_remote_code=True,
+                  enforce_eager=True,
+                  use_v2_block_manager=args.use_v2_block_manager,
+                  tensor_parallel_size=args.tensor_parallel_size,
+                  enable_prefix_caching=True,
+                  prefix_aware_admission=prefix_aware_admission,
+                  num_gpu_blocks_override=args.num_gpu_blocks_override)
+
+        start_time = time.time()
+        outputs = llm.generate(prompt_token_ids=prompt_token_ids,
+                               sampling_params=sampling_params)
+        elapsed_time = time.time() - start_time
+
+        scheduler = llm.llm_engine.scheduler
+        hit_rate = (scheduler.num_cached_prompt_tokens /
+                    scheduler.num_admitted_prompt_tokens)
+        ttfts = np.array([
+            output.metrics.first_token_time - output.metrics.arrival_time
+            for output in outputs
+        ])
+        mode = "prefix-aware" if prefix_aware_admission else "arrival order"
+        print(f"{mode:>13}: hit rate {hit_rate:.1%}, "
+              f"TTFT mean {ttfts.mean():.3f} s, "
+              f"p50 {np.percentile(ttfts, 50):.3f} s, "
+              f"p99 {np.percentile(ttfts, 99):.3f} s, "
+              f"total {elapsed_time:.2f} s")
+
+        del llm
+        cleanup()
+
+
 def main(args):
+    if args.compare_admission:
+        compare_admission(args)
+        return
+
     llm = LLM(model=args.model,
               tokenizer_mode='auto',
               trust_remote_code=True,
@@ -58,5 +131,19 @@ if __name__ == "__main__":
     parser.add_argument('--use-v2-block-manager',
                         action='store_true',
                         help='Use BlockSpaceMangerV2')
+    parser.add_argument('--compare-admission',
+                        action='store_true',
+                        help='compare arrival order and prefix-aware '
+                        'admission on prompts sharing a few prefixes')
+    parser.add_argument('--num-prompts', type=int, default=256)
+    parser.add_argument('--num-prefixes', type=int, default=8)
+    parser.add_argument('--prefix-len', type=int, default=512)
+    parser.add_argument('--suffix-len', type=int, default=64)
+    parser.add_argument('--num-gpu-blocks-override',
+                        type=int,
+                        default=None,
+                        help='limit the KV cache size to make the prefixes '
+                        'compete for it')
+    parser.add_argument('--seed', type=int, default=0)
     args = parser.parse_args()
     main(args)
@@ -0,0 +1,99 @@
+"""Benchmark for the output processing overhead of the engine.
+
+Runs batches of requests on a model with dummy weights, so that the text is
+random and the decode steps are short, and reports the decode throughput
+with the detokenization running in the engine loop and in the background
+while the next step runs (--async-detokenization).
+"""
+import argparse
+import gc
+import random
+import time
+from typing import List
+
+import torch
+
+from vllm import EngineArgs, LLMEngine, SamplingParams
+
+
+def run(engine: LLMEngine, args: argparse.Namespace, batch_size: int) -> float:
+    """Returns the decode throughput in tokens/s."""
+    sampling_params = SamplingParams(temperature=1.0,
+                                     max_tokens=args.output_len,
+                                     ignore_eos=True,
+                                     stop=args.stop,
+                                     logprobs=args.logprobs)
+    for i in range(batch_size):
+        prompt_token_ids = [
+            random.randint(0, 10000) for _ in range(args.prompt_len)
+        ]
+        engine.add_request(str(i), {"prompt_token_ids": prompt_token_ids},
+                           sampling_params)
+
+    # Run the prefills first, then time the decodes.
+    while engine.scheduler.waiting:
+        engine.step()
+    num_tokens = 0
+    start = time.perf_counter()
+    while engine.has_unfinished_requests():
+        for output in engine.step():
+            if output.finished:
+                num_tokens += sum(
+                    len(completion.token_ids) - 1
+                    for completion in output.outputs)
+    return num_tokens / (time.perf_counter() - start)
+
+
+def main(args: argparse.Namespace) -> None:
+    throughputs: List[List[float]] = []
+    for async_detokenization in [False, True]:
+        engine = LLMEngine.from_engine_args(
+            EngineArgs(model=args.model,
+                       load_format="dummy",
+                       max_num_seqs=max(args.batch_sizes),
+                       gpu_memory_utilization=args.gpu_memory_utilization,
+                       async_detokenization=async_detokenization,
+                       disable_log_stats=True))
+        random.seed(args.seed)
+        # Warm up.
+        run(engine, args, min(args.batch_sizes))
+        throughputs.append(
+            [run(engine, args, batch_size) for batch_size in args.batch_sizes])
+        del engine
+        gc.collect()
+        torch.cuda.empty_cache()
+
+    print(f"{'batch_size':>12} {'sync tok/s':>14} {'async tok/s':>14} "
+          f"{'speedup':>10}")
+    for batch_size, sync_throughput, async_throughput in zip(
+            args.batch_sizes, *throughputs):
+        print(f"{batch_size:>12} {sync_throughput:>14.1f} "
+              f"{async_throughput:>14.1f} "
+              f"{async_throughput / sync_throughput:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the decode throughput with the output "
+        "processing in the engine loop and in the background.")
+    parser.add_argument("--model", type=str, default="facebook/opt-125m")
+    parser.add_argument("--batch-sizes",
+                        type=int,
+                        nargs="+",
+                        default=[64, 128, 256, 512, 1024])
+    parser.add_argument("--prompt-len", type=int, default=32)
+    parser.add_argument("--output-len", type=int, default=128)
+    parser.add_argument("--stop",
+                        type=str,
+                        nargs="*",
+                        default=["\n\n", "###", "</answer>"],
+                        help="Stop strings of the requests, checked against "
+                        "the new text at every step.")
+    parser.add_argument("--logprobs", type=int, default=None)
+    parser.add_argument("--gpu-memory-utilization",
+                        type=float,
+                        default=0.45,
+                        help="Kept low so that the engine of the second mode "
+                        "fits next to leftovers of the first one.")
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
@@ -0,0 +1,114 @@
+"""Microbenchmark for the prefix caching block evictor.
+
+Compares the heap-based ``LRUEvictor`` against the previous implementation,
+which scanned every free block on each eviction.
+"""
+import argparse
+import random
+import time
+from typing import OrderedDict, Tuple
+
+from vllm.core.evictor_v2 import BlockMetaData, LRUEvictor
+
+
+class LinearScanLRUEvictor:
+    """The LRUEvictor implementation prior to the heap-based one."""
+
+    def __init__(self):
+        self.free_table: OrderedDict[int, BlockMetaData] = OrderedDict()
+
+    def evict(self) -> Tuple[int, int]:
+        if len(self.free_table) == 0:
+            raise ValueError("No usable cache memory left")
+
+        evicted_block = next(iter(self.free_table.values()))
+        evicted_block_id = next(iter(self.free_table.keys()))
+        for _id, block in self.free_table.items():
+            if evicted_block.last_accessed > block.last_accessed or (
+                    evicted_block.last_accessed == block.last_accessed and
+                    evicted_block.num_hashed_tokens < block.num_hashed_tokens):
+                evicted_block = block
+                evicted_block_id = _id
+
+        self.free_table.pop(evicted_block_id)
+
+        return evicted_block_id, evicted_block.content_hash
+
+    def add(self, block_id: int, content_hash: int, num_hashed_tokens: int,
+            last_accessed: float):
+        self.free_table[block_id] = BlockMetaData(content_hash,
+                                                  num_hashed_tokens,
+                                                  last_accessed)
+
+    def update(self, block_id: int, last_accessed: float):
+        self.free_table[block_id].last_accessed = last_accessed
+
+    def remove(self, block_id: int):
+        self.free_table.pop(block_id)
+
+
+def run(evictor, num_blocks: int, num_ops: int, block_size: int,
+        seed: int) -> float:
+    """Fills the evictor with num_blocks blocks, then replays num_ops rounds
+    of evict + re-add with a few updates/removals in between, the pattern the
+    prefix caching allocator produces under a saturated cache. Returns the
+    mean time per round in microseconds.
+    """
+    random.seed(seed)
+    for block_id in range(num_blocks):
+        evictor.add(block_id, block_id, block_size * random.randint(1, 64),
+                    float(block_id // 8))
+
+    now = float(num_blocks)
+    start = time.perf_counter()
+    for i in range(num_ops):
+        block_id, _ = evictor.evict()
+        now += 1
+        evictor.add(block_id, block_id, block_size * random.randint(1, 64),
+                    now)
+        victim = random.randrange(num_blocks)
+        if i % 4 == 0 and victim != block_id:
+            # Prefix cache hit on a free block: touch it.
+            evictor.update(victim, now)
+        elif i % 4 == 1 and victim != block_id:
+            # Prefix cache hit that reuses a free block: take it out and
+            # give it back.
+            evictor.remove(victim)
+            evictor.add(victim, victim, block_size, now)
+    return (time.perf_counter() - start) / num_ops * 1e6
+
+
+def main(args: argparse.Namespace):
+    print(f"{'num_blocks':>12} {'evictor':>12} {'us/op':>12}")
+    for num_blocks in args.num_blocks:
+        for name, evictor_cls in (("heap", LRUEvictor),
+                                  ("linear", LinearScanLRUEvictor)):
+            # The linear scan is O(n) per eviction, cap the number of rounds
+            # so the largest configurations still finish in reasonable time.
+            num_ops = args.num_ops
+            if evictor_cls is LinearScanLRUEvictor:
+                num_ops = max(1, min(num_ops,
+                                     args.linear_budget // num_blocks))
+            latency = run(evictor_cls(), num_blocks, num_ops, args.block_size,
+                          args.seed)
+            print(f"{num_blocks:>12} {name:>12} {latency:>12.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the eviction cost of the prefix caching "
+        "block evictor.")
+    parser.add_argument("--num-blocks",
+                        type=int,
+                        nargs="+",
+                        default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--num-ops", type=int, default=10_000)
+    parser.add_argument("--linear-budget",
+                        type=int,
+                        default=100_000_000,
+                        help="Upper bound of scanned blocks for the linear "
+                        "evictor, used to limit its number of rounds.")
+    parser.add_argument("--block-size", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,80 @@
+"""Benchmark for the latency of getting the guided decoding logits processors
+of concurrent requests with the same JSON schema.
+
+Gets the logits processors of many concurrent requests with the same schema,
+as the OpenAI server does before scheduling them, while the guide of the
+schema is compiled, once for all the requests, and once it is in the guide
+registry, e.g. after a `/v1/guided/precompile` request. Reports the mean and
+the longest latency of the requests, and the compilations.
+"""
+import argparse
+import asyncio
+import time
+from typing import Dict, List
+
+from transformers import AutoTokenizer, PreTrainedTokenizerBase
+
+from vllm.entrypoints.openai.protocol import CompletionRequest
+from vllm.model_executor.guided_decoding import (
+    get_guided_decoding_logits_processor)
+from vllm.model_executor.guided_decoding.guide_registry import (
+    get_guide_registry)
+
+
+def get_schema(num_properties: int) -> Dict:
+    return {
+        "type": "object",
+        "properties": {
+            f"property_{i}": {
+                "type": "string",
+                "maxLength": 16
+            }
+            for i in range(num_properties)
+        },
+        "required": [f"property_{i}" for i in range(num_properties)]
+    }
+
+
+async def _get_latency(request: CompletionRequest,
+                       tokenizer: PreTrainedTokenizerBase) -> float:
+    start = time.perf_counter()
+    await get_guided_decoding_logits_processor("outlines", request, tokenizer)
+    return time.perf_counter() - start
+
+
+async def run(args: argparse.Namespace,
+              tokenizer: PreTrainedTokenizerBase) -> List[float]:
+    """Returns the latencies of the concurrent requests."""
+    request = CompletionRequest(model="test",
+                                prompt="",
+                                guided_json=get_schema(args.num_properties))
+    return await asyncio.gather(
+        *[_get_latency(request, tokenizer) for _ in range(args.num_requests)])
+
+
+def main(args: argparse.Namespace) -> None:
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+    registry = get_guide_registry()
+
+    print(f"{args.num_requests} concurrent requests, schema of "
+          f"{args.num_properties} properties")
+    print(f"{'':>10} {'mean (ms)':>12} {'max (ms)':>12} {'compiled':>10}")
+    for name in ["cold", "warm"]:
+        num_builds = registry.num_builds
+        latencies = asyncio.run(run(args, tokenizer))
+        print(f"{name:>10} "
+              f"{sum(latencies) / len(latencies) * 1000:>12.1f} "
+              f"{max(latencies) * 1000:>12.1f} "
+              f"{registry.num_builds - num_builds:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the latency of getting the guided decoding "
+        "logits processors of concurrent requests with the same schema.")
+    parser.add_argument("--tokenizer",
+                        type=str,
+                        default="HuggingFaceH4/zephyr-7b-beta")
+    parser.add_argument("--num-requests", type=int, default=32)
+    parser.add_argument("--num-properties", type=int, default=16)
+    main(parser.parse_args())
@@ -0,0 +1,143 @@
+"""Benchmark for the overhead of the JSON-guided decoding logits processors.
+
+Decodes batches of JSON-guided sequences with random logits, a processor per
+sequence as the OpenAI server creates them, and reports the decoded tokens
+per second at each batch size, with the batched processors, whose bitmasks
+are applied to the batch at once and cached per FSM state, and with
+processors that apply a full-vocabulary mask to each row, as the processors
+used to.
+"""
+import argparse
+import json
+import math
+import time
+from typing import Callable, Dict, List
+
+import torch
+from transformers import AutoTokenizer, PreTrainedTokenizerBase
+
+from vllm.model_executor.guided_decoding.outlines_logits_processors import (
+    JSONLogitsProcessor, _get_allowed_tokens, get_token_bitmask_cache)
+from vllm.model_executor.layers.logits_processor import (
+    _apply_logits_processors)
+from vllm.model_executor.sampling_metadata import SamplingMetadata
+from vllm.sampling_params import LogitsProcessor
+from vllm.sequence import SamplingParams, SequenceData, SequenceGroupMetadata
+from vllm.utils import is_pin_memory_available
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {
+            "type": "string"
+        },
+        "age": {
+            "type": "integer"
+        },
+        "skills": {
+            "type": "array",
+            "items": {
+                "type": "string",
+                "maxLength": 10
+            },
+            "minItems": 3
+        },
+    },
+    "required": ["name", "age", "skills"]
+}
+
+
+def per_row(processor: JSONLogitsProcessor) -> LogitsProcessor:
+    """Apply the processor to a row at a time with a full-vocabulary mask.
+    The processor is used by a single sequence."""
+
+    def process(token_ids: List[int], logits: torch.Tensor) -> torch.Tensor:
+        allowed_tokens = _get_allowed_tokens(
+            processor._guide, processor._get_fsm_state(0, token_ids))
+        mask = torch.full((logits.shape[-1], ),
+                          -math.inf,
+                          device=logits.device)
+        mask[allowed_tokens] = 0
+        logits.add_(mask)
+        return logits
+
+    return process
+
+
+def run(args: argparse.Namespace, tokenizer: PreTrainedTokenizerBase,
+        batch_size: int, wrap: Callable[[JSONLogitsProcessor],
+                                        LogitsProcessor]) -> float:
+    """Returns the decoded tokens per second."""
+    seq_group_metadata_list = [
+        SequenceGroupMetadata(
+            request_id=str(i),
+            is_prompt=False,
+            seq_data={i: SequenceData([0])},
+            sampling_params=SamplingParams(logits_processors=[
+                wrap(
+                    JSONLogitsProcessor(json.dumps(SCHEMA),
+                                        tokenizer,
+                                        whitespace_pattern=None))
+            ]),
+            block_tables={i: [0]},
+        ) for i in range(batch_size)
+    ]
+    vocab_size = len(tokenizer)
+    generator = torch.Generator(device=args.device).manual_seed(args.seed)
+
+    elapsed = 0.0
+    for _ in range(args.num_steps):
+        sampling_metadata = SamplingMetadata.prepare(
+            seq_group_metadata_list, [1] * batch_size, [1] * batch_size,
+            device=args.device,
+            pin_memory=is_pin_memory_available())
+        logits = torch.rand((batch_size, vocab_size),
+                            generator=generator,
+                            device=args.device)
+        torch.cuda.synchronize()
+        start = time.perf_counter()
+        logits = _apply_logits_processors(logits, sampling_metadata)
+        token_ids = logits.argmax(dim=-1).tolist()
+        elapsed += time.perf_counter() - start
+        for seq_group_metadata, token_id in zip(seq_group_metadata_list,
+                                                token_ids):
+            for seq_data in seq_group_metadata.seq_data.values():
+                seq_data.append_token_id(token_id, 0.0)
+    return batch_size * args.num_steps / elapsed
+
+
+def main(args: argparse.Namespace) -> None:
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+    # Compile the guide before timing.
+    JSONLogitsProcessor(json.dumps(SCHEMA), tokenizer, whitespace_pattern=None)
+
+    results: Dict[int, List[float]] = {}
+    for batch_size in args.batch_sizes:
+        results[batch_size] = [
+            run(args, tokenizer, batch_size, wrap)
+            for wrap in (lambda processor: processor, per_row)
+        ]
+
+    print(f"{args.num_steps} steps, tokens/s")
+    print(f"{'batch size':>10} {'batched':>12} {'per row':>12}")
+    for batch_size, (batched, row) in results.items():
+        print(f"{batch_size:>10} {batched:>12.0f} {row:>12.0f}")
+    print(f"bitmask cache hit rate "
+          f"{get_token_bitmask_cache().hit_rate * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the overhead of the JSON-guided decoding "
+        "logits processors at several batch sizes.")
+    parser.add_argument("--tokenizer",
+                        type=str,
+                        default="HuggingFaceH4/zephyr-7b-beta")
+    parser.add_argument("--batch-sizes",
+                        type=int,
+                        nargs="+",
+                        default=[1, 4, 16, 64, 256])
+    parser.add_argument("--num-steps", type=int, default=32)
+    parser.add_argument("--device", type=str, default="cuda")
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
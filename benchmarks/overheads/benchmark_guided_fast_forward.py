@@ -0,0 +1,118 @@
+"""Benchmark for the fast-forwarding of the tokens forced by guided decoding.
+
+Runs batches of JSON-guided requests on a model with dummy weights, with a
+schema of long literal property names, with chunked prefill, and reports the
+engine steps and the time to complete the batch, with the forced tokens
+sampled one step at a time and fast-forwarded
+(--guided-decoding-fast-forward).
+"""
+import argparse
+import gc
+import random
+import time
+from typing import Dict, List, Tuple
+
+import torch
+
+from vllm import EngineArgs, LLMEngine, SamplingParams
+from vllm.model_executor.guided_decoding.outlines_logits_processors import (
+    JSONLogitsProcessor)
+
+
+def get_schema(num_properties: int) -> Dict:
+    return {
+        "type":
+        "object",
+        "properties": {
+            f"a_rather_long_property_name_number_{i}": {
+                "type": "boolean"
+            }
+            for i in range(num_properties)
+        },
+        "required": [
+            f"a_rather_long_property_name_number_{i}"
+            for i in range(num_properties)
+        ]
+    }
+
+
+def run(engine: LLMEngine, args: argparse.Namespace,
+        batch_size: int) -> Tuple[int, int, float]:
+    """Returns the engine steps, the output tokens and the elapsed time."""
+    tokenizer = engine.get_tokenizer()
+    schema = get_schema(args.num_properties)
+    for i in range(batch_size):
+        sampling_params = SamplingParams(temperature=1.0,
+                                         max_tokens=args.max_tokens,
+                                         logits_processors=[
+                                             JSONLogitsProcessor(
+                                                 schema,
+                                                 tokenizer,
+                                                 whitespace_pattern=None)
+                                         ])
+        prompt_token_ids = [
+            random.randint(0, 10000) for _ in range(args.prompt_len)
+        ]
+        engine.add_request(str(i), {"prompt_token_ids": prompt_token_ids},
+                           sampling_params)
+
+    num_steps = 0
+    num_tokens = 0
+    start = time.perf_counter()
+    while engine.has_unfinished_requests():
+        num_steps += 1
+        for output in engine.step():
+            if output.finished:
+                num_tokens += sum(
+                    len(completion.token_ids) for completion in output.outputs)
+    return num_steps, num_tokens, time.perf_counter() - start
+
+
+def main(args: argparse.Namespace) -> None:
+    results: List[List[Tuple[int, int, float]]] = []
+    for fast_forward in [False, True]:
+        engine = LLMEngine.from_engine_args(
+            EngineArgs(model=args.model,
+                       load_format="dummy",
+                       enable_chunked_prefill=True,
+                       max_num_seqs=max(args.batch_sizes),
+                       gpu_memory_utilization=args.gpu_memory_utilization,
+                       guided_decoding_fast_forward=fast_forward,
+                       disable_log_stats=True))
+        random.seed(args.seed)
+        # Warm up, compiling the guide.
+        run(engine, args, min(args.batch_sizes))
+        results.append(
+            [run(engine, args, batch_size) for batch_size in args.batch_sizes])
+        del engine
+        gc.collect()
+        torch.cuda.empty_cache()
+
+    print(f"{'batch_size':>12} {'mode':>14} {'steps':>8} {'tokens':>8} "
+          f"{'time (s)':>10}")
+    for i, batch_size in enumerate(args.batch_sizes):
+        for mode, mode_results in zip(["sampled", "fast-forward"], results):
+            num_steps, num_tokens, elapsed = mode_results[i]
+            print(f"{batch_size:>12} {mode:>14} {num_steps:>8} "
+                  f"{num_tokens:>8} {elapsed:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the JSON-guided generation with the tokens "
+        "forced by the guide sampled and fast-forwarded.")
+    parser.add_argument("--model", type=str, default="facebook/opt-125m")
+    parser.add_argument("--batch-sizes",
+                        type=int,
+                        nargs="+",
+                        default=[1, 16, 64])
+    parser.add_argument("--num-properties", type=int, default=8)
+    parser.add_argument("--prompt-len", type=int, default=32)
+    parser.add_argument("--max-tokens", type=int, default=512)
+    parser.add_argument("--gpu-memory-utilization",
+                        type=float,
+                        default=0.45,
+                        help="Kept low so that the engine of the second mode "
+                        "fits next to leftovers of the first one.")
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
@@ -1,8 +1,11 @@
 import argparse
 import cProfile
 import pstats
+import time
 
 from vllm import LLM, SamplingParams
+from vllm.inputs import LLMInputs
+from vllm.sequence import Logprob, Sequence
 
 # A very long prompt, total number of tokens is about 15k.
 LONG_PROMPT = ["You are an expert in large language models, aren't you?"
@@ -10,7 +13,40 @@ LONG_PROMPT = ["You are an expert in large language models, aren't you?"
 LONG_PROMPT = ' '.join(LONG_PROMPT)
 
 
+def legacy_hash_of_block(seq: Sequence, logical_idx: int) -> int:
+    """The O(L^2) prefix hashing used before block hashes were chained."""
+    num_tokens = seq.num_hashed_tokens_of_block(logical_idx)
+    hashed_tokens = seq.data.get_prefix_token_ids(num_tokens)
+    return hash((hashed_tokens, seq.lora_int_id))
+
+
+def benchmark_block_hashing(args):
+    """Measure the cost of hashing every block of a sequence as it is
+    allocated and then grown token by token, without running a model."""
+    print(f"{'num_tokens':>12} {'chained (s)':>12} {'legacy (s)':>12}")
+    for num_tokens in args.num_tokens:
+        timings = []
+        for hash_fn in (Sequence.hash_of_block, legacy_hash_of_block):
+            inputs = LLMInputs(prompt_token_ids=list(range(num_tokens)))
+            seq = Sequence(seq_id=0, inputs=inputs, block_size=args.block_size)
+            start = time.perf_counter()
+            # Allocation of the prompt blocks.
+            for logical_idx in range(len(seq.logical_token_blocks)):
+                hash_fn(seq, logical_idx)
+            # Decoding, hashing the last block whenever it becomes full.
+            for i in range(args.output_len):
+                seq.append_token_id(i, {i: Logprob(0.0)})
+                if seq.get_len() % args.block_size == 0:
+                    hash_fn(seq, len(seq.logical_token_blocks) - 1)
+            timings.append(time.perf_counter() - start)
+        print(f"{num_tokens:>12} {timings[0]:>12.4f} {timings[1]:>12.4f}")
+
+
 def main(args):
+    if args.only_hashing:
+        benchmark_block_hashing(args)
+        return
+
     llm = LLM(
         model=args.model,
         enforce_eager=True,
@@ -59,5 +95,15 @@ if __name__ == "__main__":
     parser.add_argument('--use-v2-block-manager',
                         action='store_true',
                         help='Use BlockSpaceMangerV2')
+    parser.add_argument('--only-hashing',
+                        action='store_true',
+                        help='only benchmark the block hashing of synthetic '
+                        'sequences, without loading a model')
+    parser.add_argument('--num-tokens',
+                        type=int,
+                        nargs='+',
+                        default=[4096, 32768, 131072],
+                        help='prompt lengths used with --only-hashing')
+    parser.add_argument('--block-size', type=int, default=16)
     args = parser.parse_args()
     main(args)
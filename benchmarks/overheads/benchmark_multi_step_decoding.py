@@ -0,0 +1,87 @@
+"""Benchmark for the host overhead of the engine amortized by multi-step
+decoding.
+
+Runs the engine on the stub executor of benchmark_pipelined_step.py, whose
+model steps sleep for a fixed time instead of running a model, and reports
+the duration of each decoded token with the workers running one and several
+decoding steps per scheduler invocation (--num-scheduler-steps). The host
+overhead of a token is its duration beyond the model time.
+"""
+import argparse
+import time
+from typing import Dict
+
+from benchmark_pipelined_step import StubExecutor
+
+from vllm import EngineArgs, LLMEngine, SamplingParams
+
+
+def run(args: argparse.Namespace, num_scheduler_steps: int) -> float:
+    """Returns the mean duration of the decoded tokens in seconds."""
+    engine_config = EngineArgs(model=args.model,
+                               skip_tokenizer_init=True,
+                               max_num_seqs=args.batch_size,
+                               use_v2_block_manager=True,
+                               num_scheduler_steps=num_scheduler_steps,
+                               disable_log_stats=True).create_engine_config()
+    StubExecutor.model_time = args.model_time_ms / 1000
+    blocks_per_seq = -(
+        -(args.prompt_len + args.output_len + num_scheduler_steps) //
+        engine_config.cache_config.block_size)
+    StubExecutor.num_gpu_blocks = args.batch_size * blocks_per_seq
+    engine = LLMEngine(**engine_config.to_dict(),
+                       executor_class=StubExecutor,
+                       log_stats=False)
+
+    sampling_params = SamplingParams(max_tokens=args.output_len,
+                                     ignore_eos=True)
+    for i in range(args.batch_size):
+        engine.add_request(str(i), {"prompt_token_ids": [0] * args.prompt_len},
+                           sampling_params)
+
+    # Run the prefills first, then time the decodes.
+    while engine.scheduler.waiting:
+        engine.step()
+    start = time.perf_counter()
+    while engine.has_unfinished_requests():
+        engine.step()
+    # The prefills sampled the first token.
+    return (time.perf_counter() - start) / (args.output_len - 1)
+
+
+def main(args: argparse.Namespace) -> None:
+    token_times: Dict[int, float] = {}
+    for num_scheduler_steps in [1, args.num_scheduler_steps]:
+        token_times[num_scheduler_steps] = run(args, num_scheduler_steps)
+
+    model_time = args.model_time_ms / 1000
+    print(f"batch size {args.batch_size}, model time "
+          f"{args.model_time_ms:.1f} ms/step")
+    print(f"{'steps':>8} {'token (ms)':>12} {'overhead (ms)':>14}")
+    for num_scheduler_steps, token_time in token_times.items():
+        print(f"{num_scheduler_steps:>8} {token_time * 1000:>12.2f} "
+              f"{(token_time - model_time) * 1000:>14.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the host overhead of the engine per decoded "
+        "token with multi-step decoding, with a stub executor instead of a "
+        "model.")
+    parser.add_argument("--model",
+                        type=str,
+                        default="facebook/opt-125m",
+                        help="The model whose config is used.")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--prompt-len", type=int, default=128)
+    parser.add_argument("--output-len", type=int, default=128)
+    parser.add_argument("--model-time-ms",
+                        type=float,
+                        default=5.0,
+                        help="The duration of a model step.")
+    parser.add_argument("--num-scheduler-steps",
+                        type=int,
+                        default=8,
+                        help="The number of decoding steps per scheduler "
+                        "invocation to compare with a single one.")
+    main(parser.parse_args())
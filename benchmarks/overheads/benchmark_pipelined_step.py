@@ -0,0 +1,134 @@
+"""Benchmark for the CPU overhead of the engine hidden by the pipelined step.
+
+Runs the engine on a stub executor, whose model steps sleep for a fixed time
+instead of running a model, like a GPU they release the GIL meanwhile. The
+CPU overhead of a step is its duration beyond the model time. The pipelined
+step (--pipelined-step) schedules the next step while the model runs, and
+the overhead it hides is the difference in the duration of the steps.
+"""
+import argparse
+import time
+from typing import Dict, List, Set, Tuple
+
+from vllm import EngineArgs, LLMEngine, SamplingParams
+from vllm.executor.executor_base import ExecutorBase
+from vllm.lora.request import LoRARequest
+from vllm.sequence import (CompletionSequenceGroupOutput, ExecuteModelRequest,
+                           Logprob, SamplerOutput, SequenceOutput)
+
+
+class StubExecutor(ExecutorBase):
+    """Executes the model steps by sleeping, and samples the same token for
+    every sequence. Runs the number of steps of the request, like the workers
+    with multi-step decoding."""
+
+    model_time = 0.0
+    num_gpu_blocks = 0
+
+    def _init_executor(self) -> None:
+        pass
+
+    def determine_num_available_blocks(self) -> Tuple[int, int]:
+        return self.num_gpu_blocks, 0
+
+    def initialize_cache(self, num_gpu_blocks: int,
+                         num_cpu_blocks: int) -> None:
+        pass
+
+    def execute_model(
+            self,
+            execute_model_req: ExecuteModelRequest) -> List[SamplerOutput]:
+        time.sleep(self.model_time * execute_model_req.num_steps)
+        token_id = 1
+        return [
+            SamplerOutput(outputs=[
+                CompletionSequenceGroupOutput(samples=[
+                    SequenceOutput(seq_id, token_id, {token_id: Logprob(0.0)})
+                    for seq_id in seq_group_metadata.seq_data
+                ],
+                                              prompt_logprobs=None) for
+                seq_group_metadata in execute_model_req.seq_group_metadata_list
+            ]) for _ in range(execute_model_req.num_steps)
+        ]
+
+    def add_lora(self, lora_request: LoRARequest) -> bool:
+        return False
+
+    def remove_lora(self, lora_id: int) -> bool:
+        return False
+
+    def list_loras(self) -> Set[int]:
+        return set()
+
+    def check_health(self) -> None:
+        return
+
+
+def run(args: argparse.Namespace, pipelined_step: bool) -> float:
+    """Returns the mean duration of the decode steps in seconds."""
+    engine_config = EngineArgs(model=args.model,
+                               skip_tokenizer_init=True,
+                               max_num_seqs=args.batch_size,
+                               use_v2_block_manager=True,
+                               pipelined_step=pipelined_step,
+                               disable_log_stats=True).create_engine_config()
+    StubExecutor.model_time = args.model_time_ms / 1000
+    blocks_per_seq = -(-(args.prompt_len + args.output_len + 1) //
+                       engine_config.cache_config.block_size)
+    StubExecutor.num_gpu_blocks = args.batch_size * blocks_per_seq
+    engine = LLMEngine(**engine_config.to_dict(),
+                       executor_class=StubExecutor,
+                       log_stats=False)
+
+    sampling_params = SamplingParams(max_tokens=args.output_len,
+                                     ignore_eos=True)
+    for i in range(args.batch_size):
+        engine.add_request(str(i), {"prompt_token_ids": [0] * args.prompt_len},
+                           sampling_params)
+
+    # Run the prefills first, then time the decodes.
+    while engine.scheduler.waiting:
+        engine.step()
+    num_steps = 0
+    start = time.perf_counter()
+    while engine.has_unfinished_requests():
+        engine.step()
+        num_steps += 1
+    return (time.perf_counter() - start) / num_steps
+
+
+def main(args: argparse.Namespace) -> None:
+    step_times: Dict[bool, float] = {}
+    for pipelined_step in [False, True]:
+        step_times[pipelined_step] = run(args, pipelined_step)
+
+    model_time = args.model_time_ms / 1000
+    overhead = step_times[False] - model_time
+    hidden_overhead = step_times[False] - step_times[True]
+    print(f"batch size {args.batch_size}, model time "
+          f"{args.model_time_ms:.1f} ms/step")
+    print(f"{'step (ms)':>24} {step_times[False] * 1000:>10.2f}")
+    print(f"{'pipelined step (ms)':>24} {step_times[True] * 1000:>10.2f}")
+    print(f"{'CPU overhead (ms)':>24} {overhead * 1000:>10.2f}")
+    print(f"{'hidden overhead (ms)':>24} {hidden_overhead * 1000:>10.2f}")
+    if overhead > 0:
+        print(f"{'hidden overhead (%)':>24} "
+              f"{hidden_overhead / overhead * 100:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the CPU overhead of the engine hidden by the "
+        "pipelined step, with a stub executor instead of a model.")
+    parser.add_argument("--model",
+                        type=str,
+                        default="facebook/opt-125m",
+                        help="The model whose config is used.")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--prompt-len", type=int, default=128)
+    parser.add_argument("--output-len", type=int, default=128)
+    parser.add_argument("--model-time-ms",
+                        type=float,
+                        default=20.0,
+                        help="The duration of a model step.")
+    main(parser.parse_args())
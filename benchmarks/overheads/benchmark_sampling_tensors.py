@@ -0,0 +1,98 @@
+"""Benchmark for the preparation of the sampling tensors in decode steps.
+
+Decodes a batch of sequences with repetition penalties for many steps, and
+reports the time to prepare the sampling tensors of a step, penalty masks and
+counts included, by building them from the token ids of the sequences with
+`SamplingTensors.from_sampling_metadata`, and by updating the persistent
+sampling state with the tokens of the step.
+"""
+import argparse
+import random
+import time
+from typing import Callable, List
+
+import torch
+
+from vllm.model_executor.layers.sampler import _get_bin_counts_and_mask
+from vllm.model_executor.sampling_metadata import (PersistentSamplingState,
+                                                   SamplingMetadata,
+                                                   SamplingTensors)
+from vllm.sequence import SamplingParams, SequenceData, SequenceGroupMetadata
+from vllm.utils import is_pin_memory_available
+
+
+def build_from_lists(sampling_metadata: SamplingMetadata, vocab_size: int,
+                     device: torch.device) -> None:
+    sampling_tensors, do_penalties, _, _ = (
+        SamplingTensors.from_sampling_metadata(sampling_metadata, vocab_size,
+                                               device, torch.float32))
+    assert do_penalties
+    num_seqs = len(sampling_tensors.temperatures)
+    _get_bin_counts_and_mask(sampling_tensors.prompt_tokens, vocab_size,
+                             num_seqs)
+    _get_bin_counts_and_mask(sampling_tensors.output_tokens, vocab_size,
+                             num_seqs)
+
+
+def run(args: argparse.Namespace, prepare: Callable[[SamplingMetadata],
+                                                    None]) -> float:
+    """Returns the mean time to prepare the sampling tensors of a step."""
+    rng = random.Random(args.seed)
+    sampling_params = SamplingParams(repetition_penalty=1.1)
+    seq_group_metadata_list: List[SequenceGroupMetadata] = [
+        SequenceGroupMetadata(
+            request_id=str(i),
+            is_prompt=False,
+            seq_data={
+                i:
+                SequenceData(
+                    rng.choices(range(args.vocab_size), k=args.prompt_len))
+            },
+            sampling_params=sampling_params,
+            block_tables={i: [0]},
+        ) for i in range(args.batch_size)
+    ]
+
+    elapsed = 0.0
+    for _ in range(args.num_steps):
+        sampling_metadata = SamplingMetadata.prepare(
+            seq_group_metadata_list, [1] * args.batch_size,
+            [1] * args.batch_size,
+            device=args.device,
+            pin_memory=is_pin_memory_available())
+        torch.cuda.synchronize()
+        start = time.perf_counter()
+        prepare(sampling_metadata)
+        torch.cuda.synchronize()
+        elapsed += time.perf_counter() - start
+        for seq_group_metadata in seq_group_metadata_list:
+            for seq_data in seq_group_metadata.seq_data.values():
+                seq_data.append_token_id(rng.randrange(args.vocab_size), 0.0)
+    return elapsed / args.num_steps
+
+
+def main(args: argparse.Namespace) -> None:
+    device = torch.device(args.device)
+    from_lists_time = run(
+        args, lambda sampling_metadata: build_from_lists(
+            sampling_metadata, args.vocab_size, device))
+    state = PersistentSamplingState(args.vocab_size, device, torch.float32)
+    state_time = run(args, state.get_sampling_tensors)
+
+    print(f"batch size {args.batch_size}, prompt len {args.prompt_len}, "
+          f"{args.num_steps} steps")
+    print(f"{'from lists (ms)':>24} {from_lists_time * 1000:>10.3f}")
+    print(f"{'persistent state (ms)':>24} {state_time * 1000:>10.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the preparation of the sampling tensors with "
+        "penalties in decode steps.")
+    parser.add_argument("--batch-size", type=int, default=128)
+    parser.add_argument("--prompt-len", type=int, default=1024)
+    parser.add_argument("--num-steps", type=int, default=128)
+    parser.add_argument("--vocab-size", type=int, default=32000)
+    parser.add_argument("--device", type=str, default="cuda")
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
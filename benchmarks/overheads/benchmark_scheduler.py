@@ -0,0 +1,113 @@
+"""Microbenchmark for the scheduler without a model.
+
+Drives Scheduler.schedule() with synthetic sequence groups and reports the
+scheduling overhead per step against the number of concurrent sequences.
+"""
+import argparse
+import time
+from typing import List
+
+from vllm.config import CacheConfig, SchedulerConfig
+from vllm.core.scheduler import Scheduler
+from vllm.sampling_params import SamplingParams
+from vllm.sequence import Logprob, Sequence, SequenceGroup
+
+
+def create_seq_group(request_id: int, prompt_len: int, output_len: int,
+                     block_size: int) -> SequenceGroup:
+    seq = Sequence(seq_id=request_id,
+                   inputs={"prompt_token_ids": list(range(prompt_len))},
+                   block_size=block_size)
+    return SequenceGroup(request_id=str(request_id),
+                         seqs=[seq],
+                         arrival_time=time.time(),
+                         sampling_params=SamplingParams(max_tokens=output_len,
+                                                        ignore_eos=True))
+
+
+def run(args: argparse.Namespace, num_seqs: int) -> List[float]:
+    """Returns the latencies in seconds of the decode steps."""
+    blocks_per_seq = -(-(args.prompt_len + args.output_len) // args.block_size)
+    scheduler_config = SchedulerConfig(
+        max_num_batched_tokens=max(args.prompt_len * num_seqs, 2048),
+        max_num_seqs=num_seqs,
+        max_model_len=args.prompt_len + args.output_len,
+        use_v2_block_manager=args.use_v2_block_manager,
+        policy=args.scheduling_policy)
+    cache_config = CacheConfig(
+        args.block_size,
+        1.0,
+        1,
+        cache_dtype="auto",
+        enable_prefix_caching=args.enable_prefix_caching)
+    cache_config.num_gpu_blocks = int(num_seqs * blocks_per_seq *
+                                      args.kv_cache_ratio)
+    cache_config.num_cpu_blocks = num_seqs * blocks_per_seq
+    scheduler = Scheduler(scheduler_config, cache_config, None)
+
+    for i in range(num_seqs):
+        scheduler.add_seq_group(
+            create_seq_group(i, args.prompt_len, args.output_len,
+                             args.block_size))
+
+    latencies: List[float] = []
+    token_id = 0
+    for _ in range(args.num_steps):
+        start = time.perf_counter()
+        seq_group_metadata_list, scheduler_outputs = scheduler.schedule()
+        end = time.perf_counter()
+        if scheduler_outputs.num_prefill_groups == 0:
+            latencies.append(end - start)
+
+        # Pretend the model ran: mark the tokens as computed and append a
+        # new token to every sequence.
+        for scheduled_seq_group, seq_group_metadata in zip(
+                scheduler_outputs.scheduled_seq_groups,
+                seq_group_metadata_list):
+            seq_group = scheduled_seq_group.seq_group
+            seq_group.update_num_computed_tokens(
+                seq_group_metadata.token_chunk_size)
+            for seq in seq_group.get_unfinished_seqs():
+                seq.append_token_id(token_id, {token_id: Logprob(0.0)})
+        scheduler.free_finished_seq_groups()
+        if not scheduler.has_unfinished_seqs():
+            break
+    return latencies
+
+
+def main(args: argparse.Namespace):
+    print(f"{'num_seqs':>10} {'steps':>8} {'mean (us)':>12} {'p99 (us)':>12}")
+    for num_seqs in args.num_seqs:
+        latencies = sorted(run(args, num_seqs))
+        if not latencies:
+            print(f"{num_seqs:>10} {0:>8} {'-':>12} {'-':>12}")
+            continue
+        mean_us = sum(latencies) / len(latencies) * 1e6
+        p99_us = latencies[int(len(latencies) * 0.99) - 1] * 1e6
+        print(f"{num_seqs:>10} {len(latencies):>8} {mean_us:>12.1f} "
+              f"{p99_us:>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the overhead of Scheduler.schedule() per "
+        "step without running a model.")
+    parser.add_argument("--num-seqs",
+                        type=int,
+                        nargs="+",
+                        default=[64, 256, 1024, 2048, 4096])
+    parser.add_argument("--prompt-len", type=int, default=128)
+    parser.add_argument("--output-len", type=int, default=128)
+    parser.add_argument("--num-steps", type=int, default=100)
+    parser.add_argument("--block-size", type=int, default=16)
+    parser.add_argument("--kv-cache-ratio",
+                        type=float,
+                        default=1.0,
+                        help="Number of GPU blocks relative to the number of "
+                        "blocks needed by all sequences. Values below 1 force "
+                        "preemption.")
+    parser.add_argument("--use-v2-block-manager", action="store_true")
+    parser.add_argument("--enable-prefix-caching", action="store_true")
+    parser.add_argument("--scheduling-policy", type=str, default="fcfs")
+    args = parser.parse_args()
+    main(args)
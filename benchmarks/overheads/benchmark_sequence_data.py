@@ -0,0 +1,104 @@
+"""Benchmark for the memory and CPU overhead of the token ids of the sequences.
+
+Builds as many long sequences as the engine holds under a high load, with
+`SequenceData`, which stores the token ids in arrays, and with the lists of
+ints used before, then reports the memory they take and the time of the
+per-step operations on them: appending the new tokens, reading all the token
+ids and pickling the data sent to the workers.
+"""
+import argparse
+import pickle
+import random
+import time
+import tracemalloc
+from typing import Dict, List, Optional, Type, Union
+
+from vllm.sequence import SequenceData
+
+
+class ListSequenceData:
+    """The token ids of a sequence stored in lists, as done before."""
+
+    def __init__(self,
+                 prompt_token_ids: List[int],
+                 output_token_ids: Optional[List[int]] = None) -> None:
+        self.prompt_token_ids = prompt_token_ids
+        self.output_token_ids = output_token_ids or []
+        self.cumulative_logprob = 0.0
+
+    def append_token_id(self, token_id: int, logprob: float) -> None:
+        self.output_token_ids.append(token_id)
+        self.cumulative_logprob += logprob
+
+    def get_token_ids(self) -> List[int]:
+        return self.prompt_token_ids + self.output_token_ids
+
+
+AnySequenceData = Union[SequenceData, ListSequenceData]
+
+
+def build(cls: Type[AnySequenceData],
+          args: argparse.Namespace) -> List[AnySequenceData]:
+    rng = random.Random(args.seed)
+    vocab = range(args.vocab_size)
+    return [
+        cls(rng.choices(vocab, k=args.prompt_len),
+            rng.choices(vocab, k=args.seq_len - args.prompt_len))
+        for _ in range(args.num_seqs)
+    ]
+
+
+def run(cls: Type[AnySequenceData],
+        args: argparse.Namespace) -> Dict[str, float]:
+    """Returns the memory of the sequences in MiB and the time of each
+    operation in ms per step."""
+    tracemalloc.start()
+    seqs = build(cls, args)
+    memory = tracemalloc.get_traced_memory()[0] / 2**20
+    tracemalloc.stop()
+
+    times = {"append": 0.0, "get_token_ids": 0.0, "pickle": 0.0}
+    for step in range(args.num_steps):
+        start = time.perf_counter()
+        for seq in seqs:
+            seq.append_token_id(step, 0.0)
+        times["append"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        for seq in seqs:
+            seq.get_token_ids()
+        times["get_token_ids"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        pickle.dumps(seqs, protocol=pickle.HIGHEST_PROTOCOL)
+        times["pickle"] += time.perf_counter() - start
+
+    result = {"memory (MiB)": memory}
+    for name, total_time in times.items():
+        result[f"{name} (ms/step)"] = total_time * 1000 / args.num_steps
+    return result
+
+
+def main(args: argparse.Namespace) -> None:
+    list_result = run(ListSequenceData, args)
+    array_result = run(SequenceData, args)
+
+    print(f"{args.num_seqs} sequences of {args.seq_len} tokens")
+    print(f"{'':>24} {'list':>12} {'array':>12} {'ratio':>8}")
+    for name, list_value in list_result.items():
+        array_value = array_result[name]
+        print(f"{name:>24} {list_value:>12.2f} {array_value:>12.2f} "
+              f"{list_value / array_value:>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the memory and CPU overhead of the token ids "
+        "of many long sequences, stored in arrays and in lists.")
+    parser.add_argument("--num-seqs", type=int, default=4096)
+    parser.add_argument("--seq-len", type=int, default=8192)
+    parser.add_argument("--prompt-len", type=int, default=4096)
+    parser.add_argument("--vocab-size", type=int, default=32000)
+    parser.add_argument("--num-steps", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
@@ -0,0 +1,180 @@
+"""Benchmark for swapping KV cache blocks between the GPU and the CPU.
+
+``kernel`` mode measures the swap bandwidth of the per-block swap kernel
+against the coalesced extents issued by the cache engine, for swaps made of
+runs of consecutive blocks of various lengths.
+
+``engine`` mode measures the step latency of an engine whose GPU KV cache is
+small enough to force preemption by swapping.
+"""
+import argparse
+import random
+import time
+from typing import List, Tuple
+
+import numpy as np
+import torch
+
+from vllm import EngineArgs, LLMEngine, SamplingParams
+from vllm.attention.ops.paged_attn import PagedAttention
+from vllm.core.block.common import coalesce_block_copies
+from vllm.worker.cache_engine import (copy_block_runs, get_block_major_views,
+                                      split_block_extents)
+
+
+def create_swap(num_blocks: int, num_swap_blocks: int, run_length: int,
+                seed: int) -> List[Tuple[int, int]]:
+    """Returns (src, dst) block pairs made of runs of consecutive blocks on
+    both sides, scattered over the cache."""
+    random.seed(seed)
+    num_runs = num_swap_blocks // run_length
+    src_runs = random.sample(range(num_blocks // run_length), num_runs)
+    dst_runs = random.sample(range(num_blocks // run_length), num_runs)
+    return [(src_run * run_length + i, dst_run * run_length + i)
+            for src_run, dst_run in zip(src_runs, dst_runs)
+            for i in range(run_length)]
+
+
+def run_kernel(args: argparse.Namespace) -> None:
+    kv_cache_shape = PagedAttention.get_kv_cache_shape(args.num_blocks,
+                                                       args.block_size,
+                                                       args.num_kv_heads,
+                                                       args.head_size)
+    gpu_cache = [
+        torch.rand(kv_cache_shape, dtype=torch.float16, device="cuda")
+        for _ in range(args.num_layers)
+    ]
+    cpu_cache = [
+        torch.empty(kv_cache_shape, dtype=torch.float16, pin_memory=True)
+        for _ in range(args.num_layers)
+    ]
+    gpu_views = [get_block_major_views(layer, 1) for layer in gpu_cache]
+    cpu_views = [get_block_major_views(layer, 1) for layer in cpu_cache]
+    block_bytes = gpu_cache[0].select(1, 0).numel() * 2 * args.num_layers
+
+    def swap_per_block(src_to_dst: torch.Tensor) -> None:
+        for i in range(args.num_layers):
+            PagedAttention.swap_blocks(gpu_cache[i], cpu_cache[i], src_to_dst)
+
+    def swap_extents(extents: torch.Tensor) -> None:
+        single, runs = split_block_extents(extents)
+        for i in range(args.num_layers):
+            if single.numel() > 0:
+                PagedAttention.swap_blocks(gpu_cache[i], cpu_cache[i], single)
+            copy_block_runs(gpu_views[i],
+                            cpu_views[i],
+                            runs,
+                            non_blocking=True)
+
+    print(f"{'run_length':>12} {'method':>12} {'ms/swap':>12} {'GiB/s':>12}")
+    for run_length in args.run_lengths:
+        src_to_dst = create_swap(args.num_blocks, args.num_swap_blocks,
+                                 run_length, args.seed)
+        inputs = {
+            "per-block":
+            (swap_per_block, torch.tensor(src_to_dst,
+                                          dtype=torch.int64).view(-1, 2)),
+            "extents": (swap_extents,
+                        torch.tensor(coalesce_block_copies(src_to_dst),
+                                     dtype=torch.int64).view(-1, 3)),
+        }
+        for name, (swap, mapping) in inputs.items():
+            swap(mapping)
+            torch.cuda.synchronize()
+            start = time.perf_counter()
+            for _ in range(args.num_iters):
+                swap(mapping)
+            torch.cuda.synchronize()
+            latency = (time.perf_counter() - start) / args.num_iters
+            bandwidth = len(src_to_dst) * block_bytes / latency / (1 << 30)
+            print(f"{run_length:>12} {name:>12} {latency * 1000:>12.3f} "
+                  f"{bandwidth:>12.2f}")
+
+
+def run_engine(args: argparse.Namespace) -> None:
+    engine = LLMEngine.from_engine_args(
+        EngineArgs(model=args.model,
+                   block_size=args.block_size,
+                   num_gpu_blocks_override=args.num_gpu_blocks_override,
+                   swap_space=args.swap_space,
+                   preemption_mode="swap",
+                   enforce_eager=True))
+    sampling_params = SamplingParams(n=args.n,
+                                     temperature=1.0,
+                                     max_tokens=args.output_len,
+                                     ignore_eos=True)
+    random.seed(args.seed)
+    for i in range(args.num_prompts):
+        prompt_token_ids = [
+            random.randint(0, 10000) for _ in range(args.prompt_len)
+        ]
+        engine.add_request(str(i), {"prompt_token_ids": prompt_token_ids},
+                           sampling_params)
+
+    scheduler = engine.scheduler
+    latencies: List[float] = []
+    preempted_latencies: List[float] = []
+    start = time.perf_counter()
+    while engine.has_unfinished_requests():
+        num_preemptions = scheduler.num_cumulative_preemption
+        step_start = time.perf_counter()
+        engine.step()
+        latency = time.perf_counter() - step_start
+        if scheduler.num_cumulative_preemption > num_preemptions:
+            preempted_latencies.append(latency)
+        else:
+            latencies.append(latency)
+    total_time = time.perf_counter() - start
+
+    print(f"Total time: {total_time:.2f} s, "
+          f"preemptions: {scheduler.num_cumulative_preemption}")
+    for name, values in (("steps without preemption", latencies),
+                         ("steps with preemption", preempted_latencies)):
+        if not values:
+            continue
+        ms = np.array(values) * 1000
+        print(f"{name}: {len(values)} steps, mean {ms.mean():.2f} ms, "
+              f"p50 {np.percentile(ms, 50):.2f} ms, "
+              f"p99 {np.percentile(ms, 99):.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark swapping KV cache blocks between the GPU and "
+        "the CPU.")
+    parser.add_argument("--mode",
+                        choices=["kernel", "engine"],
+                        default="kernel")
+    parser.add_argument("--block-size", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+
+    kernel_group = parser.add_argument_group("kernel mode")
+    kernel_group.add_argument("--num-blocks", type=int, default=4096)
+    kernel_group.add_argument("--num-swap-blocks", type=int, default=1024)
+    kernel_group.add_argument("--run-lengths",
+                              type=int,
+                              nargs="+",
+                              default=[1, 2, 4, 16, 64])
+    kernel_group.add_argument("--num-layers", type=int, default=32)
+    kernel_group.add_argument("--num-kv-heads", type=int, default=8)
+    kernel_group.add_argument("--head-size", type=int, default=128)
+    kernel_group.add_argument("--num-iters", type=int, default=20)
+
+    engine_group = parser.add_argument_group("engine mode")
+    engine_group.add_argument("--model", type=str, default="facebook/opt-125m")
+    engine_group.add_argument("--num-gpu-blocks-override",
+                              type=int,
+                              default=512,
+                              help="Size of the GPU KV cache, small enough "
+                              "to force preemption.")
+    engine_group.add_argument("--swap-space", type=int, default=4)
+    engine_group.add_argument("--num-prompts", type=int, default=64)
+    engine_group.add_argument("--n", type=int, default=2)
+    engine_group.add_argument("--prompt-len", type=int, default=256)
+    engine_group.add_argument("--output-len", type=int, default=256)
+    args = parser.parse_args()
+
+    if args.mode == "kernel":
+        run_kernel(args)
+    else:
+        run_engine(args)
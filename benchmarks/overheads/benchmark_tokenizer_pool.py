@@ -0,0 +1,112 @@
+"""Benchmark for the request-ingest throughput of the tokenizer groups with
+long prompts.
+
+Encodes many long prompts concurrently with `encode_async`, as the async
+engine does for the incoming requests, and at once with `encode_batch`, as
+`LLM` does, with the tokenizer group in the engine process and with a pool
+of local processes (--tokenizer-pool-type process). Reports the prompts and
+tokens encoded per second, and the longest stall of the event loop, during
+which no other request is served.
+"""
+import argparse
+import asyncio
+import random
+import time
+from typing import Dict, List, Optional
+
+from vllm.config import TokenizerPoolConfig
+from vllm.transformers_utils.tokenizer_group import (BaseTokenizerGroup,
+                                                     get_tokenizer_group)
+
+_WORDS = ("the of and to in is was for that with as on by at from his an "
+          "were are which this be or has had not but first one their its "
+          "new after who they have her she two been other when there all "
+          "during into school time may years more most only over city some "
+          "world would where later up such used many can state about "
+          "national out known university united then made").split()
+
+
+async def _measure_stall(done: asyncio.Event) -> float:
+    """Returns the longest time the event loop did not run this task."""
+    max_stall = 0.0
+    last = time.perf_counter()
+    while not done.is_set():
+        await asyncio.sleep(0.001)
+        now = time.perf_counter()
+        max_stall = max(max_stall, now - last - 0.001)
+        last = now
+    return max_stall
+
+
+async def _encode_async(tokenizer_group: BaseTokenizerGroup,
+                        prompts: List[str]) -> Dict[str, float]:
+    done = asyncio.Event()
+    stall = asyncio.create_task(_measure_stall(done))
+    start = time.perf_counter()
+    results = await asyncio.gather(*[
+        tokenizer_group.encode_async(prompt=prompt, request_id=str(i))
+        for i, prompt in enumerate(prompts)
+    ])
+    elapsed = time.perf_counter() - start
+    done.set()
+    return {
+        "elapsed": elapsed,
+        "num_tokens": sum(len(token_ids) for token_ids in results),
+        "max_stall": await stall,
+    }
+
+
+def run(args: argparse.Namespace, prompts: List[str],
+        pool_type: Optional[str]) -> Dict[str, float]:
+    tokenizer_pool_config = TokenizerPoolConfig.create_config(
+        args.pool_size if pool_type else 0, pool_type or "process", None)
+    tokenizer_group = get_tokenizer_group(tokenizer_pool_config,
+                                          tokenizer_id=args.tokenizer,
+                                          enable_lora=False,
+                                          max_num_seqs=1,
+                                          max_input_length=None)
+    result = asyncio.run(_encode_async(tokenizer_group, prompts))
+
+    start = time.perf_counter()
+    tokenizer_group.encode_batch(prompts)
+    result["batch_elapsed"] = time.perf_counter() - start
+    return result
+
+
+def main(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    prompts = [
+        " ".join(rng.choices(_WORDS, k=args.prompt_words))
+        for _ in range(args.num_prompts)
+    ]
+
+    print(f"{args.num_prompts} prompts of {args.prompt_words} words, "
+          f"pool of {args.pool_size} processes")
+    print(f"{'':>10} {'async prompts/s':>16} {'async tokens/s':>16} "
+          f"{'max stall (ms)':>15} {'batch prompts/s':>16}")
+    for pool_type in [None, "process"]:
+        result = run(args, prompts, pool_type)
+        print(f"{pool_type or 'none':>10} "
+              f"{args.num_prompts / result['elapsed']:>16.1f} "
+              f"{result['num_tokens'] / result['elapsed']:>16.0f} "
+              f"{result['max_stall'] * 1000:>15.1f} "
+              f"{args.num_prompts / result['batch_elapsed']:>16.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the request-ingest throughput of the "
+        "tokenizer groups with long prompts.")
+    parser.add_argument("--tokenizer",
+                        type=str,
+                        default="facebook/opt-125m",
+                        help="The tokenizer to encode the prompts with.")
+    parser.add_argument("--num-prompts", type=int, default=64)
+    parser.add_argument("--prompt-words",
+                        type=int,
+                        default=100000,
+                        help="The number of words of each prompt, about "
+                        "as many tokens.")
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
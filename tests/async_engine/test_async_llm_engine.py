@@ -18,6 +18,7 @@ class MockEngine:
         self.step_calls = 0
         self.add_request_calls = 0
         self.abort_request_calls = 0
+        self.shutdown_calls = 0
         self.request_id = None
 
     async def step_async(self):
@@ -42,6 +43,10 @@ class MockEngine:
         self.add_request_calls += 1
         return
 
+    def add_request_batch(self, requests):
+        self.add_request_calls += len(requests)
+        return {}
+
     def abort_request(self, request_id):
         del request_id  # Unused
         self.abort_request_calls += 1
@@ -49,6 +54,12 @@ class MockEngine:
     def has_unfinished_requests(self):
         return self.request_id is not None
 
+    def has_pending_outputs(self):
+        return False
+
+    def shutdown(self):
+        self.shutdown_calls += 1
+
 
 class MockAsyncLLMEngine(AsyncLLMEngine):
 
@@ -94,3 +105,15 @@ async def test_new_requests_event():
     assert engine.get_model_config() is not None
     assert engine.get_tokenizer() is not None
     assert engine.get_decoding_config() is not None
+
+
+@pytest.mark.asyncio
+async def test_shutdown():
+    engine = MockAsyncLLMEngine(worker_use_ray=False, engine_use_ray=False)
+    engine.start_background_loop()
+    await asyncio.sleep(0.01)
+    assert engine.is_running
+
+    await engine.shutdown()
+    assert not engine.is_running
+    assert engine.engine.shutdown_calls == 1
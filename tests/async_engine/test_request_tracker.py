@@ -1,7 +1,10 @@
+import asyncio
+
 import pytest
 
-from vllm.engine.async_llm_engine import RequestTracker
-from vllm.outputs import RequestOutput
+from vllm.engine.async_llm_engine import AsyncStream, RequestTracker
+from vllm.outputs import CompletionOutput, RequestOutput
+from vllm.sequence import Logprob
 
 
 @pytest.mark.asyncio
@@ -65,3 +68,55 @@ async def test_request_tracker():
     assert new[0]["request_id"] == "5"
     assert stream_2.finished
     assert not stream_5.finished
+
+
+def _request_output(request_id: str, text: str, finished: bool = False):
+    completion = CompletionOutput(0, text, list(range(len(text))), 0.0,
+                                  [{
+                                      i: Logprob(0.0)
+                                  } for i in range(len(text))])
+    return RequestOutput(request_id, "prompt", [], None, [completion],
+                         finished)
+
+
+@pytest.mark.asyncio
+async def test_stream_coalesces_outputs():
+    stream = AsyncStream("1")
+    stream.put(_request_output("1", "a"))
+    stream.put(_request_output("1", "ab"))
+    stream.put(ValueError("error"))
+    stream.put(_request_output("1", "abc"))
+    stream.finish()
+    # The pending cumulative output is replaced by the next one.
+    assert (await stream.__anext__()).outputs[0].text == "ab"
+    with pytest.raises(ValueError):
+        await stream.__anext__()
+    assert (await stream.__anext__()).outputs[0].text == "abc"
+    with pytest.raises(StopAsyncIteration):
+        await stream.__anext__()
+
+
+@pytest.mark.asyncio
+async def test_stream_deltas():
+    stream = AsyncStream("1", deltas=True)
+
+    async def consume():
+        return [output async for output in stream]
+
+    consumer = asyncio.create_task(consume())
+    await asyncio.sleep(0)
+    stream.put(_request_output("1", "a"))
+    await asyncio.sleep(0)
+    # The pending delta output is extended with the next one.
+    stream.put(_request_output("1", "b"))
+    stream.put(_request_output("1", "c"))
+    await asyncio.sleep(0)
+    stream.put(_request_output("1", "d", finished=True))
+    stream.finish()
+    outputs = await consumer
+
+    assert [output.outputs[0].text for output in outputs] == ["a", "bc", "d"]
+    assert [output.outputs[0].token_ids for output in outputs] == [[0], [0, 0],
+                                                                   [0]]
+    assert [len(output.outputs[0].logprobs) for output in outputs] == [1, 2, 1]
+    assert outputs[-1].finished
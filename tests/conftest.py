@@ -524,6 +524,10 @@ def get_tokenizer_pool_config(tokenizer_group_type):
         return TokenizerPoolConfig(pool_size=1,
                                    pool_type="ray",
                                    extra_config={})
+    if tokenizer_group_type == "process":
+        return TokenizerPoolConfig(pool_size=2,
+                                   pool_type="process",
+                                   extra_config={})
     raise ValueError(f"Unknown tokenizer_group_type: {tokenizer_group_type}")
 
 
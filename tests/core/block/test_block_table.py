@@ -547,6 +547,8 @@ def test_num_blocks_touched_by_append_slots(block_size: int, sequence_len: int,
         block_table.get_num_blocks_touched_by_append_slots(
             token_ids=token_ids_to_append,
             num_lookahead_slots=num_lookahead_slots))
+    assert block_table.get_num_blocks_touched_by_num_slots(
+        num_new_tokens + num_lookahead_slots) == expected_num_touched_blocks
 
     # Measure how many blocks are touched by measuring num_free_blocks before
     # and after the append.
@@ -2,7 +2,7 @@ import random
 
 import pytest
 
-from vllm.core.block.common import RefCounter
+from vllm.core.block.common import RefCounter, coalesce_block_copies
 
 
 @pytest.mark.parametrize("seed", list(range(20)))
@@ -40,3 +40,30 @@ def test_incr_decr(seed: int, num_incrs: int, num_blocks: int):
 
     with pytest.raises(AssertionError):
         counter.decr(block_id)
+
+
+def test_coalesce_block_copies():
+    # Block tables allocated in descending order are merged as well.
+    src_to_dst = [(7, 3), (6, 2), (5, 1), (9, 4), (10, 8), (11, 9)]
+    assert coalesce_block_copies(src_to_dst) == [
+        (5, 1, 3),
+        (9, 4, 1),
+        (10, 8, 2),
+    ]
+    assert coalesce_block_copies([]) == []
+
+
+@pytest.mark.parametrize("seed", list(range(10)))
+def test_coalesce_block_copies_preserves_copies(seed: int):
+    random.seed(seed)
+    src_to_dst = list(
+        zip(random.sample(range(64), 32), random.sample(range(64), 32)))
+    src_to_dst += [(src + 1, dst + 1) for src, dst in src_to_dst[:8]
+                   if dst + 1 not in {d
+                                      for _, d in src_to_dst}]
+
+    extents = coalesce_block_copies(src_to_dst)
+    expanded = [(src + i, dst + i) for src, dst, num_blocks in extents
+                for i in range(num_blocks)]
+    assert sorted(expanded) == sorted(src_to_dst)
+    assert len(extents) <= len(src_to_dst)
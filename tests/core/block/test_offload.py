@@ -0,0 +1,232 @@
+import random
+from typing import Dict, List, Tuple
+
+import pytest
+
+from vllm.core.block.offload import OffloadTier, TieredBlockCache
+from vllm.core.block.prefix_cache_store import PrefixCacheStore
+from vllm.core.block.prefix_caching_block import PrefixCachingBlockAllocator
+from vllm.core.block.transfers import OffloadCopy, OffloadTransfers
+
+_SOURCE_AND_DEST = {
+    OffloadCopy.GPU_TO_HOST: ("gpu", "host"),
+    OffloadCopy.HOST_TO_DISK: ("host", "disk"),
+    OffloadCopy.HOST_TO_GPU: ("host", "gpu"),
+    OffloadCopy.DISK_TO_GPU: ("disk", "gpu"),
+    OffloadCopy.GPU_TO_DISK: ("gpu", "disk"),
+}
+
+
+def _apply(transfers: OffloadTransfers, storage: Dict[Tuple[str, int], int],
+           batched: bool) -> None:
+    """Applies the transfers to a storage mapping (tier, slot) to content."""
+    if not batched:
+        for kind, src, dst in transfers.copies:
+            src_tier, dst_tier = _SOURCE_AND_DEST[kind]
+            storage[(dst_tier, dst)] = storage.get((src_tier, src), -1)
+        return
+
+    for kind, src_to_dst in transfers.get_batches():
+        src_tier, dst_tier = _SOURCE_AND_DEST[kind]
+        contents = [storage.get((src_tier, src), -1) for src, _ in src_to_dst]
+        for (_, dst), content in zip(src_to_dst, contents):
+            storage[(dst_tier, dst)] = content
+
+
+def test_demotion_cascades_through_tiers():
+    cache = TieredBlockCache(num_host_blocks=2, num_disk_blocks=1)
+
+    cache.offload(content_hash=10, block_id=0)
+    cache.offload(content_hash=11, block_id=1)
+    assert cache.get_and_clear_transfers().copies == [
+        (OffloadCopy.GPU_TO_HOST, 0, 0),
+        (OffloadCopy.GPU_TO_HOST, 1, 1),
+    ]
+
+    # The host tier is full, its LRU block moves to disk and the slot is
+    # reused for the new block.
+    cache.offload(content_hash=12, block_id=2)
+    assert cache.get_and_clear_transfers().copies == [
+        (OffloadCopy.HOST_TO_DISK, 0, 0),
+        (OffloadCopy.GPU_TO_HOST, 2, 0),
+    ]
+    assert cache.get_num_blocks(OffloadTier.HOST) == 2
+    assert cache.get_num_blocks(OffloadTier.DISK) == 1
+
+    # The disk tier is full too, its LRU block is dropped.
+    cache.offload(content_hash=13, block_id=3)
+    assert cache.get_and_clear_transfers().copies == [
+        (OffloadCopy.HOST_TO_DISK, 1, 0),
+        (OffloadCopy.GPU_TO_HOST, 3, 1),
+    ]
+    assert 10 not in cache
+    assert all(h in cache for h in (11, 12, 13))
+
+    # Offloading a block which is already in the host tier copies nothing.
+    cache.offload(content_hash=12, block_id=4)
+    assert cache.get_and_clear_transfers().is_empty()
+
+
+def test_load_from_tiers():
+    cache = TieredBlockCache(num_host_blocks=1, num_disk_blocks=1)
+    cache.offload(content_hash=10, block_id=0)
+    cache.offload(content_hash=11, block_id=1)
+    cache.get_and_clear_transfers()
+
+    assert cache.load(content_hash=11, block_id=5)
+    assert cache.load(content_hash=10, block_id=6)
+    assert not cache.load(content_hash=12, block_id=7)
+    cache.record_gpu_hit()
+
+    assert cache.get_and_clear_transfers().copies == [
+        (OffloadCopy.HOST_TO_GPU, 0, 5),
+        (OffloadCopy.DISK_TO_GPU, 0, 6),
+    ]
+
+    num_queries, num_hits = cache.get_and_reset_stats()
+    assert num_queries == 4
+    assert num_hits == {"gpu": 1, "host": 1, "disk": 1}
+    assert cache.get_and_reset_stats() == (0, {"gpu": 0, "host": 0, "disk": 0})
+
+
+def test_batches_split_on_repeated_destination():
+    transfers = OffloadTransfers()
+    transfers.append(OffloadCopy.GPU_TO_HOST, 0, 0)
+    transfers.append(OffloadCopy.GPU_TO_HOST, 1, 1)
+    transfers.append(OffloadCopy.GPU_TO_HOST, 2, 0)
+    transfers.append(OffloadCopy.HOST_TO_GPU, 1, 3)
+    assert list(transfers.get_batches()) == [
+        (OffloadCopy.GPU_TO_HOST, [(0, 0), (1, 1)]),
+        (OffloadCopy.GPU_TO_HOST, [(2, 0)]),
+        (OffloadCopy.HOST_TO_GPU, [(1, 3)]),
+    ]
+
+
+@pytest.mark.parametrize("seed", list(range(10)))
+def test_transfers_preserve_content(seed: int):
+    """Offloads and loads random blocks and checks with a simulated storage
+    that the GPU blocks end up with the expected content, both when the
+    copies are applied one by one and in batches."""
+    random.seed(seed)
+    num_gpu_blocks = 8
+    cache = TieredBlockCache(num_host_blocks=4, num_disk_blocks=4)
+
+    gpu_content = {b: random.randrange(16) for b in range(num_gpu_blocks)}
+    storages: List[Dict[Tuple[str, int], int]] = [{}, {}]
+
+    for _ in range(50):
+        # The model writes new content into some blocks between the steps.
+        for block_id in random.sample(range(num_gpu_blocks), 2):
+            gpu_content[block_id] = random.randrange(16)
+        for storage in storages:
+            for block_id, content_hash in gpu_content.items():
+                storage[("gpu", block_id)] = content_hash
+
+        for _ in range(random.randint(1, 8)):
+            block_id = random.randrange(num_gpu_blocks)
+            if random.random() < 0.5:
+                cache.offload(gpu_content[block_id], block_id)
+            else:
+                content_hash = random.randrange(16)
+                if cache.load(content_hash, block_id):
+                    gpu_content[block_id] = content_hash
+
+        transfers = cache.get_and_clear_transfers()
+        for storage, batched in zip(storages, [False, True]):
+            _apply(transfers, storage, batched)
+            for block_id, content_hash in gpu_content.items():
+                assert storage[("gpu", block_id)] == content_hash
+
+
+def _allocate_chain(allocator: PrefixCachingBlockAllocator,
+                    token_ids: List[int], block_size: int):
+    blocks = []
+    prev_block = None
+    for i in range(0, len(token_ids), block_size):
+        prev_block = allocator.allocate_immutable(
+            prev_block=prev_block, token_ids=token_ids[i:i + block_size])
+        blocks.append(prev_block)
+    return blocks
+
+
+@pytest.mark.parametrize("block_size", [1, 4])
+def test_allocator_reloads_evicted_prefix(block_size: int):
+    num_blocks = 4
+    cache = TieredBlockCache(num_host_blocks=4, num_disk_blocks=4)
+    allocator = PrefixCachingBlockAllocator(num_blocks=num_blocks,
+                                            block_size=block_size,
+                                            offload_cache=cache)
+
+    prefix = list(range(num_blocks * block_size))
+    blocks = _allocate_chain(allocator, prefix, block_size)
+    assert not any(block.computed for block in blocks)
+    allocator.mark_blocks_as_computed([block.block_id for block in blocks])
+    storage = {("gpu", block.block_id): block.content_hash for block in blocks}
+    for block in blocks:
+        allocator.free(block)
+    assert cache.get_and_clear_transfers().is_empty()
+
+    # Fill the GPU with other content, evicting the whole prefix.
+    other = [t + len(prefix) for t in prefix]
+    blocks = _allocate_chain(allocator, other, block_size)
+    transfers = cache.get_and_clear_transfers()
+    assert len(transfers.copies) == num_blocks
+    _apply(transfers, storage, batched=True)
+    for block in blocks:
+        storage[("gpu", block.block_id)] = block.content_hash
+        allocator.free(block)
+
+    # The prefix is loaded back from the tiers instead of being recomputed,
+    # while the other blocks are demoted in turn.
+    blocks = _allocate_chain(allocator, prefix, block_size)
+    assert all(block.computed for block in blocks)
+    transfers = cache.get_and_clear_transfers()
+    _apply(transfers, storage, batched=True)
+    for block in blocks:
+        assert storage[("gpu", block.block_id)] == block.content_hash
+
+    num_queries, num_hits = cache.get_and_reset_stats()
+    assert num_queries == 3 * num_blocks
+    assert num_hits["host"] + num_hits["disk"] == num_blocks
+
+
+def test_persist_and_restore(tmp_path):
+    """Persists the host tier and the GPU blocks to the disk tier, and
+    checks that a new cache with the same store loads them from disk."""
+    store = PrefixCacheStore(str(tmp_path), {"model": "m"}, num_blocks=4)
+    store.open()
+    cache = TieredBlockCache(num_host_blocks=1, num_disk_blocks=4, store=store)
+    storage = {("gpu", b): 10 + b for b in range(4)}
+
+    cache.offload(content_hash=10, block_id=0)
+    cache.offload(content_hash=11, block_id=1)
+    _apply(cache.get_and_clear_transfers(), storage, batched=True)
+
+    # Block 11 is in the host tier and block 10 on disk already.
+    cache.persist([(10, 0), (12, 2)])
+    transfers = cache.get_and_clear_transfers()
+    assert transfers.copies == [
+        (OffloadCopy.HOST_TO_DISK, 0, 1),
+        (OffloadCopy.GPU_TO_DISK, 2, 2),
+    ]
+    _apply(transfers, storage, batched=True)
+    cache.save()
+    store.close()
+
+    store = PrefixCacheStore(str(tmp_path), {"model": "m"}, num_blocks=4)
+    store.open()
+    cache = TieredBlockCache(num_host_blocks=1, num_disk_blocks=4, store=store)
+    assert cache.get_num_blocks(OffloadTier.DISK) == 3
+    for block_id, content_hash in enumerate([10, 11, 12]):
+        assert cache.load(content_hash, block_id)
+    transfers = cache.get_and_clear_transfers()
+    assert all(kind == OffloadCopy.DISK_TO_GPU
+               for kind, _, _ in transfers.copies)
+    storage = {
+        key: value
+        for key, value in storage.items() if key[0] == "disk"
+    }
+    _apply(transfers, storage, batched=True)
+    for block_id, content_hash in enumerate([10, 11, 12]):
+        assert storage[("gpu", block_id)] == content_hash
+    store.close()
@@ -0,0 +1,125 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from vllm.core.block.prefix_cache_store import PrefixCacheStore
+
+_FINGERPRINT = {"model": "facebook/opt-125m", "dtype": "torch.float16"}
+
+
+def _open(root, fingerprint=None, num_blocks=8) -> PrefixCacheStore:
+    store = PrefixCacheStore(str(root), fingerprint or _FINGERPRINT,
+                             num_blocks)
+    store.open()
+    return store
+
+
+def _write_data_file(store: PrefixCacheStore) -> str:
+    path = PrefixCacheStore.get_data_file(store.directory, rank=0)
+    with open(path, "wb") as f:
+        f.write(b"\0" * 16)
+    return path
+
+
+def test_round_trip(tmp_path):
+    store = _open(tmp_path)
+    assert store.pop_restored_blocks() == []
+    data_file = _write_data_file(store)
+    store.save([(123, 4), (-5, 0)])
+    store.close()
+
+    store = _open(tmp_path)
+    assert store.pop_restored_blocks() == [(123, 4), (-5, 0)]
+    assert store.pop_restored_blocks() == []
+    assert os.path.exists(data_file)
+    store.close()
+
+
+def test_refuses_other_version(tmp_path):
+    store = _open(tmp_path)
+    data_file = _write_data_file(store)
+    store.save([(123, 4)])
+    store.close()
+
+    # Simulate a store written by another version of the engine.
+    index_path = os.path.join(store.directory, "index.json")
+    with open(index_path) as f:
+        index = json.load(f)
+    index["fingerprint"]["version"] = -1
+    with open(index_path, "w") as f:
+        json.dump(index, f)
+
+    store = _open(tmp_path)
+    assert store.pop_restored_blocks() == []
+    assert not os.path.exists(data_file)
+    store.close()
+
+
+def test_refuses_other_num_blocks(tmp_path):
+    store = _open(tmp_path, num_blocks=8)
+    data_file = _write_data_file(store)
+    store.save([(123, 4)])
+    store.close()
+
+    store = _open(tmp_path, num_blocks=16)
+    assert store.pop_restored_blocks() == []
+    assert not os.path.exists(data_file)
+    store.close()
+
+
+def test_fingerprint_selects_directory(tmp_path):
+    store = PrefixCacheStore(str(tmp_path), _FINGERPRINT, 8)
+    other = PrefixCacheStore(str(tmp_path),
+                             dict(_FINGERPRINT, kv_cache_dtype="fp8"), 8)
+    assert store.directory != other.directory
+
+
+def test_unclean_shutdown_leaves_empty_cache(tmp_path):
+    store = _open(tmp_path)
+    store.save([(123, 4)])
+    # The disk tier changes after the save, and the engine then crashes.
+    store.invalidate()
+    store.close()
+
+    store = _open(tmp_path)
+    assert store.pop_restored_blocks() == []
+    store.close()
+
+
+@pytest.mark.parametrize("index", [
+    "not json",
+    json.dumps([1, 2]),
+    json.dumps({"blocks": [[1, 8]]}),
+])
+def test_ignores_corrupted_index(tmp_path, index):
+    store = _open(tmp_path)
+    store.save([])
+    store.close()
+    with open(os.path.join(store.directory, "index.json"), "w") as f:
+        f.write(index)
+
+    store = _open(tmp_path)
+    assert store.pop_restored_blocks() == []
+    store.close()
+
+
+def test_rejects_concurrent_engines(tmp_path):
+    store = _open(tmp_path)
+    with pytest.raises(RuntimeError):
+        _open(tmp_path)
+    store.close()
+    _open(tmp_path).close()
+
+
+def test_block_hashes_are_stable_across_processes():
+    code = ("from vllm.core.block.hashing import hash_block_tokens; "
+            "h = hash_block_tokens(True, None, [1, 2, 3]); "
+            "print(h, hash_block_tokens(False, h, [4, 5, 6]))")
+    outputs = {
+        subprocess.check_output([sys.executable, "-c", code]).splitlines()[-1]
+        for _ in range(2)
+    }
+    assert len(outputs) == 1
@@ -457,12 +457,12 @@ class TestPrefixCachingBlockAllocator:
         token_ids = list(range(num_blocks * block_size))
 
         # now we have num_blocks free blocks in hashless allocator
-        # with internal tracking list _blocks _cached_blocks and evictor
+        # with internal tracking list _blocks _prefix_tree and evictor
         # empty and block's ref shall be 0
         assert list(allocator._hashless_allocator._free_block_indices
                     ) == all_blocks_list
         assert len(allocator._blocks.keys()) == 0
-        assert len(allocator._cached_blocks.values()) == 0
+        assert len(allocator._prefix_tree) == 0
         assert len(allocator.evictor.free_table.keys()) == 0
         assert allocator._refcounter._refcounts == zero_ref
 
@@ -476,14 +476,15 @@ class TestPrefixCachingBlockAllocator:
 
         # Free all blocks, and now all blocks shall be in the evictor
         # there shall be no tracking data left in _blocks
-        # all blocks shall be tracked in _cached_blocks
+        # all blocks shall be tracked in _prefix_tree
         # all blocks' ref shall be zero
         for block in new_block:
             allocator.free(block)
 
         assert len(allocator._blocks.keys()) == 0
         assert len(allocator._hashless_allocator._free_block_indices) == 0
-        assert list(allocator._cached_blocks.values()) == all_blocks_list
+        assert [block_id for _, block_id in allocator._prefix_tree.items()
+                ] == all_blocks_list
         assert list(allocator.evictor.free_table.keys()) == all_blocks_list
         assert allocator._refcounter._refcounts == zero_ref
 
@@ -495,7 +496,7 @@ class TestPrefixCachingBlockAllocator:
         assert mutable.content_hash is None
         assert 0 in allocator._blocks
         assert allocator._refcounter.get(0) == 1
-        assert 0 not in allocator._cached_blocks
+        assert 0 not in allocator._prefix_tree
         assert 0 not in allocator.evictor
 
         # Since this mutable block has no hash yet, it shall be released into
@@ -504,7 +505,7 @@ class TestPrefixCachingBlockAllocator:
 
         assert len(allocator._blocks.keys()) == 0
         assert allocator._refcounter._refcounts == zero_ref
-        assert 0 not in allocator._cached_blocks
+        assert 0 not in allocator._prefix_tree
         assert 0 not in allocator.evictor
         assert 0 in allocator._hashless_allocator._free_block_indices
 
@@ -517,7 +518,9 @@ class TestPrefixCachingBlockAllocator:
         assert block.block_id == 0
         assert len(allocator._hashless_allocator._free_block_indices) == 0
         assert 0 in allocator._blocks
-        assert 0 in allocator._cached_blocks.values()
+        assert 0 in [
+            block_id for _, block_id in allocator._prefix_tree.items()
+        ]
         assert allocator._refcounter.get(0) == 1
         assert 0 not in allocator.evictor
 
@@ -600,6 +603,50 @@ class TestPrefixCachingBlockAllocator:
 
         assert new_block[0].block_id == last_block_id
 
+    @staticmethod
+    def test_eviction_keeps_shared_prefix():
+        """A shared prefix is kept over its branches when blocks have to be
+        evicted, even if it is the least recently used block."""
+        block_size = 2
+        allocator = PrefixCachingBlockAllocator(num_blocks=4,
+                                                block_size=block_size)
+        first_chain = TestPrefixCachingBlockAllocator.create_immutable_chain(
+            block_size=block_size,
+            token_ids=[0, 1, 2, 3],
+            allocator=allocator,
+        )
+        second_chain = TestPrefixCachingBlockAllocator.create_immutable_chain(
+            block_size=block_size,
+            token_ids=[0, 1, 4, 5],
+            allocator=allocator,
+        )
+        prefix, first_branch = first_chain
+        second_branch = second_chain[1]
+        assert second_chain[0].block_id == prefix.block_id
+        allocator.mark_blocks_as_accessed([prefix.block_id], 1)
+        allocator.mark_blocks_as_accessed(
+            [first_branch.block_id, second_branch.block_id], 2)
+        prefix_hash, prefix_block_id = prefix.content_hash, prefix.block_id
+        branch_hashes = [first_branch.content_hash, second_branch.content_hash]
+        for block in first_chain + second_chain:
+            allocator.free(block)
+
+        # The first allocation takes the free block, the second one evicts
+        # the least hit branch instead of the prefix.
+        allocator.allocate_mutable(prev_block=None)
+        allocator.allocate_mutable(prev_block=None)
+        assert prefix_hash in allocator._prefix_tree
+        assert branch_hashes[0] not in allocator._prefix_tree
+        assert branch_hashes[1] in allocator._prefix_tree
+        assert allocator.get_num_computed_prefix_blocks(
+            [prefix_hash, branch_hashes[1]]) == 2
+
+        dump = allocator.dump_prefix_tree().splitlines()
+        assert len(dump) == 2
+        assert dump[0].startswith(f"block {prefix_block_id} ")
+        assert dump[1].startswith("  block ")
+        assert "refs=0 computed=True" in dump[1]
+
     @staticmethod
     def create_immutable_chain(
         block_size: int,
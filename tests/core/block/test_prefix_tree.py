@@ -0,0 +1,81 @@
+from vllm.core.block.prefix_tree import PrefixTree
+
+
+def _build_tree() -> PrefixTree:
+    """Builds the tree 10 -> {11 -> 13, 12}, with the block id of each node
+    equal to its hash minus 10."""
+    tree = PrefixTree()
+    tree.insert(10, None, 0)
+    tree.insert(11, 10, 1)
+    tree.insert(12, 10, 2)
+    tree.insert(13, 11, 3)
+    return tree
+
+
+def test_match_longest_prefix():
+    tree = _build_tree()
+    assert [node.block_id for node in tree.match([10, 11, 13])] == [0, 1, 3]
+    assert [node.block_id for node in tree.match([10, 12, 13])] == [0, 2]
+    assert list(tree.match([11, 13])) == []
+
+    # The hashes are only consumed up to the first miss.
+    hashes = iter([10, 14, 15])
+    assert len(list(tree.match(hashes))) == 1
+    assert list(hashes) == [15]
+
+
+def test_remove_detaches_and_insert_adopts_children():
+    tree = _build_tree()
+    tree.remove(11)
+    assert 11 not in tree and 13 in tree
+    assert [node.block_id for node in tree.match([10, 11, 13])] == [0]
+    assert "detached:" in tree.dump()
+
+    # The block is cached again in another physical block.
+    tree.insert(11, 10, 5)
+    assert [node.block_id for node in tree.match([10, 11, 13])] == [0, 5, 3]
+    assert "detached:" not in tree.dump()
+
+    tree.remove(13)
+    tree.remove(11)
+    tree.remove(12)
+    tree.remove(10)
+    assert len(tree) == 0
+    assert tree.dump() == ""
+
+
+def test_insert_below_missing_parent():
+    tree = PrefixTree()
+    tree.insert(11, 10, 1)
+    assert list(tree.match([10, 11])) == []
+    tree.insert(10, None, 0)
+    assert [node.block_id for node in tree.match([10, 11])] == [0, 1]
+
+
+def test_find_leaf():
+    tree = _build_tree()
+    tree.get(11).num_hits = 2
+
+    def is_candidate(_) -> bool:
+        return True
+
+    # The least hit branch is followed down to a leaf.
+    assert tree.find_leaf(10, is_candidate).block_id == 2
+    tree.get(12).num_hits = 3
+    assert tree.find_leaf(10, is_candidate).block_id == 3
+    assert tree.find_leaf(12, is_candidate).block_id == 2
+
+    # Nodes which are not candidates, e.g. in use, are not descended into.
+    assert tree.find_leaf(10, lambda node: node.block_id == 2).block_id == 2
+    assert tree.find_leaf(10, lambda node: False).block_id == 0
+
+
+def test_dump():
+    tree = _build_tree()
+    tree.get(12).num_hits = 1
+    assert tree.dump(lambda node: f"id={node.block_id}").splitlines() == [
+        "block 0 hash=10 hits=0 id=0",
+        "  block 1 hash=11 hits=0 id=1",
+        "    block 3 hash=13 hits=0 id=3",
+        "  block 2 hash=12 hits=1 id=2",
+    ]
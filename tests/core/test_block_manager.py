@@ -220,6 +220,40 @@ def test_append_slot_single_seq():
     assert before_blocks - after_blocks == 1
 
 
+def test_append_slots_multiple_blocks():
+    block_size = 4
+    num_cpu_blocks = 4
+    num_gpu_blocks = 4
+    block_manager = BlockSpaceManagerV1(block_size,
+                                        num_cpu_blocks,
+                                        num_gpu_blocks,
+                                        watermark=0)
+
+    prompt, seq_group = create_dummy_prompt("1", block_size)
+    block_manager.allocate(seq_group)
+    prompt.status = SequenceStatus.RUNNING
+
+    # Add the tokens of two new blocks at once, e.g. fast-forwarded tokens.
+    for i in range(2 * block_size):
+        token_id = i + 5
+        prompt.append_token_id(token_id, {token_id: Logprob(0.0)})
+
+    assert block_manager.can_append_slots(seq_group)
+    assert block_manager.can_append_slots_batch([seq_group])
+    before_blocks = block_manager.get_num_free_gpu_blocks()
+    assert not block_manager.append_slots(prompt)
+    after_blocks = block_manager.get_num_free_gpu_blocks()
+    assert before_blocks - after_blocks == 2
+    assert len(block_manager.get_block_table(prompt)) == 3
+
+    # Only one block is left for the two new blocks of the next tokens.
+    for i in range(2 * block_size):
+        token_id = i + 5
+        prompt.append_token_id(token_id, {token_id: Logprob(0.0)})
+    assert not block_manager.can_append_slots(seq_group)
+    assert not block_manager.can_append_slots_batch([seq_group])
+
+
 def test_append_slot_cow():
     block_size = 4
     num_cpu_blocks = 4
@@ -344,6 +344,9 @@ def test_swap():
 
     # The last request should be swapped out.
     scheduler.block_manager.can_append_slots = MagicMock()
+    # Skip the batched check so that the mocked per-group check is used.
+    scheduler.block_manager.can_append_slots_batch = MagicMock(
+        return_value=False)
 
     def cannot_append_second_group(seq_group, num_lookahead_slots):
         return seq_group.request_id != "1"
@@ -395,6 +398,9 @@ def test_running_prefill_prioritized_over_swap():
 
     # The request should be swapped out.
     scheduler.block_manager.can_append_slots = MagicMock()
+    # Skip the batched check so that the mocked per-group check is used.
+    scheduler.block_manager.can_append_slots_batch = MagicMock(
+        return_value=False)
 
     def cannot_append_second_group(seq_group, num_lookahead_slots):
         return seq_group.request_id != "1"
@@ -482,6 +488,9 @@ def test_chunked_prefill_preempt():
 
     # The request should be preempted.
     scheduler.block_manager.can_append_slots = MagicMock()
+    # Skip the batched check so that the mocked per-group check is used.
+    scheduler.block_manager.can_append_slots_batch = MagicMock(
+        return_value=False)
 
     def cannot_append_second_group(seq_group, num_lookahead_slots):
         return seq_group.request_id != "1"
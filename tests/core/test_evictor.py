@@ -0,0 +1,107 @@
+import random
+from typing import Dict, Tuple
+
+import pytest
+
+from vllm.core.evictor_v2 import LRUEvictor
+
+
+class ReferenceLRUEvictor:
+    """Linear-scan evictor with the tie-breaking rules LRUEvictor must keep."""
+
+    def __init__(self):
+        self.free_table: Dict[int, Tuple[int, int, float]] = {}
+
+    def add(self, block_id: int, content_hash: int, num_hashed_tokens: int,
+            last_accessed: float):
+        self.free_table[block_id] = (content_hash, num_hashed_tokens,
+                                     last_accessed)
+
+    def update(self, block_id: int, last_accessed: float):
+        content_hash, num_hashed_tokens, _ = self.free_table[block_id]
+        self.free_table[block_id] = (content_hash, num_hashed_tokens,
+                                     last_accessed)
+
+    def remove(self, block_id: int):
+        self.free_table.pop(block_id)
+
+    def evict(self) -> Tuple[int, int]:
+        best_id = None
+        best = None
+        for block_id, (content_hash, num_hashed_tokens,
+                       last_accessed) in self.free_table.items():
+            if best is None or last_accessed < best[2] or (
+                    last_accessed == best[2] and num_hashed_tokens > best[1]):
+                best_id = block_id
+                best = (content_hash, num_hashed_tokens, last_accessed)
+        assert best_id is not None and best is not None
+        self.free_table.pop(best_id)
+        return best_id, best[0]
+
+
+def test_evict_empty():
+    evictor = LRUEvictor()
+    with pytest.raises(ValueError):
+        evictor.evict()
+
+
+def test_evict_order():
+    evictor = LRUEvictor()
+    evictor.add(0, 100, 16, last_accessed=2.0)
+    evictor.add(1, 101, 16, last_accessed=1.0)
+    evictor.add(2, 102, 32, last_accessed=1.0)
+    evictor.add(3, 103, 32, last_accessed=1.0)
+
+    # Oldest first, then the largest number of hashed tokens, then the block
+    # that was added first.
+    assert evictor.evict() == (2, 102)
+    assert evictor.evict() == (3, 103)
+    assert evictor.evict() == (1, 101)
+    assert evictor.evict() == (0, 100)
+    assert evictor.num_blocks == 0
+
+
+def test_update_and_remove_invalidate_entries():
+    evictor = LRUEvictor()
+    for block_id in range(4):
+        evictor.add(block_id, block_id, 16, last_accessed=float(block_id))
+
+    evictor.update(0, last_accessed=10.0)
+    evictor.remove(1)
+    assert 1 not in evictor
+    with pytest.raises(ValueError):
+        evictor.remove(1)
+
+    assert evictor.evict() == (2, 2)
+    assert evictor.evict() == (3, 3)
+    assert evictor.evict() == (0, 0)
+
+
+@pytest.mark.parametrize("seed", list(range(5)))
+def test_matches_linear_scan(seed: int):
+    random.seed(seed)
+    evictor = LRUEvictor()
+    reference = ReferenceLRUEvictor()
+    next_block_id = 0
+
+    for _ in range(5000):
+        op = random.random()
+        if op < 0.4 or not reference.free_table:
+            args = (next_block_id, random.randint(0, 1 << 30),
+                    random.choice([16, 32, 48]), float(random.randint(0, 50)))
+            evictor.add(*args)
+            reference.add(*args)
+            next_block_id += 1
+        elif op < 0.6:
+            block_id = random.choice(list(reference.free_table))
+            last_accessed = float(random.randint(0, 50))
+            evictor.update(block_id, last_accessed)
+            reference.update(block_id, last_accessed)
+        elif op < 0.7:
+            block_id = random.choice(list(reference.free_table))
+            evictor.remove(block_id)
+            reference.remove(block_id)
+        else:
+            expected = evictor.peek()
+            assert evictor.evict() == reference.evict() == expected
+        assert evictor.num_blocks == len(reference.free_table)
@@ -0,0 +1,201 @@
+import time
+from collections import deque
+
+import pytest
+
+from vllm.config import CacheConfig, SchedulerConfig
+from vllm.core.policy import PolicyFactory, PolicyQueue
+from vllm.core.scheduler import Scheduler
+from vllm.lora.request import LoRARequest
+
+from .utils import create_dummy_prompt
+
+
+def create_seq_group(request_id: str,
+                     prompt_length: int = 4,
+                     priority: int = 0,
+                     max_tokens: int = 16,
+                     lora_int_id: int = 0):
+    lora_request = None
+    if lora_int_id:
+        lora_request = LoRARequest(str(lora_int_id), lora_int_id, "/fake/path")
+    _, seq_group = create_dummy_prompt(request_id,
+                                       prompt_length=prompt_length,
+                                       lora_request=lora_request)
+    seq_group.sampling_params.priority = priority
+    seq_group.sampling_params.max_tokens = max_tokens
+    return seq_group
+
+
+def request_ids(seq_groups):
+    return [seq_group.request_id for seq_group in seq_groups]
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        PolicyFactory.get_policy(policy_name="unknown")
+
+
+def test_fcfs():
+    policy = PolicyFactory.get_policy(policy_name="fcfs")
+    seq_groups = [create_seq_group(str(i)) for i in range(3)]
+    seq_groups[1].metrics.arrival_time -= 10
+    sorted_groups = policy.sort_by_priority(time.time(), deque(seq_groups))
+    assert request_ids(sorted_groups) == ["1", "0", "2"]
+    # Arrival order does not change, so FCFS queues are kept in order too.
+    assert isinstance(sorted_groups, PolicyQueue)
+
+
+def test_priority():
+    policy = PolicyFactory.get_policy(policy_name="priority")
+    seq_groups = deque(
+        create_seq_group(str(i), priority=priority)
+        for i, priority in enumerate([2, 0, 1, 0]))
+    sorted_groups = policy.sort_by_priority(time.time(), seq_groups)
+    assert request_ids(sorted_groups) == ["1", "3", "2", "0"]
+    # The input is not modified.
+    assert request_ids(seq_groups) == ["0", "1", "2", "3"]
+
+    # Sorting an ordered queue keeps it as is.
+    assert request_ids(policy.sort_by_priority(
+        time.time(), sorted_groups)) == ["1", "3", "2", "0"]
+
+
+def test_shortest_job_first():
+    policy = PolicyFactory.get_policy(policy_name="sjf")
+    seq_groups = deque([
+        create_seq_group("0", prompt_length=8, max_tokens=100),
+        create_seq_group("1", prompt_length=64, max_tokens=1),
+        create_seq_group("2", prompt_length=8, max_tokens=10),
+    ])
+    sorted_groups = policy.sort_by_priority(time.time(), seq_groups)
+    assert request_ids(sorted_groups) == ["2", "1", "0"]
+
+
+def test_shortest_job_first_aging():
+    policy = PolicyFactory.get_policy(policy_name="sjf")
+    long_job = create_seq_group("0", prompt_length=8, max_tokens=1000)
+    short_job = create_seq_group("1", prompt_length=8, max_tokens=10)
+    # The long job has waited long enough to go first.
+    long_job.metrics.arrival_time -= 60
+    sorted_groups = policy.sort_by_priority(time.time(),
+                                            deque([short_job, long_job]))
+    assert request_ids(sorted_groups) == ["0", "1"]
+
+    policy = PolicyFactory.get_policy(policy_name="sjf", aging_rate=0.0)
+    long_job.scheduling_sort_key = None
+    short_job.scheduling_sort_key = None
+    sorted_groups = policy.sort_by_priority(time.time(),
+                                            deque([short_job, long_job]))
+    assert request_ids(sorted_groups) == ["1", "0"]
+
+
+def test_weighted_fair_queueing():
+    policy = PolicyFactory.get_policy(policy_name="fair")
+    # Flow 1 submits a burst of requests before flow 2 submits any.
+    seq_groups = deque(
+        [create_seq_group(f"{i}", lora_int_id=1) for i in range(4)] +
+        [create_seq_group(f"{i}", lora_int_id=2) for i in range(4, 6)])
+    for seq_group in seq_groups:
+        policy.on_added(seq_group)
+    sorted_groups = policy.sort_by_priority(time.time(), seq_groups)
+    # The flows are interleaved instead of served in arrival order.
+    assert request_ids(sorted_groups) == ["0", "4", "1", "5", "2", "3"]
+    # The keys do not change the state of the policy.
+    assert policy.get_sort_key(seq_groups[0]) == policy.get_sort_key(
+        seq_groups[0])
+
+
+def test_weighted_fair_queueing_weights():
+    # Flow 2 has three times the weight of flow 1, so it is served three
+    # times as often.
+    scheduler_config = SchedulerConfig(100,
+                                       2,
+                                       16,
+                                       policy="fair",
+                                       fair_queueing_weights={"2": 3.0})
+    cache_config = CacheConfig(4, 1.0, 1, cache_dtype="auto")
+    cache_config.num_cpu_blocks = 8
+    cache_config.num_gpu_blocks = 8
+    scheduler = Scheduler(scheduler_config, cache_config, None)
+    assert scheduler.policy.weights == {2: 3.0}
+
+    policy = scheduler.policy
+    seq_groups = deque(
+        [create_seq_group(f"{i}", lora_int_id=1) for i in range(2)] +
+        [create_seq_group(f"{i}", lora_int_id=2) for i in range(2, 6)])
+    for seq_group in seq_groups:
+        policy.on_added(seq_group)
+    sorted_groups = policy.sort_by_priority(time.time(), seq_groups)
+    assert request_ids(sorted_groups) == ["0", "2", "3", "4", "1", "5"]
+
+
+def test_policy_kwargs_from_config():
+    scheduler_config = SchedulerConfig(100,
+                                       2,
+                                       16,
+                                       policy="sjf",
+                                       sjf_aging_rate=0.5)
+    cache_config = CacheConfig(4, 1.0, 1, cache_dtype="auto")
+    cache_config.num_cpu_blocks = 8
+    cache_config.num_gpu_blocks = 8
+    scheduler = Scheduler(scheduler_config, cache_config, None)
+    assert scheduler.policy.aging_rate == 0.5
+
+
+def test_policy_queue():
+    policy = PolicyFactory.get_policy(policy_name="priority")
+    seq_groups = [
+        create_seq_group(str(i), priority=priority)
+        for i, priority in enumerate([2, 0, 1, 0, 3])
+    ]
+    queue = policy.create_queue(seq_groups[:3])
+    assert isinstance(queue, PolicyQueue)
+    # Appending to either end inserts by key.
+    queue.appendleft(seq_groups[4])
+    queue.append(seq_groups[3])
+    assert request_ids(queue) == ["1", "3", "2", "0", "4"]
+    assert queue[0] is seq_groups[1]
+    assert queue[-1] is seq_groups[4]
+
+    copy = queue.copy()
+    queue.remove(seq_groups[3])
+    assert queue.pop() is seq_groups[4]
+    del queue[1]
+    assert len(queue) == 2
+    assert request_ids(queue) == ["1", "0"]
+    assert queue.popleft() is seq_groups[1]
+    assert queue.popleft() is seq_groups[0]
+    assert not queue
+    with pytest.raises(IndexError):
+        queue.popleft()
+    # The copy is not affected.
+    assert request_ids(copy) == ["1", "3", "2", "0", "4"]
+
+    # A removed group can be queued again.
+    copy.remove(seq_groups[2])
+    copy.append(seq_groups[2])
+    assert [copy.popleft().request_id
+            for _ in range(len(copy))] == ["1", "3", "2", "0", "4"]
+
+
+def test_scheduler_admits_by_priority():
+    block_size = 4
+    scheduler_config = SchedulerConfig(100, 2, 16, policy="priority")
+    cache_config = CacheConfig(block_size, 1.0, 1, cache_dtype="auto")
+    cache_config.num_cpu_blocks = 8
+    cache_config.num_gpu_blocks = 8
+    scheduler = Scheduler(scheduler_config, cache_config, None)
+
+    for i, priority in enumerate([3, 2, 1, 0]):
+        scheduler.add_seq_group(
+            create_seq_group(str(i),
+                             prompt_length=block_size,
+                             priority=priority))
+
+    # Only two sequences fit, the ones with the lowest priority values are
+    # admitted first.
+    _, out = scheduler.schedule()
+    assert request_ids(s.seq_group
+                       for s in out.scheduled_seq_groups) == ["3", "2"]
+    assert request_ids(scheduler.waiting) == ["1", "0"]
@@ -0,0 +1,23 @@
+import math
+
+from vllm.core.preemption import PreemptionCostModel
+
+
+def test_preemption_costs():
+    cost_model = PreemptionCostModel(flops_per_token=2,
+                                     attention_flops_per_token_pair=4,
+                                     flops_per_second=10,
+                                     kv_cache_bytes_per_token=8,
+                                     swap_bytes_per_second=16)
+    # 3 tokens attend to 1 + 2 + 3 tokens.
+    assert cost_model.get_prefill_flops(3) == 3 * 2 + 6 * 4
+    assert cost_model.get_recompute_time(3) == 3.0
+    # The cache is copied out and back in.
+    assert cost_model.get_swap_time(3) == 3.0
+
+    # The recompute time grows quadratically with the context length.
+    assert (cost_model.get_recompute_time(1000) >
+            10 * cost_model.get_swap_time(1000))
+
+    cost_model.swap_bytes_per_second = 0
+    assert math.isinf(cost_model.get_swap_time(3))
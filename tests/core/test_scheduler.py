@@ -8,9 +8,11 @@ import pytest  # noqa
 from vllm.config import CacheConfig, LoRAConfig, SchedulerConfig
 from vllm.core.interfaces import AllocStatus
 from vllm.core.policy import PolicyFactory
+from vllm.core.preemption import PreemptionCostModel
 from vllm.core.scheduler import Scheduler, SchedulingBudget
 from vllm.lora.request import LoRARequest
-from vllm.sequence import Logprob, SequenceGroup, SequenceStatus
+from vllm.sampling_params import SamplingParams
+from vllm.sequence import Logprob, Sequence, SequenceGroup, SequenceStatus
 
 from .utils import create_dummy_prompt
 
@@ -284,6 +286,9 @@ def test_swapped_out_prioritized():
 
     # The last request should be swapped out.
     scheduler.block_manager.can_append_slots = MagicMock()
+    # Skip the batched check so that the mocked per-group check is used.
+    scheduler.block_manager.can_append_slots_batch = MagicMock(
+        return_value=False)
 
     def cannot_append_second_group(seq_group, num_lookahead_slots):
         return seq_group.request_id != "2"
@@ -545,6 +550,9 @@ def test_decode_schedule_preempted():
         append_new_token_seq_group(60, seq_group, 1)
         running.append(seq_group)
     scheduler.block_manager.can_append_slots = MagicMock()
+    # Skip the batched check so that the mocked per-group check is used.
+    scheduler.block_manager.can_append_slots_batch = MagicMock(
+        return_value=False)
 
     def cannot_append_second_group(seq_group, num_lookahead_slots):
         return seq_group.request_id != "1"
@@ -593,6 +601,9 @@ def test_decode_swap_beam_search():
 
     # The last request should be swapped out.
     scheduler.block_manager.can_append_slots = MagicMock()
+    # Skip the batched check so that the mocked per-group check is used.
+    scheduler.block_manager.can_append_slots_batch = MagicMock(
+        return_value=False)
 
     def cannot_append_second_group(seq_group, num_lookahead_slots):
         return seq_group.request_id != "2"
@@ -899,3 +910,259 @@ def test_scheduling_budget():
     assert budget.num_curr_seqs == 0
     budget.subtract_num_seqs(seq_group.request_id, 2)
     assert budget.num_curr_seqs == 0
+
+
+def _create_prompt(request_id: str, token_ids: List[int],
+                   block_size: int) -> SequenceGroup:
+    seq = Sequence(int(request_id),
+                   inputs={
+                       "prompt": None,
+                       "prompt_token_ids": token_ids,
+                   },
+                   block_size=block_size)
+    return SequenceGroup(request_id=request_id,
+                         seqs=[seq],
+                         arrival_time=time.time(),
+                         sampling_params=SamplingParams())
+
+
+def _create_prefix_caching_scheduler(
+        prefix_aware_admission: bool,
+        use_v2_block_manager: bool,
+        max_admission_skips: int = 8) -> Scheduler:
+    block_size = 4
+    # The token budget only fits one of the 12-token prompts per step.
+    scheduler_config = SchedulerConfig(
+        16,
+        16,
+        16,
+        use_v2_block_manager=use_v2_block_manager,
+        prefix_aware_admission=prefix_aware_admission,
+        max_admission_skips=max_admission_skips)
+    cache_config = CacheConfig(block_size,
+                               1.0,
+                               1,
+                               "auto",
+                               enable_prefix_caching=True)
+    cache_config.num_cpu_blocks = 16
+    cache_config.num_gpu_blocks = 16
+    return Scheduler(scheduler_config, cache_config, None)
+
+
+def _warm_up_prefix(scheduler: Scheduler, token_ids: List[int]) -> None:
+    """Runs a request with the given prompt and frees its blocks, which stay
+    in the prefix cache."""
+    scheduler.add_seq_group(_create_prompt("100", token_ids, 4))
+    _, out = schedule_and_update_computed_tokens(scheduler)
+    assert len(out.scheduled_seq_groups) == 1
+    scheduler.abort_seq_group("100")
+
+
+@pytest.mark.parametrize("use_v2_block_manager", [False, True])
+@pytest.mark.parametrize("prefix_aware_admission", [False, True])
+def test_prefix_aware_admission(prefix_aware_admission: bool,
+                                use_v2_block_manager: bool):
+    scheduler = _create_prefix_caching_scheduler(prefix_aware_admission,
+                                                 use_v2_block_manager)
+    cached_prompt = list(range(12))
+    _warm_up_prefix(scheduler, cached_prompt)
+
+    scheduler.add_seq_group(_create_prompt("0", list(range(100, 112)), 4))
+    scheduler.add_seq_group(_create_prompt("1", cached_prompt, 4))
+
+    _, out = schedule_and_update_computed_tokens(scheduler)
+    expected = "1" if prefix_aware_admission else "0"
+    assert [s.request_id for s in get_sequence_groups(out)] == [expected]
+    # The waiting queue stays in arrival order.
+    assert [s.request_id
+            for s in scheduler.waiting] == [str(1 - int(expected))]
+    if prefix_aware_admission:
+        assert scheduler.waiting[0].num_admission_skips == 1
+
+    # The warm-up request and the admitted one.
+    assert scheduler.num_admitted_prompt_tokens == 2 * 12
+    num_cached = 12 if prefix_aware_admission else 0
+    assert scheduler.num_cached_prompt_tokens == num_cached
+
+
+def test_prefix_aware_admission_bounds_skips():
+    scheduler = _create_prefix_caching_scheduler(True,
+                                                 True,
+                                                 max_admission_skips=1)
+    cached_prompt = list(range(12))
+    _warm_up_prefix(scheduler, cached_prompt)
+
+    scheduler.add_seq_group(_create_prompt("0", list(range(100, 112)), 4))
+    for i in range(1, 3):
+        scheduler.add_seq_group(_create_prompt(str(i), cached_prompt, 4))
+
+    # Request 0 is passed over once, and admitted next although request 2
+    # would hit the prefix cache.
+    _, out = schedule_and_update_computed_tokens(scheduler)
+    assert [s.request_id for s in get_sequence_groups(out)] == ["1"]
+    _, out = schedule_and_update_computed_tokens(scheduler)
+    assert [s.request_id for s in get_sequence_groups(out)] == ["0"]
+
+
+def _create_preemption_cost_model(
+        swap_bytes_per_second: float) -> PreemptionCostModel:
+    # Recomputing n tokens costs n + n * (n + 1) / 2 seconds, and swapping
+    # them 2 * n / swap_bytes_per_second seconds.
+    return PreemptionCostModel(flops_per_token=1,
+                               attention_flops_per_token_pair=1,
+                               flops_per_second=1,
+                               kv_cache_bytes_per_token=1,
+                               swap_bytes_per_second=swap_bytes_per_second)
+
+
+def _schedule_running_with_preemption(scheduler, prompt_lengths):
+    """Runs decodes for prompts of the given lengths. The first group cannot
+    append a slot until another group is preempted."""
+    running = deque()
+    for i, prompt_length in enumerate(prompt_lengths):
+        _, seq_group = create_dummy_prompt(str(i), prompt_length=prompt_length)
+        scheduler._allocate_and_set_running(seq_group)
+        append_new_token_seq_group(prompt_length, seq_group, 1)
+        running.append(seq_group)
+    scheduler.block_manager.can_append_slots_batch = MagicMock(
+        return_value=False)
+
+    def can_append_after_preemption(seq_group, num_lookahead_slots):
+        return (seq_group.request_id != "0"
+                or scheduler.num_cumulative_preemption > 0)
+
+    scheduler.block_manager.can_append_slots = MagicMock(
+        side_effect=can_append_after_preemption)
+    policy = PolicyFactory.get_policy(policy_name="fcfs")
+    return scheduler._schedule_running(running, create_token_budget(), None,
+                                       policy)
+
+
+@pytest.mark.parametrize("can_swap_out", [True, False])
+def test_preemption_mode_by_cost(can_swap_out: bool):
+    scheduler = initialize_scheduler()
+    scheduler.preemption_cost_model = _create_preemption_cost_model(1e6)
+    scheduler.block_manager.can_swap_out = MagicMock(return_value=can_swap_out)
+    scheduler.block_manager.swap_out = MagicMock(return_value=[(5, 7)])
+
+    _, output = _schedule_running_with_preemption(scheduler, [60, 60])
+    # Swapping the long context is cheaper than recomputing it, when the
+    # CPU has room for it.
+    if can_swap_out:
+        assert [s.request_id for s in output.swapped_out] == ["1"]
+        assert output.blocks_to_swap_out == [(5, 7)]
+        expected_stats = {("swap", "cost"): 1}
+    else:
+        assert [s.request_id for s in output.preempted] == ["1"]
+        expected_stats = {("recompute", "no_swap_space"): 1}
+    assert scheduler.get_and_reset_preemption_stats() == expected_stats
+    assert scheduler.get_and_reset_preemption_stats() == {}
+
+
+def test_preemption_victim_by_cost():
+    scheduler = initialize_scheduler()
+    scheduler.preemption_cost_model = _create_preemption_cost_model(1e-3)
+
+    # Recomputing the short group wastes the least work per freed token, so
+    # it is preempted instead of the long group at the back of the queue.
+    remaining, output = _schedule_running_with_preemption(
+        scheduler, [10, 20, 60])
+    assert len(remaining) == 0
+    assert [s.request_id for s in output.preempted] == ["1"]
+    assert [s.seq_group.request_id
+            for s in output.decode_seq_groups] == ["0", "2"]
+    assert scheduler.get_and_reset_preemption_stats() == {
+        ("recompute", "cost"): 1
+    }
+
+    # Without a cost model, the back of the queue is preempted.
+    scheduler = initialize_scheduler()
+    _, output = _schedule_running_with_preemption(scheduler, [10, 20, 60])
+    assert [s.request_id for s in output.preempted] == ["2"]
+    assert scheduler.get_and_reset_preemption_stats() == {
+        ("recompute", "default"): 1
+    }
+
+
+def test_pipelined_step_reserves_pending_slot():
+    """With the pipelined step, the decodes are scheduled before the token of
+    the previous step is appended, with a slot for that token."""
+    block_size = 4
+    scheduler_config = SchedulerConfig(64,
+                                       64,
+                                       64,
+                                       use_v2_block_manager=True,
+                                       pipelined_step=True)
+    cache_config = CacheConfig(block_size, 1.0, 1, "auto")
+    cache_config.num_cpu_blocks = 8
+    cache_config.num_gpu_blocks = 8
+    scheduler = Scheduler(scheduler_config, cache_config, None)
+    seq, seq_group = create_dummy_prompt("0", block_size)
+    scheduler.add_seq_group(seq_group)
+
+    metas, _ = scheduler.schedule()
+    assert metas[0].is_prompt
+    seq.data.set_prefill_in_flight()
+    num_computed_tokens = block_size
+    for token_id in range(2 * block_size):
+        # Scheduled while the previous step runs.
+        metas, _ = scheduler.schedule()
+        assert not metas[0].is_prompt
+        num_slots = len(metas[0].block_tables[seq.seq_id]) * block_size
+        assert num_slots >= seq.get_len() + 1
+        # The previous step completes.
+        seq_group.update_num_computed_tokens(num_computed_tokens)
+        num_computed_tokens = 1
+        seq.append_token_id(token_id, {token_id: Logprob(0.0)})
+
+
+def test_pipelined_step_requires_v2_block_manager():
+    with pytest.raises(ValueError):
+        SchedulerConfig(64, 64, 64, pipelined_step=True)
+
+
+@pytest.mark.parametrize("num_scheduler_steps", [2, 4])
+def test_multi_step_reserves_lookahead_slots(num_scheduler_steps: int):
+    """With multi-step decoding, the decodes are scheduled with a slot for
+    each of the tokens of the steps but the last, while the prefills are
+    not."""
+    block_size = 4
+    scheduler_config = SchedulerConfig(64,
+                                       64,
+                                       64,
+                                       use_v2_block_manager=True,
+                                       num_scheduler_steps=num_scheduler_steps)
+    cache_config = CacheConfig(block_size, 1.0, 1, "auto")
+    cache_config.num_cpu_blocks = 16
+    cache_config.num_gpu_blocks = 16
+    scheduler = Scheduler(scheduler_config, cache_config, None)
+    seq, seq_group = create_dummy_prompt("0", block_size)
+    scheduler.add_seq_group(seq_group)
+
+    metas, out = scheduler.schedule()
+    assert metas[0].is_prompt
+    assert out.num_lookahead_slots == 0
+    seq_group.update_num_computed_tokens(block_size)
+    seq.append_token_id(0, {0: Logprob(0.0)})
+    for _ in range(3):
+        metas, out = scheduler.schedule()
+        assert not metas[0].is_prompt
+        assert out.num_lookahead_slots == num_scheduler_steps - 1
+        num_slots = len(metas[0].block_tables[seq.seq_id]) * block_size
+        assert num_slots >= seq.get_len() + num_scheduler_steps - 1
+        # The steps complete.
+        seq_group.update_num_computed_tokens(1)
+        for token_id in range(num_scheduler_steps):
+            seq.append_token_id(token_id, {token_id: Logprob(0.0)})
+
+
+def test_multi_step_requires_v2_block_manager():
+    with pytest.raises(ValueError):
+        SchedulerConfig(64, 64, 64, num_scheduler_steps=2)
+    with pytest.raises(ValueError):
+        SchedulerConfig(64,
+                        64,
+                        64,
+                        use_v2_block_manager=True,
+                        num_scheduler_steps=2,
+                        pipelined_step=True)
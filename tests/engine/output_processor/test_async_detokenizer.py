@@ -0,0 +1,82 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from vllm.engine.output_processor.async_detokenizer import AsyncDetokenizer
+from vllm.sampling_params import SamplingParams
+from vllm.sequence import Logprob, Sequence, SequenceGroup, SequenceStatus
+
+
+def _create_seq_group(request_id: str, text: str,
+                      sampling_params: SamplingParams) -> SequenceGroup:
+    seq = Sequence(seq_id=int(request_id),
+                   inputs={"prompt_token_ids": [1, 2]},
+                   block_size=16,
+                   eos_token_id=0)
+    seq.output_text = text
+    seq.append_token_id(token_id=3, logprobs={3: Logprob(0.0)})
+    seq.status = SequenceStatus.RUNNING
+    return SequenceGroup(request_id=request_id,
+                         seqs=[seq],
+                         arrival_time=0.0,
+                         sampling_params=sampling_params)
+
+
+def _create_detokenizer(new_text: str) -> MagicMock:
+    """Returns a detokenizer decoding every new token to `new_text`."""
+
+    def decode_sequences_inplace(seqs):
+        for seq, _ in seqs:
+            seq.output_text += new_text
+        return [len(new_text)] * len(seqs)
+
+    detokenizer = MagicMock()
+    detokenizer.decode_sequences_inplace.side_effect = (
+        decode_sequences_inplace)
+    return detokenizer
+
+
+def test_stop_strings_are_reported():
+    async_detokenizer = AsyncDetokenizer(_create_detokenizer("ld!"))
+    stopped = _create_seq_group("0", "hello wor",
+                                SamplingParams(stop=["world"]))
+    running = _create_seq_group("1", "hello", SamplingParams(stop=["world"]))
+    # Stopped on the EOS token before detokenization.
+    finished = _create_seq_group("2", "bye", SamplingParams())
+    finished.get_seqs()[0].status = SequenceStatus.FINISHED_STOPPED
+
+    assert not async_detokenizer.has_pending_batches()
+    for seq_group in [stopped, running, finished]:
+        async_detokenizer.add(seq_group, seq_group.get_seqs()[0])
+    async_detokenizer.submit()
+    assert async_detokenizer.has_pending_batches()
+
+    (stopped_seq, ) = stopped.get_seqs()
+    assert async_detokenizer.collect() == [(stopped, stopped_seq, "world")]
+    assert not async_detokenizer.has_pending_batches()
+    # The status is left to the engine.
+    assert stopped_seq.status == SequenceStatus.RUNNING
+    assert stopped_seq.output_text == "hello "
+    assert running.get_seqs()[0].output_text == "hellold!"
+    # The text of the EOS token is removed.
+    assert finished.get_seqs()[0].output_text == "bye"
+    async_detokenizer.shutdown()
+
+
+def test_errors_are_raised_by_collect():
+    detokenizer = MagicMock()
+    detokenizer.decode_sequences_inplace.side_effect = ValueError("boom")
+    async_detokenizer = AsyncDetokenizer(detokenizer)
+    seq_group = _create_seq_group("0", "", SamplingParams())
+    async_detokenizer.add(seq_group, seq_group.get_seqs()[0])
+    async_detokenizer.submit()
+    with pytest.raises(ValueError, match="boom"):
+        async_detokenizer.collect()
+
+    # The thread keeps serving the next batches.
+    detokenizer.decode_sequences_inplace.side_effect = None
+    detokenizer.decode_sequences_inplace.return_value = [0]
+    async_detokenizer.add(seq_group, seq_group.get_seqs()[0])
+    async_detokenizer.submit()
+    assert async_detokenizer.collect() == []
+    async_detokenizer.shutdown()
@@ -0,0 +1,113 @@
+from typing import List, Sequence
+from unittest.mock import MagicMock
+
+import pytest
+
+from vllm.config import SchedulerConfig
+from vllm.core.scheduler import Scheduler
+from vllm.engine.output_processor.single_step import SingleStepOutputProcessor
+from vllm.engine.output_processor.stop_checker import StopChecker
+from vllm.sampling_params import BatchedLogitsProcessor, SamplingParams
+from vllm.sequence import (CompletionSequenceGroupOutput, Logprob,
+                           SequenceOutput, SequenceStage, SequenceStatus)
+from vllm.utils import Counter
+
+from ...core.utils import create_seq_group
+
+
+class _ForcingLogitsProcessor(BatchedLogitsProcessor):
+    """Forces the given tokens after any output."""
+
+    def __init__(self, forced_token_ids: List[int]):
+        self.forced_token_ids = forced_token_ids
+
+    def get_forced_token_ids(self, seq_id: int,
+                             output_token_ids: Sequence[int],
+                             max_num_tokens: int) -> List[int]:
+        return self.forced_token_ids[:max_num_tokens]
+
+
+def _create_output_processor(
+        fast_forward: bool = True) -> SingleStepOutputProcessor:
+    scheduler_config = MagicMock(spec=SchedulerConfig)
+    scheduler_config.max_model_len = 4096
+    return SingleStepOutputProcessor(
+        scheduler_config,
+        detokenizer=None,
+        scheduler=MagicMock(spec=Scheduler),
+        seq_counter=Counter(),
+        stop_checker=StopChecker(scheduler_config.max_model_len,
+                                 lambda _: MagicMock()),
+        guided_decoding_fast_forward=fast_forward,
+    )
+
+
+def _process_token(output_processor: SingleStepOutputProcessor,
+                   sampling_params: SamplingParams, token_id: int):
+    seq_group = create_seq_group(seq_prompt_len=8,
+                                 seq_output_lens=[4],
+                                 sampling_params=sampling_params)
+    seq = seq_group.get_seqs()[0]
+    seq.status = SequenceStatus.RUNNING
+    seq_group.update_num_computed_tokens(seq.get_len())
+    output_processor.process_outputs(seq_group, [
+        CompletionSequenceGroupOutput(
+            samples=[
+                SequenceOutput(parent_seq_id=seq.seq_id,
+                               output_token=token_id,
+                               logprobs={token_id: Logprob(-1.0)})
+            ],
+            prompt_logprobs=None,
+        )
+    ])
+    return seq
+
+
+@pytest.mark.parametrize("fast_forward", [True, False])
+def test_appends_forced_token_ids(fast_forward: bool):
+    sampling_params = SamplingParams(
+        max_tokens=64,
+        detokenize=False,
+        ignore_eos=True,
+        logits_processors=[_ForcingLogitsProcessor([10, 11, 12])])
+    seq = _process_token(_create_output_processor(fast_forward),
+                         sampling_params, 100)
+
+    if not fast_forward:
+        assert seq.get_output_token_ids().tolist()[-1] == 100
+        assert seq.data.stage == SequenceStage.DECODE
+        return
+    assert seq.get_output_token_ids().tolist()[-4:] == [100, 10, 11, 12]
+    assert seq.output_logprobs[-1] == {12: Logprob(0.0)}
+    # The new token and the forced ones are computed as a prefill chunk.
+    assert seq.data.stage == SequenceStage.PREFILL
+    assert seq.data.get_num_uncomputed_tokens() == 4
+
+
+def test_forced_token_ids_respect_max_tokens():
+    sampling_params = SamplingParams(
+        max_tokens=6,
+        detokenize=False,
+        ignore_eos=True,
+        logits_processors=[_ForcingLogitsProcessor([10, 11, 12])])
+    seq = _process_token(_create_output_processor(), sampling_params, 100)
+
+    assert seq.get_output_token_ids().tolist()[-2:] == [100, 10]
+    assert seq.status == SequenceStatus.FINISHED_LENGTH_CAPPED
+
+
+@pytest.mark.parametrize("token_id, output_token_ids", [
+    (100, [100, 10, 11]),
+    (11, [11]),
+])
+def test_forced_token_ids_stop_on_stop_token(token_id: int,
+                                             output_token_ids: List[int]):
+    sampling_params = SamplingParams(
+        max_tokens=64,
+        detokenize=False,
+        stop_token_ids=[11],
+        logits_processors=[_ForcingLogitsProcessor([10, 11, 12])])
+    seq = _process_token(_create_output_processor(), sampling_params, token_id)
+
+    assert seq.get_output_token_ids().tolist()[4:] == output_token_ids
+    assert seq.status == SequenceStatus.FINISHED_STOPPED
@@ -1,3 +1,4 @@
+import random
 from unittest.mock import MagicMock
 
 import pytest
@@ -83,3 +84,91 @@ def test_stop_on_eos_token(text_wo_eos: str, eos_token: str, eos_token_id: int,
     else:
         assert seq.status == SequenceStatus.FINISHED_STOPPED
         assert seq.output_text == text_wo_eos
+
+
+def _create_stop_checker() -> StopChecker:
+    tokenizer = MagicMock(spec=PreTrainedTokenizer)
+    return StopChecker(max_model_len=1024,
+                       get_tokenizer_for_seq=MagicMock(return_value=tokenizer))
+
+
+def _create_sequence() -> Sequence:
+    seq = Sequence(seq_id=0,
+                   inputs={"prompt_token_ids": [1, 2]},
+                   block_size=16)
+    seq.status = SequenceStatus.RUNNING
+    return seq
+
+
+@pytest.mark.parametrize("min_tokens", [0, 3])
+@pytest.mark.parametrize("include_stop_str_in_output", [True, False])
+@pytest.mark.skip_global_cleanup
+def test_stop_strings_match_find(min_tokens: int,
+                                 include_stop_str_in_output: bool):
+    """The stop strings matched step by step are the ones searched with
+    `str.find` in the window of the new text."""
+    stop_checker = _create_stop_checker()
+    rng = random.Random(0)
+    for _ in range(200):
+        stop = [
+            "".join(rng.choices("ab#", k=rng.randint(1, 4)))
+            for _ in range(rng.randint(1, 20))
+        ]
+        sampling_params = SamplingParams(
+            stop=stop,
+            min_tokens=min_tokens,
+            include_stop_str_in_output=include_stop_str_in_output)
+        seq = _create_sequence()
+        for _ in range(10):
+            new_text = "".join(rng.choices("ab#", k=rng.randint(0, 3)))
+            seq.append_token_id(3, {3: Logprob(0.0)})
+            seq.output_text += new_text
+
+            expected_text = seq.output_text
+            expected_stop_str = None
+            if new_text and seq.get_output_len() >= min_tokens:
+                for stop_str in stop:
+                    stop_index = expected_text.find(
+                        stop_str, -len(new_text) - len(stop_str))
+                    if stop_index != -1:
+                        expected_stop_str = stop_str
+                        if include_stop_str_in_output:
+                            stop_index += len(stop_str)
+                        expected_text = expected_text[:stop_index]
+                        break
+
+            stop_checker.maybe_stop_sequence(seq, len(new_text),
+                                             sampling_params)
+            assert seq.output_text == expected_text
+            if expected_stop_str is not None:
+                assert seq.status == SequenceStatus.FINISHED_STOPPED
+                assert seq.stop_reason == expected_stop_str
+                break
+            assert seq.status == SequenceStatus.RUNNING
+
+
+@pytest.mark.parametrize("before_detokenization", [True, False])
+@pytest.mark.skip_global_cleanup
+def test_stop_on_token_sequence(before_detokenization: bool):
+    stop_checker = _create_stop_checker()
+    sampling_params = SamplingParams(stop_token_sequences=[[5, 6, 7], [7, 7]],
+                                     min_tokens=4)
+    seq = _create_sequence()
+    for token_id in [5, 6, 7, 5, 6, 7]:
+        seq.append_token_id(token_id, {token_id: Logprob(0.0)})
+        seq.output_text += "x"
+        # The first match is before min_tokens.
+        if before_detokenization:
+            stop_checker.maybe_stop_sequence_before_detokenization(
+                seq, sampling_params)
+            assert StopChecker.check_detokenized_sequence(
+                seq, 1, sampling_params) is None
+        else:
+            stop_checker.maybe_stop_sequence(seq, 1, sampling_params)
+        if seq.is_finished():
+            break
+    assert seq.get_output_token_ids() == [5, 6, 7, 5, 6, 7]
+    assert seq.status == SequenceStatus.FINISHED_STOPPED
+    assert seq.stop_reason == [5, 6, 7]
+    # The text of the stop sequence is kept.
+    assert seq.output_text == "xxxxxx"
@@ -0,0 +1,61 @@
+import random
+
+import pytest
+
+from vllm.engine.output_processor.stop_matcher import (StopMatcher,
+                                                       get_stop_matcher)
+
+
+def test_first_pattern_wins():
+    matcher = StopMatcher(["abc", "bc", "c"])
+    # "c" ends first, but "abc" has the priority.
+    assert matcher.feed(0, "xabcx")[1:] == (0, 3)
+    assert matcher.feed(0, "xbcx")[1:] == (1, 2)
+    # The first occurrence of the winning pattern.
+    assert matcher.feed(0, "cbcbc")[1:] == (1, 2)
+    assert matcher.feed(0, "xyz")[1:] == (None, -1)
+
+
+def test_feed_incrementally():
+    matcher = StopMatcher(["</answer>", "###"])
+    state = 0
+    for chunk in ["The answer</an", "sw", "er"]:
+        state, match_index, _ = matcher.feed(state, chunk)
+        assert match_index is None
+    state, match_index, match_end = matcher.feed(state, ">!")
+    assert (match_index, match_end) == (0, 0)
+
+
+def test_token_id_patterns():
+    matcher = get_stop_matcher(((1, 2, 3), (2, 2)))
+    assert get_stop_matcher(((1, 2, 3), (2, 2))) is matcher
+    state = 0
+    for token_id in [1, 2]:
+        state, match_index, _ = matcher.feed(state, [token_id])
+        assert match_index is None
+    assert matcher.feed(state, [3])[1] == 0
+    assert matcher.feed(state, [2])[1] == 1
+
+
+def test_empty_patterns():
+    with pytest.raises(ValueError):
+        StopMatcher(["a", ""])
+    with pytest.raises(ValueError):
+        StopMatcher([])
+
+
+def test_matches_find():
+    """The first pattern found and its first occurrence are the ones found
+    with `str.find`."""
+    rng = random.Random(0)
+    for _ in range(1000):
+        patterns = [
+            "".join(rng.choices("ab\n", k=rng.randint(1, 4)))
+            for _ in range(rng.randint(1, 8))
+        ]
+        text = "".join(rng.choices("ab\n", k=12))
+        expected = next(
+            ((i, text.find(pattern) + len(pattern) - 1)
+             for i, pattern in enumerate(patterns) if pattern in text),
+            (None, -1))
+        assert StopMatcher(patterns).feed(0, text)[1:] == expected
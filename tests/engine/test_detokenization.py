@@ -30,3 +30,33 @@ def test_computed_prefix_blocks(model: str):
     assert outputs_with_detokenization.text != ''
     assert outputs_no_detokenization.token_ids == \
         outputs_with_detokenization.token_ids
+
+
+@pytest.mark.parametrize("model", ["facebook/opt-125m"])
+def test_async_detokenization(model: str):
+    # The outputs are the same when the detokenization and the stop string
+    # checks run in the background while the next step runs.
+    prompts = [
+        "The capital of France is",
+        "The best way to learn a language is",
+        "Once upon a time,",
+    ]
+    sampling_params = [
+        SamplingParams(max_tokens=32, temperature=0.0, stop=[","]),
+        SamplingParams(max_tokens=32,
+                       temperature=0.0,
+                       stop=["the"],
+                       include_stop_str_in_output=True),
+        SamplingParams(max_tokens=16, temperature=0.0, n=2, logprobs=3),
+    ]
+
+    outputs = {}
+    for async_detokenization in [False, True]:
+        llm = LLM(model=model, async_detokenization=async_detokenization)
+        outputs[async_detokenization] = [[
+            (completion.text, completion.token_ids, completion.finish_reason,
+             completion.stop_reason) for completion in output.outputs
+        ] for output in llm.generate(prompts, sampling_params)]
+        del llm
+
+    assert outputs[True] == outputs[False]
@@ -0,0 +1,45 @@
+import pytest
+
+from vllm.entrypoints.llm import LLM
+from vllm.sampling_params import SamplingParams
+
+
+@pytest.mark.parametrize("model", ["facebook/opt-125m"])
+@pytest.mark.parametrize("num_scheduler_steps", [4, 8])
+def test_multi_step_decoding(model: str, num_scheduler_steps: int):
+    # The outputs are the same when the decodes run several steps per
+    # scheduler invocation, including for the sequences which stop within
+    # the steps.
+    prompts = [
+        "The capital of France is",
+        "The best way to learn a language is",
+        "Once upon a time,",
+        "The future of AI is",
+    ]
+    sampling_params = [
+        SamplingParams(max_tokens=32, temperature=0.0, stop=[","]),
+        SamplingParams(max_tokens=23, temperature=0.0),
+        SamplingParams(max_tokens=17, temperature=0.0, logprobs=3),
+        SamplingParams(max_tokens=16, temperature=0.0, prompt_logprobs=2),
+    ]
+
+    outputs = {}
+    for steps in [1, num_scheduler_steps]:
+        llm = LLM(model=model,
+                  use_v2_block_manager=True,
+                  num_scheduler_steps=steps)
+        outputs[steps] = [(output.prompt_logprobs is None, [
+            (completion.text, completion.token_ids, completion.finish_reason,
+             completion.stop_reason) for completion in output.outputs
+        ]) for output in llm.generate(prompts, sampling_params)]
+        del llm
+
+    assert outputs[num_scheduler_steps] == outputs[1]
+
+
+def test_multi_step_decoding_rejects_best_of():
+    llm = LLM(model="facebook/opt-125m",
+              use_v2_block_manager=True,
+              num_scheduler_steps=4)
+    with pytest.raises(ValueError):
+        llm.generate("Hello", SamplingParams(n=2))
@@ -0,0 +1,65 @@
+import gc
+
+import pytest
+
+from vllm import SamplingParams
+from vllm.core.block.offload import OffloadTier
+
+from .utils import create_stub_engine
+
+BLOCK_SIZE = 16
+
+
+@pytest.fixture(autouse=True)
+def cpu_attention_backend(monkeypatch):
+    # The fingerprint of the store includes the attention backend, whose
+    # default is chosen from the GPU.
+    monkeypatch.setenv("VLLM_ATTENTION_BACKEND", "TORCH_SDPA")
+
+
+def _create_engine(tmp_path):
+    return create_stub_engine(tmp_path,
+                              enable_prefix_caching=True,
+                              kv_offload_host_space=0.001,
+                              kv_offload_disk_space=0.001,
+                              kv_offload_path=str(tmp_path / "kv"),
+                              persistent_prefix_cache=True)
+
+
+def _run_prompt(engine, num_blocks: int) -> None:
+    prompt_token_ids = list(range(num_blocks * BLOCK_SIZE))
+    engine.add_request("0", {"prompt_token_ids": prompt_token_ids},
+                       SamplingParams(max_tokens=1, ignore_eos=True))
+    while engine.has_unfinished_requests():
+        engine.step()
+
+
+def _num_disk_blocks(engine) -> int:
+    offload_cache = engine.scheduler.block_manager.offload_cache
+    return offload_cache.get_num_blocks(OffloadTier.DISK)
+
+
+def test_shutdown_saves_prefix_cache(tmp_path):
+    engine = _create_engine(tmp_path)
+    _run_prompt(engine, num_blocks=3)
+    engine.shutdown()
+    # Does nothing the second time, nor when garbage collected.
+    engine.shutdown()
+    del engine
+    gc.collect()
+
+    engine = _create_engine(tmp_path)
+    assert _num_disk_blocks(engine) == 3
+    engine.shutdown()
+
+
+def test_garbage_collection_does_not_save_prefix_cache(tmp_path):
+    # Saving runs the model, which is not done in the finalizer.
+    engine = _create_engine(tmp_path)
+    _run_prompt(engine, num_blocks=3)
+    del engine
+    gc.collect()
+
+    engine = _create_engine(tmp_path)
+    assert _num_disk_blocks(engine) == 0
+    engine.shutdown()
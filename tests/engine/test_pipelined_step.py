@@ -0,0 +1,202 @@
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Set
+
+import pytest
+
+from vllm.entrypoints.llm import LLM
+from vllm.sampling_params import SamplingParams
+from vllm.sequence import (ExecuteModelRequest, Logprob, SequenceOutput,
+                           SequenceStage)
+
+from .utils import StubExecutor, create_stub_engine
+
+
+@pytest.mark.parametrize("model", ["facebook/opt-125m"])
+@pytest.mark.parametrize("async_detokenization", [False, True])
+def test_pipelined_step(model: str, async_detokenization: bool):
+    # The outputs are the same when the next step is scheduled while the
+    # model runs, including for the sequence groups which fork new sequences
+    # or stop.
+    prompts = [
+        "The capital of France is",
+        "The best way to learn a language is",
+        "Once upon a time,",
+        "The future of AI is",
+    ]
+    sampling_params = [
+        SamplingParams(max_tokens=32, temperature=0.0, stop=[","]),
+        SamplingParams(max_tokens=24, temperature=0.0),
+        SamplingParams(max_tokens=16, temperature=0.8, seed=0, n=2,
+                       logprobs=3),
+        SamplingParams(max_tokens=16,
+                       temperature=0.0,
+                       n=2,
+                       use_beam_search=True),
+    ]
+
+    outputs = {}
+    for pipelined_step in [False, True]:
+        llm = LLM(model=model,
+                  use_v2_block_manager=True,
+                  async_detokenization=async_detokenization,
+                  pipelined_step=pipelined_step)
+        outputs[pipelined_step] = [[
+            (completion.text, completion.token_ids, completion.finish_reason,
+             completion.stop_reason) for completion in output.outputs
+        ] for output in llm.generate(prompts, sampling_params)]
+        del llm
+
+    assert outputs[True] == outputs[False]
+
+
+class ForkingStubExecutor(StubExecutor):
+    """Samples best_of tokens for the prompts, so that the groups with n > 1
+    fork, and records the sequences of each request in the batches."""
+
+    batch_seq_ids: Dict[str, List[Set[int]]] = {}
+
+    def execute_model(self, execute_model_req: ExecuteModelRequest):
+        outputs = super().execute_model(execute_model_req)
+        for seq_group_metadata in execute_model_req.seq_group_metadata_list:
+            self.batch_seq_ids.setdefault(seq_group_metadata.request_id,
+                                          []).append(
+                                              set(seq_group_metadata.seq_data))
+        for output in outputs:
+            for seq_group_metadata, seq_group_output in zip(
+                    execute_model_req.seq_group_metadata_list, output.outputs):
+                if not seq_group_metadata.is_prompt:
+                    continue
+                (parent_seq_id, ) = seq_group_metadata.seq_data
+                best_of = seq_group_metadata.sampling_params.best_of
+                seq_group_output.samples = [
+                    SequenceOutput(parent_seq_id, 1, {1: Logprob(0.0)})
+                ] * best_of
+        return outputs
+
+
+def _run_stub_engine(engine, sampling_params: List[SamplingParams]):
+    for i, params in enumerate(sampling_params):
+        engine.add_request(str(i), {"prompt_token_ids": [0] * 16}, params)
+    outputs = {}
+    while engine.has_unfinished_requests():
+        for output in engine.step():
+            if output.finished:
+                outputs[output.request_id] = [(completion.token_ids,
+                                               completion.finish_reason)
+                                              for completion in output.outputs]
+    return outputs
+
+
+def test_pipelined_step_fork(tmp_path):
+    # The decode of the group scheduled while its prompt runs is dropped,
+    # since the prompt forks a second sequence. The next step schedules
+    # both sequences.
+    sampling_params = [
+        SamplingParams(max_tokens=8,
+                       temperature=0.8,
+                       seed=0,
+                       n=2,
+                       ignore_eos=True),
+        SamplingParams(max_tokens=4, ignore_eos=True),
+    ]
+    outputs = {}
+    for pipelined_step in [False, True]:
+        ForkingStubExecutor.batch_seq_ids = {}
+        engine = create_stub_engine(tmp_path,
+                                    executor_class=ForkingStubExecutor,
+                                    pipelined_step=pipelined_step)
+        outputs[pipelined_step] = _run_stub_engine(engine, sampling_params)
+
+        prompt_seq_ids, *decode_seq_ids = ForkingStubExecutor.batch_seq_ids[
+            "0"]
+        assert len(prompt_seq_ids) == 1
+        assert len(decode_seq_ids) == 7
+        assert all(len(seq_ids) == 2 for seq_ids in decode_seq_ids)
+
+    assert outputs[True] == outputs[False]
+    assert [len(token_ids) for token_ids, _ in outputs[True]["0"]] == [8, 8]
+
+
+def test_pipelined_step_preemption(tmp_path):
+    # With 6 blocks for 3 sequences growing to 4 blocks each, the groups
+    # are preempted by recomputation, also while their step runs. Their
+    # outputs of that step are dropped.
+    sampling_params = [
+        SamplingParams(max_tokens=40, ignore_eos=True) for _ in range(3)
+    ]
+    outputs = {}
+    for pipelined_step in [False, True]:
+        engine = create_stub_engine(tmp_path,
+                                    num_gpu_blocks=6,
+                                    pipelined_step=pipelined_step)
+        outputs[pipelined_step] = _run_stub_engine(engine, sampling_params)
+        assert engine.scheduler.num_cumulative_preemption > 0
+
+    assert outputs[True] == outputs[False]
+    assert all(
+        len(completions[0][0]) == 40 for completions in outputs[True].values())
+
+
+class _DeferredFuture(Future):
+    """Runs the function when its result is first requested."""
+
+    def __init__(self, fn: Callable):
+        super().__init__()
+        self._fn = fn
+
+    def result(self, timeout=None):
+        if not self.done():
+            self.set_result(self._fn())
+        return super().result(timeout)
+
+
+class DeferredStubExecutor(StubExecutor):
+    """Executes a batch when the engine waits for its outputs, after the next
+    batch is scheduled, and checks that the batch reads the sequence data as
+    it was when submitted."""
+
+    def execute_model_nonblocking(self,
+                                  execute_model_req: ExecuteModelRequest):
+        return _DeferredFuture(lambda: self.execute_model(execute_model_req))
+
+    def execute_model(self, execute_model_req: ExecuteModelRequest):
+        for seq_group_metadata in execute_model_req.seq_group_metadata_list:
+            for seq_data in seq_group_metadata.seq_data.values():
+                if seq_group_metadata.is_prompt:
+                    assert seq_data.stage == SequenceStage.PREFILL
+                else:
+                    assert seq_data.stage == SequenceStage.DECODE
+                    assert (seq_data.get_num_computed_tokens() ==
+                            seq_data.get_len() - 1)
+        return super().execute_model(execute_model_req)
+
+
+def test_pipelined_step_preemption_snapshot(tmp_path):
+    # The sequences preempted by recomputation while their batch runs are
+    # reset, but the batch still reads their state from before.
+    engine = create_stub_engine(tmp_path,
+                                num_gpu_blocks=6,
+                                executor_class=DeferredStubExecutor,
+                                pipelined_step=True)
+    outputs = _run_stub_engine(
+        engine,
+        [SamplingParams(max_tokens=40, ignore_eos=True) for _ in range(3)])
+    assert engine.scheduler.num_cumulative_preemption > 0
+    assert all(
+        len(completions[0][0]) == 40 for completions in outputs.values())
+
+
+def test_pipelined_step_abort(tmp_path):
+    # The aborted group is in the running batch and in the next one.
+    engine = create_stub_engine(tmp_path, pipelined_step=True)
+    for i in range(2):
+        engine.add_request(str(i), {"prompt_token_ids": [0] * 16},
+                           SamplingParams(max_tokens=8, ignore_eos=True))
+    engine.step()
+    engine.step()
+    engine.abort_request("0")
+    finished = []
+    while engine.has_unfinished_requests():
+        finished.extend(output.request_id for output in engine.step()
+                        if output.finished)
+    assert finished == ["1"]
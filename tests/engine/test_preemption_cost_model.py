@@ -0,0 +1,27 @@
+from vllm.core.preemption import PreemptionCostModel
+
+from .utils import StubExecutor, create_stub_engine
+
+COST_MODEL = PreemptionCostModel(flops_per_token=1.0,
+                                 attention_flops_per_token_pair=1.0,
+                                 flops_per_second=1.0,
+                                 kv_cache_bytes_per_token=1.0,
+                                 swap_bytes_per_second=1.0)
+
+
+class ProfilingStubExecutor(StubExecutor):
+
+    def get_preemption_cost_model(self):
+        return COST_MODEL
+
+
+def test_scheduler_gets_cost_model_from_executor(tmp_path):
+    # The workers may run in other processes, so the engine asks the
+    # executor for the costs they measured.
+    engine = create_stub_engine(tmp_path, executor_class=ProfilingStubExecutor)
+    assert engine.scheduler.preemption_cost_model is COST_MODEL
+
+
+def test_no_cost_model_by_default(tmp_path):
+    engine = create_stub_engine(tmp_path)
+    assert engine.scheduler.preemption_cost_model is None
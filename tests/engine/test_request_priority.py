@@ -0,0 +1,16 @@
+from vllm import SamplingParams
+
+from .utils import create_stub_engine
+
+
+def test_add_request_priority(tmp_path):
+    engine = create_stub_engine(tmp_path, scheduling_policy="priority")
+    inputs = {"prompt_token_ids": [1, 2, 3, 4]}
+    sampling_params = SamplingParams(max_tokens=1, priority=1)
+    # The priority given to add_request overrides the one of the sampling
+    # parameters.
+    engine.add_request("0", inputs, sampling_params)
+    engine.add_request("1", inputs, sampling_params, priority=0)
+    engine.add_request("2", inputs, sampling_params, priority=2)
+    assert [seq_group.request_id
+            for seq_group in engine.scheduler.waiting] == ["1", "0", "2"]
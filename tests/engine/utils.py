@@ -0,0 +1,62 @@
+"""Model-free engines, which run on the stub executor of the pipelined step
+benchmark."""
+import importlib.util
+import json
+from pathlib import Path
+from typing import Type
+
+from vllm import EngineArgs, LLMEngine
+from vllm.executor.executor_base import ExecutorBase
+
+# A tiny OPT model. Only its config is read, the stub executor loads no
+# weights.
+_MODEL_CONFIG = {
+    "architectures": ["OPTForCausalLM"],
+    "model_type": "opt",
+    "hidden_size": 64,
+    "num_attention_heads": 4,
+    "num_hidden_layers": 2,
+    "ffn_dim": 128,
+    "vocab_size": 1000,
+    "max_position_embeddings": 512,
+    "word_embed_proj_dim": 64,
+    "torch_dtype": "float16",
+    "do_layer_norm_before": True,
+}
+
+_BENCHMARK_PATH = (Path(__file__).parents[2] / "benchmarks" / "overheads" /
+                   "benchmark_pipelined_step.py")
+
+
+def _load_stub_executor() -> Type[ExecutorBase]:
+    spec = importlib.util.spec_from_file_location("benchmark_pipelined_step",
+                                                  _BENCHMARK_PATH)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.StubExecutor
+
+
+StubExecutor = _load_stub_executor()
+
+
+def create_stub_engine(tmp_path: Path,
+                       num_gpu_blocks: int = 64,
+                       executor_class: Type[ExecutorBase] = StubExecutor,
+                       **kwargs) -> LLMEngine:
+    """Creates an engine without tokenizer on the stub executor, or a
+    subclass of it, which samples token 1 for every sequence."""
+    model_dir = tmp_path / "model"
+    model_dir.mkdir(exist_ok=True)
+    (model_dir / "config.json").write_text(json.dumps(_MODEL_CONFIG))
+
+    engine_config = EngineArgs(model=str(model_dir),
+                               skip_tokenizer_init=True,
+                               use_v2_block_manager=True,
+                               disable_log_stats=True,
+                               **kwargs).create_engine_config()
+    return LLMEngine(**engine_config.to_dict(),
+                     executor_class=type(executor_class.__name__,
+                                         (executor_class, ),
+                                         {"num_gpu_blocks": num_gpu_blocks}),
+                     log_stats=False)
@@ -1,14 +1,24 @@
 # This unit test should be moved to a new
 # tests/test_guided_decoding directory.
+import json
+import threading
+from typing import Dict, List
+
 import pytest
 import torch
+from outlines.fsm.guide import Generate, Instruction, Write
 from transformers import AutoTokenizer
 
 from vllm.entrypoints.openai.protocol import CompletionRequest
 from vllm.model_executor.guided_decoding import (
     get_guided_decoding_logits_processor)
+from vllm.model_executor.guided_decoding.guide_registry import (
+    GuideRegistry, estimate_guide_size, get_guide_registry)
 from vllm.model_executor.guided_decoding.outlines_logits_processors import (
-    JSONLogitsProcessor, RegexLogitsProcessor)
+    BaseLogitsProcessor, JSONLogitsProcessor, RegexLogitsProcessor,
+    TokenBitmaskCache, get_json_guide_spec, get_token_bitmask_cache)
+from vllm.model_executor.layers.logits_processor import _apply_token_bitmasks
+from vllm.sampling_params import BatchedLogitsProcessor, LogitsProcessor
 
 TEST_SCHEMA = {
     "type": "object",
@@ -55,6 +65,19 @@ TEST_REGEX = (r"((25[0-5]|(2[0-4]|1\d|[1-9]|)\d)\.){3}"
 pytestmark = pytest.mark.openai
 
 
+def _process_logits(logits_processor: LogitsProcessor, token_ids: List[int],
+                    logits: torch.Tensor) -> torch.Tensor:
+    """Process the logits of a single sequence."""
+    if isinstance(logits_processor, BatchedLogitsProcessor):
+        logits = logits.unsqueeze(0)
+        bitmasks = logits_processor.get_allowed_token_bitmasks(
+            [0], [token_ids], logits.shape[-1])
+        assert bitmasks is not None
+        _apply_token_bitmasks(logits, [0], bitmasks)
+        return logits.squeeze(0)
+    return logits_processor(token_ids, logits)
+
+
 def test_guided_logits_processors():
     """Basic unit test for RegexLogitsProcessor and JSONLogitsProcessor."""
     tokenizer = AutoTokenizer.from_pretrained('HuggingFaceH4/zephyr-7b-beta')
@@ -67,7 +90,7 @@ def test_guided_logits_processors():
         f"Give an example IPv4 address with this regex: {TEST_REGEX}")
     tensor = torch.rand(32000)
     original_tensor = torch.clone(tensor)
-    regex_LP(token_ids, tensor)
+    tensor = _process_logits(regex_LP, token_ids, tensor)
     assert tensor.shape == original_tensor.shape
     assert not torch.allclose(tensor, original_tensor)
 
@@ -75,11 +98,39 @@ def test_guided_logits_processors():
         f"Give an employee profile that fits this schema: {TEST_SCHEMA}")
     tensor = torch.rand(32000)
     original_tensor = torch.clone(tensor)
-    json_LP(token_ids, tensor)
+    tensor = _process_logits(json_LP, token_ids, tensor)
     assert tensor.shape == original_tensor.shape
     assert not torch.allclose(tensor, original_tensor)
 
 
+def test_guided_logits_processor_fsm_states():
+    """The FSM of each sequence advances with its new tokens, and the
+    processors of the same guide share the bitmasks of the states."""
+    tokenizer = AutoTokenizer.from_pretrained('HuggingFaceH4/zephyr-7b-beta')
+    vocab_size = len(tokenizer)
+    cache = get_token_bitmask_cache()
+    regex_LP = RegexLogitsProcessor(TEST_REGEX, tokenizer)
+    other_regex_LP = RegexLogitsProcessor(TEST_REGEX, tokenizer)
+
+    token_ids: List[int] = []
+    for _ in range(8):
+        bitmask, = regex_LP.get_allowed_token_bitmasks([0], [token_ids],
+                                                       vocab_size)
+        num_hits = cache.num_hits
+        assert other_regex_LP.get_allowed_token_bitmasks(
+            [0], [token_ids], vocab_size) == [bitmask]
+        assert cache.num_hits == num_hits + 1
+        # A new sequence with the same tokens reaches the same state.
+        assert regex_LP.get_allowed_token_bitmasks([len(token_ids) + 1],
+                                                   [token_ids],
+                                                   vocab_size) == [bitmask]
+        # Follow the first allowed token.
+        token_ids.append(
+            next(token_id for token_id in range(vocab_size)
+                 if bitmask[token_id >> 3] >> (token_id & 7) & 1))
+    assert 0 < cache.hit_rate <= 1
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize("backend", ["outlines", "lm-format-enforcer"])
 async def test_guided_logits_processor_black_box(backend: str):
@@ -94,7 +145,7 @@ async def test_guided_logits_processor_black_box(backend: str):
     assert regex_lp is not None
     tensor = torch.rand(32000)
     original_tensor = torch.clone(tensor)
-    tensor = regex_lp(token_ids, tensor)
+    tensor = _process_logits(regex_lp, token_ids, tensor)
     assert tensor.shape == original_tensor.shape
     assert not torch.allclose(tensor, original_tensor)
 
@@ -108,6 +159,181 @@ async def test_guided_logits_processor_black_box(backend: str):
     assert json_lp is not None
     tensor = torch.rand(32000)
     original_tensor = torch.clone(tensor)
-    tensor = json_lp(token_ids, tensor)
+    tensor = _process_logits(json_lp, token_ids, tensor)
     assert tensor.shape == original_tensor.shape
     assert not torch.allclose(tensor, original_tensor)
+
+
+class _Guide:
+
+    def __init__(self, num_transitions: int):
+        self.states_to_token_maps: Dict[int, Dict[int, int]] = {
+            0: {token_id: 0
+                for token_id in range(num_transitions)}
+        }
+
+
+def test_guide_registry_builds_once():
+    registry = GuideRegistry(max_bytes=1 << 30)
+    num_builds = 0
+    started = threading.Event()
+    release = threading.Event()
+
+    def build() -> _Guide:
+        nonlocal num_builds
+        num_builds += 1
+        started.set()
+        release.wait()
+        return _Guide(1)
+
+    guides: List[_Guide] = []
+    threads = [
+        threading.Thread(
+            target=lambda: guides.append(registry.get_guide("key", build)))
+        for _ in range(8)
+    ]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert num_builds == 1 and registry.num_builds == 1
+    assert len(guides) == 8 and all(guide is guides[0] for guide in guides)
+    assert registry.get_guide("key", build) is guides[0]
+    assert registry.num_hits == 8
+
+
+@pytest.mark.asyncio
+async def test_guide_registry_async():
+    registry = GuideRegistry(max_bytes=1 << 30)
+    guide = _Guide(1)
+    with pytest.raises(ValueError):
+        await registry.get_guide_async("key", lambda: _Guide(int("x")))
+    assert "key" not in registry
+    assert await registry.get_guide_async("key", lambda: guide) is guide
+    assert registry.get_guide("key", _Guide) is guide
+
+
+def test_guide_registry_memory_budget():
+    size = estimate_guide_size(_Guide(1000))
+    registry = GuideRegistry(max_bytes=2 * size)
+    registry.get_guide(0, lambda: _Guide(1000))
+    registry.get_guide(1, lambda: _Guide(1000))
+    assert registry.num_bytes == 2 * size
+    # Use the first guide, so that the second one is evicted.
+    registry.get_guide(0, lambda: _Guide(1000))
+    registry.get_guide(2, lambda: _Guide(1000))
+    assert 0 in registry and 1 not in registry and 2 in registry
+    assert registry.num_bytes == 2 * size
+    # A guide over the budget is kept alone.
+    registry.get_guide(3, lambda: _Guide(5000))
+    assert [key in registry for key in range(4)] == [False] * 3 + [True]
+
+
+def test_guide_registry_guide_ids():
+    size = estimate_guide_size(_Guide(1000))
+    registry = GuideRegistry(max_bytes=2 * size)
+    removed_guide_ids: List[int] = []
+    registry.add_removal_callback(removed_guide_ids.append)
+    registry.get_guide(0, lambda: _Guide(1000))
+    registry.get_guide(1, lambda: _Guide(1000))
+    guide_ids = [registry.get_guide_id(0), registry.get_guide_id(1)]
+    assert None not in guide_ids and guide_ids[0] != guide_ids[1]
+    registry.get_guide(2, lambda: _Guide(1000))
+    assert registry.get_guide_id(0) is None
+    assert removed_guide_ids == guide_ids[:1]
+    # A guide built again after its eviction gets a new id.
+    registry.get_guide(0, lambda: _Guide(1000))
+    assert registry.get_guide_id(0) not in guide_ids
+    assert removed_guide_ids == guide_ids
+
+
+def test_guide_registry_cache_dir(tmp_path):
+    registry = GuideRegistry(max_bytes=1 << 30, cache_dir=str(tmp_path))
+    guide = registry.get_guide(("json", "{}"), lambda: _Guide(10))
+
+    other_registry = GuideRegistry(max_bytes=1 << 30, cache_dir=str(tmp_path))
+    loaded_guide = other_registry.get_guide(("json", "{}"),
+                                            lambda: _Guide(int("x")))
+    assert loaded_guide.states_to_token_maps == guide.states_to_token_maps
+    assert other_registry.num_loads == 1 and other_registry.num_builds == 0
+    other_registry.get_guide(("json", "[]"), lambda: _Guide(10))
+    assert other_registry.num_builds == 1
+
+
+def test_guided_processors_share_guides():
+    """The processors of the same schema share the guide, whatever the
+    formatting of the schema."""
+    tokenizer = AutoTokenizer.from_pretrained('HuggingFaceH4/zephyr-7b-beta')
+    key, _ = get_json_guide_spec(TEST_SCHEMA, tokenizer, None)
+    assert get_json_guide_spec(json.dumps(TEST_SCHEMA, indent=4), tokenizer,
+                               None)[0] == key
+    json_LP = JSONLogitsProcessor(TEST_SCHEMA,
+                                  tokenizer,
+                                  whitespace_pattern=None)
+    assert key in get_guide_registry()
+    other_json_LP = JSONLogitsProcessor(json.dumps(TEST_SCHEMA),
+                                        tokenizer,
+                                        whitespace_pattern=None)
+    assert other_json_LP._guide is json_LP._guide
+
+
+class _LinearGuide:
+    """A guide whose state is the number of tokens generated, with the
+    given instruction in each state and EOS in the last one."""
+
+    eos_token_id = 2
+
+    def __init__(self, instructions: List[Instruction]):
+        self.instructions = instructions
+
+    def get_next_instruction(self, state: int) -> Instruction:
+        if state < len(self.instructions):
+            return self.instructions[state]
+        return Write([self.eos_token_id])
+
+    def get_next_state(self, state: int, token_id: int) -> int:
+        return state + 1
+
+
+def test_guided_logits_processor_forced_tokens():
+    """The tokens the guide allows alone are forced, up to the EOS token."""
+    logits_processor = BaseLogitsProcessor(
+        _LinearGuide([
+            Generate([10, 11]),
+            Generate([12]),
+            Write([13, 14]),
+            Write([14]),
+            Generate([15, 16]),
+            Generate([17]),
+        ]))
+
+    assert logits_processor.get_forced_token_ids(0, [], 8) == []
+    assert logits_processor.get_forced_token_ids(0, [10], 8) == [12, 13, 14]
+    assert logits_processor.get_forced_token_ids(1, [11], 2) == [12, 13]
+    assert logits_processor.get_forced_token_ids(0, [10, 12, 13, 14, 15],
+                                                 8) == [17]
+
+
+def test_token_bitmask_cache_removed_guides():
+    """The bitmasks are keyed by the guide ids, and the ones of the guides
+    removed from the registry are dropped."""
+    cache = TokenBitmaskCache(capacity=16)
+    guide = _LinearGuide([Generate([10, 11]), Generate([12])])
+    for guide_id in range(2):
+        for state in range(2):
+            cache.get_bitmask(guide_id, guide, state, 32)
+    assert cache.num_misses == 4
+    assert all(isinstance(key[0], int) for key in cache._cache.cache)
+    cache.get_bitmask(0, guide, 0, 32)
+    assert cache.num_hits == 1
+
+    cache.remove_guide(0)
+    cache.get_bitmask(1, guide, 2, 32)
+    assert sorted(key[:2] for key in cache._cache.cache) == [(1, 0), (1, 1),
+                                                             (1, 2)]
+    cache.get_bitmask(0, guide, 0, 32)
+    assert cache.num_misses == 6
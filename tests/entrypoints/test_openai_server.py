@@ -8,6 +8,7 @@ import pytest
 # using Ray for overall ease of process management, parallel requests,
 # and debugging.
 import ray
+import requests
 import torch
 # downloading lora to test lora requests
 from huggingface_hub import snapshot_download
@@ -675,6 +676,23 @@ async def test_guided_json_completion(server, client: openai.AsyncOpenAI,
         jsonschema.validate(instance=output_json, schema=TEST_SCHEMA)
 
 
+@pytest.mark.parametrize("guided_decoding_backend",
+                         ["outlines", "lm-format-enforcer"])
+def test_guided_precompile(server, guided_decoding_backend: str):
+    url = "http://localhost:8000/v1/guided/precompile"
+    response = requests.post(
+        url,
+        json=dict(guided_json=TEST_SCHEMA,
+                  guided_decoding_backend=guided_decoding_backend))
+    assert response.status_code == 200
+    assert response.json()["guided_decoding_backend"] == (
+        guided_decoding_backend)
+
+    # Without guided decoding parameters.
+    response = requests.post(url, json={})
+    assert response.status_code == 400
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize("guided_decoding_backend",
                          ["outlines", "lm-format-enforcer"])
@@ -9,7 +9,7 @@ from ..conftest import get_tokenizer_pool_config
 
 
 @pytest.mark.asyncio
-@pytest.mark.parametrize("tokenizer_group_type", [None, "ray"])
+@pytest.mark.parametrize("tokenizer_group_type", [None, "ray", "process"])
 async def test_tokenizer_group_lora(sql_lora_files, tokenizer_group_type):
     reference_tokenizer = AutoTokenizer.from_pretrained(sql_lora_files)
     tokenizer_group = get_tokenizer_group(
@@ -1,3 +1,4 @@
+import copy
 import itertools
 import random
 from typing import List, Optional, Tuple
@@ -7,10 +8,14 @@ import pytest
 import torch
 from transformers import GenerationConfig, GenerationMixin
 
-from vllm.model_executor.layers.sampler import Sampler
-from vllm.model_executor.sampling_metadata import SamplingMetadata
+from vllm.model_executor.layers.sampler import (Sampler,
+                                                _get_bin_counts_and_mask)
+from vllm.model_executor.sampling_metadata import (PersistentSamplingState,
+                                                   SamplingMetadata,
+                                                   SamplingTensors)
 from vllm.model_executor.utils import set_random_seed
-from vllm.sequence import SamplingParams, SequenceData, SequenceGroupMetadata
+from vllm.sequence import (SamplingParams, SequenceData, SequenceGroupMetadata,
+                           SequenceGroupState)
 from vllm.utils import Counter, is_pin_memory_available
 
 
@@ -626,3 +631,241 @@ def test_sampler_top_k_top_p(seed: int, device: str):
     hf_probs = torch.softmax(hf_probs, dim=-1, dtype=torch.float)
     assert torch.allclose(hf_probs, sample_probs, atol=1e-5)
     assert torch.equal(hf_probs.eq(0), sample_probs.eq(0))
+
+
+@pytest.mark.parametrize("device", CUDA_DEVICES)
+def test_sampling_metadata_seeded_prefills(device: str):
+    """A seeded sequence is reseeded when it is prefilled again after a
+    recompute preemption, but keeps its generator when it is prefilled for
+    the tokens fast-forwarded by guided decoding."""
+    seq_data = SequenceData([1, 2, 3])
+    state = SequenceGroupState()
+
+    def prepare_prefill():
+        seq_len = seq_data.get_len()
+        query_len = seq_len - seq_data.get_num_computed_tokens()
+        SamplingMetadata.prepare([
+            SequenceGroupMetadata(
+                request_id="0",
+                is_prompt=True,
+                seq_data={0: seq_data},
+                sampling_params=SamplingParams(temperature=1.0, seed=0),
+                block_tables={0: [1]},
+                state=state,
+            )
+        ], [seq_len], [query_len],
+                                 device=device,
+                                 pin_memory=is_pin_memory_available())
+        assert state.generator is not None
+        return state.generator
+
+    generator = prepare_prefill()
+    seq_data.update_num_computed_tokens(3)
+    seq_data.append_token_id(4, 0.0)
+    seq_data.append_token_id(5, 0.0)
+    seq_data.set_fast_forwarded()
+    assert seq_data.is_fast_forwarded
+    assert prepare_prefill() is generator
+
+    seq_data.update_num_computed_tokens(2)
+    assert not seq_data.is_fast_forwarded
+    seq_data.reset_state_for_recompute()
+    assert prepare_prefill() is not generator
+
+
+@pytest.mark.parametrize("seed", RANDOM_SEEDS[:8])
+@pytest.mark.parametrize("max_num_seqs", [None, 128])
+@pytest.mark.parametrize("device", CUDA_DEVICES)
+def test_persistent_sampling_state(seed: int, max_num_seqs: Optional[int],
+                                   device: str):
+    """The persistent sampling state gives the same sampling tensors as
+    `SamplingTensors.from_sampling_metadata` across decode steps, as
+    sequences are added, finish and have their outputs rolled back."""
+    set_random_seed(seed)
+    torch.set_default_device(device)
+    vocab_size = 1000
+    state = PersistentSamplingState(vocab_size,
+                                    torch.device(device),
+                                    torch.float32,
+                                    max_num_seqs=max_num_seqs)
+    seq_id_counter = Counter()
+    request_id_counter = Counter()
+    seq_groups: List[SequenceGroupMetadata] = []
+
+    def add_seq_group():
+        penalties = random.random() < 0.5
+        sampling_params = SamplingParams(
+            temperature=random.choice([0.0, 0.5, 1.0]),
+            top_p=random.choice([1.0, 0.9]),
+            top_k=random.choice([-1, 20]),
+            min_p=random.choice([0.0, 0.1]),
+            presence_penalty=random.random() if penalties else 0.0,
+            frequency_penalty=random.random() if penalties else 0.0,
+            repetition_penalty=1.0 + random.random() if penalties else 1.0,
+            seed=random.choice([None, random.randint(0, 10000)]))
+        seq_data = {
+            next(seq_id_counter): SequenceData(
+                random.choices(range(vocab_size), k=random.randint(1, 20)),
+                random.choices(range(vocab_size), k=random.randint(0, 5)))
+            for _ in range(random.randint(1, 2))
+        }
+        seq_groups.append(
+            SequenceGroupMetadata(
+                request_id=str(next(request_id_counter)),
+                is_prompt=False,
+                seq_data=seq_data,
+                sampling_params=sampling_params,
+                block_tables={seq_id: [1]
+                              for seq_id in seq_data},
+            ))
+
+    for _ in range(8):
+        add_seq_group()
+    for step in range(32):
+        # Some groups finish, new ones arrive, and some outputs are rolled
+        # back.
+        random.shuffle(seq_groups)
+        del seq_groups[:random.randint(0, 2)]
+        for _ in range(random.randint(0, 3)):
+            add_seq_group()
+        for seq_group in seq_groups:
+            for seq_data in seq_group.seq_data.values():
+                if seq_data.output_token_ids and random.random() < 0.05:
+                    seq_data.output_token_ids = (
+                        seq_data.output_token_ids[:-1])
+        # Leave some groups out of the step, as if preempted.
+        step_seq_groups = [
+            seq_group for seq_group in seq_groups if random.random() < 0.9
+        ]
+        sampling_metadata = SamplingMetadata.prepare(
+            step_seq_groups, [
+                seq_data.get_len() for seq_group in step_seq_groups
+                for seq_data in seq_group.seq_data.values()
+            ], [1] * len(step_seq_groups),
+            device=device,
+            pin_memory=is_pin_memory_available())
+
+        random.seed(step)
+        result = state.get_sampling_tensors(sampling_metadata)
+        random.seed(step)
+        expected = SamplingTensors.from_sampling_metadata(
+            sampling_metadata, vocab_size, torch.device(device), torch.float32)
+        assert result is not None
+        tensors, *flags = result
+        expected_tensors, *expected_flags = expected
+        assert flags == expected_flags
+        for name in ("temperatures", "top_ps", "top_ks", "min_ps",
+                     "presence_penalties", "frequency_penalties",
+                     "repetition_penalties", "sampling_seeds",
+                     "sample_indices"):
+            assert torch.equal(getattr(tensors, name),
+                               getattr(expected_tensors, name)), name
+        if flags[0]:
+            num_seqs = len(tensors.temperatures)
+            _, prompt_mask = _get_bin_counts_and_mask(
+                expected_tensors.prompt_tokens, vocab_size, num_seqs)
+            output_bin_counts, _ = _get_bin_counts_and_mask(
+                expected_tensors.output_tokens, vocab_size, num_seqs)
+            # The sequences without penalties have no tokens in the state.
+            has_penalties = expected_tensors.presence_penalties.ne(0)
+            assert torch.equal(tensors.prompt_mask[has_penalties],
+                               prompt_mask[has_penalties])
+            assert torch.equal(tensors.output_bin_counts[has_penalties].long(),
+                               output_bin_counts[has_penalties])
+
+        for seq_group in step_seq_groups:
+            for seq_data in seq_group.seq_data.values():
+                seq_data.append_token_id(random.randrange(vocab_size), 0.0)
+
+
+@pytest.mark.parametrize("device", CUDA_DEVICES)
+def test_persistent_sampling_state_unsupported_steps(device: str):
+    """Steps with prompt logprobs or a sequence in several groups are left to
+    `SamplingTensors.from_sampling_metadata`."""
+    torch.set_default_device(device)
+    state = PersistentSamplingState(VOCAB_SIZE, torch.device(device),
+                                    torch.float32)
+
+    def get_sampling_tensors(
+            seq_group_metadata_list: List[SequenceGroupMetadata]):
+        seq_lens = [
+            seq_group_metadata.seq_data[0].get_len()
+            for seq_group_metadata in seq_group_metadata_list
+        ]
+        return state.get_sampling_tensors(
+            SamplingMetadata.prepare(seq_group_metadata_list,
+                                     seq_lens,
+                                     query_lens=seq_lens,
+                                     device=device,
+                                     pin_memory=is_pin_memory_available()))
+
+    prompt_logprobs = SequenceGroupMetadata(
+        request_id="0",
+        is_prompt=True,
+        seq_data={0: SequenceData([1, 2, 3])},
+        sampling_params=SamplingParams(prompt_logprobs=1),
+        block_tables={0: [1]},
+    )
+    assert get_sampling_tensors([prompt_logprobs]) is None
+    same_seq_ids = [
+        SequenceGroupMetadata(
+            request_id=str(i),
+            is_prompt=True,
+            seq_data={0: SequenceData([1, 2, 3])},
+            sampling_params=SamplingParams(),
+            block_tables={0: [1]},
+        ) for i in range(2)
+    ]
+    assert get_sampling_tensors(same_seq_ids) is None
+    assert get_sampling_tensors(same_seq_ids[:1]) is not None
+
+
+@pytest.mark.parametrize("device", CUDA_DEVICES)
+def test_persistent_sampling_state_rows(device: str):
+    """The rows are only rewritten when the values of the sampling params
+    change, and with `max_num_seqs` they are allocated upfront and steps with
+    more sequences are left to `SamplingTensors.from_sampling_metadata`."""
+    torch.set_default_device(device)
+    state = PersistentSamplingState(VOCAB_SIZE,
+                                    torch.device(device),
+                                    torch.float32,
+                                    max_num_seqs=2)
+    assert state._params.shape == (2, 6)
+    assert state._prompt_masks.shape == (3, VOCAB_SIZE)
+    assert state._output_bin_counts.shape == (3, VOCAB_SIZE)
+
+    def get_sampling_tensors(num_seqs: int, **kwargs):
+        # New sampling params in every step, as after unpickling the
+        # metadata on a worker.
+        seq_group_metadata_list = [
+            SequenceGroupMetadata(
+                request_id=str(i),
+                is_prompt=False,
+                seq_data={i: SequenceData([1, 2, 3], [4])},
+                sampling_params=SamplingParams(**kwargs),
+                block_tables={i: [1]},
+            ) for i in range(num_seqs)
+        ]
+        return state.get_sampling_tensors(
+            SamplingMetadata.prepare(copy.deepcopy(seq_group_metadata_list),
+                                     [4] * num_seqs, [1] * num_seqs,
+                                     device=device,
+                                     pin_memory=is_pin_memory_available()))
+
+    get_values = SamplingTensors._get_sampling_values
+    with patch.object(SamplingTensors,
+                      "_get_sampling_values",
+                      side_effect=get_values) as mock_get_values:
+        assert get_sampling_tensors(2, temperature=0.5) is not None
+        assert mock_get_values.call_count == 2
+        assert get_sampling_tensors(2, temperature=0.5) is not None
+        assert mock_get_values.call_count == 2
+        result = get_sampling_tensors(2, temperature=0.7)
+        assert mock_get_values.call_count == 4
+    assert result is not None
+    assert torch.allclose(result[0].temperatures,
+                          torch.tensor([0.7, 0.7], device=device))
+
+    assert get_sampling_tensors(3, temperature=0.5) is None
+    assert state._params.shape == (2, 6)
+    assert state._prompt_masks.shape == (3, VOCAB_SIZE)
@@ -7,7 +7,7 @@ from typing import List, Optional
 import pytest
 
 from vllm.lora.request import LoRARequest
-from vllm.sequence import Sequence
+from vllm.sequence import Logprob, Sequence
 from vllm.transformers_utils.tokenizer_group import TokenizerGroup
 
 # Make two prefixes with different first blocks.
@@ -97,3 +97,33 @@ def test_auto_prefix_caching(model: str, block_size: int, max_num_seqs: int,
         different_hashes = [h[-1] for h in hash_pref]
         assert (len(set(same_hashes)) == 1)
         assert (len(set(different_hashes)) == len(different_hashes))
+
+
+@pytest.mark.parametrize("block_size", [1, 16])
+@pytest.mark.parametrize("num_prompt_tokens", [0, 7, 64, 100])
+@pytest.mark.parametrize("lora_int_id", [None, 1])
+def test_incremental_block_hashes(block_size: int, num_prompt_tokens: int,
+                                  lora_int_id: Optional[int]):
+    """Block hashes extended while decoding must match the hashes of a
+    sequence created with the same tokens as its prompt."""
+    lora_request = None
+    if lora_int_id is not None:
+        lora_request = LoRARequest(f"example_lora_{lora_int_id}", lora_int_id,
+                                   f"example/path/to/lora_{lora_int_id}")
+
+    token_ids = list(range(1, num_prompt_tokens + 80))
+    seq = Sequence(0,
+                   inputs={"prompt_token_ids": token_ids[:num_prompt_tokens]},
+                   block_size=block_size,
+                   lora_request=lora_request)
+    for token_id in token_ids[num_prompt_tokens:]:
+        seq.append_token_id(token_id, {token_id: Logprob(0.0)})
+        # Query the hash of the last block, which may be partially filled.
+        seq.hash_of_block(len(seq.logical_token_blocks) - 1)
+
+    reference = Sequence(1,
+                         inputs={"prompt_token_ids": token_ids},
+                         block_size=block_size,
+                         lora_request=lora_request)
+    for idx in range(len(reference.logical_token_blocks)):
+        assert seq.hash_of_block(idx) == reference.hash_of_block(idx)
@@ -1,13 +1,15 @@
 import random
-from typing import Tuple
+from typing import List, Optional, Sequence, Tuple
 from unittest.mock import patch
 
 import pytest
 import torch
 
-from vllm.model_executor.layers.logits_processor import LogitsProcessor
+from vllm.model_executor.layers.logits_processor import (LogitsProcessor,
+                                                         pack_token_bitmask)
 from vllm.model_executor.sampling_metadata import SamplingMetadata
 from vllm.model_executor.utils import set_random_seed
+from vllm.sampling_params import BatchedLogitsProcessor
 from vllm.sequence import SamplingParams, SequenceData, SequenceGroupMetadata
 from vllm.utils import is_pin_memory_available
 
@@ -92,3 +94,147 @@ def test_logits_processors(seed: int, device: str):
     fake_logits *= logits_processor.scale
     assert torch.allclose(logits_processor_output[:, 1], fake_logits[:, 1],
                           1e-4)
+
+
+class AllowTokensProcessor(BatchedLogitsProcessor):
+    """Allows the tokens of a range starting at the number of output tokens
+    of each sequence."""
+
+    def __init__(self, num_tokens: int):
+        self.num_tokens = num_tokens
+        self.calls: List[List[int]] = []
+
+    def get_allowed_token_bitmasks(self, seq_ids: List[int],
+                                   output_token_ids: List[Sequence[int]],
+                                   vocab_size: int) -> Optional[List[bytes]]:
+        self.calls.append(seq_ids)
+        return [
+            pack_token_bitmask(
+                range(len(token_ids),
+                      len(token_ids) + self.num_tokens), vocab_size)
+            for token_ids in output_token_ids
+        ]
+
+
+class AddSeqIdProcessor(BatchedLogitsProcessor):
+    """Adds the id of each sequence to its logits."""
+
+    def __init__(self):
+        self.calls: List[List[int]] = []
+
+    def __call__(self, seq_ids: List[int],
+                 prompt_token_ids: List[Sequence[int]],
+                 output_token_ids: List[Sequence[int]],
+                 logits: torch.Tensor) -> torch.Tensor:
+        self.calls.append(seq_ids)
+        return logits + torch.tensor(
+            seq_ids, dtype=logits.dtype, device=logits.device).unsqueeze(1)
+
+
+@pytest.mark.parametrize("device", CUDA_DEVICES)
+def test_batched_logits_processors(device: str):
+    torch.set_default_device(device)
+    batch_size = 8
+    vocab_size = 32000
+    input_tensor, fake_logits, logits_processor = _prepare_test(batch_size)
+    allow_tokens = AllowTokensProcessor(num_tokens=3)
+    also_allow_tokens = AllowTokensProcessor(num_tokens=2)
+    add_seq_id = AddSeqIdProcessor()
+
+    seq_group_metadata_list = []
+    seq_lens = []
+    for i in range(batch_size):
+        # The even groups are restricted by a second processor.
+        logits_processors = [allow_tokens, add_seq_id]
+        if i % 2 == 0:
+            logits_processors.append(also_allow_tokens)
+        seq_group_metadata_list.append(
+            SequenceGroupMetadata(
+                request_id=f"test_{i}",
+                is_prompt=False,
+                seq_data={i: SequenceData([1, 2, 3], [4] * i)},
+                sampling_params=SamplingParams(
+                    temperature=0, logits_processors=logits_processors),
+                block_tables={i: [1]},
+            ))
+        seq_lens.append(seq_group_metadata_list[-1].seq_data[i].get_len())
+
+    sampling_metadata = SamplingMetadata.prepare(
+        seq_group_metadata_list,
+        seq_lens,
+        query_lens=None,
+        device=device,
+        pin_memory=is_pin_memory_available())
+    logits_processor_output = logits_processor(
+        embedding=None,
+        hidden_states=input_tensor,
+        sampling_metadata=sampling_metadata)
+
+    # Each processor is called once, with all its sequences.
+    seq_ids = list(range(batch_size))
+    assert allow_tokens.calls == [seq_ids]
+    assert add_seq_id.calls == [seq_ids]
+    assert also_allow_tokens.calls == [seq_ids[::2]]
+
+    fake_logits *= logits_processor.scale
+    for i in range(batch_size):
+        num_allowed = 2 if i % 2 == 0 else 3
+        allowed = torch.zeros(vocab_size, dtype=torch.bool)
+        allowed[i:i + num_allowed] = True
+        row = logits_processor_output[i]
+        assert torch.isinf(row[~allowed]).all()
+        assert torch.allclose(row[allowed], fake_logits[i, allowed] + i)
+
+
+@pytest.mark.parametrize("device", CUDA_DEVICES)
+def test_logits_processors_order(device: str):
+    torch.set_default_device(device)
+    batch_size = 4
+    input_tensor, fake_logits, logits_processor = _prepare_test(batch_size)
+    allow_tokens = AllowTokensProcessor(num_tokens=3)
+    # seq id -> the number of tokens the function saw allowed.
+    num_allowed_seen = {}
+
+    def count_allowed(seq_id: int):
+
+        def fn(token_ids: List[int], logits: torch.Tensor) -> torch.Tensor:
+            num_allowed_seen[seq_id] = int(torch.isfinite(logits).sum())
+            return logits
+
+        return fn
+
+    seq_group_metadata_list = []
+    seq_lens = []
+    for i in range(batch_size):
+        # The function of the odd groups comes after the batched processor.
+        logits_processors = [count_allowed(i), allow_tokens]
+        if i % 2 == 1:
+            logits_processors.reverse()
+        seq_group_metadata_list.append(
+            SequenceGroupMetadata(
+                request_id=f"test_{i}",
+                is_prompt=False,
+                seq_data={i: SequenceData([1, 2, 3], [4] * i)},
+                sampling_params=SamplingParams(
+                    temperature=0, logits_processors=logits_processors),
+                block_tables={i: [1]},
+            ))
+        seq_lens.append(seq_group_metadata_list[-1].seq_data[i].get_len())
+
+    sampling_metadata = SamplingMetadata.prepare(
+        seq_group_metadata_list,
+        seq_lens,
+        query_lens=None,
+        device=device,
+        pin_memory=is_pin_memory_available())
+    logits_processor_output = logits_processor(
+        embedding=None,
+        hidden_states=input_tensor,
+        sampling_metadata=sampling_metadata)
+
+    vocab_size = fake_logits.shape[-1]
+    assert num_allowed_seen == {0: vocab_size, 1: 3, 2: vocab_size, 3: 3}
+    # The even groups are batched, the odd ones are processed in order.
+    assert allow_tokens.calls == [[1], [3], [0, 2]]
+    assert torch.isfinite(logits_processor_output).sum(
+        dim=-1).tolist() == [3] * batch_size
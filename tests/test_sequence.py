@@ -1,7 +1,14 @@
+import copy
+import pickle
+from array import array
+
 import pytest
 
-from vllm.sequence import (CompletionSequenceGroupOutput, SamplerOutput,
-                           SequenceData, SequenceOutput)
+from vllm.outputs import RequestOutput
+from vllm.sampling_params import RequestOutputKind, SamplingParams
+from vllm.sequence import (CompletionSequenceGroupOutput, Logprob,
+                           SamplerOutput, SequenceData, SequenceOutput,
+                           SequenceStatus)
 
 from .core.utils import create_dummy_prompt
 
@@ -74,6 +81,63 @@ def test_sequence_data_prefill():
     assert seq_data.get_num_computed_tokens() == 0
 
 
+def test_sequence_data_token_ids():
+    seq_data = SequenceData(prompt_token_ids=[1, 2, 3, 4])
+    seq_data.append_token_id(5, logprob=0.0)
+    seq_data.append_token_id(6, logprob=0.0)
+    assert seq_data.get_token_ids() == [1, 2, 3, 4, 5, 6]
+    assert seq_data.get_last_token_id() == 6
+    for start in range(7):
+        for end in range(start, 7):
+            assert seq_data.get_token_ids_in_range(
+                start, end).tolist() == [1, 2, 3, 4, 5, 6][start:end]
+    assert seq_data.get_prefix_token_ids(3) == ((1, 2, 3), None)
+    assert seq_data.get_prefix_token_ids(5) == ((1, 2, 3, 4), (5, ))
+
+    seq_data.output_token_ids = [7]
+    assert seq_data.get_output_token_ids() == [7]
+
+    pickled = pickle.loads(pickle.dumps(seq_data))
+    assert pickled.get_token_ids() == seq_data.get_token_ids()
+    assert pickled.cumulative_logprob == seq_data.cumulative_logprob
+    assert pickled.stage == seq_data.stage
+
+
+def test_token_ids_view():
+    seq_data = SequenceData(prompt_token_ids=[1, 2, 3])
+    seq_data.append_token_id(4, logprob=0.0)
+    view = seq_data.get_token_ids()
+    # Tokens appended after the view was created are not part of it.
+    seq_data.append_token_id(5, logprob=0.0)
+
+    assert len(view) == 4
+    assert list(view) == view.tolist() == [1, 2, 3, 4]
+    assert [view[i] for i in range(-4, 4)] == [1, 2, 3, 4, 1, 2, 3, 4]
+    with pytest.raises(IndexError):
+        view[4]
+    assert view[1:] == [2, 3, 4]
+    assert view[2:3] == [3]
+    assert view[::-1] == [4, 3, 2, 1]
+    assert view[3:1] == []
+    assert view == array("q", [1, 2, 3, 4])
+    assert view != [1, 2, 3, 4, 5]
+    assert view == seq_data.get_token_ids()[:4]
+    assert view < seq_data.get_token_ids()
+    assert sorted([seq_data.get_output_token_ids(), view]) == [[1, 2, 3, 4],
+                                                               [4, 5]]
+    assert 3 in view
+    assert repr(view) == "[1, 2, 3, 4]"
+    # Like a list, it can be concatenated, and like a tuple, hashed.
+    assert view + [5] == [1, 2, 3, 4, 5]
+    assert [0] + view == [0, 1, 2, 3, 4]
+    assert view + seq_data.get_output_token_ids() == [1, 2, 3, 4, 4, 5]
+    assert hash(view) == hash((1, 2, 3, 4))
+    assert len({view, SequenceData([1, 2, 3, 4]).get_token_ids()}) == 1
+    # The view is read-only.
+    with pytest.raises(TypeError):
+        view[0] = 0  # type: ignore
+
+
 def test_sequence_group_stage():
     _, seq_group = create_dummy_prompt("1", 12)
     assert seq_group.is_prefill() is True
@@ -95,3 +159,61 @@ def test_sequence_group_stage():
     assert seq_group.is_prefill() is True
     seq_group.update_num_computed_tokens(1)
     assert seq_group.is_prefill() is False
+
+
+class _CountingDecoder:
+
+    def __init__(self):
+        self.num_calls = 0
+
+    def __call__(self) -> str:
+        self.num_calls += 1
+        return "hello"
+
+
+def test_logprob_lazy_decoded_token():
+    decoder = _CountingDecoder()
+    logprob = Logprob(-1.0, rank=2)
+    logprob.set_lazy_decoded_token(decoder)
+    assert decoder.num_calls == 0
+
+    # Copies keep the text undecoded.
+    pickled = pickle.loads(pickle.dumps(logprob))
+    assert copy.deepcopy(logprob) == Logprob(-1.0, 2, "hello")
+    assert pickled.decoded_token == "hello"
+    assert decoder.num_calls == 0
+
+    assert logprob.decoded_token == "hello"
+    assert logprob.decoded_token == "hello"
+    assert decoder.num_calls == 1
+    assert logprob == Logprob(-1.0, 2, "hello")
+    logprob.decoded_token = "world"
+    assert logprob != Logprob(-1.0, 2, "hello")
+
+
+@pytest.mark.parametrize("output_kind", list(RequestOutputKind))
+def test_request_output_kind(output_kind: RequestOutputKind):
+    """Delta outputs hold the same text and tokens as the cumulative ones,
+    split across the outputs."""
+    seq, seq_group = create_dummy_prompt("1", 4)
+    seq_group.sampling_params = SamplingParams(stop=["xyz"],
+                                               output_kind=output_kind)
+    outputs = []
+    for token_id, text in enumerate(["a", "bc", "d", "e"]):
+        seq.append_token_id(token_id, {token_id: Logprob(0.0)})
+        seq.output_text += text
+        outputs.append(RequestOutput.from_seq_group(seq_group).outputs[0])
+    seq.status = SequenceStatus.FINISHED_STOPPED
+    outputs.append(RequestOutput.from_seq_group(seq_group).outputs[0])
+
+    texts = [output.text for output in outputs]
+    token_ids = [output.token_ids for output in outputs]
+    if output_kind == RequestOutputKind.DELTA:
+        # The last 2 characters are held back for the stop string until the
+        # sequence finishes.
+        assert texts == ["", "a", "b", "c", "de"]
+        assert token_ids == [[0], [1], [2], [3], []]
+    else:
+        assert texts == ["", "a", "ab", "abc", "abcde"]
+        assert token_ids == [[0], [0, 1], [0, 1, 2], [0, 1, 2, 3],
+                             [0, 1, 2, 3]]
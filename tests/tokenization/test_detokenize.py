@@ -1,10 +1,12 @@
-from typing import Dict, List
+import random
+from typing import Dict, List, Optional
 
 import pytest
 from transformers import AutoTokenizer
 
 from vllm.sequence import Logprob, SamplingParams, Sequence, SequenceGroup
-from vllm.transformers_utils.detokenizer import (Detokenizer,
+from vllm.transformers_utils.detokenizer import (INVALID_TOKEN_ID, Detokenizer,
+                                                 convert_prompt_ids_to_tokens,
                                                  detokenize_incrementally)
 from vllm.transformers_utils.tokenizer_group import get_tokenizer_group
 
@@ -208,3 +210,121 @@ def test_decode_prompt_logprobs(complete_sequence: str,
             logprobs[token_id + 1].decoded_token for token_id, logprobs in zip(
                 complete_sequence_token_ids, decoded_prompt_logprobs)
         ])
+
+
+@pytest.mark.parametrize("tokenizer_name,is_byte_level", [
+    ("facebook/opt-125m", True),
+    ("gpt2", True),
+    ("meta-llama/Llama-2-7b-hf", False),
+])
+def test_get_token_bytes(detokenizer: Detokenizer, tokenizer_name: str,
+                         is_byte_level: bool):
+    tokenizer = detokenizer.get_tokenizer_for_seq(create_sequence())
+    token_bytes = detokenizer.get_token_bytes(tokenizer)
+    assert (token_bytes is not None) == is_byte_level
+    if token_bytes is not None:
+        assert len(token_bytes.token_bytes) == len(tokenizer)
+        token_ids = tokenizer(TRUTH[2], add_special_tokens=False)["input_ids"]
+        assert b"".join(
+            token_bytes.convert_ids_to_bytes(
+                token_ids, skip_special_tokens=True)).decode() == TRUTH[2]
+
+
+def _decode_sequence_reference(tokenizer, seq: Sequence,
+                               prms: SamplingParams) -> int:
+    """Decodes the new token of a sequence from the token strings of the
+    whole sequence."""
+    all_input_ids = seq.get_token_ids()
+    if seq.tokens is None:
+        (seq.tokens, seq.prefix_offset,
+         seq.read_offset) = convert_prompt_ids_to_tokens(
+             tokenizer,
+             all_input_ids[:-1],
+             skip_special_tokens=prms.skip_special_tokens)
+    for token_id, logprob in seq.output_logprobs[-1].items():
+        if token_id not in (all_input_ids[-1], INVALID_TOKEN_ID):
+            _, logprob.decoded_token, _, _ = detokenize_incrementally(
+                tokenizer,
+                all_input_ids[:-1] + [token_id],
+                seq.tokens,
+                seq.prefix_offset,
+                seq.read_offset,
+                skip_special_tokens=prms.skip_special_tokens)
+    (new_tokens, new_text, seq.prefix_offset,
+     seq.read_offset) = detokenize_incrementally(
+         tokenizer,
+         all_input_ids,
+         seq.tokens,
+         seq.prefix_offset,
+         seq.read_offset,
+         skip_special_tokens=prms.skip_special_tokens)
+    seq.tokens.extend(new_tokens)
+    seq.output_logprobs[-1][all_input_ids[-1]].decoded_token = new_text
+    seq.output_text += new_text
+    return len(new_text)
+
+
+def _get_decoded_logprobs(seq: Sequence) -> Dict[int, Optional[str]]:
+    return {
+        token_id: logprob.decoded_token
+        for token_id, logprob in seq.output_logprobs[-1].items()
+    }
+
+
+@pytest.mark.parametrize("tokenizer_name", TOKENIZERS)
+@pytest.mark.parametrize("skip_special_tokens", [True, False])
+def test_decode_sequences_parity(detokenizer: Detokenizer, tokenizer_name: str,
+                                 skip_special_tokens: bool):
+    """Verify the batched detokenization of a step matches the
+    detokenization of the token strings of each whole sequence, including for
+    special, out of bounds and random tokens which are not valid UTF-8 on
+    their own."""
+    tokenizer = detokenizer.get_tokenizer_for_seq(create_sequence())
+    sampling_params = SamplingParams(skip_special_tokens=skip_special_tokens,
+                                     logprobs=3)
+    special_ids = sorted(tokenizer.all_special_ids)
+    rng = random.Random(0)
+
+    def random_token_id() -> int:
+        value = rng.random()
+        if value < 0.05:
+            return rng.choice(special_ids)
+        if value < 0.07:
+            return len(tokenizer)
+        return rng.randrange(len(tokenizer))
+
+    outputs = [
+        tokenizer(truth, add_special_tokens=False)["input_ids"]
+        for truth in TRUTH
+    ] + [[random_token_id() for _ in range(64)] for _ in range(4)]
+    prompt_token_ids = tokenizer("Hello, my name is")["input_ids"]
+    seqs = [create_sequence(prompt_token_ids) for _ in outputs]
+    reference_seqs = [create_sequence(prompt_token_ids) for _ in outputs]
+
+    for step in range(max(len(output) for output in outputs)):
+        batch = []
+        for seq, reference_seq, output in zip(seqs, reference_seqs, outputs):
+            if step >= len(output):
+                continue
+            logprob_token_ids = [
+                output[step],
+                random_token_id(), INVALID_TOKEN_ID
+            ]
+            for s in (seq, reference_seq):
+                s.append_token_id(
+                    output[step], {
+                        token_id: Logprob(logprob=-float(i))
+                        for i, token_id in enumerate(logprob_token_ids)
+                    })
+            batch.append((seq, reference_seq))
+
+        new_char_counts = detokenizer.decode_sequences_inplace([
+            (seq, sampling_params) for seq, _ in batch
+        ])
+        for (seq,
+             reference_seq), new_char_count in zip(batch, new_char_counts):
+            assert new_char_count == _decode_sequence_reference(
+                tokenizer, reference_seq, sampling_params)
+            assert seq.output_text == reference_seq.output_text
+            assert (_get_decoded_logprobs(seq) == _get_decoded_logprobs(
+                reference_seq))
@@ -15,7 +15,7 @@ from ..conftest import get_tokenizer_pool_config
 
 
 @pytest.mark.asyncio
-@pytest.mark.parametrize("tokenizer_group_type", [None, "ray"])
+@pytest.mark.parametrize("tokenizer_group_type", [None, "ray", "process"])
 async def test_tokenizer_group(tokenizer_group_type):
     reference_tokenizer = AutoTokenizer.from_pretrained("gpt2")
     tokenizer_group = get_tokenizer_group(
@@ -37,7 +37,7 @@ async def test_tokenizer_group(tokenizer_group_type):
 
 
 @pytest.mark.asyncio
-@pytest.mark.parametrize("tokenizer_group_type", ["ray"])
+@pytest.mark.parametrize("tokenizer_group_type", ["ray", "process"])
 async def test_tokenizer_group_pool(tokenizer_group_type):
     reference_tokenizer = AutoTokenizer.from_pretrained("gpt2")
     tokenizer_group_pool = get_tokenizer_group(
@@ -64,6 +64,33 @@ async def test_tokenizer_group_pool(tokenizer_group_type):
     assert results == expected_results
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize("tokenizer_group_type", [None, "ray", "process"])
+async def test_tokenizer_group_encode_batch(tokenizer_group_type):
+    reference_tokenizer = AutoTokenizer.from_pretrained("gpt2")
+    tokenizer_group = get_tokenizer_group(
+        get_tokenizer_pool_config(tokenizer_group_type),
+        tokenizer_id="gpt2",
+        enable_lora=False,
+        max_num_seqs=1,
+        max_input_length=16,
+    )
+    # More prompts than processes, in order.
+    prompts = [f"prompt {i}" * (i % 3 + 1) for i in range(7)]
+    expected_results = [
+        reference_tokenizer.encode(prompt) for prompt in prompts
+    ]
+    assert tokenizer_group.encode_batch(prompts) == expected_results
+    assert await tokenizer_group.encode_batch_async(prompts
+                                                    ) == expected_results
+    assert tokenizer_group.encode_batch([]) == []
+
+    with pytest.raises(ValueError):
+        tokenizer_group.encode_batch(["prompt " * 20])
+    with pytest.raises(ValueError):
+        await tokenizer_group.encode_batch_async(["prompt " * 20])
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize("tokenizer_group_type", ["ray"])
 async def test_tokenizer_group_ray_pool_env_var_propagation(
@@ -0,0 +1,98 @@
+import pytest
+import torch
+
+from vllm.core.block.transfers import OffloadCopy, OffloadTransfers
+from vllm.worker.kv_offload import KVCacheOffloader
+
+
+def _paged_attn_shape(num_blocks: int):
+    return (2, num_blocks, 8)
+
+
+def _flashinfer_shape(num_blocks: int):
+    return (num_blocks, 2, 4, 2)
+
+
+@pytest.mark.parametrize("get_kv_cache_shape",
+                         [_paged_attn_shape, _flashinfer_shape])
+def test_offload_round_trip(get_kv_cache_shape, tmp_path):
+    num_layers = 2
+    num_device_blocks = 4
+    offloader = KVCacheOffloader(get_kv_cache_shape,
+                                 num_layers=num_layers,
+                                 dtype=torch.float32,
+                                 num_host_blocks=2,
+                                 num_disk_blocks=2,
+                                 disk_path=str(tmp_path))
+    # The backing file is unlinked once mapped.
+    assert not list(tmp_path.iterdir())
+
+    device_cache = [
+        torch.rand(get_kv_cache_shape(num_device_blocks))
+        for _ in range(num_layers)
+    ]
+    original = [layer.clone() for layer in device_cache]
+    block_dim = offloader.block_dim
+
+    # Demote blocks 0 and 1 to the host, then block 0 on to the disk while
+    # block 2 takes its host slot.
+    offloader.transfer(
+        OffloadTransfers(copies=[
+            (OffloadCopy.GPU_TO_HOST, 0, 0),
+            (OffloadCopy.GPU_TO_HOST, 1, 1),
+            (OffloadCopy.HOST_TO_DISK, 0, 1),
+            (OffloadCopy.GPU_TO_HOST, 2, 0),
+        ]), device_cache)
+
+    # Overwrite the device blocks and load them back from the tiers.
+    for layer in device_cache:
+        layer.zero_()
+    offloader.transfer(
+        OffloadTransfers(copies=[
+            (OffloadCopy.DISK_TO_GPU, 1, 3),
+            (OffloadCopy.HOST_TO_GPU, 1, 1),
+            (OffloadCopy.HOST_TO_GPU, 0, 2),
+        ]), device_cache)
+
+    for layer, expected in zip(device_cache, original):
+        assert torch.equal(layer.select(block_dim, 3),
+                           expected.select(block_dim, 0))
+        assert torch.equal(layer.select(block_dim, 1),
+                           expected.select(block_dim, 1))
+        assert torch.equal(layer.select(block_dim, 2),
+                           expected.select(block_dim, 2))
+        assert not layer.select(block_dim, 0).any()
+
+
+def test_persistent_disk_tier(tmp_path):
+    disk_file = str(tmp_path / "store" / "rank0.bin")
+    device_cache = [torch.rand(_paged_attn_shape(2))]
+    original = device_cache[0].clone()
+
+    offloader = KVCacheOffloader(_paged_attn_shape,
+                                 num_layers=1,
+                                 dtype=torch.float32,
+                                 num_host_blocks=1,
+                                 num_disk_blocks=2,
+                                 disk_file=disk_file)
+    offloader.transfer(
+        OffloadTransfers(copies=[
+            (OffloadCopy.GPU_TO_DISK, 0, 1),
+            (OffloadCopy.GPU_TO_DISK, 1, 0),
+        ]), device_cache)
+    del offloader
+
+    # A new offloader, as created after a restart, maps the same content.
+    offloader = KVCacheOffloader(_paged_attn_shape,
+                                 num_layers=1,
+                                 dtype=torch.float32,
+                                 num_host_blocks=1,
+                                 num_disk_blocks=2,
+                                 disk_file=disk_file)
+    device_cache[0].zero_()
+    offloader.transfer(
+        OffloadTransfers(copies=[
+            (OffloadCopy.DISK_TO_GPU, 1, 0),
+            (OffloadCopy.DISK_TO_GPU, 0, 1),
+        ]), device_cache)
+    assert torch.equal(device_cache[0], original)
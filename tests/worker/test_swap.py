@@ -1,8 +1,12 @@
+import pytest
 import torch
 
+from vllm.core.block.common import coalesce_block_copies
 from vllm.engine.arg_utils import EngineArgs
 from vllm.sequence import ExecuteModelRequest
 from vllm.utils import get_distributed_init_method, get_ip, get_open_port
+from vllm.worker.cache_engine import (copy_block_runs, get_block_major_views,
+                                      split_block_extents)
 from vllm.worker.worker import Worker
 
 
@@ -53,8 +57,9 @@ def test_swap() -> None:
     allclose = lambda a, b: torch.allclose(
         a.cuda(), b.cuda(), rtol=0.0, atol=0.0)
 
-    # Test swap out.
-    blocks_to_swap_out = [(3, 72), (56, 35), (84, 34)]
+    # Test swap out, with a run of consecutive blocks which is copied at once.
+    blocks_to_swap_out = [(3, 72), (56, 35), (84, 34), (12, 92), (11, 91),
+                          (10, 90)]
     execute_model_req = ExecuteModelRequest(
         seq_group_metadata_list=[],
         blocks_to_swap_in=[],
@@ -78,6 +83,8 @@ def test_swap() -> None:
         (12, 78),
         (40, 99),
         (1, 71),
+        (500, 600),
+        (501, 601),
     ]
     worker.execute_model(execute_model_req=execute_model_req)
 
@@ -87,3 +94,27 @@ def test_swap() -> None:
         for src, dst in execute_model_req.blocks_to_swap_in:
             assert allclose(gpu_key_cache[dst], cpu_key_cache[src])
             assert allclose(gpu_value_cache[dst], cpu_value_cache[src])
+
+
+@pytest.mark.parametrize("kv_cache_shape,block_dim", [
+    ((2, 16, 8), 1),
+    ((16, 2, 4, 2), 0),
+])
+def test_copy_block_runs(kv_cache_shape, block_dim):
+    src_cache = torch.rand(kv_cache_shape)
+    dst_cache = torch.zeros(kv_cache_shape)
+    src_to_dst = [(0, 5), (1, 6), (2, 7), (9, 1), (12, 14), (13, 15)]
+    extents = torch.tensor(coalesce_block_copies(src_to_dst)).view(-1, 3)
+
+    single, runs = split_block_extents(extents)
+    assert single.tolist() == [[9, 1]]
+    assert runs == [[0, 5, 3], [12, 14, 2]]
+    copy_block_runs(get_block_major_views(src_cache, block_dim),
+                    get_block_major_views(dst_cache, block_dim), runs)
+
+    for src, dst in src_to_dst:
+        if src == 9:
+            assert not dst_cache.select(block_dim, dst).any()
+        else:
+            assert torch.equal(dst_cache.select(block_dim, dst),
+                               src_cache.select(block_dim, src))
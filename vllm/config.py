@@ -1,7 +1,7 @@
 import enum
 import json
 from dataclasses import dataclass, field, fields
-from typing import TYPE_CHECKING, ClassVar, List, Optional, Tuple, Union
+from typing import TYPE_CHECKING, ClassVar, Dict, List, Optional, Tuple, Union
 
 import torch
 from transformers import PretrainedConfig
@@ -15,6 +15,7 @@ from vllm.utils import get_cpu_memory, is_cpu, is_hip, is_neuron
 if TYPE_CHECKING:
     from ray.util.placement_group import PlacementGroup
 
+    from vllm.core.preemption import PreemptionCostModel
     from vllm.model_executor.model_loader.loader import BaseModelLoader
 
 logger = init_logger(__name__)
@@ -351,6 +352,14 @@ class CacheConfig:
         cache_dtype: Data type for kv cache storage.
         num_gpu_blocks_override: Number of GPU blocks to use. This overrides the
             profiled num_gpu_blocks if specified. Does nothing if None.
+        kv_offload_host_space: Size of the host memory tier of the prefix
+            cache per GPU (in GiB), which keeps blocks evicted from the GPU.
+        kv_offload_disk_space: Size of the disk tier of the prefix cache per
+            GPU (in GiB), which keeps blocks evicted from the host tier.
+        kv_offload_path: Directory of the memory-mapped file backing the disk
+            tier. Defaults to the system temporary directory.
+        persistent_prefix_cache: Whether to keep the disk tier of the prefix
+            cache in kv_offload_path across engine restarts.
     """
 
     def __init__(
@@ -362,6 +371,10 @@ class CacheConfig:
         num_gpu_blocks_override: Optional[int] = None,
         sliding_window: Optional[int] = None,
         enable_prefix_caching: bool = False,
+        kv_offload_host_space: float = 0,
+        kv_offload_disk_space: float = 0,
+        kv_offload_path: Optional[str] = None,
+        persistent_prefix_cache: bool = False,
     ) -> None:
         self.block_size = block_size
         self.gpu_memory_utilization = gpu_memory_utilization
@@ -370,13 +383,37 @@ class CacheConfig:
         self.cache_dtype = cache_dtype
         self.sliding_window = sliding_window
         self.enable_prefix_caching = enable_prefix_caching
+        self.kv_offload_host_space_bytes = int(kv_offload_host_space * _GB)
+        self.kv_offload_disk_space_bytes = int(kv_offload_disk_space * _GB)
+        self.kv_offload_path = kv_offload_path
+        self.persistent_prefix_cache = persistent_prefix_cache
         self._verify_args()
         self._verify_cache_dtype()
         self._verify_prefix_caching()
+        self._verify_offload()
+        self._verify_persistent_prefix_cache()
 
         # Will be set after profiling.
         self.num_gpu_blocks = None
         self.num_cpu_blocks = None
+        self.preemption_cost_model: Optional["PreemptionCostModel"] = None
+
+        # Will be set once the size of a cache block is known.
+        self.num_host_offload_blocks = 0
+        self.num_disk_offload_blocks = 0
+
+    @property
+    def offload_enabled(self) -> bool:
+        return (self.kv_offload_host_space_bytes > 0
+                or self.kv_offload_disk_space_bytes > 0)
+
+    def set_num_offload_blocks(self, cache_block_size: int) -> None:
+        """Sets the number of blocks of the prefix cache offload tiers, given
+        the size of a cache block in bytes."""
+        self.num_host_offload_blocks = int(self.kv_offload_host_space_bytes //
+                                           cache_block_size)
+        self.num_disk_offload_blocks = int(self.kv_offload_disk_space_bytes //
+                                           cache_block_size)
 
     def metrics_info(self):
         # convert cache_config to dict(key: str, value: str) for prometheus
@@ -414,6 +451,29 @@ class CacheConfig:
                 "Prefix caching is not supported for fp8 cache_dtype. "
                 "Run with --kv-cache-dtype auto to use prefix caching.")
 
+    def _verify_offload(self) -> None:
+        if not self.offload_enabled:
+            return
+
+        if not self.enable_prefix_caching:
+            raise ValueError("KV cache offloading requires prefix caching. "
+                             "Run with --enable-prefix-caching to use it.")
+        if self.kv_offload_host_space_bytes <= 0:
+            raise ValueError(
+                "The disk tier of the KV cache only receives blocks evicted "
+                "from the host memory tier. Set --kv-offload-host-space too.")
+
+    def _verify_persistent_prefix_cache(self) -> None:
+        if not self.persistent_prefix_cache:
+            return
+
+        if (self.kv_offload_disk_space_bytes <= 0
+                or self.kv_offload_path is None):
+            raise ValueError(
+                "The persistent prefix cache is kept in the disk tier of the "
+                "KV cache. Set --kv-offload-disk-space and --kv-offload-path "
+                "to use it.")
+
     def verify_with_parallel_config(
         self,
         parallel_config: "ParallelConfig",
@@ -422,11 +482,13 @@ class CacheConfig:
         # FIXME(woosuk): Here, it is assumed that the GPUs in a tensor parallel
         # group are in the same node. However, the GPUs may span multiple nodes.
         num_gpus_per_node = parallel_config.tensor_parallel_size
-        cpu_memory_usage = self.swap_space_bytes * num_gpus_per_node
+        cpu_memory_usage = (
+            (self.swap_space_bytes + self.kv_offload_host_space_bytes) *
+            num_gpus_per_node)
 
         msg = (f"{cpu_memory_usage / _GB:.2f} GiB out of "
                f"the {total_cpu_memory / _GB:.2f} GiB total CPU memory is "
-               "allocated for the swap space.")
+               "allocated for the swap space and the KV cache offloading.")
         if cpu_memory_usage > 0.7 * total_cpu_memory:
             raise ValueError("Too large swap space. " + msg)
         elif cpu_memory_usage > 0.4 * total_cpu_memory:
@@ -439,7 +501,8 @@ class TokenizerPoolConfig:
 
     Args:
         pool_size: Number of tokenizer workers in the pool.
-        pool_type: Type of the pool.
+        pool_type: Type of the pool, "ray" for Ray actors or "process" for
+            local processes.
         extra_config: Additional config for the pool.
             The way the config will be used depends on the
             pool type.
@@ -449,7 +512,7 @@ class TokenizerPoolConfig:
     extra_config: dict
 
     def __post_init__(self):
-        if self.pool_type not in ("ray", ):
+        if self.pool_type not in ("ray", "process"):
             raise ValueError(f"Unknown pool type: {self.pool_type}")
         if not isinstance(self.extra_config, dict):
             raise ValueError("extra_config must be a dictionary.")
@@ -657,6 +720,27 @@ class SchedulerConfig:
             swapping. However, when the sequence group has multiple sequences
             (e.g., beam search), recomputation is not currently supported. In
             such a case, we use swapping instead.
+        policy: The scheduling policy ordering the waiting, running and
+            swapped queues. One of "fcfs", "priority", "sjf" (shortest
+            expected job first) or "fair" (weighted fair queueing across LoRA
+            adapters).
+        sjf_aging_rate: The expected tokens a sequence group is credited per
+            second since its arrival by the "sjf" policy, so that long
+            requests are not starved.
+        fair_queueing_weights: The weight of each LoRA int id (0 for the base
+            model) in the "fair" policy. Adapters without a weight have
+            weight 1.
+        prefix_aware_admission: Whether to admit the waiting sequence groups
+            with the most prompt tokens in the prefix cache first.
+        max_admission_skips: The number of steps a waiting sequence group can
+            be passed over by prefix-aware admission before it is admitted in
+            queue order again.
+        pipelined_step: Whether to schedule the next step while the model
+            executes the current one.
+        num_scheduler_steps: The number of decoding steps the workers run
+            back-to-back for each scheduled batch of decodes. The slots of
+            the new tokens are allocated ahead as lookahead slots, and the
+            stop conditions are checked once the steps are done.
     """
 
     def __init__(self,
@@ -668,7 +752,14 @@ class SchedulerConfig:
                  delay_factor: float = 0.0,
                  enable_chunked_prefill: bool = False,
                  embedding_mode: Optional[bool] = False,
-                 preemption_mode: Optional[str] = None) -> None:
+                 preemption_mode: Optional[str] = None,
+                 policy: str = "fcfs",
+                 sjf_aging_rate: float = 100.0,
+                 fair_queueing_weights: Optional[Dict[int, float]] = None,
+                 prefix_aware_admission: bool = False,
+                 max_admission_skips: int = 8,
+                 pipelined_step: bool = False,
+                 num_scheduler_steps: int = 1) -> None:
         if max_num_batched_tokens is not None:
             self.max_num_batched_tokens = max_num_batched_tokens
         else:
@@ -695,6 +786,19 @@ class SchedulerConfig:
         self.chunked_prefill_enabled = enable_chunked_prefill
         self.embedding_mode = embedding_mode
         self.preemption_mode = preemption_mode
+        self.policy = policy
+        self.sjf_aging_rate = sjf_aging_rate
+        # The keys are strings when the weights are parsed from JSON.
+        self.fair_queueing_weights: Optional[Dict[int, float]] = None
+        if fair_queueing_weights is not None:
+            self.fair_queueing_weights = {
+                int(lora_int_id): float(weight)
+                for lora_int_id, weight in fair_queueing_weights.items()
+            }
+        self.prefix_aware_admission = prefix_aware_admission
+        self.max_admission_skips = max_admission_skips
+        self.pipelined_step = pipelined_step
+        self.num_scheduler_steps = num_scheduler_steps
 
         self._verify_args()
 
@@ -721,6 +825,55 @@ class SchedulerConfig:
                 f"({self.num_lookahead_slots}) must be greater than or "
                 "equal to 0.")
 
+        if self.sjf_aging_rate < 0:
+            raise ValueError(
+                f"sjf_aging_rate ({self.sjf_aging_rate}) must be greater than "
+                "or equal to 0.")
+
+        if self.fair_queueing_weights is not None and any(
+                weight <= 0 for weight in self.fair_queueing_weights.values()):
+            raise ValueError("fair_queueing_weights must be positive, got "
+                             f"{self.fair_queueing_weights}.")
+
+        if self.max_admission_skips < 0:
+            raise ValueError(
+                "max_admission_skips "
+                f"({self.max_admission_skips}) must be greater than or "
+                "equal to 0.")
+
+        if self.pipelined_step:
+            if not self.use_v2_block_manager:
+                raise ValueError(
+                    "The pipelined engine step requires the v2 block "
+                    "manager. Set --use-v2-block-manager to use it.")
+            if self.num_lookahead_slots > 0:
+                raise ValueError("The pipelined engine step is not supported "
+                                 "with speculative decoding.")
+            if self.chunked_prefill_enabled:
+                raise ValueError("The pipelined engine step is not supported "
+                                 "with chunked prefill.")
+
+        if self.num_scheduler_steps < 1:
+            raise ValueError(
+                "num_scheduler_steps "
+                f"({self.num_scheduler_steps}) must be greater than or "
+                "equal to 1.")
+
+        if self.num_scheduler_steps > 1:
+            if not self.use_v2_block_manager:
+                raise ValueError(
+                    "Multi-step decoding requires the v2 block manager. Set "
+                    "--use-v2-block-manager to use it.")
+            if self.num_lookahead_slots > 0:
+                raise ValueError("Multi-step decoding is not supported with "
+                                 "speculative decoding.")
+            if self.chunked_prefill_enabled:
+                raise ValueError("Multi-step decoding is not supported with "
+                                 "chunked prefill.")
+            if self.pipelined_step:
+                raise ValueError("Multi-step decoding is not supported with "
+                                 "the pipelined engine step.")
+
 
 class DeviceConfig:
 
@@ -1295,6 +1448,14 @@ class DecodingConfig:
     # Which guided decoding algo to use. 'outlines' / 'lm-format-enforcer'
     guided_decoding_backend: str = 'outlines'
 
+    # Whether to detokenize the outputs of a step while the next step runs,
+    # returning them one step later.
+    async_detokenization: bool = False
+
+    # Whether to append the tokens forced by the guides of guided decoding
+    # without sampling them, computing them in a single prefill chunk.
+    guided_decoding_fast_forward: bool = False
+
     def __post_init__(self):
         valid_guided_backends = ['outlines', 'lm-format-enforcer']
         backend = self.guided_decoding_backend
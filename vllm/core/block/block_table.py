@@ -315,6 +315,15 @@ class BlockTable:
         token_blocks = self._chunk_token_blocks_for_append(all_token_ids)
         return len(token_blocks)
 
+    def get_num_blocks_touched_by_num_slots(self, num_slots: int) -> int:
+        """Same as get_num_blocks_touched_by_append_slots, but only needs the
+        total number of appended slots (token ids plus lookahead slots), which
+        avoids materializing the token ids.
+        """
+        first_chunk_size = self._block_size - (self._num_full_slots %
+                                               self._block_size)
+        return 1 + cdiv(max(num_slots - first_chunk_size, 0), self._block_size)
+
     def _chunk_token_blocks_for_append(
             self, token_ids: List[int]) -> List[List[int]]:
         """Split the token ids into block-sized chunks so they can be easily
@@ -195,3 +195,33 @@ def get_all_blocks_recursively(last_block: Block) -> List[Block]:
     all_blocks: List[Block] = []
     recurse(last_block, all_blocks)
     return all_blocks
+
+
+def coalesce_block_copies(
+    src_to_dst: Iterable[Tuple[BlockId, BlockId]]
+) -> List[Tuple[BlockId, BlockId, int]]:
+    """Merges block copies into extents of consecutive blocks.
+
+    The copies are sorted by source block first, so that the runs of a block
+    table allocated in descending order are merged too. This requires the
+    destination blocks to be distinct, which holds for swaps and
+    copy-on-writes.
+
+    Args:
+        src_to_dst (Iterable[Tuple[BlockId, BlockId]]): The (source,
+            destination) block copies.
+
+    Returns:
+        List[Tuple[BlockId, BlockId, int]]: The (source, destination, number
+            of blocks) extents, where the blocks source + i are copied to
+            destination + i.
+    """
+    extents: List[Tuple[BlockId, BlockId, int]] = []
+    for src, dst in sorted(src_to_dst):
+        if extents:
+            last_src, last_dst, num_blocks = extents[-1]
+            if src == last_src + num_blocks and dst == last_dst + num_blocks:
+                extents[-1] = (last_src, last_dst, num_blocks + 1)
+                continue
+        extents.append((src, dst, 1))
+    return extents
@@ -1,8 +1,9 @@
-from typing import Dict, FrozenSet, List, Optional, Tuple
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
 
 from vllm.core.block.interfaces import (Block, BlockAllocator, BlockId,
                                         DeviceAwareBlockAllocator)
 from vllm.core.block.naive_block import NaiveBlock, NaiveBlockAllocator
+from vllm.core.block.offload import TieredBlockCache
 from vllm.core.block.prefix_caching_block import PrefixCachingBlockAllocator
 from vllm.utils import Device
 
@@ -25,6 +26,7 @@ class CpuGpuBlockAllocator(DeviceAwareBlockAllocator):
         num_gpu_blocks: int,
         num_cpu_blocks: int,
         block_size: int,
+        offload_cache: Optional[TieredBlockCache] = None,
     ) -> DeviceAwareBlockAllocator:
         """Creates a CpuGpuBlockAllocator instance with the specified
         configuration.
@@ -43,6 +45,9 @@ class CpuGpuBlockAllocator(DeviceAwareBlockAllocator):
             num_cpu_blocks (int): The number of blocks to allocate for CPU
                 memory.
             block_size (int): The size of each block in number of tokens.
+            offload_cache (Optional[TieredBlockCache]): The offload tiers of
+                the GPU prefix cache. Only used by the "prefix_caching"
+                allocator.
 
         Returns:
             DeviceAwareBlockAllocator: A CpuGpuBlockAllocator instance with the
@@ -50,7 +55,8 @@ class CpuGpuBlockAllocator(DeviceAwareBlockAllocator):
 
         Notes:
             - The block IDs are assigned contiguously, with GPU block IDs coming
-                before CPU block IDs.
+                before CPU block IDs. GPU block IDs are thus also the physical
+                block numbers, which the offload transfers rely on.
         """
         block_ids = list(range(num_gpu_blocks + num_cpu_blocks))
         gpu_block_ids = block_ids[:num_gpu_blocks]
@@ -75,6 +81,7 @@ class CpuGpuBlockAllocator(DeviceAwareBlockAllocator):
                 num_blocks=num_gpu_blocks,
                 block_size=block_size,
                 block_ids=gpu_block_ids,
+                offload_cache=offload_cache,
             )
 
             cpu_allocator = PrefixCachingBlockAllocator(
@@ -290,6 +297,18 @@ class CpuGpuBlockAllocator(DeviceAwareBlockAllocator):
         return self._allocators[device].get_common_computed_block_ids(
             seq_block_ids)
 
+    def get_computed_cached_blocks(self) -> List[Tuple[int, int]]:
+        # Prefix caching only supported on GPU.
+        device = Device.GPU
+        return self._allocators[device].get_computed_cached_blocks()
+
+    def get_num_computed_prefix_blocks(self,
+                                       block_hashes: Iterable[int]) -> int:
+        # Prefix caching only supported on GPU.
+        device = Device.GPU
+        return self._allocators[device].get_num_computed_prefix_blocks(
+            block_hashes)
+
     @property
     def all_block_ids(self) -> FrozenSet[int]:
         return frozenset(self._block_ids_to_allocator.keys())
@@ -0,0 +1,35 @@
+"""Content hashes of token blocks for prefix caching.
+
+Kept free of other vLLM imports, so that both the block allocators and
+`vllm.sequence` can use it.
+"""
+from typing import Optional, Sequence
+
+
+def hash_block_tokens(is_first_block: bool, prev_block_hash: Optional[int],
+                      cur_block_token_ids: Sequence[int]) -> int:
+    """Computes a hash value corresponding to the contents of a block and
+    the contents of the preceding block(s). The hash value is used for
+    prefix caching.
+
+    NOTE: Content-based hashing does not yet support LoRA.
+
+    Parameters:
+    - is_first_block (bool): A flag indicating if the block is the first in
+        the sequence.
+    - prev_block_hash (Optional[int]): The hash of the previous block. None
+        if this is the first block.
+    - cur_block_token_ids (Sequence[int]): The token ids in the current
+        block. The current block is assumed to be full.
+
+    Returns:
+    - int: The computed hash value for the block.
+    """
+    assert (prev_block_hash is None) == is_first_block
+    # The hash of None depends on its address before Python 3.12, so it is
+    # replaced by 0 to keep the hashes stable across processes, which the
+    # persistent prefix cache relies on. The first block is still told
+    # apart by is_first_block.
+    if prev_block_hash is None:
+        prev_block_hash = 0
+    return hash((is_first_block, prev_block_hash, *cur_block_token_ids))
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Dict, FrozenSet, List, Optional, Protocol, Tuple
+from typing import Dict, FrozenSet, Iterable, List, Optional, Protocol, Tuple
 
 from vllm.utils import Device
 
@@ -151,6 +151,15 @@ class BlockAllocator(ABC):
             self, seq_block_ids: List[List[int]]) -> List[int]:
         pass
 
+    @abstractmethod
+    def get_computed_cached_blocks(self) -> List[Tuple[int, int]]:
+        pass
+
+    @abstractmethod
+    def get_num_computed_prefix_blocks(self,
+                                       block_hashes: Iterable[int]) -> int:
+        pass
+
     @abstractmethod
     def cow_block_if_not_appendable(self, block: Block) -> Optional["BlockId"]:
         """NOTE: This should not be used besides Block"""
@@ -222,6 +231,15 @@ class DeviceAwareBlockAllocator(ABC):
             self, seq_block_ids: List[List[int]]) -> List[int]:
         pass
 
+    @abstractmethod
+    def get_computed_cached_blocks(self) -> List[Tuple[int, int]]:
+        pass
+
+    @abstractmethod
+    def get_num_computed_prefix_blocks(self,
+                                       block_hashes: Iterable[int]) -> int:
+        pass
+
     @abstractmethod
     def get_num_blocks_touched(self,
                                blocks: List[Block],
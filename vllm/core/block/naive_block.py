@@ -222,6 +222,23 @@ class NaiveBlockAllocator(BlockAllocator):
         """
         return []
 
+    def get_computed_cached_blocks(self) -> List[Tuple[int, BlockId]]:
+        """Return the content hash and id of the computed cached blocks.
+
+        Since the naive allocator does not support prefix caching, always return
+        an empty list.
+        """
+        return []
+
+    def get_num_computed_prefix_blocks(self,
+                                       block_hashes: Iterable[int]) -> int:
+        """Determine how many leading blocks of a prefix are cached.
+
+        Since the naive allocator does not support prefix caching, always return
+        0.
+        """
+        return 0
+
     def promote_to_immutable_block(self, block: Block) -> BlockId:
         raise NotImplementedError
 
@@ -0,0 +1,219 @@
+"""Tiered offloading of prefix-cached KV blocks."""
+import enum
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from vllm.core.block.interfaces import BlockId
+from vllm.core.block.prefix_cache_store import PrefixCacheStore
+from vllm.core.block.transfers import OffloadCopy, OffloadTransfers
+
+PrefixHash = int
+
+
+class OffloadTier(enum.Enum):
+    """Storage tiers below the GPU KV cache, from fastest to slowest."""
+    HOST = enum.auto()
+    DISK = enum.auto()
+
+
+class _TierIndex:
+    """LRU index of the blocks stored in one offload tier."""
+
+    def __init__(self, num_slots: int):
+        self.num_slots = num_slots
+        self._free_slots: List[int] = list(range(num_slots - 1, -1, -1))
+        # Ordered from the least to the most recently used.
+        self._slots: "OrderedDict[PrefixHash, int]" = OrderedDict()
+
+    def __contains__(self, content_hash: PrefixHash) -> bool:
+        return content_hash in self._slots
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def items(self) -> List[Tuple[PrefixHash, int]]:
+        """Returns the (content hash, slot) of the blocks, from the least to
+        the most recently used."""
+        return list(self._slots.items())
+
+    def restore(self, blocks: Iterable[Tuple[PrefixHash, int]]) -> None:
+        """Fills the empty index with the given blocks, from the least to the
+        most recently used."""
+        assert not self._slots
+        for content_hash, slot in blocks:
+            self._slots[content_hash] = slot
+        used_slots = set(self._slots.values())
+        self._free_slots = [
+            slot for slot in self._free_slots if slot not in used_slots
+        ]
+
+    def get(self, content_hash: PrefixHash) -> Optional[int]:
+        """Returns the slot of the given block and marks it as recently used,
+        or returns None."""
+        slot = self._slots.get(content_hash)
+        if slot is not None:
+            self._slots.move_to_end(content_hash)
+        return slot
+
+    def is_full(self) -> bool:
+        return not self._free_slots
+
+    def evict(self) -> Tuple[PrefixHash, int]:
+        """Removes the least recently used block from the index and returns
+        its hash and slot. The slot is free again once the block is copied
+        out of it."""
+        content_hash, slot = self._slots.popitem(last=False)
+        self._free_slots.append(slot)
+        return content_hash, slot
+
+    def allocate(self, content_hash: PrefixHash) -> int:
+        """Adds the given block to the index and returns its slot."""
+        assert content_hash not in self._slots
+        slot = self._free_slots.pop()
+        self._slots[content_hash] = slot
+        return slot
+
+
+class TieredBlockCache:
+    """Keeps the content of prefix-cached blocks evicted from the GPU in host
+    memory and, below it, in a memory-mapped file, so that a later request
+    with the same prefix can load the blocks instead of recomputing them.
+
+    Both tiers are managed as LRU caches keyed by the content hash of the
+    blocks. A block evicted from the GPU is demoted to the host tier, and a
+    block evicted from the host tier is demoted to the disk tier. Blocks are
+    promoted back to the GPU on a hash hit, while a copy stays in the tier.
+
+    This class only does the bookkeeping; the copies are recorded as
+    `OffloadTransfers` and executed by the worker's cache engine.
+
+    With a `PrefixCacheStore`, the disk tier outlives the engine: it starts
+    with the blocks saved by the previous engine, and `persist` followed by
+    `save` writes the whole prefix cache to it.
+
+    Args:
+        num_host_blocks (int): The number of blocks in the host memory tier.
+        num_disk_blocks (int): The number of blocks in the disk tier.
+        store (Optional[PrefixCacheStore]): The store of the disk tier, if it
+            is persistent.
+    """
+
+    def __init__(self,
+                 num_host_blocks: int,
+                 num_disk_blocks: int,
+                 store: Optional[PrefixCacheStore] = None):
+        self._tiers: Dict[OffloadTier, _TierIndex] = {
+            OffloadTier.HOST: _TierIndex(num_host_blocks),
+            OffloadTier.DISK: _TierIndex(num_disk_blocks),
+        }
+        self._transfers = OffloadTransfers()
+
+        self._store = store
+        if store is not None:
+            self._tiers[OffloadTier.DISK].restore(store.pop_restored_blocks())
+
+        # Hit statistics since the last call to get_and_reset_stats, keyed
+        # by the name of the tier serving the hit ("gpu", "host", "disk").
+        self._num_queries = 0
+        self._num_hits: Dict[str, int] = {"gpu": 0, "host": 0, "disk": 0}
+
+    def __contains__(self, content_hash: PrefixHash) -> bool:
+        return any(content_hash in tier for tier in self._tiers.values())
+
+    @property
+    def is_persistent(self) -> bool:
+        return self._store is not None
+
+    def get_num_blocks(self, tier: OffloadTier) -> int:
+        return len(self._tiers[tier])
+
+    def record_gpu_hit(self) -> None:
+        """Records a lookup which was served by the GPU prefix cache."""
+        self._num_queries += 1
+        self._num_hits["gpu"] += 1
+
+    def offload(self, content_hash: PrefixHash, block_id: BlockId) -> None:
+        """Demotes a block that is evicted from the GPU to the host tier.
+
+        If the host tier is full, its least recently used block is demoted to
+        the disk tier, whose least recently used block is dropped in turn.
+        Blocks that are already offloaded are only marked as recently used.
+        """
+        host = self._tiers[OffloadTier.HOST]
+        if host.get(content_hash) is not None or host.num_slots == 0:
+            return
+
+        if host.is_full():
+            content_hash_to_demote, host_slot = host.evict()
+            self._copy_to_disk(content_hash_to_demote,
+                               OffloadCopy.HOST_TO_DISK, host_slot)
+        host_slot = host.allocate(content_hash)
+        self._transfers.append(OffloadCopy.GPU_TO_HOST, block_id, host_slot)
+
+    def _copy_to_disk(self, content_hash: PrefixHash, kind: OffloadCopy,
+                      src: int) -> None:
+        disk = self._tiers[OffloadTier.DISK]
+        if disk.get(content_hash) is not None or disk.num_slots == 0:
+            return
+
+        if self._store is not None:
+            self._store.invalidate()
+        if disk.is_full():
+            disk.evict()
+        disk_slot = disk.allocate(content_hash)
+        self._transfers.append(kind, src, disk_slot)
+
+    def persist(self, gpu_blocks: Iterable[Tuple[PrefixHash,
+                                                 BlockId]]) -> None:
+        """Copies the blocks of the host tier and the given computed GPU
+        blocks to the disk tier, as far as they fit, so that `save` keeps the
+        whole prefix cache."""
+        for content_hash, host_slot in self._tiers[OffloadTier.HOST].items():
+            self._copy_to_disk(content_hash, OffloadCopy.HOST_TO_DISK,
+                               host_slot)
+        for content_hash, block_id in gpu_blocks:
+            self._copy_to_disk(content_hash, OffloadCopy.GPU_TO_DISK, block_id)
+
+    def save(self) -> None:
+        """Saves the index of the disk tier to the store, once the recorded
+        transfers are executed."""
+        assert self._store is not None
+        assert self._transfers.is_empty()
+        self._store.save(self._tiers[OffloadTier.DISK].items())
+
+    def load(self, content_hash: PrefixHash, block_id: BlockId) -> bool:
+        """Looks up a block that missed in the GPU prefix cache and, if it is
+        offloaded, schedules loading it into the given GPU block.
+
+        Returns:
+            bool: Whether the block was found in one of the tiers.
+        """
+        self._num_queries += 1
+
+        slot = self._tiers[OffloadTier.HOST].get(content_hash)
+        if slot is not None:
+            self._num_hits["host"] += 1
+            self._transfers.append(OffloadCopy.HOST_TO_GPU, slot, block_id)
+            return True
+
+        slot = self._tiers[OffloadTier.DISK].get(content_hash)
+        if slot is not None:
+            self._num_hits["disk"] += 1
+            self._transfers.append(OffloadCopy.DISK_TO_GPU, slot, block_id)
+            return True
+
+        return False
+
+    def get_and_clear_transfers(self) -> OffloadTransfers:
+        """Returns the transfers recorded since the last call."""
+        transfers = self._transfers
+        self._transfers = OffloadTransfers()
+        return transfers
+
+    def get_and_reset_stats(self) -> Tuple[int, Dict[str, int]]:
+        """Returns the number of lookups and the number of hits per tier since
+        the last call."""
+        stats = (self._num_queries, self._num_hits)
+        self._num_queries = 0
+        self._num_hits = {tier: 0 for tier in self._num_hits}
+        return stats
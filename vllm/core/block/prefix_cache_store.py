@@ -0,0 +1,181 @@
+"""On-disk store keeping the disk tier of the prefix cache across restarts."""
+import contextlib
+import glob
+import hashlib
+import json
+import os
+import sys
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import filelock
+
+from vllm.logger import init_logger
+
+logger = init_logger(__name__)
+
+PrefixHash = int
+
+# Bump when the layout of the store or the block hashes change.
+_STORE_VERSION = 1
+_INDEX_FILE = "index.json"
+_LOCK_FILE = ".lock"
+
+
+class PrefixCacheStore:
+    """Keeps the index of the disk tier of the prefix cache on disk, so that
+    the blocks in the memory-mapped files of the workers can be reused by the
+    next engine.
+
+    The store lives in a subdirectory of `root` named after the fingerprint
+    of the KV cache, i.e. the model and the cache configuration determining
+    the content and the layout of the blocks. It contains one data file per
+    tensor parallel rank, written by the workers, and an index mapping the
+    content hashes of the blocks to their slots in the data files.
+
+    The index is only valid while the data files are not written to. It is
+    therefore removed when the store is opened and whenever the disk tier
+    changes after a save, so that an engine which does not shut down cleanly
+    leaves an empty cache behind rather than a stale one.
+
+    Args:
+        root (str): The directory containing the stores.
+        fingerprint (Dict[str, Any]): The properties of the KV cache that
+            have to match for a block to be reused.
+        num_blocks (int): The number of blocks of the disk tier.
+    """
+
+    def __init__(self, root: str, fingerprint: Dict[str, Any],
+                 num_blocks: int):
+        self.fingerprint = dict(fingerprint,
+                                version=_STORE_VERSION,
+                                python=list(sys.version_info[:2]))
+        self.num_blocks = num_blocks
+        self.directory = self.get_directory(root, fingerprint)
+
+        self._lock: Optional[filelock.FileLock] = None
+        self._restored_blocks: List[Tuple[PrefixHash, int]] = []
+        self._index_saved = False
+
+    @staticmethod
+    def get_directory(root: str, fingerprint: Dict[str, Any]) -> str:
+        key = json.dumps(dict(fingerprint, version=_STORE_VERSION),
+                         sort_keys=True)
+        digest = hashlib.sha256(key.encode()).hexdigest()[:16]
+        return os.path.join(root, f"prefix-cache-{digest}")
+
+    @staticmethod
+    def get_data_file(directory: str, rank: int) -> str:
+        return os.path.join(directory, f"rank{rank}.bin")
+
+    @property
+    def _index_path(self) -> str:
+        return os.path.join(self.directory, _INDEX_FILE)
+
+    def open(self) -> None:
+        """Locks the store and reads its index. Stale stores, written for
+        another KV cache layout or another number of blocks, are cleared.
+
+        This has to happen before the workers map the data files.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = filelock.FileLock(os.path.join(self.directory,
+                                                    _LOCK_FILE))
+        try:
+            self._lock.acquire(timeout=0)
+        except filelock.Timeout as e:
+            raise RuntimeError(
+                f"The persistent prefix cache in {self.directory} is used by "
+                "another engine.") from e
+
+        index = self._read_index()
+        if index is None:
+            # Either a new store, or the last engine did not shut down cleanly
+            # and the data files may not match any index.
+            pass
+        elif (index.get("fingerprint") != self.fingerprint
+              or index.get("num_blocks") != self.num_blocks):
+            logger.warning(
+                "Ignoring the persistent prefix cache in %s, which was "
+                "written with another model or cache configuration.",
+                self.directory)
+            self._clear_data_files()
+        else:
+            self._restored_blocks = self._parse_blocks(index.get("blocks"))
+            logger.info(
+                "Restored %d blocks from the persistent prefix cache "
+                "in %s", len(self._restored_blocks), self.directory)
+
+        # From now on, the data files are written to.
+        self._remove_index()
+
+    def close(self) -> None:
+        if self._lock is not None:
+            self._lock.release()
+            self._lock = None
+
+    def pop_restored_blocks(self) -> List[Tuple[PrefixHash, int]]:
+        """Returns the (content hash, slot) of the blocks found when opening
+        the store, from the least to the most recently used."""
+        blocks = self._restored_blocks
+        self._restored_blocks = []
+        return blocks
+
+    def save(self, blocks: Iterable[Tuple[PrefixHash, int]]) -> None:
+        """Writes the index of the disk tier. The copies into the data files
+        must have been executed by the workers."""
+        index = {
+            "fingerprint": self.fingerprint,
+            "num_blocks": self.num_blocks,
+            "blocks": [list(block) for block in blocks],
+        }
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._index_path)
+        self._index_saved = True
+
+    def invalidate(self) -> None:
+        """Removes the saved index before the disk tier changes."""
+        if self._index_saved:
+            self._remove_index()
+            self._index_saved = False
+
+    def _read_index(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._index_path) as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            index = None
+        if not isinstance(index, dict):
+            logger.warning(
+                "Ignoring the corrupted index of the persistent "
+                "prefix cache in %s.", self.directory)
+            return None
+        return index
+
+    def _parse_blocks(self, blocks: Any) -> List[Tuple[PrefixHash, int]]:
+        try:
+            parsed = [(int(content_hash), int(slot))
+                      for content_hash, slot in blocks]
+        except (TypeError, ValueError):
+            parsed = None
+        slots = [slot for _, slot in parsed or []]
+        if (parsed is None or len(set(slots)) != len(slots)
+                or any(not 0 <= slot < self.num_blocks for slot in slots)):
+            logger.warning(
+                "Ignoring the corrupted index of the persistent "
+                "prefix cache in %s.", self.directory)
+            return []
+        return parsed
+
+    def _remove_index(self) -> None:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self._index_path)
+
+    def _clear_data_files(self) -> None:
+        for path in glob.glob(os.path.join(self.directory, "rank*.bin")):
+            os.remove(path)
@@ -1,13 +1,14 @@
 """Token blocks."""
 
-from itertools import takewhile
-from os.path import commonprefix
 from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
 
 from vllm.core.block.common import (CopyOnWriteTracker,
                                     get_all_blocks_recursively)
+from vllm.core.block.hashing import hash_block_tokens
 from vllm.core.block.interfaces import Block, BlockAllocator, BlockId, Device
 from vllm.core.block.naive_block import NaiveBlock, NaiveBlockAllocator
+from vllm.core.block.offload import TieredBlockCache
+from vllm.core.block.prefix_tree import PrefixTree, PrefixTreeNode
 from vllm.core.evictor_v2 import EvictionPolicy, Evictor, make_evictor
 from vllm.utils import cdiv
 
@@ -26,12 +27,20 @@ class PrefixCachingBlockAllocator(BlockAllocator):
     content hash. It reuses blocks with the same content hash to avoid redundant
     memory allocation. The allocator also supports copy-on-write operations.
 
+    The cached blocks are indexed by a prefix tree following the block chains.
+    When unused cached blocks have to be evicted, the blocks extending a
+    prefix are evicted before the prefix itself, so that a prefix shared by
+    many branches outlives them.
+
     Args:
         num_blocks (int): The total number of blocks to manage.
         block_size (int): The size of each block in tokens.
         block_ids(Optional[Iterable[int]], optional): An optional iterable of
             block IDs. If not provided, block IDs will be assigned sequentially
             from 0 to num_blocks - 1.
+        offload_cache (Optional[TieredBlockCache], optional): If given,
+            evicted blocks are demoted to this cache and blocks missing in
+            the prefix cache are loaded from it when possible.
     """
 
     def __init__(
@@ -40,10 +49,11 @@ class PrefixCachingBlockAllocator(BlockAllocator):
         block_size: int,
         block_ids: Optional[Iterable[int]] = None,
         eviction_policy: EvictionPolicy = EvictionPolicy.LRU,
+        offload_cache: Optional[TieredBlockCache] = None,
     ):
-        # A mapping of prefix hash to block index. All blocks which have a
-        # prefix hash will be in this dict, even if they have refcount 0.
-        self._cached_blocks: Dict[PrefixHash, BlockId] = {}
+        # Index of the blocks which have a prefix hash, even if they have
+        # refcount 0.
+        self._prefix_tree = PrefixTree()
 
         # A mapping of blockId to Block to track those cached blocks
         self._blocks: Dict[BlockId, Block] = {}
@@ -62,6 +72,10 @@ class PrefixCachingBlockAllocator(BlockAllocator):
         # if we find memory pressure is high.
         self.evictor: Evictor = make_evictor(eviction_policy)
 
+        # Lower tiers of the prefix cache, holding the content of evicted
+        # blocks.
+        self._offload_cache = offload_cache
+
         # We share the refcounter between allocators. This allows us to promote
         # blocks originally allocated in the hashless allocator to immutable
         # blocks.
@@ -119,15 +133,28 @@ class PrefixCachingBlockAllocator(BlockAllocator):
         )
         assert block.content_hash is not None
 
-        cached_block_id = self._cached_blocks.get(block.content_hash, None)
-        if cached_block_id is not None:
-            block.block_id = cached_block_id
+        cached_node = self._prefix_tree.get(block.content_hash)
+        if cached_node is not None:
+            block.block_id = cached_node.block_id
+            cached_node.num_hits += 1
             self._incr_refcount_cached_block(block, block.block_id)
+            if self._offload_cache is not None:
+                self._offload_cache.record_gpu_hit()
             return block
 
         block = self.allocate_mutable(prev_block)
         block.append_token_ids(token_ids)
-        assert block.content_hash is not None
+        content_hash = block.content_hash
+        block_id = block.block_id
+        assert content_hash is not None and block_id is not None
+
+        # The block may still be held by an offload tier, in which case it is
+        # copied into the newly allocated block before the next model
+        # execution instead of being recomputed. This must happen after the
+        # allocation, which may itself demote blocks between the tiers.
+        if (self._offload_cache is not None
+                and self._offload_cache.load(content_hash, block_id)):
+            block.computed = True
 
         return block
 
@@ -165,14 +192,12 @@ class PrefixCachingBlockAllocator(BlockAllocator):
             # here we get an evicted block, which is only added
             # into evictor if its ref counter is 0
             # and since its content would be changed, we need
-            # to remove it from _cached_blocks's tracking list
-            block_id, content_hash_to_evict = self.evictor.evict()
+            # to remove it from the prefix tree
+            block_id, content_hash_to_evict = self._evict()
+            assert self._refcounter.get(block_id) == 0
 
-            _block_id = self._cached_blocks[content_hash_to_evict]
-            assert self._refcounter.get(_block_id) == 0
-            assert _block_id == block_id
-
-            self._cached_blocks.pop(content_hash_to_evict)
+            if self._offload_cache is not None:
+                self._offload_cache.offload(content_hash_to_evict, block_id)
 
             self._refcounter.incr(block_id)
 
@@ -195,11 +220,28 @@ class PrefixCachingBlockAllocator(BlockAllocator):
         # No block available in hashless allocator, nor in unused cache blocks.
         raise BlockAllocator.NoFreeBlocksError()
 
+    def _evict(self) -> Tuple[BlockId, PrefixHash]:
+        """Evicts an unused cached block and removes it from the prefix tree.
+
+        The evictor picks the candidate, but if other unused cached blocks
+        extend its prefix, a leaf of its subtree is evicted instead. Blocks in
+        use never extend an unused block, except for blocks swapped in from
+        another allocator, which are detached from the tree.
+        """
+        _, content_hash = self.evictor.peek()
+        node = self._prefix_tree.find_leaf(
+            content_hash, lambda child: child.block_id in self.evictor)
+        evicted_hash = node.content_hash
+        assert evicted_hash is not None
+        self.evictor.remove(node.block_id)
+        self._prefix_tree.remove(content_hash=evicted_hash)
+        return node.block_id, evicted_hash
+
     def _incr_refcount_cached_block(self, block: Block,
                                     block_id: BlockId) -> None:
         # now _incr_refcount_cached_block comes from two place
         # allocate_immutable/promote_to_immutable_block where hit
-        # _cached_blocks hash key.
+        # the prefix tree.
         # In both cases, it means that already exists a already
         # computed block which shared with block now
         block.computed = True
@@ -249,7 +291,7 @@ class PrefixCachingBlockAllocator(BlockAllocator):
 
         # If no longer used, add the block to the evictor.
         if refcount == 0:
-            assert block.content_hash in self._cached_blocks
+            assert block.content_hash in self._prefix_tree
             assert block.block_id is not None
             del self._blocks[block.block_id]
             self.evictor.add(block.block_id, block.content_hash,
@@ -315,7 +357,7 @@ class PrefixCachingBlockAllocator(BlockAllocator):
 
     def is_block_cached(self, block: Block) -> bool:
         assert block.content_hash is not None
-        if block.content_hash in self._cached_blocks:
+        if block.content_hash in self._prefix_tree:
             return True
         return False
 
@@ -341,15 +383,19 @@ class PrefixCachingBlockAllocator(BlockAllocator):
 
         # If the content hash does not have a corresponding cached block,
         # set this block as the cached block.
-        if block.content_hash not in self._cached_blocks:
-            self._cached_blocks[block.content_hash] = block.block_id
+        cached_node = self._prefix_tree.get(block.content_hash)
+        if cached_node is None:
+            prev_block = block.prev_block
+            cached_node = self._prefix_tree.insert(
+                block.content_hash,
+                None if prev_block is None else prev_block.content_hash,
+                block.block_id)
         else:
-            self._free_block_id_for_block(
-                self._cached_blocks[block.content_hash], block)
-            self._incr_refcount_cached_block(
-                block, self._cached_blocks[block.content_hash])
+            cached_node.num_hits += 1
+            self._free_block_id_for_block(cached_node.block_id, block)
+            self._incr_refcount_cached_block(block, cached_node.block_id)
 
-        return self._cached_blocks[block.content_hash]
+        return cached_node.block_id
 
     def cow_block_if_not_appendable(self, block: Block) -> Optional[BlockId]:
         """Performs a copy-on-write operation on the given block if it is not
@@ -421,16 +467,49 @@ class PrefixCachingBlockAllocator(BlockAllocator):
         # prompt is cached. This would cause erroneous behavior in model
         # runner.
 
-        ids_list = [
-            list(
-                takewhile(lambda block_id: self.block_is_computed(block_id),
-                          seq[:-1])) for seq in seq_block_ids
+        # Sequences without any computed block are ignored. The others are
+        # walked in lockstep, as a block is only computed if the blocks before
+        # it are.
+        seq_block_ids = [
+            seq[:-1] for seq in seq_block_ids
+            if len(seq) > 1 and self.block_is_computed(seq[0])
         ]
-        # It returns a list of int although type annotation says list of string.
-        return commonprefix([
-            ids for ids in ids_list  # type: ignore
-            if ids != []
-        ])
+        common_block_ids: List[int] = []
+        for block_ids in zip(*seq_block_ids):
+            block_id = block_ids[0]
+            if (any(other != block_id for other in block_ids)
+                    or not self.block_is_computed(block_id)):
+                break
+            common_block_ids.append(block_id)
+        return common_block_ids
+
+    def get_computed_cached_blocks(self) -> List[Tuple[PrefixHash, BlockId]]:
+        """Returns the content hash and block id of the cached blocks whose
+        content is computed."""
+        return [(content_hash, block_id)
+                for content_hash, block_id in self._prefix_tree.items()
+                if self.block_is_computed(block_id)]
+
+    def get_num_computed_prefix_blocks(
+            self, block_hashes: Iterable[PrefixHash]) -> int:
+        """Returns how many leading blocks of a chain of content hashes are
+        cached and computed, i.e. would be skipped by a prefill."""
+        num_blocks = 0
+        for node in self._prefix_tree.match(block_hashes):
+            if not self.block_is_computed(node.block_id):
+                break
+            num_blocks += 1
+        return num_blocks
+
+    def dump_prefix_tree(self) -> str:
+        """Renders the prefix tree with the refcount of each block, for
+        debugging."""
+
+        def describe(node: PrefixTreeNode) -> str:
+            return (f"refs={self._refcounter.get(node.block_id)} "
+                    f"computed={self.block_is_computed(node.block_id)}")
+
+        return self._prefix_tree.dump(describe)
 
     def get_num_blocks_touched(self,
                                blocks: List[Block],
@@ -598,22 +677,31 @@ class PrefixCachingBlock(Block):
     def num_tokens_total(self) -> int:
         """return the total tokens so far.
 
-        Here we iterate the block chain till to the first block, while
-        cache the result in local to prevent repeated computations.
+        We walk back the block chain only until the first block whose total
+        is already cached, so this is O(1) amortized as the chain grows. The
+        total is only cached for full blocks, as the token count of a partial
+        block may still change.
         """
         if self._cached_num_tokens_total is not None:
             return self._cached_num_tokens_total
 
+        uncached: List[PrefixCachingBlock] = []
         _block: Optional[Block] = self
-        self._cached_num_tokens_total = 0
-
-        # TODO: current implement here take O(N^2), we expect future
-        # we have O(1) here
+        num_tokens_total = 0
         while _block is not None:
-            self._cached_num_tokens_total += len(_block.token_ids)
+            assert isinstance(_block, PrefixCachingBlock)
+            if _block._cached_num_tokens_total is not None:
+                num_tokens_total = _block._cached_num_tokens_total
+                break
+            uncached.append(_block)
             _block = _block.prev_block
 
-        return self._cached_num_tokens_total
+        for _block in reversed(uncached):
+            num_tokens_total += len(_block.token_ids)
+            if _block.is_full:
+                _block._cached_num_tokens_total = num_tokens_total
+
+        return num_tokens_total
 
     @property
     def block_size(self) -> int:
@@ -664,25 +752,10 @@ class PrefixCachingBlock(Block):
     @staticmethod
     def hash_block_tokens(is_first_block: bool, prev_block_hash: Optional[int],
                           cur_block_token_ids: List[int]) -> int:
-        """Computes a hash value corresponding to the contents of a block and
-        the contents of the preceding block(s). The hash value is used for
-        prefix caching.
-
-        NOTE: Content-based hashing does not yet support LoRA.
-
-        Parameters:
-        - is_first_block (bool): A flag indicating if the block is the first in
-            the sequence.
-        - prev_block_hash (Optional[int]): The hash of the previous block. None
-            if this is the first block.
-        - cur_block_token_ids (List[int]): A list of token ids in the current
-            block. The current block is assumed to be full.
-
-        Returns:
-        - int: The computed hash value for the block.
-        """
-        assert (prev_block_hash is None) == is_first_block
-        return hash((is_first_block, prev_block_hash, *cur_block_token_ids))
+        """Computes the hash of a block from its tokens and the hash of the
+        previous block, see `vllm.core.block.hashing.hash_block_tokens`."""
+        return hash_block_tokens(is_first_block, prev_block_hash,
+                                 cur_block_token_ids)
 
 
 def assert_prefix_caching_block_or_none(block: Optional[Block]):
@@ -0,0 +1,176 @@
+"""Radix tree index of the prefix-cached blocks."""
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from vllm.core.block.interfaces import BlockId
+
+PrefixHash = int
+
+
+class PrefixTreeNode:
+    """A cached block in the prefix tree.
+
+    The children of a node are the cached blocks whose content directly
+    follows the content of the node, keyed by their content hash.
+    """
+
+    __slots__ = ("content_hash", "parent_hash", "block_id", "parent",
+                 "children", "num_hits")
+
+    def __init__(self, content_hash: Optional[PrefixHash],
+                 parent_hash: Optional[PrefixHash], block_id: BlockId):
+        self.content_hash = content_hash
+        self.parent_hash = parent_hash
+        self.block_id = block_id
+        # None for the root and for detached nodes, see PrefixTree.
+        self.parent: Optional[PrefixTreeNode] = None
+        self.children: Dict[PrefixHash, PrefixTreeNode] = {}
+        # The number of times the block was reused by a cache hit.
+        self.num_hits = 0
+
+    def is_leaf(self) -> bool:
+        return not self.children
+
+
+class PrefixTree:
+    """Indexes the cached blocks by content hash and arranges them in a tree
+    following the block chains, so that the cached part of a prefix is found
+    in a single walk from the root and the branches of a shared prefix can be
+    told apart from the prefix itself.
+
+    As the content hash of a block covers the whole prefix ending with it,
+    each node is reachable through exactly one path. A node whose parent is
+    not cached, e.g. because the parent was evicted while the node was in
+    use, is kept detached until a block with the parent's hash is inserted
+    again, at which point it is adopted. Detached nodes can still be looked
+    up by hash, but are not reached by `match`.
+    """
+
+    def __init__(self):
+        self._root = PrefixTreeNode(None, None, -1)
+        self._nodes: Dict[PrefixHash, PrefixTreeNode] = {}
+        # Detached nodes keyed by the hash of their missing parent.
+        self._detached: Dict[PrefixHash, Dict[PrefixHash, PrefixTreeNode]] = {}
+
+    def __contains__(self, content_hash: PrefixHash) -> bool:
+        return content_hash in self._nodes
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def get(self, content_hash: PrefixHash) -> Optional[PrefixTreeNode]:
+        return self._nodes.get(content_hash)
+
+    def items(self) -> List[Tuple[PrefixHash, BlockId]]:
+        """Returns the (content hash, block id) of the cached blocks, in
+        insertion order."""
+        return [(content_hash, node.block_id)
+                for content_hash, node in self._nodes.items()]
+
+    def insert(self, content_hash: PrefixHash,
+               parent_hash: Optional[PrefixHash],
+               block_id: BlockId) -> PrefixTreeNode:
+        """Adds a cached block following the block with `parent_hash`, or
+        starting a sequence if `parent_hash` is None."""
+        assert content_hash not in self._nodes
+        node = PrefixTreeNode(content_hash, parent_hash, block_id)
+        self._nodes[content_hash] = node
+
+        parent = (self._root
+                  if parent_hash is None else self._nodes.get(parent_hash))
+        if parent is None:
+            assert parent_hash is not None
+            self._detached.setdefault(parent_hash, {})[content_hash] = node
+        else:
+            node.parent = parent
+            parent.children[content_hash] = node
+
+        for child in self._detached.pop(content_hash, {}).values():
+            child.parent = node
+            node.children[child.content_hash] = child  # type: ignore
+        return node
+
+    def remove(self, content_hash: PrefixHash) -> PrefixTreeNode:
+        """Removes a cached block. Its children are detached."""
+        node = self._nodes.pop(content_hash)
+        if node.parent is not None:
+            del node.parent.children[content_hash]
+        else:
+            assert node.parent_hash is not None
+            siblings = self._detached[node.parent_hash]
+            del siblings[content_hash]
+            if not siblings:
+                del self._detached[node.parent_hash]
+
+        if node.children:
+            for child in node.children.values():
+                child.parent = None
+            self._detached[content_hash] = node.children
+            node.children = {}
+        node.parent = None
+        return node
+
+    def match(self,
+              block_hashes: Iterable[PrefixHash]) -> Iterator[PrefixTreeNode]:
+        """Yields the nodes of the longest cached prefix of a chain of content
+        hashes, walking down from the root. The hashes are consumed lazily."""
+        node = self._root
+        for block_hash in block_hashes:
+            child = node.children.get(block_hash)
+            if child is None:
+                return
+            yield child
+            node = child
+
+    def find_leaf(
+            self, content_hash: PrefixHash,
+            is_candidate: Callable[[PrefixTreeNode], bool]) -> PrefixTreeNode:
+        """Walks down from the given node to a leaf among the candidate nodes,
+        following the least hit child at each level. The given node is
+        returned if none of its children is a candidate."""
+        node = self._nodes[content_hash]
+        while True:
+            candidates = [
+                child for child in node.children.values()
+                if is_candidate(child)
+            ]
+            if not candidates:
+                return node
+            node = min(candidates, key=lambda child: child.num_hits)
+
+    def dump(
+        self,
+        describe: Optional[Callable[[PrefixTreeNode], str]] = None,
+    ) -> str:
+        """Renders the tree for debugging, one node per line, indented by
+        depth. Detached nodes are listed below the tree.
+
+        Args:
+            describe (Optional[Callable[[PrefixTreeNode], str]]): Returns
+                extra information to show for a node.
+        """
+        lines: List[str] = []
+
+        def _dump_subtree(node: PrefixTreeNode, depth: int) -> None:
+            stack = [(node, depth)]
+            while stack:
+                node, depth = stack.pop()
+                line = (f"{'  ' * depth}block {node.block_id} "
+                        f"hash={node.content_hash} hits={node.num_hits}")
+                if describe is not None:
+                    line += f" {describe(node)}"
+                lines.append(line)
+                children = list(node.children.values())
+                stack.extend(
+                    (child, depth + 1) for child in reversed(children))
+
+        for child in self._root.children.values():
+            _dump_subtree(child, 0)
+        detached = [
+            node for children in self._detached.values()
+            for node in children.values()
+        ]
+        if detached:
+            lines.append("detached:")
+            for node in detached:
+                _dump_subtree(node, 1)
+        return "\n".join(lines)
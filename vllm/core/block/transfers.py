@@ -0,0 +1,57 @@
+"""Block copies between the GPU KV cache and the offload tiers.
+
+Kept free of other vLLM imports, as the copies are part of the
+`ExecuteModelRequest` in `vllm.sequence`.
+"""
+import enum
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, Set, Tuple
+
+# List of (source, destination) pairs of block ids or tier slots.
+BlockCopies = List[Tuple[int, int]]
+
+
+class OffloadCopy(enum.IntEnum):
+    """Kinds of block copies between the GPU and the offload tiers."""
+    GPU_TO_HOST = 0
+    HOST_TO_DISK = 1
+    HOST_TO_GPU = 2
+    DISK_TO_GPU = 3
+    GPU_TO_DISK = 4
+
+
+@dataclass
+class OffloadTransfers:
+    """Block copies between the GPU KV cache and the offload tiers that have
+    to run before the next model execution.
+
+    The copies must be applied in order, as a slot may be read by a copy and
+    then reused by a later one within the same step.
+    """
+    # (kind, source block or slot, destination block or slot)
+    copies: List[Tuple[OffloadCopy, int, int]] = field(default_factory=list)
+
+    def is_empty(self) -> bool:
+        return not self.copies
+
+    def append(self, kind: OffloadCopy, src: int, dst: int) -> None:
+        self.copies.append((kind, src, dst))
+
+    def get_batches(self) -> Iterator[Tuple[OffloadCopy, BlockCopies]]:
+        """Groups consecutive copies of the same kind into batches, which can
+        be executed at once without changing the result."""
+        batch: BlockCopies = []
+        batch_kind: Optional[OffloadCopy] = None
+        batch_dsts: Set[int] = set()
+        for kind, src, dst in self.copies:
+            # A copy of the same kind only reads from the other side of the
+            # batch, so the batch only has to be split when a destination is
+            # written twice.
+            if batch and (kind != batch_kind or dst in batch_dsts):
+                yield batch_kind, batch  # type: ignore
+                batch, batch_dsts = [], set()
+            batch_kind = kind
+            batch.append((src, dst))
+            batch_dsts.add(dst)
+        if batch:
+            yield batch_kind, batch  # type: ignore
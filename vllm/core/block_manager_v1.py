@@ -3,7 +3,7 @@ import math
 from abc import ABC, abstractmethod
 from itertools import count, takewhile
 from os.path import commonprefix
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional
 from typing import Sequence as GenericSequence
 from typing import Set, Tuple
 
@@ -355,8 +355,30 @@ class BlockSpaceManagerV1(BlockSpaceManager):
         # Simple heuristic: If there is at least one free block
         # for each sequence, we can append.
         num_free_gpu_blocks = self.gpu_allocator.get_num_free_blocks()
-        num_seqs = seq_group.num_seqs(status=SequenceStatus.RUNNING)
-        return num_seqs <= num_free_gpu_blocks
+        return self._get_num_new_blocks(seq_group) <= num_free_gpu_blocks
+
+    def can_append_slots_batch(self,
+                               seq_groups: Iterable[SequenceGroup],
+                               num_lookahead_slots: int = 0) -> bool:
+        assert (num_lookahead_slots == 0
+                ), "lookahead allocation not supported in BlockSpaceManagerV1"
+
+        # Each running sequence usually needs at most one new block, so all
+        # groups fit if there is one free block per running sequence.
+        num_new_blocks = sum(
+            self._get_num_new_blocks(seq_group) for seq_group in seq_groups)
+        return num_new_blocks <= self.gpu_allocator.get_num_free_blocks()
+
+    def _get_num_new_blocks(self, seq_group: SequenceGroup) -> int:
+        """Get the blocks the running sequences may need for their new
+        tokens, one per sequence unless several tokens were appended since
+        the last step, e.g. the tokens fast-forwarded by guided decoding."""
+        return sum(
+            max(
+                1,
+                len(seq.logical_token_blocks) -
+                len(self.block_tables[seq.seq_id]))
+            for seq in seq_group.get_seqs(status=SequenceStatus.RUNNING))
 
     def _promote_last_block(
         self,
@@ -431,21 +453,25 @@ class BlockSpaceManagerV1(BlockSpaceManager):
         """Allocate a physical slot for a new token."""
         logical_blocks = seq.logical_token_blocks
         block_table = self.block_tables[seq.seq_id]
-        # If we need to allocate a new physical block
+        # If we need to allocate new physical blocks. There are several when
+        # several tokens were appended since the last step, e.g. the tokens
+        # fast-forwarded by guided decoding.
         if len(block_table) < len(logical_blocks):
-            # Currently this code only supports adding one physical block
-            assert len(block_table) == len(logical_blocks) - 1
-
-            if (self.block_sliding_window
-                    and len(block_table) >= self.block_sliding_window):
-                # reuse a block
-                block_table.append(block_table[len(block_table) %
-                                               self.block_sliding_window])
-            else:
-                # The sequence hash a new logical block.
-                # Allocate a new physical block.
-                new_block = self._allocate_last_physical_block(seq)
-                block_table.append(new_block)
+            is_new_block = False
+            while len(block_table) < len(logical_blocks):
+                if (self.block_sliding_window
+                        and len(block_table) >= self.block_sliding_window):
+                    # reuse a block
+                    block_table.append(block_table[len(block_table) %
+                                                   self.block_sliding_window])
+                    is_new_block = False
+                else:
+                    # The sequence hash a new logical block.
+                    # Allocate a new physical block.
+                    new_block = self._allocate_last_physical_block(seq)
+                    block_table.append(new_block)
+                    is_new_block = True
+            if is_new_block:
                 return []
 
         # We want to append the token to the last physical block.
@@ -696,6 +722,17 @@ class BlockSpaceManagerV1(BlockSpaceManager):
         ids_list = [self.get_all_computed_blocks(seq) for seq in seqs]
         return commonprefix([ids for ids in ids_list if ids != []])
 
+    def get_num_cached_prefix_tokens(self, seq: Sequence) -> int:
+        if not self.enable_caching:
+            return 0
+        num_blocks = 0
+        for logical_idx in range(seq.get_len() // self.block_size):
+            if not self.gpu_allocator.contains_block(
+                    seq.hash_of_block(logical_idx)):
+                break
+            num_blocks += 1
+        return num_blocks * self.block_size
+
     def mark_blocks_as_computed(self, seq_group: SequenceGroup):
         if self.enable_caching:
             for seq in seq_group.seqs_dict.values():
@@ -1,12 +1,15 @@
 """A block manager that manages token blocks."""
 from itertools import chain
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional
 from typing import Sequence as GenericSequence
 from typing import Tuple
 
 from vllm.core.block.block_table import BlockTable
 from vllm.core.block.cpu_gpu_block_allocator import CpuGpuBlockAllocator
 from vllm.core.block.interfaces import Block
+from vllm.core.block.offload import TieredBlockCache
+from vllm.core.block.prefix_cache_store import PrefixCacheStore
+from vllm.core.block.transfers import OffloadTransfers
 from vllm.core.block.utils import check_no_caching_or_swa_for_blockmgr_encdec
 from vllm.core.interfaces import AllocStatus, BlockSpaceManager
 from vllm.sequence import Sequence, SequenceGroup, SequenceStatus
@@ -55,6 +58,12 @@ class BlockSpaceManagerV2(BlockSpaceManager):
             window. Defaults to None.
         enable_caching (bool, optional): Flag indicating whether caching is
             enabled. Defaults to False.
+        num_host_offload_blocks (int, optional): The number of blocks in the
+            host memory tier of the prefix cache. Defaults to 0.
+        num_disk_offload_blocks (int, optional): The number of blocks in the
+            disk tier of the prefix cache. Defaults to 0.
+        prefix_cache_store (Optional[PrefixCacheStore], optional): The store
+            keeping the disk tier across restarts. Defaults to None.
     """
 
     def __init__(
@@ -65,6 +74,9 @@ class BlockSpaceManagerV2(BlockSpaceManager):
         watermark: float = 0.01,
         sliding_window: Optional[int] = None,
         enable_caching: bool = False,
+        num_host_offload_blocks: int = 0,
+        num_disk_offload_blocks: int = 0,
+        prefix_cache_store: Optional[PrefixCacheStore] = None,
     ) -> None:
         self.block_size = block_size
         self.num_total_gpu_blocks = num_gpu_blocks
@@ -90,11 +102,23 @@ class BlockSpaceManagerV2(BlockSpaceManager):
 
         self.watermark_blocks = int(watermark * num_gpu_blocks)
 
+        # Blocks evicted from the GPU prefix cache are kept in the offload
+        # tiers, if there are any.
+        self.offload_cache: Optional[TieredBlockCache] = None
+        if enable_caching and (num_host_offload_blocks > 0
+                               or num_disk_offload_blocks > 0):
+            self.offload_cache = TieredBlockCache(
+                num_host_blocks=num_host_offload_blocks,
+                num_disk_blocks=num_disk_offload_blocks,
+                store=prefix_cache_store,
+            )
+
         self.block_allocator = CpuGpuBlockAllocator.create(
             allocator_type="prefix_caching" if enable_caching else "naive",
             num_gpu_blocks=num_gpu_blocks,
             num_cpu_blocks=num_cpu_blocks,
             block_size=block_size,
+            offload_cache=self.offload_cache,
         )
 
         self.block_tables: Dict[SeqId, BlockTable] = {}
@@ -193,19 +217,38 @@ class BlockSpaceManagerV2(BlockSpaceManager):
 
         num_touched_blocks = 0
         for seq in seq_group.get_seqs(status=SequenceStatus.RUNNING):
-            block_table = self.block_tables[seq.seq_id]
+            num_touched_blocks += self._get_num_blocks_touched_by_append_slots(
+                seq, num_lookahead_slots)
+
+        num_free_gpu_blocks = self.block_allocator.get_num_free_blocks(
+            Device.GPU)
+        return num_touched_blocks <= num_free_gpu_blocks
 
-            num_touched_blocks += (
-                block_table.get_num_blocks_touched_by_append_slots(
-                    token_ids=block_table.get_unseen_token_ids(
-                        seq.get_token_ids()),
-                    num_lookahead_slots=num_lookahead_slots,
-                ))
+    def can_append_slots_batch(self, seq_groups: Iterable[SequenceGroup],
+                               num_lookahead_slots: int) -> bool:
+        # The per-group check assumes that every touched block needs a new
+        # allocation, so summing it over all groups gives a bound for the
+        # groups appending slots one after the other.
+        num_touched_blocks = 0
+        for seq_group in seq_groups:
+            for seq in seq_group.get_seqs(status=SequenceStatus.RUNNING):
+                num_touched_blocks += (
+                    self._get_num_blocks_touched_by_append_slots(
+                        seq, num_lookahead_slots))
 
         num_free_gpu_blocks = self.block_allocator.get_num_free_blocks(
             Device.GPU)
         return num_touched_blocks <= num_free_gpu_blocks
 
+    def _get_num_blocks_touched_by_append_slots(
+            self, seq: Sequence, num_lookahead_slots: int) -> int:
+        block_table = self.block_tables[seq.seq_id]
+        # The unseen tokens are the ones after the block table's full slots,
+        # see BlockTable.get_unseen_token_ids.
+        num_unseen_tokens = seq.get_len() - block_table.num_full_slots
+        return block_table.get_num_blocks_touched_by_num_slots(
+            num_unseen_tokens + num_lookahead_slots)
+
     def append_slots(
         self,
         seq: Sequence,
@@ -214,8 +257,11 @@ class BlockSpaceManagerV2(BlockSpaceManager):
 
         block_table = self.block_tables[seq.seq_id]
 
+        # Only the unseen tokens are copied, see
+        # BlockTable.get_unseen_token_ids.
         block_table.append_token_ids(
-            token_ids=block_table.get_unseen_token_ids(seq.get_token_ids()),
+            token_ids=seq.data.get_token_ids_in_range(
+                block_table.num_full_slots, seq.get_len()),
             num_lookahead_slots=num_lookahead_slots,
             num_computed_slots=seq.data.get_num_computed_tokens(),
         )
@@ -292,6 +338,17 @@ class BlockSpaceManagerV2(BlockSpaceManager):
         return self.block_allocator.get_common_computed_block_ids(
             seq_block_ids)  # type: ignore
 
+    def get_num_cached_prefix_tokens(self, seq: Sequence) -> int:
+        # The sequence folds the LoRA id into its block hashes, unlike
+        # PrefixCachingBlock, so the hashes only agree without LoRA.
+        if not self.enable_caching or seq.lora_int_id > 0:
+            return 0
+        num_full_blocks = seq.get_len() // self.block_size
+        num_blocks = self.block_allocator.get_num_computed_prefix_blocks(
+            seq.hash_of_block(logical_idx)
+            for logical_idx in range(num_full_blocks))
+        return num_blocks * self.block_size
+
     def fork(self, parent_seq: Sequence, child_seq: Sequence) -> None:
         src_block_table = self.block_tables[parent_seq.seq_id]
         self.block_tables[child_seq.seq_id] = src_block_table.fork()
@@ -380,6 +437,29 @@ class BlockSpaceManagerV2(BlockSpaceManager):
         # convert to list of tuples once here
         return list(block_number_mapping.items())
 
+    def get_and_clear_offload_transfers(self) -> OffloadTransfers:
+        if self.offload_cache is None:
+            return OffloadTransfers()
+        return self.offload_cache.get_and_clear_transfers()
+
+    def get_and_reset_offload_stats(self) -> Tuple[int, Dict[str, int]]:
+        if self.offload_cache is None:
+            return 0, {}
+        return self.offload_cache.get_and_reset_stats()
+
+    def persist_prefix_cache(self) -> OffloadTransfers:
+        if (self.offload_cache is None
+                or not self.offload_cache.is_persistent):
+            return OffloadTransfers()
+        self.offload_cache.persist(
+            self.block_allocator.get_computed_cached_blocks())
+        return self.offload_cache.get_and_clear_transfers()
+
+    def save_prefix_cache(self) -> None:
+        if (self.offload_cache is not None
+                and self.offload_cache.is_persistent):
+            self.offload_cache.save()
+
     def get_num_free_gpu_blocks(self) -> int:
         return self.block_allocator.get_num_free_blocks(Device.GPU)
 
@@ -1,4 +1,4 @@
-from typing import List, Tuple
+from typing import Iterable, List, Tuple
 
 from vllm.core.interfaces import AllocStatus, BlockSpaceManager
 from vllm.sequence import Sequence, SequenceGroup
@@ -32,6 +32,10 @@ class EmbeddingModelBlockSpaceManager(BlockSpaceManager):
                          num_lookahead_slots: int) -> bool:
         return True
 
+    def can_append_slots_batch(self, seq_groups: Iterable[SequenceGroup],
+                               num_lookahead_slots: int) -> bool:
+        return True
+
     def append_slots(
         self,
         seq: Sequence,
@@ -1,6 +1,8 @@
 import enum
+import heapq
 from abc import ABC, abstractmethod
-from typing import OrderedDict
+from itertools import count
+from typing import Dict, List, OrderedDict, Tuple
 
 from vllm.block import PhysicalTokenBlock
 
@@ -50,16 +52,30 @@ class Evictor(ABC):
         pass
 
 
+# (last_accessed, -num_hashed_tokens, insertion_id, block_hash)
+_HeapEntry = Tuple[float, int, int, int]
+
+
 class LRUEvictor(Evictor):
     """Evicts in a least-recently-used order using the last_accessed timestamp
     that's recorded in the PhysicalTokenBlock. If there are multiple blocks with
     the same last_accessed time, then the one with the largest num_hashed_tokens
     will be evicted. If two blocks each have the lowest last_accessed time and
-    highest num_hashed_tokens value, then one will be chose arbitrarily
+    highest num_hashed_tokens value, then the one added to the evictor first
+    will be evicted.
+
+    Candidates are kept in a binary heap so that eviction costs O(log n).
+    Entries of removed blocks are invalidated lazily and skipped on eviction.
     """
 
+    # Rebuild the heap once stale entries outnumber live ones by this factor.
+    _COMPACTION_FACTOR = 2
+
     def __init__(self):
         self.free_table: OrderedDict[int, PhysicalTokenBlock] = OrderedDict()
+        self._heap: List[_HeapEntry] = []
+        self._insertion_ids: Dict[int, int] = {}
+        self._insertion_ctr = count()
 
     def __contains__(self, block_hash: int) -> bool:
         return block_hash in self.free_table
@@ -68,23 +84,34 @@ class LRUEvictor(Evictor):
         if len(self.free_table) == 0:
             raise ValueError("No usable cache memory left")
 
-        evicted_block = next(iter(self.free_table.values()))
-        # The blocks with the lowest timestamps should be placed consecutively
-        # at the start of OrderedDict. Loop through all these blocks to
-        # find the one with maximum number of hashed tokens.
-        for _, block in self.free_table.items():
-            if evicted_block.last_accessed < block.last_accessed:
-                break
-            if evicted_block.num_hashed_tokens < block.num_hashed_tokens:
-                evicted_block = block
-
-        self.free_table.pop(evicted_block.block_hash)
-
-        evicted_block.computed = False
-        return evicted_block
+        while self._heap:
+            (last_accessed, neg_num_hashed_tokens, insertion_id,
+             block_hash) = heapq.heappop(self._heap)
+            if self._insertion_ids.get(block_hash) != insertion_id:
+                # The block was removed from the evictor after this entry was
+                # pushed.
+                continue
+            block = self.free_table[block_hash]
+            if (block.last_accessed != last_accessed
+                    or block.num_hashed_tokens != -neg_num_hashed_tokens):
+                # The block was modified in place while being in the evictor,
+                # re-queue it with its current priority.
+                self._push(block_hash, block, insertion_id)
+                continue
+
+            self.free_table.pop(block_hash)
+            del self._insertion_ids[block_hash]
+            block.computed = False
+            return block
+
+        # Unreachable as long as every live block owns a heap entry.
+        raise AssertionError("LRUEvictor heap is out of sync")
 
     def add(self, block: PhysicalTokenBlock):
+        insertion_id = next(self._insertion_ctr)
         self.free_table[block.block_hash] = block
+        self._insertion_ids[block.block_hash] = insertion_id
+        self._push(block.block_hash, block, insertion_id)
 
     def remove(self, block_hash: int) -> PhysicalTokenBlock:
         if block_hash not in self.free_table:
@@ -92,12 +119,26 @@ class LRUEvictor(Evictor):
                 "Attempting to remove block that's not in the evictor")
         block: PhysicalTokenBlock = self.free_table[block_hash]
         self.free_table.pop(block_hash)
+        del self._insertion_ids[block_hash]
         return block
 
     @property
     def num_blocks(self) -> int:
         return len(self.free_table)
 
+    def _push(self, block_hash: int, block: PhysicalTokenBlock,
+              insertion_id: int):
+        heapq.heappush(self._heap,
+                       (block.last_accessed, -block.num_hashed_tokens,
+                        insertion_id, block_hash))
+        if len(self._heap
+               ) > self._COMPACTION_FACTOR * len(self.free_table) + 64:
+            # Drop stale entries so lazily invalidated entries stay bounded.
+            self._heap = [(b.last_accessed, -b.num_hashed_tokens,
+                           self._insertion_ids[h], h)
+                          for h, b in self.free_table.items()]
+            heapq.heapify(self._heap)
+
 
 def make_evictor(eviction_policy: EvictionPolicy) -> Evictor:
     if eviction_policy == EvictionPolicy.LRU:
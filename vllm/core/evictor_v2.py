@@ -1,6 +1,8 @@
 import enum
+import heapq
 from abc import ABC, abstractmethod
-from typing import OrderedDict, Tuple
+from itertools import count
+from typing import List, OrderedDict, Tuple
 
 
 class EvictionPolicy(enum.Enum):
@@ -30,6 +32,12 @@ class Evictor(ABC):
         """
         pass
 
+    @abstractmethod
+    def peek(self) -> Tuple[int, int]:
+        """Returns the block id and content hash of the block the next call
+        to evict would return, without evicting it"""
+        pass
+
     @abstractmethod
     def add(self, block_id: int, content_hash: int, num_hashed_tokens: int,
             last_accessed: float):
@@ -60,11 +68,22 @@ class BlockMetaData():
     blocks with the same content hash, but their physical id is unique.
     """
 
-    def __init__(self, content_hash: int, num_hashed_tokens: int,
-                 last_accessed: float):
+    def __init__(self,
+                 content_hash: int,
+                 num_hashed_tokens: int,
+                 last_accessed: float,
+                 insertion_id: int = 0):
         self.content_hash = content_hash
         self.num_hashed_tokens = num_hashed_tokens
         self.last_accessed = last_accessed
+        # Monotonic id assigned when the block is added to the evictor. It is
+        # used to break ties in insertion order, which keeps the eviction order
+        # identical to a linear scan over the free table.
+        self.insertion_id = insertion_id
+
+
+# (last_accessed, -num_hashed_tokens, insertion_id, block_id)
+_HeapEntry = Tuple[float, int, int, int]
 
 
 class LRUEvictor(Evictor):
@@ -72,54 +91,95 @@ class LRUEvictor(Evictor):
     that's recorded in the PhysicalTokenBlock. If there are multiple blocks with
     the same last_accessed time, then the one with the largest num_hashed_tokens
     will be evicted. If two blocks each have the lowest last_accessed time and
-    highest num_hashed_tokens value, then one will be chose arbitrarily
+    highest num_hashed_tokens value, then the one added to the evictor first
+    will be evicted.
+
+    Candidates are kept in a binary heap so that eviction costs O(log n)
+    instead of a scan over all free blocks. Heap entries are invalidated lazily:
+    update() pushes a fresh entry and remove() only drops the metadata, stale
+    entries are discarded when they reach the top of the heap.
     """
 
+    # Rebuild the heap once stale entries outnumber live ones by this factor.
+    _COMPACTION_FACTOR = 2
+
     def __init__(self):
         self.free_table: OrderedDict[int, BlockMetaData] = OrderedDict()
+        self._heap: List[_HeapEntry] = []
+        self._insertion_ctr = count()
 
     def __contains__(self, block_id: int) -> bool:
         return block_id in self.free_table
 
     def evict(self) -> Tuple[int, int]:
+        evicted_block_id, content_hash = self.peek()
+        heapq.heappop(self._heap)
+        self.free_table.pop(evicted_block_id)
+        return evicted_block_id, content_hash
+
+    def peek(self) -> Tuple[int, int]:
         if len(self.free_table) == 0:
             raise ValueError("No usable cache memory left")
 
-        evicted_block = next(iter(self.free_table.values()))
-        evicted_block_id = next(iter(self.free_table.keys()))
-        # The blocks with the lowest timestamps should be placed consecutively
-        # at the start of OrderedDict. Loop through all these blocks to
-        # find the one with maximum number of hashed tokens.
-        for _id, block in self.free_table.items():
-            if evicted_block.last_accessed > block.last_accessed or (
-                    evicted_block.last_accessed == block.last_accessed and
-                    evicted_block.num_hashed_tokens < block.num_hashed_tokens):
-                evicted_block = block
-                evicted_block_id = _id
-
-        self.free_table.pop(evicted_block_id)
+        while self._heap:
+            entry = self._heap[0]
+            if not self._is_valid(entry):
+                heapq.heappop(self._heap)
+                continue
+            block_id = entry[3]
+            return block_id, self.free_table[block_id].content_hash
 
-        return evicted_block_id, evicted_block.content_hash
+        # Unreachable as long as every live block owns a heap entry.
+        raise AssertionError("LRUEvictor heap is out of sync")
 
     def add(self, block_id: int, content_hash: int, num_hashed_tokens: int,
             last_accessed: float):
-        self.free_table[block_id] = BlockMetaData(content_hash,
-                                                  num_hashed_tokens,
-                                                  last_accessed)
+        block = BlockMetaData(content_hash, num_hashed_tokens, last_accessed,
+                              next(self._insertion_ctr))
+        self.free_table[block_id] = block
+        self._push(block_id, block)
 
     def update(self, block_id: int, last_accessed: float):
-        self.free_table[block_id].last_accessed = last_accessed
+        block = self.free_table[block_id]
+        block.last_accessed = last_accessed
+        self._push(block_id, block)
 
     def remove(self, block_id: int):
         if block_id not in self.free_table:
             raise ValueError(
                 "Attempting to remove block that's not in the evictor")
         self.free_table.pop(block_id)
+        self._maybe_compact()
 
     @property
     def num_blocks(self) -> int:
         return len(self.free_table)
 
+    def _is_valid(self, entry: _HeapEntry) -> bool:
+        last_accessed, neg_num_hashed_tokens, insertion_id, block_id = entry
+        block = self.free_table.get(block_id)
+        return (block is not None and block.insertion_id == insertion_id
+                and block.last_accessed == last_accessed
+                and block.num_hashed_tokens == -neg_num_hashed_tokens)
+
+    def _push(self, block_id: int, block: BlockMetaData):
+        heapq.heappush(self._heap,
+                       (block.last_accessed, -block.num_hashed_tokens,
+                        block.insertion_id, block_id))
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        """Drop stale heap entries once they dominate the heap, so that the
+        memory held by lazily invalidated entries stays bounded.
+        """
+        if len(self._heap
+               ) <= self._COMPACTION_FACTOR * len(self.free_table) + 64:
+            return
+        self._heap = [(block.last_accessed, -block.num_hashed_tokens,
+                       block.insertion_id, block_id)
+                      for block_id, block in self.free_table.items()]
+        heapq.heapify(self._heap)
+
 
 def make_evictor(eviction_policy: EvictionPolicy) -> Evictor:
     if eviction_policy == EvictionPolicy.LRU:
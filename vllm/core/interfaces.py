@@ -1,9 +1,10 @@
 import enum
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Dict, Iterable, List
 from typing import Sequence as GenericSequence
 from typing import Tuple
 
+from vllm.core.block.transfers import OffloadTransfers
 from vllm.sequence import Sequence, SequenceGroup
 
 
@@ -55,6 +56,38 @@ class BlockSpaceManager(ABC):
                          num_lookahead_slots: int) -> bool:
         pass
 
+    def can_append_slots_batch(self, seq_groups: Iterable[SequenceGroup],
+                               num_lookahead_slots: int) -> bool:
+        """Determine if all the given sequence groups can append slots in the
+        same step.
+
+        This is a conservative check over all groups at once, which lets the
+        scheduler skip the per-group can_append_slots calls when there is no
+        memory pressure. Returning False only means that the groups have to be
+        checked one by one.
+        """
+        return False
+
+    def get_and_clear_offload_transfers(self) -> OffloadTransfers:
+        """Returns the copies between the GPU KV cache and its offload tiers
+        that were scheduled since the last call."""
+        return OffloadTransfers()
+
+    def get_and_reset_offload_stats(self) -> Tuple[int, Dict[str, int]]:
+        """Returns the number of prefix cache lookups and the number of hits
+        per cache tier since the last call."""
+        return 0, {}
+
+    def persist_prefix_cache(self) -> OffloadTransfers:
+        """Returns the copies writing the prefix cache to its persistent
+        store. `save_prefix_cache` has to be called once they are executed."""
+        return OffloadTransfers()
+
+    def save_prefix_cache(self) -> None:  # noqa: B027
+        """Saves the index of the persistent prefix cache. Does nothing
+        without one."""
+        pass
+
     @abstractmethod
     def append_slots(
         self,
@@ -116,3 +149,9 @@ class BlockSpaceManager(ABC):
     @abstractmethod
     def mark_blocks_as_computed(self, seq_group: SequenceGroup):
         pass
+
+    def get_num_cached_prefix_tokens(self, seq: Sequence) -> int:
+        """Returns the number of leading tokens of the sequence whose KV cache
+        is in the prefix cache, i.e. would not be recomputed if the sequence
+        was allocated now."""
+        return 0
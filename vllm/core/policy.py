@@ -1,10 +1,33 @@
+import bisect
+import itertools
+import weakref
 from collections import deque
-from typing import Deque
+from typing import (Deque, Dict, Iterable, Iterator, List, Optional, Tuple,
+                    Union)
 
 from vllm.sequence import SequenceGroup
 
+# Ordering key of a sequence group. Sequence groups with smaller keys are
+# scheduled first and preempted last.
+SortKey = Tuple[float, ...]
+
+# Numbers the entries of the policy queues, which breaks ties between equal
+# keys in insertion order.
+_entry_counter = itertools.count()
+# (sort key, entry number) of a sequence group in a policy queue.
+_EntryKey = Tuple[SortKey, int]
+
 
 class Policy:
+    """Ordering of sequence groups in the scheduler queues.
+
+    Policies either implement `get_priority`, which may depend on the current
+    time and requires the queues to be re-sorted every step, or `get_sort_key`,
+    which must stay constant while a sequence group is queued and must not
+    change the state of the policy. Constant keys are computed once per
+    sequence group and cached on it, and the queues of such policies are
+    `PolicyQueue`s, which keep them in order as groups are added and removed.
+    """
 
     def get_priority(
         self,
@@ -13,20 +36,161 @@ class Policy:
     ) -> float:
         raise NotImplementedError
 
+    def get_sort_key(self, seq_group: SequenceGroup) -> SortKey:
+        raise NotImplementedError
+
+    @property
+    def has_static_keys(self) -> bool:
+        return type(self).get_sort_key is not Policy.get_sort_key
+
+    def on_added(self, seq_group: SequenceGroup) -> None:
+        """Called when a new sequence group is added to the scheduler, before
+        it is queued."""
+        pass
+
+    def on_scheduled(self, seq_group: SequenceGroup) -> None:
+        """Called when a waiting sequence group is admitted for prefill."""
+        pass
+
+    def create_queue(
+            self,
+            seq_groups: Iterable[SequenceGroup] = (),
+    ) -> "SeqGroupQueue":
+        """Creates a scheduler queue holding the given sequence groups."""
+        if self.has_static_keys:
+            return PolicyQueue(self, seq_groups)
+        return deque(seq_groups)
+
     def sort_by_priority(
         self,
         now: float,
-        seq_groups: Deque[SequenceGroup],
-    ) -> Deque[SequenceGroup]:
-        return deque(
-            sorted(
-                seq_groups,
-                key=lambda seq_group: self.get_priority(now, seq_group),
-                reverse=True,
-            ))
+        seq_groups: "SeqGroupQueue",
+    ) -> "SeqGroupQueue":
+        if isinstance(seq_groups, PolicyQueue):
+            # Already in order, only copied as the input is not modified.
+            return seq_groups.copy()
+        if not self.has_static_keys:
+            return deque(
+                sorted(
+                    seq_groups,
+                    key=lambda seq_group: self.get_priority(now, seq_group),
+                    reverse=True,
+                ))
+        return PolicyQueue(self, seq_groups)
+
+    def _get_cached_sort_key(self, seq_group: SequenceGroup) -> SortKey:
+        sort_key = seq_group.scheduling_sort_key
+        if sort_key is None:
+            sort_key = self.get_sort_key(seq_group)
+            seq_group.scheduling_sort_key = sort_key
+        return sort_key
+
+
+class PolicyQueue:
+    """Queue of sequence groups in the order of the static keys of a policy.
+
+    The groups are kept in a list sorted by their (policy key, entry number)
+    keys, which is updated in place with binary searches as groups are added
+    and removed, so the queue is never re-sorted. Taking the first or the
+    last group, indexing and iterating in order are as cheap as on a list.
+
+    The queue supports the deque operations the scheduler uses. Appending to
+    either end inserts a group by its key.
+    """
+
+    def __init__(
+        self, policy: Policy,
+        seq_groups: Iterable[SequenceGroup] = ()) -> None:
+        self._policy = policy
+        # The keys of the queued sequence groups in order, and the groups at
+        # the same positions.
+        self._keys: List[_EntryKey] = []
+        self._seq_groups: List[SequenceGroup] = []
+        # The key of each queued sequence group.
+        self._entries: Dict[SequenceGroup, _EntryKey] = {}
+        entries = sorted(((self._new_key(seq_group), seq_group)
+                          for seq_group in seq_groups),
+                         key=lambda entry: entry[0])
+        for key, seq_group in entries:
+            self._keys.append(key)
+            self._seq_groups.append(seq_group)
+
+    def __len__(self) -> int:
+        return len(self._seq_groups)
+
+    def __iter__(self) -> Iterator[SequenceGroup]:
+        return iter(self._seq_groups)
+
+    def __getitem__(self, index: int) -> SequenceGroup:
+        return self._seq_groups[index]
+
+    def __delitem__(self, index: int) -> None:
+        seq_group = self._seq_groups.pop(index)
+        del self._keys[index]
+        del self._entries[seq_group]
+
+    def append(self, seq_group: SequenceGroup) -> None:
+        key = self._new_key(seq_group)
+        index = bisect.bisect(self._keys, key)
+        self._keys.insert(index, key)
+        self._seq_groups.insert(index, seq_group)
+
+    def appendleft(self, seq_group: SequenceGroup) -> None:
+        self.append(seq_group)
+
+    def extend(self, seq_groups: Iterable[SequenceGroup]) -> None:
+        for seq_group in seq_groups:
+            self.append(seq_group)
+
+    def extendleft(self, seq_groups: Iterable[SequenceGroup]) -> None:
+        self.extend(seq_groups)
+
+    def popleft(self) -> SequenceGroup:
+        if not self._seq_groups:
+            raise IndexError("pop from an empty PolicyQueue")
+        seq_group = self._seq_groups[0]
+        del self[0]
+        return seq_group
+
+    def pop(self) -> SequenceGroup:
+        if not self._seq_groups:
+            raise IndexError("pop from an empty PolicyQueue")
+        seq_group = self._seq_groups[-1]
+        del self[-1]
+        return seq_group
+
+    def remove(self, seq_group: SequenceGroup) -> None:
+        key = self._entries.get(seq_group)
+        if key is None:
+            raise ValueError(f"{seq_group.request_id} is not in the queue")
+        del self[bisect.bisect_left(self._keys, key)]
+
+    def clear(self) -> None:
+        self._keys.clear()
+        self._seq_groups.clear()
+        self._entries.clear()
+
+    def copy(self) -> "PolicyQueue":
+        queue = PolicyQueue(self._policy)
+        queue._keys = self._keys.copy()
+        queue._seq_groups = self._seq_groups.copy()
+        queue._entries = self._entries.copy()
+        return queue
+
+    def _new_key(self, seq_group: SequenceGroup) -> _EntryKey:
+        key = (self._policy._get_cached_sort_key(seq_group),
+               next(_entry_counter))
+        self._entries[seq_group] = key
+        return key
+
+
+# A scheduler queue. Policies ordering the groups by the current time use a
+# deque, re-sorted every step, and the others a PolicyQueue.
+SeqGroupQueue = Union[Deque[SequenceGroup], PolicyQueue]
 
 
 class FCFS(Policy):
+    """Schedules sequence groups in arrival order."""
 
     def get_priority(
         self,
@@ -35,11 +199,108 @@ class FCFS(Policy):
     ) -> float:
         return now - seq_group.metrics.arrival_time
 
+    def get_sort_key(self, seq_group: SequenceGroup) -> SortKey:
+        return (seq_group.metrics.arrival_time, )
+
+
+class PriorityPolicy(Policy):
+    """Schedules sequence groups by their request priority, lower values
+    first, and in arrival order within the same priority."""
+
+    def get_sort_key(self, seq_group: SequenceGroup) -> SortKey:
+        return (seq_group.priority, seq_group.metrics.arrival_time)
+
+
+def _expected_num_tokens(seq_group: SequenceGroup) -> float:
+    """Upper bound of the number of tokens a sequence group will process."""
+    num_tokens = float(len(seq_group.prompt_token_ids))
+    sampling_params = seq_group.sampling_params
+    if sampling_params is not None:
+        if sampling_params.max_tokens is None:
+            return float("inf")
+        num_tokens += sampling_params.max_tokens * sampling_params.best_of
+    return num_tokens
+
+
+class ShortestJobFirst(Policy):
+    """Schedules the sequence groups with the fewest expected tokens first,
+    which lowers the mean latency under mixed workloads. The expected number
+    of tokens is the prompt length plus the generation budget.
+
+    So that long requests are not starved by a steady stream of short ones,
+    the expected tokens of a group are lowered by `aging_rate` per second it
+    has waited. All groups age at the same rate, so this amounts to adding
+    `aging_rate` times the arrival time, which keeps the keys constant. Groups
+    without a generation budget are still scheduled last.
+
+    Args:
+        aging_rate: The expected tokens a group is credited per second since
+            its arrival.
+    """
+
+    def __init__(self, aging_rate: float = 100.0) -> None:
+        self.aging_rate = aging_rate
+
+    def get_sort_key(self, seq_group: SequenceGroup) -> SortKey:
+        arrival_time = seq_group.metrics.arrival_time
+        return (_expected_num_tokens(seq_group) +
+                self.aging_rate * arrival_time, arrival_time)
+
+
+class WeightedFairQueueing(Policy):
+    """Start-time fair queueing across flows of requests.
+
+    Requests are grouped into flows by LoRA adapter. Each sequence group gets
+    a virtual start tag when it is added, the later of the current virtual
+    time and the finish tag of the previous request of its flow, and a finish
+    tag that adds its expected cost divided by the flow weight. Groups are
+    scheduled by start tag, so a flow submitting many requests cannot starve
+    the others.
+
+    Args:
+        weights: Optional weight per LoRA int id (0 for the base model).
+            Flows without an entry have weight 1.
+    """
+
+    def __init__(self, weights: Optional[Dict[int, float]] = None) -> None:
+        self.weights = weights or {}
+        self.virtual_time = 0.0
+        self._last_finish_tags: Dict[int, float] = {}
+        # The start tags of the sequence groups added to the scheduler.
+        self._start_tags: "weakref.WeakKeyDictionary[SequenceGroup, float]" = (
+            weakref.WeakKeyDictionary())
+
+    def on_added(self, seq_group: SequenceGroup) -> None:
+        flow = seq_group.lora_int_id
+        start_tag = max(self.virtual_time,
+                        self._last_finish_tags.get(flow, 0.0))
+        cost = _expected_num_tokens(seq_group)
+        if cost == float("inf"):
+            cost = float(len(seq_group.prompt_token_ids))
+        self._last_finish_tags[flow] = start_tag + cost / self.weights.get(
+            flow, 1.0)
+        self._start_tags[seq_group] = start_tag
+
+    def get_sort_key(self, seq_group: SequenceGroup) -> SortKey:
+        return (self._start_tags[seq_group], seq_group.metrics.arrival_time)
+
+    def on_scheduled(self, seq_group: SequenceGroup) -> None:
+        start_tag = self._get_cached_sort_key(seq_group)[0]
+        self.virtual_time = max(self.virtual_time, start_tag)
+
 
 class PolicyFactory:
 
-    _POLICY_REGISTRY = {'fcfs': FCFS}
+    _POLICY_REGISTRY = {
+        'fcfs': FCFS,
+        'priority': PriorityPolicy,
+        'sjf': ShortestJobFirst,
+        'fair': WeightedFairQueueing,
+    }
 
     @classmethod
     def get_policy(cls, policy_name: str, **kwargs) -> Policy:
+        if policy_name not in cls._POLICY_REGISTRY:
+            raise ValueError(f"Unknown scheduling policy: {policy_name}. "
+                             f"Supported: {list(cls._POLICY_REGISTRY)}")
         return cls._POLICY_REGISTRY[policy_name](**kwargs)
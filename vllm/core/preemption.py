@@ -0,0 +1,62 @@
+"""Cost model for choosing how, and which, sequence groups to preempt."""
+import enum
+from dataclasses import dataclass
+
+
+class PreemptionReason(enum.Enum):
+    """Why a preemption mode was chosen, exported as a metrics label."""
+    # The mode was set with --preemption-mode.
+    USER = "user"
+    # Recomputation is not supported for groups with several sequences.
+    MULTIPLE_SEQS = "multiple_seqs"
+    # Recomputation by default for single sequences, without a cost model.
+    DEFAULT = "default"
+    # The CPU swap space cannot hold the blocks of the group.
+    NO_SWAP_SPACE = "no_swap_space"
+    # The mode is estimated to be the cheaper one.
+    COST = "cost"
+
+
+@dataclass
+class PreemptionCostModel:
+    """Estimates the time lost by preempting a sequence group, either by
+    recomputing its KV cache when it is resumed or by swapping the cache out
+    to the CPU and back in.
+
+    The throughputs are measured by the driver worker when profiling the
+    model, see `Worker.determine_num_available_blocks`, and returned by
+    `ExecutorBase.get_preemption_cost_model`.
+
+    Args:
+        flops_per_token: FLOPs of the linear layers per prefilled token.
+        attention_flops_per_token_pair: FLOPs of the attention per pair of
+            tokens attending to each other.
+        flops_per_second: Measured prefill throughput.
+        kv_cache_bytes_per_token: Size of the KV cache of a token.
+        swap_bytes_per_second: Measured bandwidth of the copies between the
+            GPU and the CPU, or 0 without swap space.
+    """
+    flops_per_token: float
+    attention_flops_per_token_pair: float
+    flops_per_second: float
+    kv_cache_bytes_per_token: float
+    swap_bytes_per_second: float
+
+    def get_prefill_flops(self, num_tokens: int) -> float:
+        """FLOPs of the prefill of a sequence of `num_tokens` tokens, whose
+        causal attention is quadratic in the sequence length."""
+        num_token_pairs = num_tokens * (num_tokens + 1) / 2
+        return (num_tokens * self.flops_per_token +
+                num_token_pairs * self.attention_flops_per_token_pair)
+
+    def get_recompute_time(self, num_tokens: int) -> float:
+        """Time to prefill the tokens of a preempted sequence again."""
+        return self.get_prefill_flops(num_tokens) / self.flops_per_second
+
+    def get_swap_time(self, num_tokens: int) -> float:
+        """Time to swap the KV cache of `num_tokens` tokens out and back
+        in."""
+        if self.swap_bytes_per_second <= 0:
+            return float("inf")
+        return (2 * num_tokens * self.kv_cache_bytes_per_token /
+                self.swap_bytes_per_second)
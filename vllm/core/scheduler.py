@@ -1,14 +1,20 @@
 import enum
+import itertools
 import os
 import random
 import time
-from collections import deque
+from collections import Counter, deque
 from dataclasses import dataclass, field
+from typing import Any
+from typing import Counter as CollectionsCounter
 from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple, Union
 
 from vllm.config import CacheConfig, LoRAConfig, SchedulerConfig
+from vllm.core.block.prefix_cache_store import PrefixCacheStore
+from vllm.core.block.transfers import OffloadTransfers
 from vllm.core.interfaces import AllocStatus, BlockSpaceManager
-from vllm.core.policy import Policy, PolicyFactory
+from vllm.core.policy import Policy, PolicyFactory, SeqGroupQueue
+from vllm.core.preemption import PreemptionReason
 from vllm.logger import init_logger
 from vllm.lora.request import LoRARequest
 from vllm.sequence import (Sequence, SequenceData, SequenceGroup,
@@ -23,6 +29,14 @@ ENABLE_ARTIFICIAL_PREEMPT = bool(
 ARTIFICIAL_PREEMPTION_PROB = 0.5
 ARTIFICIAL_PREEMPTION_MAX_CNT = 500
 
+# The number of sequence groups at the front of the waiting queue that are
+# reordered by prefix-aware admission.
+PREFIX_AWARE_ADMISSION_WINDOW = 256
+
+# The number of sequence groups at the back of the running queue among which
+# the cheapest victim is preempted, when preemption costs are known.
+PREEMPTION_VICTIM_WINDOW = 8
+
 
 class PreemptionMode(enum.Enum):
     """Preemption modes.
@@ -130,6 +144,9 @@ class SchedulerOutputs:
     # The number of requests in the running queue
     running_queue_size: int
     preempted: int
+    # Copies between the GPU KV cache and its offload tiers.
+    offload_transfers: OffloadTransfers = field(
+        default_factory=OffloadTransfers)
 
     def __post_init__(self):
         # Swap in and swap out should never happen at the same time.
@@ -142,7 +159,8 @@ class SchedulerOutputs:
     def is_empty(self) -> bool:
         # NOTE: We do not consider the ignored sequence groups.
         return (not self.scheduled_seq_groups and not self.blocks_to_swap_in
-                and not self.blocks_to_swap_out and not self.blocks_to_copy)
+                and not self.blocks_to_swap_out and not self.blocks_to_copy
+                and self.offload_transfers.is_empty())
 
     def _sort_by_lora_ids(self):
         self.scheduled_seq_groups = sorted(
@@ -256,6 +274,7 @@ class Scheduler:
         scheduler_config: SchedulerConfig,
         cache_config: CacheConfig,
         lora_config: Optional[LoRAConfig],
+        prefix_cache_store: Optional[PrefixCacheStore] = None,
     ) -> None:
         self.scheduler_config = scheduler_config
         self.cache_config = cache_config
@@ -273,23 +292,51 @@ class Scheduler:
         BlockSpaceManagerImpl = BlockSpaceManager.get_block_space_manager_class(
             version)
 
+        # Only the v2 block manager supports offloading the prefix cache.
+        offload_kwargs = {}
+        if self.cache_config.offload_enabled:
+            offload_kwargs = dict(
+                num_host_offload_blocks=self.cache_config.
+                num_host_offload_blocks,
+                num_disk_offload_blocks=self.cache_config.
+                num_disk_offload_blocks,
+                prefix_cache_store=prefix_cache_store,
+            )
+
         # Create the block space manager.
         self.block_manager = BlockSpaceManagerImpl(
             block_size=self.cache_config.block_size,
             num_gpu_blocks=self.cache_config.num_gpu_blocks,
             num_cpu_blocks=self.cache_config.num_cpu_blocks,
             sliding_window=self.cache_config.sliding_window,
-            enable_caching=self.cache_config.enable_prefix_caching)
-
+            enable_caching=self.cache_config.enable_prefix_caching,
+            **offload_kwargs)
+
+        # The policy ordering the queues below. Running and swapped queues are
+        # kept in policy order, the waiting queue is in arrival order unless
+        # the policy assigns its own ordering keys.
+        policy_kwargs: Dict[str, Any] = {}
+        if self.scheduler_config.policy == "sjf":
+            policy_kwargs["aging_rate"] = self.scheduler_config.sjf_aging_rate
+        elif self.scheduler_config.policy == "fair":
+            policy_kwargs["weights"] = (
+                self.scheduler_config.fair_queueing_weights)
+        self.policy = PolicyFactory.get_policy(
+            policy_name=self.scheduler_config.policy, **policy_kwargs)
         # Sequence groups in the WAITING state.
         # Contain new prefill or preempted requests.
-        self.waiting: Deque[SequenceGroup] = deque()
+        self.waiting: SeqGroupQueue = self.policy.create_queue()
         # Sequence groups in the RUNNING state.
         # Contain decode requests.
-        self.running: Deque[SequenceGroup] = deque()
+        self.running: SeqGroupQueue = self.policy.create_queue()
         # Sequence groups in the SWAPPED state.
         # Contain decode requests that are swapped out.
-        self.swapped: Deque[SequenceGroup] = deque()
+        self.swapped: SeqGroupQueue = self.policy.create_queue()
+
+        # The number of prompt tokens of the admitted prefills and how many of
+        # them were found in the prefix cache, if it is enabled.
+        self.num_admitted_prompt_tokens = 0
+        self.num_cached_prompt_tokens = 0
 
         # Time at previous scheduling step
         self.prev_time = 0.0
@@ -299,6 +346,13 @@ class Scheduler:
         self.last_prompt_latency = 0.0
         # preemption mode, RECOMPUTE or SWAP
         self.user_specified_preemption_mode = scheduler_config.preemption_mode
+        # Estimates the cost of the preemption modes, once the worker has
+        # profiled the model. Without it, the mode only depends on the number
+        # of sequences of the preempted group.
+        self.preemption_cost_model = cache_config.preemption_cost_model
+        # The number of preemptions by (mode, reason), since the last call to
+        # get_and_reset_preemption_stats.
+        self._preemption_stats: CollectionsCounter[Tuple[str, str]] = Counter()
 
         # The following field is test-only. It is used to inject artificial
         # preemption.
@@ -319,6 +373,7 @@ class Scheduler:
 
     def add_seq_group(self, seq_group: SequenceGroup) -> None:
         # Add sequence groups to the waiting queue.
+        self.policy.on_added(seq_group)
         self.waiting.append(seq_group)
 
     def abort_seq_group(self, request_id: Union[str, Iterable[str]]) -> None:
@@ -338,19 +393,24 @@ class Scheduler:
             request_id = (request_id, )
         request_ids = set(request_id)
         for state_queue in [self.waiting, self.running, self.swapped]:
+            if not request_ids:
+                break
             aborted_groups: List[SequenceGroup] = []
+            remaining_groups: List[SequenceGroup] = []
             for seq_group in state_queue:
-                if not request_ids:
-                    # Using 'break' here may add two extra iterations,
-                    # but is acceptable to reduce complexity.
-                    break
                 if seq_group.request_id in request_ids:
                     # Appending aborted group into pending list.
                     aborted_groups.append(seq_group)
                     request_ids.remove(seq_group.request_id)
+                else:
+                    remaining_groups.append(seq_group)
+            if not aborted_groups:
+                continue
+            # Rebuild the state queue at once rather than removing the groups
+            # one by one, which is quadratic in the number of aborts.
+            state_queue.clear()
+            state_queue.extend(remaining_groups)
             for aborted_group in aborted_groups:
-                # Remove the sequence group from the state queue.
-                state_queue.remove(aborted_group)
                 for seq in aborted_group.get_seqs():
                     if seq.is_finished():
                         continue
@@ -366,12 +426,12 @@ class Scheduler:
 
     def _schedule_running(
         self,
-        running_queue: deque,
+        running_queue: SeqGroupQueue,
         budget: SchedulingBudget,
         curr_loras: Optional[Set[int]],
         policy: Policy,
         enable_chunking: bool = False,
-    ) -> Tuple[deque, SchedulerRunningOutputs]:
+    ) -> Tuple[SeqGroupQueue, SchedulerRunningOutputs]:
         """Schedule sequence groups that are running.
 
         Running queue should include decode and chunked prefill requests.
@@ -408,6 +468,10 @@ class Scheduler:
         # groups to preempt.
         now = time.time()
         running_queue = policy.sort_by_priority(now, running_queue)
+        # Fast path: when all running groups fit into the free KV cache at
+        # once, which is the common case, nothing is preempted and the
+        # per-group checks below can be skipped.
+        can_append_all = self._can_append_slots_batch(running_queue)
         while running_queue:
             seq_group = running_queue[0]
             num_running_tokens = self._get_num_new_tokens(
@@ -417,7 +481,7 @@ class Scheduler:
                 break
 
             running_queue.popleft()
-            while not self._can_append_slots(seq_group):
+            while not can_append_all and not self._can_append_slots(seq_group):
                 budget.subtract_num_batched_tokens(seq_group.request_id,
                                                    num_running_tokens)
                 num_running_seqs = seq_group.get_max_num_running_seqs()
@@ -428,7 +492,8 @@ class Scheduler:
 
                 if running_queue:
                     # Preempt the lowest-priority sequence groups.
-                    victim_seq_group = running_queue.pop()
+                    victim_seq_group = self._pop_preemption_victim(
+                        running_queue)
                     preempted_mode = self._preempt(victim_seq_group,
                                                    blocks_to_swap_out)
                     if preempted_mode == PreemptionMode.RECOMPUTE:
@@ -481,12 +546,12 @@ class Scheduler:
 
     def _schedule_swapped(
         self,
-        swapped_queue: deque,
+        swapped_queue: SeqGroupQueue,
         budget: SchedulingBudget,
         curr_loras: Optional[Set[int]],
         policy: Policy,
         enable_chunking: bool = False,
-    ) -> Tuple[deque, SchedulerSwappedInOutputs]:
+    ) -> Tuple[SeqGroupQueue, SchedulerSwappedInOutputs]:
         """Schedule sequence groups that are swapped out.
 
         It schedules swapped requests as long as it fits `budget` and
@@ -610,11 +675,11 @@ class Scheduler:
 
     def _schedule_prefills(
         self,
-        waiting_queue: deque,
+        waiting_queue: SeqGroupQueue,
         budget: SchedulingBudget,
         curr_loras: Optional[Set[int]],
         enable_chunking: bool = False,
-    ) -> Tuple[deque, SchedulerPrefillOutputs]:
+    ) -> Tuple[SeqGroupQueue, SchedulerPrefillOutputs]:
         """Schedule sequence groups that are in prefill stage.
 
         Note that the current scheduler treats PREEMPTED_FOR_RECOMPUTE
@@ -643,9 +708,16 @@ class Scheduler:
         """
         ignored_seq_groups: List[SequenceGroup] = []
         seq_groups: List[SequenceGroup] = []
-        # We don't sort waiting queue because we assume it is sorted.
-        # Copy the queue so that the input queue is not modified.
-        waiting_queue = deque([s for s in waiting_queue])
+        prefix_aware = self.scheduler_config.prefix_aware_admission
+        num_cached_tokens: Dict[str, int] = {}
+        original_waiting_queue = waiting_queue
+        if prefix_aware:
+            waiting_queue, num_cached_tokens = self._order_by_cached_prefix(
+                waiting_queue)
+        else:
+            # We don't sort waiting queue because we assume it is sorted.
+            # Copy the queue so that the input queue is not modified.
+            waiting_queue = waiting_queue.copy()
 
         leftover_waiting_sequences: Deque[SequenceGroup] = deque()
         while self._passed_delay(time.time()) and waiting_queue:
@@ -712,6 +784,10 @@ class Scheduler:
             if curr_loras is not None and lora_int_id > 0:
                 curr_loras.add(lora_int_id)
             waiting_queue.popleft()
+            if self.cache_config.enable_prefix_caching:
+                self._count_cached_prompt_tokens(
+                    waiting_seqs[0],
+                    num_cached_tokens.get(seq_group.request_id))
             self._allocate_and_set_running(seq_group)
             seq_groups.append(
                 ScheduledSequenceGroup(seq_group=seq_group,
@@ -720,7 +796,11 @@ class Scheduler:
             budget.add_num_seqs(seq_group.request_id, num_new_seqs)
 
         # Queue requests that couldn't be scheduled.
-        waiting_queue.extendleft(leftover_waiting_sequences)
+        if prefix_aware:
+            waiting_queue = self._restore_waiting_order(
+                original_waiting_queue, seq_groups, ignored_seq_groups)
+        else:
+            waiting_queue.extendleft(leftover_waiting_sequences)
         if len(seq_groups) > 0:
             self.prev_prompt = True
 
@@ -729,6 +809,75 @@ class Scheduler:
             ignored_seq_groups=ignored_seq_groups,
             num_lookahead_slots=self._get_num_lookahead_slots(is_prefill=True))
 
+    def _order_by_cached_prefix(
+        self, waiting_queue: SeqGroupQueue
+    ) -> Tuple[Deque[SequenceGroup], Dict[str, int]]:
+        """Orders the front of the waiting queue for prefix-aware admission.
+
+        Sequence groups with more prompt tokens in the prefix cache go first,
+        and groups whose prompts start with the same block are kept together.
+        Requests sharing a prefix are thus admitted in the same step and hold
+        its blocks, which would otherwise be evicted by the other requests.
+        Groups that were passed over `max_admission_skips` times go before
+        all others, in queue order, which bounds their wait.
+
+        Returns the reordered copy of the queue and the number of cached
+        prompt tokens of the scored groups by request id.
+        """
+        max_skips = self.scheduler_config.max_admission_skips
+        window = list(
+            itertools.islice(waiting_queue, PREFIX_AWARE_ADMISSION_WINDOW))
+        num_cached_tokens: Dict[str, int] = {}
+        first_block_positions: Dict[int, int] = {}
+        keys: List[Tuple[int, int, int, int]] = []
+        for position, seq_group in enumerate(window):
+            if seq_group.num_admission_skips >= max_skips:
+                keys.append((0, 0, position, position))
+                continue
+            seq = seq_group.get_seqs(status=SequenceStatus.WAITING)[0]
+            num_cached = self.block_manager.get_num_cached_prefix_tokens(seq)
+            num_cached_tokens[seq_group.request_id] = num_cached
+            group_position = position
+            if seq.get_len() >= self.cache_config.block_size:
+                group_position = first_block_positions.setdefault(
+                    seq.hash_of_block(0), position)
+            keys.append((1, -num_cached, group_position, position))
+
+        order = sorted(range(len(window)), key=keys.__getitem__)
+        reordered = deque(window[i] for i in order)
+        reordered.extend(itertools.islice(waiting_queue, len(window), None))
+        return reordered, num_cached_tokens
+
+    def _count_cached_prompt_tokens(self, seq: Sequence,
+                                    num_cached: Optional[int]) -> None:
+        if num_cached is None:
+            num_cached = self.block_manager.get_num_cached_prefix_tokens(seq)
+        self.num_admitted_prompt_tokens += seq.get_len()
+        self.num_cached_prompt_tokens += num_cached
+
+    def _restore_waiting_order(
+        self,
+        waiting_queue: SeqGroupQueue,
+        scheduled: List[ScheduledSequenceGroup],
+        ignored: List[SequenceGroup],
+    ) -> SeqGroupQueue:
+        """Returns the sequence groups of the waiting queue which were not
+        scheduled, in their original order, and counts a skip for each group
+        that a later group was admitted ahead of."""
+        scheduled_ids = {s.seq_group.request_id for s in scheduled}
+        ignored_ids = {seq_group.request_id for seq_group in ignored}
+        remaining = self.policy.create_queue()
+        num_scheduled_behind = len(scheduled_ids)
+        for seq_group in waiting_queue:
+            if seq_group.request_id in scheduled_ids:
+                seq_group.num_admission_skips = 0
+                num_scheduled_behind -= 1
+            elif seq_group.request_id not in ignored_ids:
+                if num_scheduled_behind > 0:
+                    seq_group.num_admission_skips += 1
+                remaining.append(seq_group)
+        return remaining
+
     def _schedule_default(self) -> SchedulerOutputs:
         """Schedule queued requests.
         
@@ -763,7 +912,6 @@ class Scheduler:
             remaining_waiting, prefills = self._schedule_prefills(
                 self.waiting, budget, curr_loras, enable_chunking=False)
 
-        fcfs_policy = PolicyFactory.get_policy(policy_name="fcfs")
         # Don't schedule decodes if prefills are scheduled.
         # NOTE: If `_schedule_prefills` doesn't enable chunking, self.running
         # only contains decode requests, not chunked prefills.
@@ -772,7 +920,7 @@ class Scheduler:
                 self.running,
                 budget,
                 curr_loras,
-                fcfs_policy,
+                self.policy,
                 enable_chunking=False)
 
             # If any sequence group is preempted, do not swap in any sequence
@@ -780,7 +928,7 @@ class Scheduler:
             if len(running_scheduled.preempted) + len(
                     running_scheduled.swapped_out) == 0:
                 remaining_swapped, swapped_in = self._schedule_swapped(
-                    self.swapped, budget, curr_loras, fcfs_policy)
+                    self.swapped, budget, curr_loras, self.policy)
 
         assert (budget.num_batched_tokens <=
                 self.scheduler_config.max_num_batched_tokens)
@@ -850,13 +998,12 @@ class Scheduler:
         remaining_swapped, swapped_in = (
             self.swapped, SchedulerSwappedInOutputs.create_empty())
 
-        # Decoding should be always scheduled first by fcfs.
-        fcfs_policy = PolicyFactory.get_policy(policy_name="fcfs")
+        # Decoding should be always scheduled first, in policy order.
         remaining_running, running_scheduled = self._schedule_running(
             self.running,
             budget,
             curr_loras,
-            fcfs_policy,
+            self.policy,
             enable_chunking=True)
 
         # Schedule swapped out requests.
@@ -864,7 +1011,7 @@ class Scheduler:
         if len(running_scheduled.preempted) + len(
                 running_scheduled.swapped_out) == 0:
             remaining_swapped, swapped_in = self._schedule_swapped(
-                self.swapped, budget, curr_loras, fcfs_policy)
+                self.swapped, budget, curr_loras, self.policy)
 
         # Schedule new prefills.
         remaining_waiting, prefills = self._schedule_prefills(
@@ -938,11 +1085,28 @@ class Scheduler:
             num_lookahead_slots=self._get_num_lookahead_slots(is_prefill),
         )
 
+    def _can_append_slots_batch(self,
+                                seq_groups: Iterable[SequenceGroup]) -> bool:
+        """Determine whether all the given sequence groups can continue
+        generation in the same step, with a single pass over the groups.
+        False means that the groups must be checked one by one.
+        """
+        if self.enable_artificial_preemption:
+            return False
+
+        return self.block_manager.can_append_slots_batch(
+            seq_groups=seq_groups,
+            num_lookahead_slots=self._get_num_lookahead_slots(
+                is_prefill=False),
+        )
+
     def schedule(self) -> Tuple[List[SequenceGroupMetadata], SchedulerOutputs]:
         # Schedule sequence groups.
         # This function call changes the internal states of the scheduler
         # such as self.running, self.swapped, and self.waiting.
         scheduler_outputs = self._schedule()
+        scheduler_outputs.offload_transfers = (
+            self.block_manager.get_and_clear_offload_transfers())
         now = time.time()
 
         # Create input data structures.
@@ -1024,10 +1188,14 @@ class Scheduler:
         self.block_manager.free(seq)
 
     def free_finished_seq_groups(self) -> None:
-        self.running = deque(seq_group for seq_group in self.running
-                             if not seq_group.is_finished())
+        finished_seq_groups = [
+            seq_group for seq_group in self.running if seq_group.is_finished()
+        ]
+        for seq_group in finished_seq_groups:
+            self.running.remove(seq_group)
 
     def _allocate_and_set_running(self, seq_group: SequenceGroup) -> None:
+        self.policy.on_scheduled(seq_group)
         self.block_manager.allocate(seq_group)
         for seq in seq_group.get_seqs(status=SequenceStatus.WAITING):
             seq.status = SequenceStatus.RUNNING
@@ -1054,33 +1222,103 @@ class Scheduler:
             cows = self.block_manager.append_slots(seq, num_lookahead_slots)
             blocks_to_copy.extend(cows)
 
-    def _preempt(
-        self,
-        seq_group: SequenceGroup,
-        blocks_to_swap_out: List[Tuple[int, int]],
-        preemption_mode: Optional[PreemptionMode] = None,
-    ) -> PreemptionMode:
+    def get_and_reset_preemption_stats(self) -> Dict[Tuple[str, str], int]:
+        """Returns the number of preemptions by (mode, reason) since the last
+        call."""
+        stats = dict(self._preemption_stats)
+        self._preemption_stats.clear()
+        return stats
+
+    def _pop_preemption_victim(self,
+                               running_queue: SeqGroupQueue) -> SequenceGroup:
+        """Pops the sequence group to preempt from the back of the running
+        queue, which holds the lowest-priority groups.
+
+        When the preemption costs are known, the group losing the least work
+        per token of KV cache freed is picked among the last groups of the
+        lowest request priority, so that a long context is not recomputed to
+        make room for a short one.
+        """
+        if self.preemption_cost_model is None or len(running_queue) == 1:
+            return running_queue.pop()
+
+        lowest_priority = running_queue[-1].priority
+        window = min(PREEMPTION_VICTIM_WINDOW, len(running_queue))
+        victim_index = -1
+        victim_cost = float("inf")
+        for index in range(-1, -window - 1, -1):
+            seq_group = running_queue[index]
+            if seq_group.priority != lowest_priority:
+                break
+            _, _, cost = self._select_preemption_mode(seq_group)
+            num_tokens = sum(
+                seq.get_len()
+                for seq in seq_group.get_seqs(status=SequenceStatus.RUNNING))
+            cost /= max(num_tokens, 1)
+            if cost < victim_cost:
+                victim_index = index
+                victim_cost = cost
+
+        victim = running_queue[victim_index]
+        del running_queue[victim_index]
+        return victim
+
+    def _select_preemption_mode(
+        self, seq_group: SequenceGroup
+    ) -> Tuple[PreemptionMode, PreemptionReason, float]:
+        """Returns the mode to preempt a sequence group with, why it was
+        chosen and its estimated cost in seconds, which is infinite without a
+        cost model."""
         # If preemption mode is not specified, we determine the mode as follows:
         # We use recomputation by default since it incurs lower overhead than
-        # swapping. However, when the sequence group has multiple sequences
-        # (e.g., beam search), recomputation is not currently supported. In
-        # such a case, we use swapping instead.
+        # swapping, unless the cost model estimates that swapping the KV cache
+        # of a long sequence is cheaper than recomputing it. However, when the
+        # sequence group has multiple sequences (e.g., beam search),
+        # recomputation is not currently supported. In such a case, we use
+        # swapping instead.
         # FIXME(woosuk): This makes our scheduling policy a bit bizarre.
         # As swapped sequences are prioritized over waiting sequences,
         # sequence groups with multiple sequences are implicitly prioritized
         # over sequence groups with a single sequence.
         # TODO(woosuk): Support recomputation for sequence groups with multiple
         # sequences. This may require a more sophisticated CUDA kernel.
-        if self.user_specified_preemption_mode is None:
-            if seq_group.get_max_num_running_seqs() == 1:
-                preemption_mode = PreemptionMode.RECOMPUTE
-            else:
-                preemption_mode = PreemptionMode.SWAP
+        cost_model = self.preemption_cost_model
+        seqs = seq_group.get_seqs(status=SequenceStatus.RUNNING)
+        recompute_cost = swap_cost = float("inf")
+        if cost_model is not None:
+            recompute_cost = sum(
+                cost_model.get_recompute_time(seq.get_len()) for seq in seqs)
+            swap_cost = cost_model.get_swap_time(
+                sum(seq.get_len() for seq in seqs))
+
+        if self.user_specified_preemption_mode == "swap":
+            return PreemptionMode.SWAP, PreemptionReason.USER, swap_cost
+        if self.user_specified_preemption_mode is not None:
+            return (PreemptionMode.RECOMPUTE, PreemptionReason.USER,
+                    recompute_cost)
+        if seq_group.get_max_num_running_seqs() > 1:
+            return (PreemptionMode.SWAP, PreemptionReason.MULTIPLE_SEQS,
+                    swap_cost)
+        if cost_model is None:
+            return (PreemptionMode.RECOMPUTE, PreemptionReason.DEFAULT,
+                    recompute_cost)
+        if swap_cost < recompute_cost:
+            if self.block_manager.can_swap_out(seq_group):
+                return PreemptionMode.SWAP, PreemptionReason.COST, swap_cost
+            return (PreemptionMode.RECOMPUTE, PreemptionReason.NO_SWAP_SPACE,
+                    recompute_cost)
+        return (PreemptionMode.RECOMPUTE, PreemptionReason.COST,
+                recompute_cost)
 
-        elif self.user_specified_preemption_mode == "swap":
-            preemption_mode = PreemptionMode.SWAP
-        else:
-            preemption_mode = PreemptionMode.RECOMPUTE
+    def _preempt(
+        self,
+        seq_group: SequenceGroup,
+        blocks_to_swap_out: List[Tuple[int, int]],
+        preemption_mode: Optional[PreemptionMode] = None,
+    ) -> PreemptionMode:
+        preemption_mode, reason, _ = self._select_preemption_mode(seq_group)
+        self._preemption_stats[(preemption_mode.name.lower(),
+                                reason.value)] += 1
 
         if self.num_cumulative_preemption % 50 == 0:
             logger.warning(
@@ -1167,11 +1405,23 @@ class Scheduler:
 
         Speculative decoding does not yet support prefill, so we do not perform
         lookahead allocation for prefill.
+
+        With multi-step decoding, the workers run num_scheduler_steps steps
+        on the decodes, so the slots of the tokens sampled by all the steps
+        but the last are allocated ahead.
+
+        With the pipelined engine step, the decodes are scheduled while the
+        previous step, whose new token is not appended yet, may still be
+        running. One more slot is allocated for that token.
         """
         if is_prefill:
             return 0
 
-        return self.scheduler_config.num_lookahead_slots
+        num_lookahead_slots = (self.scheduler_config.num_lookahead_slots +
+                               self.scheduler_config.num_scheduler_steps - 1)
+        if self.scheduler_config.pipelined_step:
+            return num_lookahead_slots + 1
+        return num_lookahead_slots
 
     def _get_num_new_tokens(self, seq_group: SequenceGroup,
                             status: SequenceStatus, enable_chunking: bool,
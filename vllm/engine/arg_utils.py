@@ -3,7 +3,7 @@ import dataclasses
 import json
 import warnings
 from dataclasses import dataclass
-from typing import List, Optional, Tuple, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 from vllm.config import (CacheConfig, DecodingConfig, DeviceConfig,
                          EngineConfig, LoadConfig, LoRAConfig, ModelConfig,
@@ -45,6 +45,10 @@ class EngineArgs:
     disable_sliding_window: bool = False
     use_v2_block_manager: bool = False
     swap_space: int = 4  # GiB
+    kv_offload_host_space: float = 0  # GiB
+    kv_offload_disk_space: float = 0  # GiB
+    kv_offload_path: Optional[str] = None
+    persistent_prefix_cache: bool = False
     gpu_memory_utilization: float = 0.90
     max_num_batched_tokens: Optional[int] = None
     max_num_seqs: int = 256
@@ -76,6 +80,13 @@ class EngineArgs:
     num_lookahead_slots: int = 0
     model_loader_extra_config: Optional[dict] = None
     preemption_mode: Optional[str] = None
+    scheduling_policy: str = 'fcfs'
+    sjf_aging_rate: float = 100.0
+    fair_queueing_weights: Optional[Dict[int, float]] = None
+    prefix_aware_admission: bool = False
+    max_admission_skips: int = 8
+    pipelined_step: bool = False
+    num_scheduler_steps: int = 1
 
     # Related to Vision-language models such as llava
     image_input_type: Optional[str] = None
@@ -90,6 +101,8 @@ class EngineArgs:
     enable_chunked_prefill: bool = False
 
     guided_decoding_backend: str = 'outlines'
+    async_detokenization: bool = False
+    guided_decoding_fast_forward: bool = False
     # Speculative decoding configuration.
     speculative_model: Optional[str] = None
     num_speculative_tokens: Optional[int] = None
@@ -283,6 +296,21 @@ class EngineArgs:
             'https://github.com/noamgat/lm-format-enforcer.'
             ' Can be overridden per request via guided_decoding_backend'
             ' parameter.')
+        parser.add_argument(
+            '--async-detokenization',
+            action='store_true',
+            help='Detokenize the outputs of a step and check them for stop '
+            'strings in a background thread while the next step runs. The '
+            'outputs of a step are returned by the next one, and a sequence '
+            'matching a stop string computes one token more, which is '
+            'dropped.')
+        parser.add_argument(
+            '--guided-decoding-fast-forward',
+            action='store_true',
+            help='Append the tokens forced by the guide of a guided decoding '
+            'request, e.g. the keys of a JSON schema, without sampling them, '
+            'and compute them in a single prefill chunk. Requires '
+            '--enable-chunked-prefill.')
         # Parallel arguments
         parser.add_argument(
             '--distributed-executor-backend',
@@ -351,6 +379,33 @@ class EngineArgs:
                             type=int,
                             default=EngineArgs.swap_space,
                             help='CPU swap space size (GiB) per GPU.')
+        parser.add_argument(
+            '--kv-offload-host-space',
+            type=float,
+            default=EngineArgs.kv_offload_host_space,
+            help='Host memory (GiB) per GPU keeping the prefix-cached '
+            'blocks evicted from the GPU, so that they can be loaded back '
+            'instead of being recomputed. Requires --enable-prefix-caching '
+            'and --use-v2-block-manager.')
+        parser.add_argument(
+            '--kv-offload-disk-space',
+            type=float,
+            default=EngineArgs.kv_offload_disk_space,
+            help='Disk space (GiB) per GPU keeping the prefix-cached blocks '
+            'evicted from the host memory tier, in a memory-mapped file.')
+        parser.add_argument(
+            '--kv-offload-path',
+            type=nullable_str,
+            default=EngineArgs.kv_offload_path,
+            help='Directory of the file backing the disk tier of the KV '
+            'cache. Defaults to the system temporary directory.')
+        parser.add_argument(
+            '--persistent-prefix-cache',
+            action='store_true',
+            help='Keeps the disk tier of the KV cache in --kv-offload-path '
+            'when the engine shuts down, together with the prefix-cached '
+            'blocks still on the GPU and in host memory, and reuses it on '
+            'the next start with the same model and cache configuration.')
         parser.add_argument(
             '--gpu-memory-utilization',
             type=float,
@@ -433,7 +488,8 @@ class EngineArgs:
                             type=str,
                             default=EngineArgs.tokenizer_pool_type,
                             help='Type of tokenizer pool to use for '
-                            'asynchronous tokenization. Ignored '
+                            'asynchronous tokenization, "ray" for Ray actors '
+                            'or "process" for local processes. Ignored '
                             'if tokenizer_pool_size is 0.')
         parser.add_argument('--tokenizer-pool-extra-config',
                             type=nullable_str,
@@ -572,6 +628,60 @@ class EngineArgs:
             help='If \'recompute\', the engine performs preemption by block '
             'swapping; If \'swap\', the engine performs preemption by block '
             'swapping.')
+        parser.add_argument(
+            '--scheduling-policy',
+            choices=['fcfs', 'priority', 'sjf', 'fair'],
+            default=EngineArgs.scheduling_policy,
+            help='The scheduling policy to use. "fcfs" (first come first '
+            'served, default), "priority" (by the request priority, lower '
+            'values first), "sjf" (shortest expected job first, aged by the '
+            'waiting time) or "fair" (weighted fair queueing across LoRA '
+            'adapters).')
+        parser.add_argument(
+            '--sjf-aging-rate',
+            type=float,
+            default=EngineArgs.sjf_aging_rate,
+            help='The expected tokens a request is credited per second it '
+            'has waited by the "sjf" scheduling policy, so that long '
+            'requests are not starved by short ones.')
+        parser.add_argument(
+            '--fair-queueing-weights',
+            type=json.loads,
+            default=EngineArgs.fair_queueing_weights,
+            help='The weights of the LoRA adapters in the "fair" scheduling '
+            'policy in JSON format, by LoRA int id (0 for the base model). '
+            'For example, {"1": 2.0}. Adapters without a weight have '
+            'weight 1.')
+        parser.add_argument(
+            '--prefix-aware-admission',
+            action='store_true',
+            help='Admit the waiting requests with the most prompt tokens in '
+            'the prefix cache first, so that requests sharing a cached '
+            'prefix run together instead of evicting it. Requires '
+            '--enable-prefix-caching.')
+        parser.add_argument(
+            '--max-admission-skips',
+            type=int,
+            default=EngineArgs.max_admission_skips,
+            help='The number of scheduling steps a waiting request can be '
+            'passed over by --prefix-aware-admission before it is admitted '
+            'in the order of the scheduling policy again.')
+        parser.add_argument(
+            '--pipelined-step',
+            action='store_true',
+            help='Schedule the next step while the model executes the '
+            'current one, so that the scheduling overhead is hidden behind '
+            'the model execution. Requires --use-v2-block-manager and a '
+            'single GPU or CPU.')
+        parser.add_argument(
+            '--num-scheduler-steps',
+            type=int,
+            default=EngineArgs.num_scheduler_steps,
+            help='The number of decoding steps the GPU runs back-to-back '
+            'for each scheduled batch of decodes, which amortizes the '
+            'scheduling and output processing over the steps. The stop '
+            'conditions are checked and the outputs are streamed once per '
+            'batch. Requires --use-v2-block-manager.')
 
         parser.add_argument(
             "--served-model-name",
@@ -648,7 +758,11 @@ class EngineArgs:
             cache_dtype=self.kv_cache_dtype,
             num_gpu_blocks_override=self.num_gpu_blocks_override,
             sliding_window=model_config.get_sliding_window(),
-            enable_prefix_caching=self.enable_prefix_caching)
+            enable_prefix_caching=self.enable_prefix_caching,
+            kv_offload_host_space=self.kv_offload_host_space,
+            kv_offload_disk_space=self.kv_offload_disk_space,
+            kv_offload_path=self.kv_offload_path,
+            persistent_prefix_cache=self.persistent_prefix_cache)
         parallel_config = ParallelConfig(
             pipeline_parallel_size=self.pipeline_parallel_size,
             tensor_parallel_size=self.tensor_parallel_size,
@@ -690,6 +804,13 @@ class EngineArgs:
             enable_chunked_prefill=self.enable_chunked_prefill,
             embedding_mode=model_config.embedding_mode,
             preemption_mode=self.preemption_mode,
+            policy=self.scheduling_policy,
+            sjf_aging_rate=self.sjf_aging_rate,
+            fair_queueing_weights=self.fair_queueing_weights,
+            prefix_aware_admission=self.prefix_aware_admission,
+            max_admission_skips=self.max_admission_skips,
+            pipelined_step=self.pipelined_step,
+            num_scheduler_steps=self.num_scheduler_steps,
         )
         lora_config = LoRAConfig(
             max_lora_rank=self.max_lora_rank,
@@ -746,7 +867,20 @@ class EngineArgs:
             vision_language_config = None
 
         decoding_config = DecodingConfig(
-            guided_decoding_backend=self.guided_decoding_backend)
+            guided_decoding_backend=self.guided_decoding_backend,
+            async_detokenization=self.async_detokenization,
+            guided_decoding_fast_forward=self.guided_decoding_fast_forward)
+
+        if decoding_config.guided_decoding_fast_forward and (
+                not scheduler_config.chunked_prefill_enabled
+                or cache_config.enable_prefix_caching
+                or scheduler_config.pipelined_step
+                or scheduler_config.num_lookahead_slots > 0
+                or scheduler_config.num_scheduler_steps > 1):
+            raise ValueError(
+                "Guided decoding fast-forward requires chunked prefill, and "
+                "is not supported with prefix caching, the pipelined engine "
+                "step, multi-step or speculative decoding.")
 
         if (model_config.get_sliding_window() is not None
                 and scheduler_config.chunked_prefill_enabled
@@ -755,6 +889,34 @@ class EngineArgs:
                 "Chunked prefill is not supported with sliding window. "
                 "Set --disable-sliding-window to disable sliding window.")
 
+        if (cache_config.offload_enabled
+                and not scheduler_config.use_v2_block_manager):
+            raise ValueError(
+                "KV cache offloading is only supported by the v2 block "
+                "manager. Set --use-v2-block-manager to use it.")
+
+        if scheduler_config.pipelined_step and (parallel_config.world_size > 1
+                                                or device_config.device_type
+                                                not in ("cuda", "cpu")):
+            raise ValueError(
+                "The pipelined engine step is only supported on a single GPU "
+                "or on CPU.")
+
+        if (scheduler_config.num_scheduler_steps > 1
+                and device_config.device_type != "cuda"):
+            raise ValueError("Multi-step decoding is only supported on GPUs.")
+
+        if (scheduler_config.prefix_aware_admission
+                and not cache_config.enable_prefix_caching):
+            raise ValueError("Prefix-aware admission requires prefix caching. "
+                             "Run with --enable-prefix-caching to use it.")
+
+        if cache_config.persistent_prefix_cache and lora_config is not None:
+            # The content hashes of the blocks do not include the adapter,
+            # whose ids are not stable across restarts anyway.
+            raise ValueError(
+                "The persistent prefix cache is not supported with LoRA.")
+
         return EngineConfig(model_config=model_config,
                             cache_config=cache_config,
                             parallel_config=parallel_config,
@@ -1,8 +1,10 @@
 import asyncio
+import contextlib
 import time
+from collections import deque
 from functools import partial
-from typing import (AsyncIterator, Callable, Dict, Iterable, List, Optional,
-                    Set, Tuple, Type, Union)
+from typing import (AsyncIterator, Callable, Deque, Dict, Iterable, List,
+                    Optional, Set, Tuple, Type, Union)
 
 from transformers import PreTrainedTokenizer
 
@@ -17,7 +19,7 @@ from vllm.logger import init_logger
 from vllm.lora.request import LoRARequest
 from vllm.outputs import EmbeddingRequestOutput, RequestOutput
 from vllm.pooling_params import PoolingParams
-from vllm.sampling_params import SamplingParams
+from vllm.sampling_params import RequestOutputKind, SamplingParams
 from vllm.sequence import ExecuteModelRequest, SamplerOutput
 from vllm.usage.usage_lib import UsageContext
 
@@ -59,32 +61,67 @@ def _log_task_completion(task: asyncio.Task,
 
 class AsyncStream:
     """A stream of RequestOutputs or EmbeddingRequestOutputs for a request
-    that can be iterated over asynchronously."""
+    that can be iterated over asynchronously.
 
-    def __init__(self, request_id: str) -> None:
+    The items are buffered until the consumer reads them, and the consumer is
+    woken up once however many items are put in the meantime. A new
+    RequestOutput replaces the one still pending, as it is cumulative, or is
+    merged into it with delta outputs, so that a consumer lagging behind the
+    engine reads the progress of the request at once.
+
+    Args:
+        request_id: The ID of the request.
+        deltas: Whether the RequestOutputs of the request are deltas, see
+            `RequestOutputKind.DELTA`.
+    """
+
+    def __init__(self, request_id: str, deltas: bool = False) -> None:
         self.request_id = request_id
-        self._queue: asyncio.Queue = asyncio.Queue()
+        self.deltas = deltas
+        self._queue: Deque[Union[RequestOutput, EmbeddingRequestOutput,
+                                 Exception]] = deque()
+        self._waiter: Optional[asyncio.Future] = None
         self._finished = False
 
     def put(self, item: Union[RequestOutput, EmbeddingRequestOutput,
                               Exception]) -> None:
         if self._finished:
             return
-        self._queue.put_nowait(item)
+        pending = self._queue[-1] if self._queue else None
+        if (isinstance(item, RequestOutput)
+                and isinstance(pending, RequestOutput)):
+            if self.deltas:
+                pending.add(item)
+            else:
+                self._queue[-1] = item
+        else:
+            self._queue.append(item)
+        self._wakeup()
 
     def finish(self) -> None:
-        self._queue.put_nowait(StopAsyncIteration())
+        self._queue.append(StopAsyncIteration())
         self._finished = True
+        self._wakeup()
 
     @property
     def finished(self) -> bool:
         return self._finished
 
+    def _wakeup(self) -> None:
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
     def __aiter__(self):
         return self
 
     async def __anext__(self) -> Union[RequestOutput, EmbeddingRequestOutput]:
-        result = await self._queue.get()
+        while not self._queue:
+            self._waiter = asyncio.get_event_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        result = self._queue.popleft()
         if isinstance(result, Exception):
             raise result
         return result
@@ -125,13 +162,22 @@ class RequestTracker:
                                *,
                                verbose: bool = False) -> None:
         """Process a request output from the engine."""
-        request_id = request_output.request_id
-
-        self._request_streams[request_id].put(request_output)
-        if request_output.finished:
-            if verbose:
-                logger.info("Finished request %s.", request_id)
-            self.abort_request(request_id)
+        self.process_request_outputs([request_output], verbose=verbose)
+
+    def process_request_outputs(self,
+                                request_outputs: Iterable[Union[
+                                    RequestOutput, EmbeddingRequestOutput]],
+                                *,
+                                verbose: bool = False) -> None:
+        """Process the request outputs of an engine step."""
+        streams = self._request_streams
+        for request_output in request_outputs:
+            request_id = request_output.request_id
+            streams[request_id].put(request_output)
+            if request_output.finished:
+                if verbose:
+                    logger.info("Finished request %s.", request_id)
+                self.abort_request(request_id)
 
     def process_exception(self,
                           request_id: str,
@@ -144,14 +190,17 @@ class RequestTracker:
             logger.info("Finished request %s.", request_id)
         self.abort_request(request_id)
 
-    def add_request(self, request_id: str,
+    def add_request(self,
+                    request_id: str,
+                    *,
+                    deltas: bool = False,
                     **engine_add_request_kwargs) -> AsyncStream:
         """Add a request to be sent to the engine on the next background
         loop iteration."""
         if request_id in self._request_streams:
             raise KeyError(f"Request {request_id} already exists.")
 
-        stream = AsyncStream(request_id)
+        stream = AsyncStream(request_id, deltas=deltas)
         self._new_requests.put_nowait((stream, {
             "request_id": request_id,
             **engine_add_request_kwargs
@@ -220,6 +269,13 @@ class _AsyncLLMEngine(LLMEngine):
         and updates the scheduler with the model outputs. Finally, it decodes
         the sequences and returns the newly generated results.
         """
+        if self.scheduler_config.pipelined_step:
+            running_batch, next_batch = self._schedule_pipelined_step()
+            output = ([] if running_batch.future is None else await
+                      asyncio.wrap_future(running_batch.future))
+            return self._finish_pipelined_step(running_batch, next_batch,
+                                               output)
+
         seq_group_metadata_list, scheduler_outputs = self.scheduler.schedule()
 
         if not scheduler_outputs.is_empty():
@@ -229,8 +285,10 @@ class _AsyncLLMEngine(LLMEngine):
                 blocks_to_swap_in=scheduler_outputs.blocks_to_swap_in,
                 blocks_to_swap_out=scheduler_outputs.blocks_to_swap_out,
                 blocks_to_copy=scheduler_outputs.blocks_to_copy,
+                offload_transfers=scheduler_outputs.offload_transfers,
                 num_lookahead_slots=scheduler_outputs.num_lookahead_slots,
                 running_queue_size=scheduler_outputs.running_queue_size,
+                num_steps=self._get_num_steps(scheduler_outputs),
             )
             output = await self.model_executor.execute_model_async(
                 execute_model_req)
@@ -244,7 +302,7 @@ class _AsyncLLMEngine(LLMEngine):
         # Log stats.
         self.do_log_stats(scheduler_outputs, output)
 
-        if not request_outputs:
+        if not request_outputs and not self.has_pending_outputs():
             # Stop the execute model loop in parallel workers until there are
             # more requests to process. This avoids waiting indefinitely in
             # torch.distributed ops which may otherwise timeout, and unblocks
@@ -285,6 +343,7 @@ class _AsyncLLMEngine(LLMEngine):
         params: Union[SamplingParams, PoolingParams],
         arrival_time: Optional[float] = None,
         lora_request: Optional[LoRARequest] = None,
+        priority: Optional[int] = None,
     ) -> None:
         if lora_request is not None and not self.lora_config:
             raise ValueError(f"Got lora_request {lora_request} but LoRA is "
@@ -301,6 +360,7 @@ class _AsyncLLMEngine(LLMEngine):
             params=params,
             arrival_time=arrival_time,
             lora_request=lora_request,
+            priority=priority,
         )
 
     async def check_health_async(self) -> None:
@@ -477,19 +537,19 @@ class AsyncLLMEngine:
         new_requests, finished_requests = (
             self._request_tracker.get_new_and_finished_requests())
 
-        for new_request in new_requests:
-            # Add the request into the vLLM engine's waiting queue.
-            # TODO: Maybe add add_request_batch to reduce Ray overhead
-            try:
-                if self.engine_use_ray:
-                    await self.engine.add_request.remote(  # type: ignore
-                        **new_request)
-                else:
-                    await self.engine.add_request_async(**new_request)
-            except ValueError as e:
+        if new_requests:
+            # Add the requests into the vLLM engine's waiting queue, in a
+            # single call. Their inputs are already processed.
+            if self.engine_use_ray:
+                errors = await (
+                    self.engine.add_request_batch.remote(  # type: ignore
+                        new_requests))
+            else:
+                errors = self.engine.add_request_batch(new_requests)
+            for request_id, e in errors.items():
                 # TODO: use a vLLM specific error for failed validation
                 self._request_tracker.process_exception(
-                    new_request["request_id"],
+                    request_id,
                     e,
                     verbose=self.log_requests,
                 )
@@ -503,11 +563,17 @@ class AsyncLLMEngine:
             request_outputs = await self.engine.step_async()
 
         # Put the outputs into the corresponding streams.
-        for request_output in request_outputs:
-            self._request_tracker.process_request_output(
-                request_output, verbose=self.log_requests)
+        self._request_tracker.process_request_outputs(
+            request_outputs, verbose=self.log_requests)
 
-        return len(request_outputs) > 0
+        if request_outputs:
+            return True
+        # With async detokenization, the outputs of a step are returned by
+        # the next one.
+        if self.engine_use_ray:
+            return await self.engine.has_pending_outputs.remote(  # type: ignore
+            )
+        return self.engine.has_pending_outputs()
 
     async def _engine_abort(self, request_ids: Iterable[str]):
         if self.engine_use_ray:
@@ -542,6 +608,7 @@ class AsyncLLMEngine:
         params: Union[SamplingParams, PoolingParams],
         arrival_time: Optional[float] = None,
         lora_request: Optional[LoRARequest] = None,
+        priority: Optional[int] = None,
     ) -> AsyncStream:
         if self.log_requests:
             if isinstance(inputs, str):
@@ -591,10 +658,13 @@ class AsyncLLMEngine:
 
         stream = self._request_tracker.add_request(
             request_id,
+            deltas=(isinstance(params, SamplingParams)
+                    and params.output_kind == RequestOutputKind.DELTA),
             inputs=processed_inputs,
             params=params,
             arrival_time=arrival_time,
             lora_request=lora_request,
+            priority=priority,
         )
 
         return stream
@@ -605,6 +675,7 @@ class AsyncLLMEngine:
         sampling_params: SamplingParams,
         request_id: str,
         lora_request: Optional[LoRARequest] = None,
+        priority: Optional[int] = None,
     ) -> AsyncIterator[RequestOutput]:
         """Generate outputs for a request.
 
@@ -619,6 +690,9 @@ class AsyncLLMEngine:
             sampling_params: The sampling parameters of the request.
             request_id: The unique id of the request.
             lora_request: LoRA request to use for generation, if any.
+            priority: The priority of the request, lower values are scheduled
+                first by the "priority" scheduling policy. If None, the
+                priority of the sampling parameters is used.
 
         Yields:
             The output `RequestOutput` objects from the LLMEngine
@@ -672,6 +746,7 @@ class AsyncLLMEngine:
                 inputs,
                 sampling_params,
                 lora_request=lora_request,
+                priority=priority,
         ):
             yield LLMEngine.validate_output(output, RequestOutput)
 
@@ -756,6 +831,7 @@ class AsyncLLMEngine:
         params: Union[SamplingParams, PoolingParams],
         *,
         lora_request: Optional[LoRARequest] = None,
+        priority: Optional[int] = None,
     ) -> AsyncIterator[Union[RequestOutput, EmbeddingRequestOutput]]:
         """Common logic to process requests with SamplingParams or
         PoolingParams."""
@@ -767,6 +843,7 @@ class AsyncLLMEngine:
             params,
             arrival_time=arrival_time,
             lora_request=lora_request,
+            priority=priority,
         )
 
         try:
@@ -846,3 +923,19 @@ class AsyncLLMEngine:
         else:
             await self.engine.check_health_async()
         logger.debug("Health check took %fs", time.perf_counter() - t)
+
+    async def shutdown(self) -> None:
+        """Stops the background loop, then saves the persistent prefix cache
+        and shuts down the engine."""
+        # Meant for when no request is left, like after the server stopped,
+        # so that the loop waits for new ones and no step is cut short.
+        if self.is_running:
+            assert self._background_loop_unshielded is not None
+            self._background_loop_unshielded.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._background_loop_unshielded
+
+        if self.engine_use_ray:
+            await self.engine.shutdown.remote()  # type: ignore
+        else:
+            self.engine.shutdown()
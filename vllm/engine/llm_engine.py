@@ -1,8 +1,10 @@
 import time
+from concurrent.futures import Future
 from contextlib import contextmanager
-from typing import TYPE_CHECKING, ClassVar, Iterable, List, Optional
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, ClassVar, Dict, Iterable, List, Optional
 from typing import Sequence as GenericSequence
-from typing import Type, TypeVar, Union
+from typing import Set, Tuple, Type, TypeVar, Union
 
 from transformers import GenerationConfig, PreTrainedTokenizer
 
@@ -11,10 +13,13 @@ from vllm.config import (CacheConfig, DecodingConfig, DeviceConfig, LoadConfig,
                          LoRAConfig, ModelConfig, ParallelConfig,
                          SchedulerConfig, SpeculativeConfig,
                          VisionLanguageConfig)
+from vllm.core.block.prefix_cache_store import PrefixCacheStore
 from vllm.core.scheduler import (ScheduledSequenceGroup, Scheduler,
                                  SchedulerOutputs)
 from vllm.engine.arg_utils import EngineArgs
 from vllm.engine.metrics import StatLogger, Stats
+from vllm.engine.output_processor.async_detokenizer import (AsyncDetokenizer,
+                                                            StoppedSequence)
 from vllm.engine.output_processor.interfaces import (
     SequenceGroupOutputProcessor)
 from vllm.engine.output_processor.stop_checker import StopChecker
@@ -57,6 +62,22 @@ def _load_generation_config_dict(model_config: ModelConfig):
 _O = TypeVar("_O", RequestOutput, EmbeddingRequestOutput)
 
 
+@dataclass
+class _PipelinedBatch:
+    """A batch of the pipelined engine step. It is scheduled while the
+    previous batch runs, and submitted to the model executor once the outputs
+    of the previous batch are processed."""
+    seq_group_metadata_list: List[SequenceGroupMetadata]
+    scheduler_outputs: SchedulerOutputs
+    # The model outputs once the batch is submitted, None if there is nothing
+    # to execute.
+    future: Optional["Future[List[SamplerOutput]]"] = None
+
+    def has_outputs(self) -> bool:
+        return bool(self.scheduler_outputs.scheduled_seq_groups
+                    or self.scheduler_outputs.ignored_seq_groups)
+
+
 class LLMEngine:
     """An LLM engine that receives requests and generates texts.
 
@@ -207,6 +228,7 @@ class LLMEngine:
         self.load_config = load_config
         self.decoding_config = decoding_config or DecodingConfig()
         self.log_stats = log_stats
+        self._is_shut_down = False
 
         if not self.model_config.skip_tokenizer_init:
             self.tokenizer = self._init_tokenizer()
@@ -215,6 +237,22 @@ class LLMEngine:
             self.tokenizer = None
             self.detokenizer = None
 
+        # Detokenizes the outputs of a step while the next step runs. Only
+        # single-step output processing supports it.
+        self.async_detokenizer: Optional[AsyncDetokenizer] = None
+        if (self.decoding_config.async_detokenization
+                and self.detokenizer is not None
+                and not self.model_config.embedding_mode
+                and scheduler_config.num_lookahead_slots == 0
+                and scheduler_config.num_scheduler_steps == 1):
+            self.async_detokenizer = AsyncDetokenizer(self.detokenizer)
+        # The sequence groups of the last step, whose outputs are returned by
+        # the next step once they are detokenized.
+        self._undetokenized_seq_groups: List[SequenceGroup] = []
+        # The batch running in the model executor between two pipelined
+        # steps.
+        self._running_batch: Optional[_PipelinedBatch] = None
+
         self.seq_counter = Counter()
         self.generation_config_fields = _load_generation_config_dict(
             model_config)
@@ -231,6 +269,7 @@ class LLMEngine:
             load_config=load_config,
         )
 
+        self.prefix_cache_store: Optional[PrefixCacheStore] = None
         if not self.model_config.embedding_mode:
             self._initialize_kv_caches()
 
@@ -277,7 +316,8 @@ class LLMEngine:
         # Create the scheduler.
         # NOTE: the cache_config here have been updated with the numbers of
         # GPU and CPU blocks, which are profiled in the distributed executor.
-        self.scheduler = Scheduler(scheduler_config, cache_config, lora_config)
+        self.scheduler = Scheduler(scheduler_config, cache_config, lora_config,
+                                   self.prefix_cache_store)
 
         # Metric Logging.
         if self.log_stats:
@@ -300,6 +340,9 @@ class LLMEngine:
                     self.scheduler_config.max_model_len,
                     self.get_tokenizer_for_seq,
                 ),
+                async_detokenizer=self.async_detokenizer,
+                guided_decoding_fast_forward=(
+                    self.decoding_config.guided_decoding_fast_forward),
             ))
 
     def _initialize_kv_caches(self) -> None:
@@ -310,6 +353,9 @@ class LLMEngine:
         """
         num_gpu_blocks, num_cpu_blocks = (
             self.model_executor.determine_num_available_blocks())
+        # Measured by the workers while profiling, and read by the scheduler.
+        self.cache_config.preemption_cost_model = (
+            self.model_executor.get_preemption_cost_model())
 
         if self.cache_config.num_gpu_blocks_override is not None:
             num_gpu_blocks_override = self.cache_config.num_gpu_blocks_override
@@ -322,6 +368,30 @@ class LLMEngine:
         self.cache_config.num_gpu_blocks = num_gpu_blocks
         self.cache_config.num_cpu_blocks = num_cpu_blocks
 
+        if self.cache_config.offload_enabled:
+            # The workers derive the same numbers from their copy of the
+            # cache config when allocating the offload tiers.
+            from vllm.worker.cache_engine import CacheEngine
+            self.cache_config.set_num_offload_blocks(
+                CacheEngine.get_cache_block_size(self.cache_config,
+                                                 self.model_config,
+                                                 self.parallel_config))
+            logger.info("# host offload blocks: %d, # disk offload blocks: %d",
+                        self.cache_config.num_host_offload_blocks,
+                        self.cache_config.num_disk_offload_blocks)
+
+        if self.cache_config.persistent_prefix_cache:
+            from vllm.worker.kv_offload import get_prefix_cache_fingerprint
+            assert self.cache_config.kv_offload_path is not None
+            self.prefix_cache_store = PrefixCacheStore(
+                self.cache_config.kv_offload_path,
+                get_prefix_cache_fingerprint(self.model_config,
+                                             self.cache_config,
+                                             self.parallel_config),
+                num_blocks=self.cache_config.num_disk_offload_blocks)
+            # Stale data files are removed before the workers map them.
+            self.prefix_cache_store.open()
+
         self.model_executor.initialize_cache(num_gpu_blocks, num_cpu_blocks)
 
     @classmethod
@@ -372,9 +442,56 @@ class LLMEngine:
     def __del__(self):
         # Shutdown model executor when engine is garbage collected
         # Use getattr since __init__ can fail before the field is set
+        # The model is not run here, so the persistent prefix cache is only
+        # saved by shutdown().
+        if getattr(self, "_is_shut_down", False):
+            return
+        if async_detokenizer := getattr(self, "async_detokenizer", None):
+            async_detokenizer.shutdown()
+        if prefix_cache_store := getattr(self, "prefix_cache_store", None):
+            prefix_cache_store.close()
         if model_executor := getattr(self, "model_executor", None):
             model_executor.shutdown()
 
+    def shutdown(self) -> None:
+        """Saves the persistent prefix cache and shuts down the engine.
+
+        The engine can't be used afterwards. Calling this more than once
+        does nothing.
+        """
+        if self._is_shut_down:
+            return
+        self._is_shut_down = True
+        if self.async_detokenizer is not None:
+            self.async_detokenizer.shutdown()
+        if self.prefix_cache_store is not None:
+            try:
+                self.save_prefix_cache()
+            finally:
+                self.prefix_cache_store.close()
+        self.model_executor.shutdown()
+
+    def save_prefix_cache(self) -> None:
+        """Writes the prefix-cached blocks to the persistent prefix cache, so
+        that the next engine with the same model and cache configuration
+        starts with them.
+
+        This is done by `shutdown()`, and is a no-op without
+        `--persistent-prefix-cache`.
+        """
+        if self.prefix_cache_store is None:
+            return
+
+        block_manager = self.scheduler.block_manager
+        transfers = block_manager.persist_prefix_cache()
+        if not transfers.is_empty():
+            self.model_executor.execute_model(
+                execute_model_req=ExecuteModelRequest(
+                    seq_group_metadata_list=[], offload_transfers=transfers))
+            if not self.has_unfinished_requests():
+                self.model_executor.stop_remote_worker_execution_loop()
+        block_manager.save_prefix_cache()
+
     MISSING_TOKENIZER_GROUP_MSG = ("Unable to get tokenizer because "
                                    "skip_tokenizer_init is True")
 
@@ -432,6 +549,7 @@ class LLMEngine:
         params: Union[SamplingParams, PoolingParams],
         arrival_time: float,
         lora_request: Optional[LoRARequest],
+        priority: Optional[int] = None,
     ) -> None:
         # Create the sequences.
         block_size = self.cache_config.block_size
@@ -449,6 +567,7 @@ class LLMEngine:
                 params,
                 arrival_time=arrival_time,
                 lora_request=lora_request,
+                priority=priority,
             )
         elif isinstance(params, PoolingParams):
             seq_group = self._create_sequence_group_with_pooling(
@@ -457,6 +576,7 @@ class LLMEngine:
                 params,
                 arrival_time=arrival_time,
                 lora_request=lora_request,
+                priority=priority,
             )
         else:
             raise ValueError(
@@ -495,6 +615,7 @@ class LLMEngine:
         params: Union[SamplingParams, PoolingParams],
         arrival_time: Optional[float] = None,
         lora_request: Optional[LoRARequest] = None,
+        priority: Optional[int] = None,
     ) -> None:
         """Add a request to the engine's request pool.
 
@@ -512,6 +633,9 @@ class LLMEngine:
                 :class:`~vllm.PoolingParams` for pooling.
             arrival_time: The arrival time of the request. If None, we use
                 the current monotonic time.
+            priority: The priority of the request, lower values are scheduled
+                first by the "priority" scheduling policy. If None, the
+                priority of the sampling parameters is used.
 
         Details:
             - Set arrival_time to the current time if it is None.
@@ -553,8 +677,33 @@ class LLMEngine:
             params=params,
             arrival_time=arrival_time,
             lora_request=lora_request,
+            priority=priority,
         )
 
+    def add_request_batch(
+            self, requests: Iterable[Dict[str, Any]]) -> Dict[str, ValueError]:
+        """Add several requests to the engine's request pool at once.
+
+        This saves a call per request when the engine is a Ray actor. A
+        request that fails the validation is not added, without affecting the
+        others.
+
+        Args:
+            requests: The keyword arguments of `add_request` for each
+                request.
+
+        Returns:
+            The validation error of each request that was not added, by
+            request ID.
+        """
+        errors: Dict[str, ValueError] = {}
+        for request in requests:
+            try:
+                self.add_request(**request)
+            except ValueError as e:
+                errors[request["request_id"]] = e
+        return errors
+
     def _create_sequence_group_with_sampling(
         self,
         request_id: str,
@@ -562,6 +711,7 @@ class LLMEngine:
         sampling_params: SamplingParams,
         arrival_time: float,
         lora_request: Optional[LoRARequest],
+        priority: Optional[int] = None,
     ) -> SequenceGroup:
         """Creates a SequenceGroup with SamplingParams."""
         max_logprobs = self.get_model_config().max_logprobs
@@ -571,6 +721,11 @@ class LLMEngine:
                     and sampling_params.prompt_logprobs > max_logprobs):
             raise ValueError(f"Cannot request more than "
                              f"{max_logprobs} logprobs.")
+        if (self.scheduler_config.num_scheduler_steps > 1
+                and sampling_params.best_of > 1):
+            raise ValueError("Multi-step decoding supports a single sequence "
+                             "per request, got best_of="
+                             f"{sampling_params.best_of}.")
 
         # Defensive copy of SamplingParams, which are used by the sampler,
         # this doesn't deep-copy LogitsProcessor objects
@@ -587,7 +742,8 @@ class LLMEngine:
                                   seqs=[seq],
                                   arrival_time=arrival_time,
                                   sampling_params=sampling_params,
-                                  lora_request=lora_request)
+                                  lora_request=lora_request,
+                                  priority=priority)
 
         return seq_group
 
@@ -598,6 +754,7 @@ class LLMEngine:
         pooling_params: PoolingParams,
         arrival_time: float,
         lora_request: Optional[LoRARequest],
+        priority: Optional[int] = None,
     ) -> SequenceGroup:
         """Creates a SequenceGroup with PoolingParams."""
         # Defensive copy of PoolingParams, which are used by the pooler
@@ -607,7 +764,8 @@ class LLMEngine:
                                   seqs=[seq],
                                   arrival_time=arrival_time,
                                   lora_request=lora_request,
-                                  pooling_params=pooling_params)
+                                  pooling_params=pooling_params,
+                                  priority=priority)
         return seq_group
 
     def abort_request(self, request_id: Union[str, Iterable[str]]) -> None:
@@ -628,6 +786,13 @@ class LLMEngine:
             >>> engine.abort_request(request_id)
         """
         self.scheduler.abort_seq_group(request_id)
+        if self._undetokenized_seq_groups:
+            request_ids = ({request_id}
+                           if isinstance(request_id, str) else set(request_id))
+            self._undetokenized_seq_groups = [
+                seq_group for seq_group in self._undetokenized_seq_groups
+                if seq_group.request_id not in request_ids
+            ]
 
     def get_model_config(self) -> ModelConfig:
         """Gets the model configuration."""
@@ -643,7 +808,15 @@ class LLMEngine:
 
     def has_unfinished_requests(self) -> bool:
         """Returns True if there are unfinished requests."""
-        return self.scheduler.has_unfinished_seqs()
+        return (self.scheduler.has_unfinished_seqs()
+                or self.has_pending_outputs())
+
+    def has_pending_outputs(self) -> bool:
+        """Returns True if the outputs of the last step are still being
+        detokenized or computed, and will be returned by the next step."""
+        return bool(self._undetokenized_seq_groups) or (
+            self._running_batch is not None
+            and self._running_batch.has_outputs())
 
     def _process_sequence_group_outputs(
         self,
@@ -671,6 +844,21 @@ class LLMEngine:
 
         now = time.time()
 
+        request_outputs: List[Union[RequestOutput,
+                                    EmbeddingRequestOutput]] = []
+        if self.async_detokenizer is not None:
+            # The new tokens of the last step were detokenized while this
+            # step ran, so its outputs are complete.
+            self._stop_detokenized_seqs(self.async_detokenizer.collect())
+            for seq_group in self._undetokenized_seq_groups:
+                seq_group.maybe_set_first_token_time(now)
+                request_outputs.append(RequestOutputFactory.create(seq_group))
+            self._undetokenized_seq_groups = [
+                scheduled_seq_group.seq_group
+                for scheduled_seq_group in scheduled_seq_groups
+                if not scheduled_seq_group.seq_group.is_finished()
+            ]
+
         # Organize outputs by [sequence group][step] instead of
         # [step][sequence group].
         output_by_sequence_group = create_output_by_sequence_group(
@@ -681,6 +869,14 @@ class LLMEngine:
                 scheduled_seq_groups, output_by_sequence_group,
                 seq_group_metadata_list):
             seq_group = scheduled_seq_group.seq_group
+            if seq_group.is_finished():
+                # Stopped on a stop string of its previous token, the new
+                # token is dropped.
+                continue
+            if not seq_group.get_seqs(status=SequenceStatus.RUNNING):
+                # Preempted while the step ran, which happens with the
+                # pipelined step. The new token is dropped.
+                continue
             seq_group.update_num_computed_tokens(
                 scheduled_seq_group.token_chunk_size)
             if self.model_config.embedding_mode:
@@ -695,18 +891,174 @@ class LLMEngine:
         self.scheduler.free_finished_seq_groups()
 
         # Create the outputs.
-        request_outputs: List[Union[RequestOutput,
-                                    EmbeddingRequestOutput]] = []
-        for scheduled_seq_group in scheduled_seq_groups:
-            seq_group = scheduled_seq_group.seq_group
-            seq_group.maybe_set_first_token_time(now)
-            request_output = RequestOutputFactory.create(seq_group)
-            request_outputs.append(request_output)
+        if self.async_detokenizer is not None:
+            self.async_detokenizer.submit()
+        else:
+            for scheduled_seq_group in scheduled_seq_groups:
+                seq_group = scheduled_seq_group.seq_group
+                if seq_group.get_seqs(status=SequenceStatus.FINISHED_ABORTED):
+                    # Aborted while the step ran, which happens with the
+                    # pipelined step. Its request is already gone.
+                    continue
+                seq_group.maybe_set_first_token_time(now)
+                request_output = RequestOutputFactory.create(seq_group)
+                request_outputs.append(request_output)
         for seq_group in ignored_seq_groups:
             request_output = RequestOutputFactory.create(seq_group)
             request_outputs.append(request_output)
         return request_outputs
 
+    def _stop_detokenized_seqs(self,
+                               stopped_seqs: List[StoppedSequence]) -> None:
+        """Stops the sequences whose new text matched a stop string in the
+        async detokenizer. They may have been scheduled, preempted or aborted
+        since."""
+        preempted_request_ids: Set[str] = set()
+        for seq_group, seq, stop_str in stopped_seqs:
+            if seq.status == SequenceStatus.FINISHED_ABORTED:
+                continue
+            is_preempted = seq.status in (SequenceStatus.WAITING,
+                                          SequenceStatus.SWAPPED)
+            if not seq.is_finished():
+                self.scheduler.free_seq(seq)
+            seq.status = SequenceStatus.FINISHED_STOPPED
+            seq.stop_reason = stop_str
+            if is_preempted and seq_group.is_finished():
+                preempted_request_ids.add(seq_group.request_id)
+        # Finished groups are removed from the running queue along with the
+        # others, but not from the waiting and swapped queues.
+        if preempted_request_ids:
+            self.scheduler.abort_seq_group(preempted_request_ids)
+
+    def _schedule_pipelined_step(
+            self) -> Tuple[_PipelinedBatch, _PipelinedBatch]:
+        """Schedules the next batch of the pipelined step while the running
+        batch executes, submitting the first batch if none is running.
+        Returns the running batch and the next one."""
+        if self._running_batch is None:
+            self._running_batch = self._submit_batch(
+                _PipelinedBatch(*self.scheduler.schedule()))
+        return self._running_batch, _PipelinedBatch(*self.scheduler.schedule())
+
+    def _submit_batch(self, batch: _PipelinedBatch) -> _PipelinedBatch:
+        """Starts executing a batch of the pipelined step.
+
+        The batch was scheduled before the outputs of the previous one were
+        processed, as if all its sequences got a new token and kept running.
+        The sequence groups which finished, were preempted or forked new
+        sequences since are dropped from the batch. The ones still running
+        are scheduled again by the next step.
+
+        The next batch is scheduled while this one executes, which may
+        preempt its sequences and reset their data for recompute, so the
+        batch reads snapshots of the sequence data taken here.
+        """
+        scheduler_outputs = batch.scheduler_outputs
+        scheduled_seq_groups: List[ScheduledSequenceGroup] = []
+        seq_group_metadata_list: List[SequenceGroupMetadata] = []
+        for scheduled_seq_group, seq_group_metadata in zip(
+                scheduler_outputs.scheduled_seq_groups,
+                batch.seq_group_metadata_list):
+            seqs = scheduled_seq_group.seq_group.get_seqs(
+                status=SequenceStatus.RUNNING)
+            if len(seqs) != len(seq_group_metadata.seq_data) or any(
+                    seq.seq_id not in seq_group_metadata.seq_data
+                    for seq in seqs):
+                continue
+            seq_group_metadata.seq_data = {
+                seq_id: seq_data.snapshot()
+                for seq_id, seq_data in seq_group_metadata.seq_data.items()
+            }
+            if seq_group_metadata.is_prompt:
+                # Chunked prefill is not supported, the prompt is computed
+                # at once and the next step decodes.
+                for seq in seqs:
+                    seq.data.set_prefill_in_flight()
+            scheduled_seq_groups.append(scheduled_seq_group)
+            seq_group_metadata_list.append(seq_group_metadata)
+
+        if len(scheduled_seq_groups) < len(
+                scheduler_outputs.scheduled_seq_groups):
+            scheduler_outputs.scheduled_seq_groups = scheduled_seq_groups
+            scheduler_outputs.num_prefill_groups = sum(
+                seq_group_metadata.is_prompt
+                for seq_group_metadata in seq_group_metadata_list)
+            scheduler_outputs.num_batched_tokens = sum(
+                seq_group_metadata.token_chunk_size *
+                len(seq_group_metadata.seq_data)
+                for seq_group_metadata in seq_group_metadata_list)
+            batch.seq_group_metadata_list = seq_group_metadata_list
+
+        # Cache operations are executed even if all the groups were dropped.
+        if not scheduler_outputs.is_empty():
+            execute_model_req = ExecuteModelRequest(
+                seq_group_metadata_list=seq_group_metadata_list,
+                blocks_to_swap_in=scheduler_outputs.blocks_to_swap_in,
+                blocks_to_swap_out=scheduler_outputs.blocks_to_swap_out,
+                blocks_to_copy=scheduler_outputs.blocks_to_copy,
+                offload_transfers=scheduler_outputs.offload_transfers,
+                num_lookahead_slots=scheduler_outputs.num_lookahead_slots,
+                running_queue_size=scheduler_outputs.running_queue_size,
+            )
+            batch.future = self.model_executor.execute_model_nonblocking(
+                execute_model_req)
+        return batch
+
+    def _finish_pipelined_step(
+        self,
+        running_batch: _PipelinedBatch,
+        next_batch: _PipelinedBatch,
+        output: List[Union[SamplerOutput, PoolerOutput]],
+    ) -> List[Union[RequestOutput, EmbeddingRequestOutput]]:
+        """Processes the outputs of the running batch and submits the next
+        one."""
+        scheduler_outputs = running_batch.scheduler_outputs
+        request_outputs = self._process_model_outputs(
+            output, scheduler_outputs.scheduled_seq_groups,
+            scheduler_outputs.ignored_seq_groups,
+            running_batch.seq_group_metadata_list)
+        self._running_batch = self._submit_batch(next_batch)
+
+        # Log stats.
+        self.do_log_stats(scheduler_outputs, output)
+        return request_outputs
+
+    def _step_pipelined(
+            self) -> List[Union[RequestOutput, EmbeddingRequestOutput]]:
+        """Performs one decoding iteration with the pipelined step.
+
+        The next batch is scheduled while the running one executes, and
+        submitted once the outputs of the running one are processed. The
+        model then runs while the caller handles the returned outputs and
+        while the next step schedules.
+        """
+        running_batch, next_batch = self._schedule_pipelined_step()
+        output = ([] if running_batch.future is None else
+                  running_batch.future.result())
+        return self._finish_pipelined_step(running_batch, next_batch, output)
+
+    def _get_num_steps(self, scheduler_outputs: SchedulerOutputs) -> int:
+        """The number of decoding steps the workers run on the scheduled
+        batch. With multi-step decoding, a batch of decodes runs up to
+        num_scheduler_steps steps, but no more than its sequences can still
+        generate, while the batches with prefills run a single step.
+        """
+        num_steps = self.scheduler_config.num_scheduler_steps
+        if num_steps == 1 or scheduler_outputs.num_prefill_groups > 0:
+            return 1
+
+        max_model_len = self.scheduler_config.max_model_len
+        for scheduled_seq_group in scheduler_outputs.scheduled_seq_groups:
+            seq_group = scheduled_seq_group.seq_group
+            max_tokens = seq_group.sampling_params.max_tokens
+            for seq in seq_group.get_seqs(status=SequenceStatus.RUNNING):
+                # The last step computes the position max_model_len - 1.
+                num_steps = min(num_steps, max_model_len - seq.get_len() + 1)
+                if max_tokens is not None:
+                    num_steps = min(num_steps,
+                                    max_tokens - seq.get_output_len())
+        return max(num_steps, 1)
+
     def step(self) -> List[Union[RequestOutput, EmbeddingRequestOutput]]:
         """Performs one decoding iteration and returns newly generated results.
 
@@ -735,6 +1087,10 @@ class LLMEngine:
 
             - Finally, it creates and returns the newly generated results.
 
+        With the pipelined step (`--pipelined-step`), the scheduling of the
+        next iteration overlaps with the model execution of the current one,
+        see `_step_pipelined`.
+
         Example:
             >>> # Please see the example/ folder for more detailed examples.
             >>>
@@ -758,6 +1114,9 @@ class LLMEngine:
             >>>     if not (engine.has_unfinished_requests() or example_inputs):
             >>>         break
         """
+        if self.scheduler_config.pipelined_step:
+            return self._step_pipelined()
+
         seq_group_metadata_list, scheduler_outputs = self.scheduler.schedule()
 
         if not scheduler_outputs.is_empty():
@@ -766,8 +1125,10 @@ class LLMEngine:
                 blocks_to_swap_in=scheduler_outputs.blocks_to_swap_in,
                 blocks_to_swap_out=scheduler_outputs.blocks_to_swap_out,
                 blocks_to_copy=scheduler_outputs.blocks_to_copy,
+                offload_transfers=scheduler_outputs.offload_transfers,
                 num_lookahead_slots=scheduler_outputs.num_lookahead_slots,
                 running_queue_size=scheduler_outputs.running_queue_size,
+                num_steps=self._get_num_steps(scheduler_outputs),
             )
             output = self.model_executor.execute_model(
                 execute_model_req=execute_model_req)
@@ -781,7 +1142,7 @@ class LLMEngine:
         # Log stats.
         self.do_log_stats(scheduler_outputs, output)
 
-        if not request_outputs:
+        if not request_outputs and not self.has_pending_outputs():
             # Stop the execute model loop in parallel workers until there are
             # more requests to process. This avoids waiting indefinitely in
             # torch.distributed ops which may otherwise timeout, and unblocks
@@ -842,6 +1203,10 @@ class LLMEngine:
         time_per_output_tokens_iter: List[float] = []
         num_preemption_iter = (0 if scheduler_outputs is None else
                                scheduler_outputs.preempted)
+        num_preemption_by_mode_iter = (
+            self.scheduler.get_and_reset_preemption_stats())
+        (num_prefix_cache_queries_iter, num_prefix_cache_hits_iter) = (
+            self.scheduler.block_manager.get_and_reset_offload_stats())
 
         # Request stats
         #   Latency
@@ -951,6 +1316,9 @@ class LLMEngine:
             time_per_output_tokens_iter=time_per_output_tokens_iter,
             spec_decode_metrics=spec_decode_metrics,
             num_preemption_iter=num_preemption_iter,
+            num_preemption_by_mode_iter=num_preemption_by_mode_iter,
+            num_prefix_cache_queries_iter=num_prefix_cache_queries_iter,
+            num_prefix_cache_hits_iter=num_prefix_cache_hits_iter,
 
             # Request stats
             #   Latency
@@ -1,8 +1,8 @@
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import TYPE_CHECKING
 from typing import Counter as CollectionsCounter
-from typing import Dict, List, Optional, Protocol, Union
+from typing import Dict, List, Optional, Protocol, Tuple, Union
 
 import numpy as np
 from prometheus_client import (REGISTRY, Counter, Gauge, Histogram, Info,
@@ -24,6 +24,9 @@ disable_created_metrics()
 # begin-metrics-definitions
 class Metrics:
     labelname_finish_reason = "finished_reason"
+    labelname_cache_tier = "tier"
+    labelname_preemption_mode = "mode"
+    labelname_preemption_reason = "reason"
 
     def __init__(self, labelnames: List[str], max_model_len: int):
         # Unregister any existing vLLM collectors
@@ -59,12 +62,26 @@ class Metrics:
             name="vllm:cpu_cache_usage_perc",
             documentation="CPU KV-cache usage. 1 means 100 percent usage.",
             labelnames=labelnames)
+        #   Prefix cache hit rate per tier (gpu, host, disk)
+        self.gauge_prefix_cache_hit_rate = Gauge(
+            name="vllm:prefix_cache_hit_rate",
+            documentation="Fraction of prefix cache lookups served by each "
+            "tier of the offloaded KV cache.",
+            labelnames=labelnames + [Metrics.labelname_cache_tier])
 
         # Iteration stats
         self.counter_num_preemption = Counter(
             name="vllm:num_preemptions_total",
             documentation="Cumulative number of preemption from the engine.",
             labelnames=labelnames)
+        self.counter_num_preemption_by_mode = Counter(
+            name="vllm:num_preemptions_by_mode_total",
+            documentation="Cumulative number of preemption by preemption mode "
+            "and the reason the mode was chosen.",
+            labelnames=labelnames + [
+                Metrics.labelname_preemption_mode,
+                Metrics.labelname_preemption_reason
+            ])
         self.counter_prompt_tokens = Counter(
             name="vllm:prompt_tokens_total",
             documentation="Number of prefill tokens processed.",
@@ -73,6 +90,16 @@ class Metrics:
             name="vllm:generation_tokens_total",
             documentation="Number of generation tokens processed.",
             labelnames=labelnames)
+        self.counter_prefix_cache_queries = Counter(
+            name="vllm:prefix_cache_queries_total",
+            documentation="Number of blocks looked up in the prefix cache "
+            "with KV cache offloading.",
+            labelnames=labelnames)
+        self.counter_prefix_cache_hits = Counter(
+            name="vllm:prefix_cache_hits_total",
+            documentation="Number of prefix cache lookups served by each "
+            "tier of the offloaded KV cache.",
+            labelnames=labelnames + [Metrics.labelname_cache_tier])
         self.histogram_time_to_first_token = Histogram(
             name="vllm:time_to_first_token_seconds",
             documentation="Histogram of time to first token in seconds.",
@@ -199,6 +226,13 @@ class Stats:
 
     spec_decode_metrics: Optional["SpecDecodeWorkerMetrics"] = None
 
+    # Prefix cache lookups and hits per tier, with KV cache offloading.
+    num_prefix_cache_queries_iter: int = 0
+    num_prefix_cache_hits_iter: Dict[str, int] = field(default_factory=dict)
+    # Preemptions by (mode, reason).
+    num_preemption_by_mode_iter: Dict[Tuple[str, str],
+                                      int] = field(default_factory=dict)
+
 
 class SupportsMetricsInfo(Protocol):
 
@@ -219,6 +253,11 @@ class StatLogger:
         self.num_prompt_tokens: List[int] = []
         self.num_generation_tokens: List[int] = []
 
+        # Cumulative prefix cache lookups and hits per tier.
+        self.num_prefix_cache_queries = 0
+        self.num_prefix_cache_hits: CollectionsCounter[str] = (
+            CollectionsCounter())
+
         # Prometheus metrics
         self.labels = labels
         self.metrics = Metrics(labelnames=list(labels.keys()),
@@ -251,6 +290,13 @@ class StatLogger:
         # Iteration level data
         self._log_counter(self.metrics.counter_num_preemption,
                           stats.num_preemption_iter)
+        for (mode, reason), count in stats.num_preemption_by_mode_iter.items():
+            self.metrics.counter_num_preemption_by_mode.labels(
+                **{
+                    **self.labels,
+                    Metrics.labelname_preemption_mode: mode,
+                    Metrics.labelname_preemption_reason: reason,
+                }).inc(count)
         self._log_counter(self.metrics.counter_prompt_tokens,
                           stats.num_prompt_tokens_iter)
         self._log_counter(self.metrics.counter_generation_tokens,
@@ -259,6 +305,7 @@ class StatLogger:
                             stats.time_to_first_tokens_iter)
         self._log_histogram(self.metrics.histogram_time_per_output_token,
                             stats.time_per_output_tokens_iter)
+        self._log_prefix_cache_hits(stats)
 
         # Request level data
         # Latency
@@ -279,6 +326,25 @@ class StatLogger:
         self._log_histogram(self.metrics.histogram_best_of_request,
                             stats.best_of_requests)
 
+    def _log_prefix_cache_hits(self, stats: Stats) -> None:
+        if stats.num_prefix_cache_queries_iter == 0:
+            return
+        self._log_counter(self.metrics.counter_prefix_cache_queries,
+                          stats.num_prefix_cache_queries_iter)
+        hits = CollectionsCounter(stats.num_prefix_cache_hits_iter)
+        self._log_counter_labels(self.metrics.counter_prefix_cache_hits, hits,
+                                 Metrics.labelname_cache_tier)
+
+        self.num_prefix_cache_queries += stats.num_prefix_cache_queries_iter
+        self.num_prefix_cache_hits.update(hits)
+        for tier in stats.num_prefix_cache_hits_iter:
+            hit_rate = (self.num_prefix_cache_hits[tier] /
+                        self.num_prefix_cache_queries)
+            self.metrics.gauge_prefix_cache_hit_rate.labels(
+                **{
+                    **self.labels, Metrics.labelname_cache_tier: tier
+                }).set(hit_rate)
+
     def _log_gauge(self, gauge: Gauge, data: Union[int, float]) -> None:
         # Convenience function for logging to gauge.
         gauge.labels(**self.labels).set(data)
@@ -0,0 +1,105 @@
+import queue
+import threading
+from typing import List, Optional, Tuple, Union
+
+from vllm.engine.output_processor.stop_checker import StopChecker
+from vllm.logger import init_logger
+from vllm.sequence import Sequence, SequenceGroup
+from vllm.transformers_utils.detokenizer import Detokenizer
+
+logger = init_logger(__name__)
+
+# A sequence whose new text matched a stop string, with its group and the
+# stop string.
+StoppedSequence = Tuple[SequenceGroup, Sequence, str]
+
+
+class AsyncDetokenizer:
+    """Detokenizes the new tokens of the sequences and checks them for stop
+    strings in a background thread, so that this overlaps with the execution
+    of the next step of the engine.
+
+    The engine adds the sequences whose new token is appended during output
+    processing, and submits them as a batch at the end of the step. The
+    results are collected at the next step, after the model is executed and
+    before new tokens are appended. Until then, the thread is the only one to
+    touch the output text, the detokenization state and the logprobs of the
+    submitted sequences, which the engine only schedules in the meantime.
+    The token-level stop conditions are checked by the engine before the
+    sequences are submitted, see
+    `StopChecker.maybe_stop_sequence_before_detokenization`.
+
+    The batches are handed over through lock-free queues. The thread mostly
+    runs while the engine thread waits for the model executor, which releases
+    the GIL.
+    """
+
+    def __init__(self, detokenizer: Detokenizer):
+        self.detokenizer = detokenizer
+        self._batch: List[Tuple[SequenceGroup, Sequence]] = []
+        self._num_pending_batches = 0
+        self._requests: "queue.SimpleQueue[Optional[List]]" = (
+            queue.SimpleQueue())
+        self._results: "queue.SimpleQueue[Union[List, BaseException]]" = (
+            queue.SimpleQueue())
+        self._thread = threading.Thread(target=self._run,
+                                        name="vllm-detokenizer",
+                                        daemon=True)
+        self._thread.start()
+
+    def add(self, seq_group: SequenceGroup, seq: Sequence) -> None:
+        """Adds a sequence with a new token to the batch of the step."""
+        self._batch.append((seq_group, seq))
+
+    def submit(self) -> None:
+        """Hands the batch of the step over to the background thread."""
+        if not self._batch:
+            return
+        self._requests.put(self._batch)
+        self._batch = []
+        self._num_pending_batches += 1
+
+    def has_pending_batches(self) -> bool:
+        return self._num_pending_batches > 0
+
+    def collect(self) -> List[StoppedSequence]:
+        """Waits for the submitted batches to be detokenized. Returns the
+        sequences whose new text matched a stop string."""
+        stopped: List[StoppedSequence] = []
+        while self._num_pending_batches > 0:
+            result = self._results.get()
+            self._num_pending_batches -= 1
+            if isinstance(result, BaseException):
+                raise result
+            stopped.extend(result)
+        return stopped
+
+    def shutdown(self) -> None:
+        self._requests.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            batch = self._requests.get()
+            if batch is None:
+                return
+            try:
+                self._results.put(self._detokenize(batch))
+            except BaseException as e:
+                # Raised in the engine thread by `collect`.
+                logger.exception("Error in the detokenizer thread.")
+                self._results.put(e)
+
+    def _detokenize(
+            self, batch: List[Tuple[SequenceGroup,
+                                    Sequence]]) -> List[StoppedSequence]:
+        stopped: List[StoppedSequence] = []
+        new_char_counts = self.detokenizer.decode_sequences_inplace([
+            (seq, seq_group.sampling_params) for seq_group, seq in batch
+        ])
+        for (seq_group, seq), new_char_count in zip(batch, new_char_counts):
+            stop_str = StopChecker.check_detokenized_sequence(
+                seq, new_char_count, seq_group.sampling_params)
+            if stop_str is not None:
+                stopped.append((seq_group, seq, stop_str))
+        return stopped
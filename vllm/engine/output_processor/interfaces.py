@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Callable, List
+from typing import TYPE_CHECKING, Callable, List, Optional
 
 from transformers import PreTrainedTokenizer
 
@@ -10,6 +10,9 @@ from vllm.sequence import Sequence, SequenceGroup, SequenceGroupOutput
 from vllm.transformers_utils.detokenizer import Detokenizer
 from vllm.utils import Counter
 
+if TYPE_CHECKING:
+    from vllm.engine.output_processor.async_detokenizer import AsyncDetokenizer
+
 
 class SequenceGroupOutputProcessor(ABC):
     """Interface for logic that processes new token ids in sequence groups,
@@ -31,13 +34,19 @@ class SequenceGroupOutputProcessor(ABC):
         seq_counter: Counter,
         get_tokenizer_for_seq: Callable[[Sequence], PreTrainedTokenizer],
         stop_checker: "StopChecker",
+        async_detokenizer: Optional["AsyncDetokenizer"] = None,
+        guided_decoding_fast_forward: bool = False,
     ):
         """Create an output processor.
 
         This returns a single-step output processor if num_lookahead_slots is
-        zero, else returns a multi-step output processor.
+        zero and the workers run a single step per batch, else returns a
+        multi-step output processor. Only the former detokenizes
+        asynchronously and fast-forwards the tokens forced by guided
+        decoding.
         """
-        if scheduler_config.num_lookahead_slots == 0:
+        if (scheduler_config.num_lookahead_slots == 0
+                and scheduler_config.num_scheduler_steps == 1):
             # Importing here to avoid cycle.
             from vllm.engine.output_processor.single_step import (
                 SingleStepOutputProcessor)
@@ -47,6 +56,8 @@ class SequenceGroupOutputProcessor(ABC):
                 scheduler,
                 seq_counter,
                 stop_checker,
+                async_detokenizer,
+                guided_decoding_fast_forward,
             )
         else:
             # Importing here to avoid cycle.
@@ -47,9 +47,23 @@ class MultiStepOutputProcessor(SequenceGroupOutputProcessor):
 
     def process_prompt_logprob(self, seq_group: SequenceGroup,
                                outputs: List[SequenceGroupOutput]) -> None:
-        # TODO(sang): Prompt logprob currently not implemented in multi step
-        # workers.
-        self._log_prompt_logprob_unsupported_warning_once()
+        # The prefills run a single step, whose output holds the prompt
+        # logprobs with multi-step decoding.
+        prompt_logprobs = outputs[0].prompt_logprobs
+        if prompt_logprobs is not None:
+            if seq_group.sampling_params.detokenize and self.detokenizer:
+                self.detokenizer.decode_prompt_logprobs_inplace(
+                    seq_group, prompt_logprobs)
+            if not seq_group.prompt_logprobs:
+                # The first prompt token's logprob is None because it doesn't
+                # have tokens that are precedent.
+                seq_group.prompt_logprobs = [None]
+            seq_group.prompt_logprobs.extend(prompt_logprobs)
+        elif (seq_group.sampling_params.prompt_logprobs is not None
+              and not seq_group.prompt_logprobs):
+            # TODO(sang): Prompt logprob currently not implemented in the
+            # speculative decoding workers.
+            self._log_prompt_logprob_unsupported_warning_once()
 
     @staticmethod
     @functools.lru_cache()
@@ -97,11 +111,12 @@ class MultiStepOutputProcessor(SequenceGroupOutputProcessor):
         output_logprobs = [sample.logprobs for sample in valid_samples]
 
         # Truncate to max_tokens if necessary.
-        remaining_tokens = sampling_params.max_tokens - (seq.get_output_len() +
-                                                         len(output_token_ids))
-        if remaining_tokens < 0:
-            valid_samples = valid_samples[:remaining_tokens]
-            output_token_ids = output_token_ids[:remaining_tokens]
+        if sampling_params.max_tokens is not None:
+            remaining_tokens = sampling_params.max_tokens - (
+                seq.get_output_len() + len(output_token_ids))
+            if remaining_tokens < 0:
+                valid_samples = valid_samples[:remaining_tokens]
+                output_token_ids = output_token_ids[:remaining_tokens]
 
         # Truncate any tokens after EOS. This is required as spec decode
         # generates a fixed number of tokens without evaluating stopping
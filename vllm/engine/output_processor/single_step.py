@@ -1,14 +1,15 @@
-from typing import Dict, List, Tuple, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 from vllm.config import SchedulerConfig
 from vllm.core.scheduler import Scheduler
+from vllm.engine.output_processor.async_detokenizer import AsyncDetokenizer
 from vllm.engine.output_processor.interfaces import (
     SequenceGroupOutputProcessor)
 from vllm.engine.output_processor.stop_checker import StopChecker
 from vllm.logger import init_logger
-from vllm.sampling_params import SamplingParams
-from vllm.sequence import (Sequence, SequenceGroup, SequenceGroupOutput,
-                           SequenceOutput, SequenceStatus)
+from vllm.sampling_params import BatchedLogitsProcessor, SamplingParams
+from vllm.sequence import (Logprob, Sequence, SequenceGroup,
+                           SequenceGroupOutput, SequenceOutput, SequenceStatus)
 from vllm.transformers_utils.detokenizer import Detokenizer
 from vllm.utils import Counter
 
@@ -27,6 +28,11 @@ class SingleStepOutputProcessor(SequenceGroupOutputProcessor):
     such as speculative decoding or multi-step decoding. This enables beam
     search sampling, which requires forking/finishing/freeing sequences in a way
     that is currently difficult to schedule multiple steps ahead of time.
+
+    If guided decoding fast-forward is enabled, the tokens forced by the
+    guide of a sequence after its new token are appended along with it, and
+    the sequence is moved back to the prefill phase, so that the scheduler
+    computes them in a single chunk with chunked prefill.
     """
 
     def __init__(
@@ -36,12 +42,16 @@ class SingleStepOutputProcessor(SequenceGroupOutputProcessor):
         scheduler: Scheduler,
         seq_counter: Counter,
         stop_checker: StopChecker,
+        async_detokenizer: Optional[AsyncDetokenizer] = None,
+        guided_decoding_fast_forward: bool = False,
     ):
         self.scheduler_config = scheduler_config
         self.detokenizer = detokenizer
         self.scheduler = scheduler
         self.seq_counter = seq_counter
         self.stop_checker = stop_checker
+        self.async_detokenizer = async_detokenizer
+        self.guided_decoding_fast_forward = guided_decoding_fast_forward
 
     def process_outputs(self, sequence_group: SequenceGroup,
                         outputs: List[SequenceGroupOutput]) -> None:
@@ -81,7 +91,11 @@ class SingleStepOutputProcessor(SequenceGroupOutputProcessor):
             for parent_seq in parent_seqs
         }
         for sample in samples:
-            parent_child_dict[sample.parent_seq_id].append(sample)
+            # The samples of sequences stopped since they were scheduled,
+            # e.g. on a stop string found by the async detokenizer, are
+            # dropped.
+            if sample.parent_seq_id in parent_child_dict:
+                parent_child_dict[sample.parent_seq_id].append(sample)
         # List of (child, parent)
         child_seqs: List[Tuple[Sequence, Sequence]] = []
 
@@ -112,18 +126,41 @@ class SingleStepOutputProcessor(SequenceGroupOutputProcessor):
                                    last_child_sample.logprobs)
             child_seqs.append((parent, parent))
 
-        for seq, _ in child_seqs:
+        forced_token_ids = self._get_forced_token_ids(seq_group, child_seqs)
+
+        # Beam search selects the beams among the sequences finished in this
+        # step, so their stop strings are checked right away. The forced
+        # tokens are detokenized one at a time after the new token.
+        detokenize_async = (self.async_detokenizer is not None
+                            and seq_group.sampling_params.detokenize
+                            and not seq_group.sampling_params.use_beam_search
+                            and not forced_token_ids)
+        if detokenize_async:
+            assert self.async_detokenizer is not None
+            for seq, _ in child_seqs:
+                self.stop_checker.maybe_stop_sequence_before_detokenization(
+                    seq,
+                    seq_group.sampling_params,
+                    lora_req=seq_group.lora_request,
+                )
+                self.async_detokenizer.add(seq_group, seq)
+        else:
+            seqs = [seq for seq, _ in child_seqs]
             if seq_group.sampling_params.detokenize and self.detokenizer:
-                new_char_count = self.detokenizer.decode_sequence_inplace(
-                    seq, seq_group.sampling_params)
+                new_char_counts = self.detokenizer.decode_sequences_inplace([
+                    (seq, seq_group.sampling_params) for seq in seqs
+                ])
             else:
-                new_char_count = 0
-            self.stop_checker.maybe_stop_sequence(
-                seq,
-                new_char_count,
-                seq_group.sampling_params,
-                lora_req=seq_group.lora_request,
-            )
+                new_char_counts = [0] * len(seqs)
+            for seq, new_char_count in zip(seqs, new_char_counts):
+                self.stop_checker.maybe_stop_sequence(
+                    seq,
+                    new_char_count,
+                    seq_group.sampling_params,
+                    lora_req=seq_group.lora_request,
+                )
+        if forced_token_ids:
+            self._fast_forward(seq_group, child_seqs[0][0], forced_token_ids)
 
         # Non-beam search case
         if not seq_group.sampling_params.use_beam_search:
@@ -243,6 +280,63 @@ class SingleStepOutputProcessor(SequenceGroupOutputProcessor):
                 seq_group.remove(seq.seq_id)
                 self.scheduler.free_seq(seq)
 
+    def _get_forced_token_ids(
+            self, seq_group: SequenceGroup,
+            child_seqs: List[Tuple[Sequence, Sequence]]) -> List[int]:
+        """Get the tokens the guided decoding logits processors force the
+        sequence to generate after its new token.
+
+        Only the groups of a single sequence without prompt logprobs are
+        fast-forwarded, since the forced tokens are computed as a prompt
+        chunk.
+        """
+        sampling_params = seq_group.sampling_params
+        if (not self.guided_decoding_fast_forward or len(child_seqs) != 1
+                or sampling_params.use_beam_search
+                or sampling_params.prompt_logprobs is not None
+                or not sampling_params.logits_processors):
+            return []
+        seq = child_seqs[0][0]
+        max_num_tokens = (self.scheduler_config.max_model_len - seq.get_len())
+        if sampling_params.max_tokens is not None:
+            max_num_tokens = min(
+                max_num_tokens,
+                sampling_params.max_tokens - seq.get_output_len())
+        if max_num_tokens <= 0:
+            return []
+        for logits_processor in sampling_params.logits_processors:
+            if not isinstance(logits_processor, BatchedLogitsProcessor):
+                continue
+            forced_token_ids = logits_processor.get_forced_token_ids(
+                seq.seq_id, seq.get_output_token_ids(), max_num_tokens)
+            if forced_token_ids:
+                return forced_token_ids
+        return []
+
+    def _fast_forward(self, seq_group: SequenceGroup, seq: Sequence,
+                      token_ids: List[int]) -> None:
+        """Append the forced tokens to the sequence unless its new token
+        finished it, stopping it as if they were sampled. They are given a
+        logprob of 0, since their probability under the guide is 1."""
+        sampling_params = seq_group.sampling_params
+        for token_id in token_ids:
+            if seq.is_finished():
+                return
+            seq.append_token_id(token_id, {token_id: Logprob(0.0)})
+            if sampling_params.detokenize and self.detokenizer:
+                new_char_count = self.detokenizer.decode_sequence_inplace(
+                    seq, sampling_params)
+            else:
+                new_char_count = 0
+            self.stop_checker.maybe_stop_sequence(
+                seq,
+                new_char_count,
+                sampling_params,
+                lora_req=seq_group.lora_request,
+            )
+        if not seq.is_finished():
+            seq.data.set_fast_forwarded()
+
     def _check_beam_search_early_stopping(
         self,
         early_stopping: Union[bool, str],
@@ -2,6 +2,7 @@ from typing import Callable, Optional
 
 from transformers import PreTrainedTokenizer
 
+from vllm.engine.output_processor.stop_matcher import get_stop_matcher
 from vllm.lora.request import LoRARequest
 from vllm.sampling_params import SamplingParams
 from vllm.sequence import Sequence, SequenceStatus
@@ -45,27 +46,17 @@ class StopChecker:
         if seq.get_output_len() < sampling_params.min_tokens:
             return
 
-        # Check if the sequence has generated the EOS token.
-        if ((not sampling_params.ignore_eos)
-                and seq.get_last_token_id() == seq.eos_token_id):
-            # Remove the last EOS token unless explicitly specified
+        # Check if the sequence has generated the EOS token or a stop token.
+        if self._maybe_stop_on_token(seq, sampling_params):
+            # Remove the last token unless explicitly specified
             # This prevents unintended exposure of the EOS token
             if new_char_count and (
                     not sampling_params.include_stop_str_in_output):
                 seq.output_text = seq.output_text[:-new_char_count]
-            seq.status = SequenceStatus.FINISHED_STOPPED
             return
 
-        # Check if a stop token was encountered.
-        # This assumes a single token produced per step.
-        last_token_id = seq.get_last_token_id()
-        if last_token_id in sampling_params.stop_token_ids:
-            if new_char_count and (
-                    not sampling_params.include_stop_str_in_output):
-                # Remove last token
-                seq.output_text = seq.output_text[:-new_char_count]
-            seq.status = SequenceStatus.FINISHED_STOPPED
-            seq.stop_reason = last_token_id
+        # The text of stop token sequences is kept.
+        if self._maybe_stop_on_token_sequence(seq, sampling_params):
             return
 
         # Check if any stop strings are matched.
@@ -76,6 +67,95 @@ class StopChecker:
             seq.stop_reason = stop_str
             return
 
+        self._maybe_stop_on_length(seq, sampling_params, lora_req)
+
+    def maybe_stop_sequence_before_detokenization(
+        self,
+        seq: Sequence,
+        sampling_params: SamplingParams,
+        lora_req: Optional[LoRARequest] = None,
+    ) -> None:
+        """Stop the sequences finished by their new token, before it is
+        detokenized. The text of the token is checked later by
+        `check_detokenized_sequence`.
+        """
+        if seq.get_output_len() < sampling_params.min_tokens:
+            return
+        if (self._maybe_stop_on_token(seq, sampling_params)
+                or self._maybe_stop_on_token_sequence(seq, sampling_params)):
+            return
+        self._maybe_stop_on_length(seq, sampling_params, lora_req)
+
+    @staticmethod
+    def check_detokenized_sequence(
+            seq: Sequence, new_char_count: int,
+            sampling_params: SamplingParams) -> Optional[str]:
+        """Finish the stop checks of a sequence once its new token is
+        detokenized, and truncate the output text accordingly.
+
+        The status of the sequence is left unchanged, so that this can run
+        outside of the engine loop. Returns the stop string if matched, in
+        which case the caller is to stop the sequence, or else None.
+        """
+        if seq.get_output_len() < sampling_params.min_tokens:
+            return None
+        if seq.status == SequenceStatus.FINISHED_STOPPED:
+            # Stopped on the EOS token, a stop token or a stop token
+            # sequence, whose text is kept.
+            keep_text = (sampling_params.include_stop_str_in_output
+                         or isinstance(seq.stop_reason, list))
+            if new_char_count and not keep_text:
+                seq.output_text = seq.output_text[:-new_char_count]
+            return None
+        return StopChecker._check_stop_strings(seq, new_char_count,
+                                               sampling_params)
+
+    @staticmethod
+    def _maybe_stop_on_token(seq: Sequence,
+                             sampling_params: SamplingParams) -> bool:
+        """Stop the sequence if its last token is the EOS token or a stop
+        token. Returns whether it was stopped."""
+        # Check if the sequence has generated the EOS token.
+        last_token_id = seq.get_last_token_id()
+        if ((not sampling_params.ignore_eos)
+                and last_token_id == seq.eos_token_id):
+            seq.status = SequenceStatus.FINISHED_STOPPED
+            return True
+
+        # Check if a stop token was encountered.
+        # This assumes a single token produced per step.
+        if last_token_id in sampling_params.stop_token_ids:
+            seq.status = SequenceStatus.FINISHED_STOPPED
+            seq.stop_reason = last_token_id
+            return True
+        return False
+
+    @staticmethod
+    def _maybe_stop_on_token_sequence(seq: Sequence,
+                                      sampling_params: SamplingParams) -> bool:
+        """Stop the sequence if its output token ids end with a stop token
+        sequence. Returns whether it was stopped."""
+        if not sampling_params.stop_token_sequences:
+            return False
+        matcher = get_stop_matcher(
+            tuple(map(tuple, sampling_params.stop_token_sequences)))
+        output_token_ids = seq.get_output_token_ids()
+        state = seq.stop_token_sequence_state
+        if state is None:
+            # First check, e.g. once min_tokens are generated.
+            state, _, _ = matcher.feed(0,
+                                       output_token_ids[-matcher.max_len:-1])
+        seq.stop_token_sequence_state, match_index, _ = matcher.feed(
+            state, output_token_ids[-1:])
+        if match_index is None:
+            return False
+        seq.status = SequenceStatus.FINISHED_STOPPED
+        seq.stop_reason = sampling_params.stop_token_sequences[match_index]
+        return True
+
+    def _maybe_stop_on_length(self, seq: Sequence,
+                              sampling_params: SamplingParams,
+                              lora_req: Optional[LoRARequest]) -> None:
         # Check if the sequence has reached max_model_len.
         if seq.get_len() > self._get_max_model_len(lora_req):
             seq.status = SequenceStatus.FINISHED_LENGTH_CAPPED
@@ -94,26 +174,42 @@ class StopChecker:
 
         Returns the stop string if matched or else None.
         """
-        if not new_char_count:
+        if not new_char_count or not sampling_params.stop:
+            return None
+
+        # The stop strings are matched in the new text, which the automaton
+        # state of the sequence is advanced over. The first stop string in
+        # `sampling_params.stop` which is found wins.
+        matcher = get_stop_matcher(tuple(sampling_params.stop))
+        output_text = seq.output_text
+        new_text_start = len(output_text) - new_char_count
+        state = seq.stop_string_state
+        if state is None:
+            # First check, e.g. once min_tokens are generated. The stop
+            # strings ending with the last character of the previous text
+            # are matched too.
+            match_start = max(new_text_start - 1, 0)
+            state, _, _ = matcher.feed(
+                0, output_text[max(new_text_start -
+                                   matcher.max_len, 0):match_start])
+        else:
+            match_start = new_text_start
+        seq.stop_string_state, match_index, match_end = matcher.feed(
+            state, output_text[match_start:])
+        if match_index is None:
             return None
 
-        for stop_str in sampling_params.stop:
-            stop_string_len = len(stop_str)
-            # Avoid searching already-searched text.
-            stop_index = seq.output_text.find(
-                stop_str, -new_char_count - stop_string_len)
-            if stop_index == -1:
-                continue
-
-            if sampling_params.include_stop_str_in_output:
-                # Truncate to end of stop string.
-                stop_index += stop_string_len
-                if stop_index >= len(seq.output_text):
-                    # No truncation required.
-                    return stop_str
-
-            # Truncate the output text to either the beginning
-            # or end of the stop string.
-            seq.output_text = seq.output_text[:stop_index]
-            return stop_str
-        return None
+        stop_str = sampling_params.stop[match_index]
+        stop_string_len = len(stop_str)
+        stop_index = match_start + match_end + 1 - stop_string_len
+        if sampling_params.include_stop_str_in_output:
+            # Truncate to end of stop string.
+            stop_index += stop_string_len
+            if stop_index >= len(seq.output_text):
+                # No truncation required.
+                return stop_str
+
+        # Truncate the output text to either the beginning
+        # or end of the stop string.
+        seq.output_text = seq.output_text[:stop_index]
+        return stop_str
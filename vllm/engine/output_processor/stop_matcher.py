@@ -0,0 +1,97 @@
+"""Matching of many stop strings or stop token sequences at once."""
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+# A stop string, or a stop sequence of token ids.
+Pattern = Sequence[Hashable]
+
+
+class StopMatcher:
+    """Aho-Corasick automaton finding the occurrences of several patterns in
+    a stream of symbols, i.e. of stop strings in the characters of the
+    output text or of stop sequences in the output token ids, in a single
+    pass over the new symbols whatever the number of patterns.
+
+    The state of a stream is a node of the automaton, 0 at the start. The
+    automaton is deterministic: the transitions of each node include those
+    inherited through its failure links, so that each symbol is a single
+    lookup.
+
+    Args:
+        patterns: The patterns, by decreasing priority.
+    """
+
+    def __init__(self, patterns: Sequence[Pattern]):
+        if not patterns or not all(patterns):
+            raise ValueError("The patterns must be non-empty.")
+        self.patterns = patterns
+        self.max_len = max(len(pattern) for pattern in patterns)
+
+        # Trie of the patterns, with the first pattern ending at each node.
+        children: List[Dict[Hashable, int]] = [{}]
+        self._matches: List[int] = [-1]
+        for pattern_index, pattern in enumerate(patterns):
+            node = 0
+            for symbol in pattern:
+                child = children[node].get(symbol)
+                if child is None:
+                    child = len(children)
+                    children[node][symbol] = child
+                    children.append({})
+                    self._matches.append(-1)
+                node = child
+            if self._matches[node] == -1:
+                self._matches[node] = pattern_index
+
+        # The failure link of a node is the node of its longest proper
+        # suffix in the trie, whose depth is lower, so that the nodes are
+        # completed in breadth-first order.
+        self._transitions: List[Dict[Hashable, int]] = [{}] * len(children)
+        self._transitions[0] = dict(children[0])
+        failures = [0] * len(children)
+        queue = deque(children[0].values())
+        while queue:
+            node = queue.popleft()
+            failure = failures[node]
+            failure_match = self._matches[failure]
+            if failure_match != -1 and (self._matches[node] == -1 or
+                                        failure_match < self._matches[node]):
+                self._matches[node] = failure_match
+            transitions = dict(self._transitions[failure])
+            transitions.update(children[node])
+            self._transitions[node] = transitions
+            for symbol, child in children[node].items():
+                failures[child] = self._transitions[failure].get(symbol, 0)
+                queue.append(child)
+
+    def feed(self, state: int,
+             symbols: Iterable[Hashable]) -> Tuple[int, Optional[int], int]:
+        """Advances the state of a stream over new symbols.
+
+        Returns:
+            The new state, the index of the first pattern with an occurrence
+            ending in the new symbols, or None, and the offset in the new
+            symbols of the end of its first such occurrence.
+        """
+        transitions = self._transitions
+        matches = self._matches
+        match_index = -1
+        match_end = -1
+        for offset, symbol in enumerate(symbols):
+            state = transitions[state].get(symbol, 0)
+            node_match = matches[state]
+            if node_match != -1 and (match_index == -1
+                                     or node_match < match_index):
+                match_index = node_match
+                match_end = offset
+        if match_index == -1:
+            return state, None, -1
+        return state, match_index, match_end
+
+
+@lru_cache(maxsize=1024)
+def get_stop_matcher(patterns: Tuple[Pattern, ...]) -> StopMatcher:
+    """Returns the automaton of the stop strings or stop token sequences of
+    the requests, which are usually shared by many requests."""
+    return StopMatcher(patterns)
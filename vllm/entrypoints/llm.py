@@ -1,3 +1,5 @@
+import atexit
+import weakref
 from contextlib import contextmanager
 from typing import ClassVar, List, Optional, Sequence, Union, cast, overload
 
@@ -13,7 +15,7 @@ from vllm.logger import init_logger
 from vllm.lora.request import LoRARequest
 from vllm.outputs import EmbeddingRequestOutput, RequestOutput
 from vllm.pooling_params import PoolingParams
-from vllm.sampling_params import SamplingParams
+from vllm.sampling_params import RequestOutputKind, SamplingParams
 from vllm.transformers_utils.tokenizer import get_cached_tokenizer
 from vllm.usage.usage_lib import UsageContext
 from vllm.utils import Counter, deprecate_kwargs
@@ -21,6 +23,12 @@ from vllm.utils import Counter, deprecate_kwargs
 logger = init_logger(__name__)
 
 
+def _shutdown_engine(engine_ref: "weakref.ref[LLMEngine]") -> None:
+    engine = engine_ref()
+    if engine is not None:
+        engine.shutdown()
+
+
 class LLM:
     """An LLM for generating texts from given prompts and sampling parameters.
 
@@ -145,6 +153,11 @@ class LLM:
             engine_args, usage_context=UsageContext.LLM_CLASS)
         self.request_counter = Counter()
 
+        if self.llm_engine.prefix_cache_store is not None:
+            # The engine only saves the persistent prefix cache when shut
+            # down, which is done at exit unless shutdown() is called first.
+            atexit.register(_shutdown_engine, weakref.ref(self.llm_engine))
+
     def get_tokenizer(
             self) -> Union[PreTrainedTokenizer, PreTrainedTokenizerFast]:
         return self.llm_engine.tokenizer.tokenizer
@@ -162,6 +175,14 @@ class LLM:
             self.llm_engine.tokenizer.tokenizer = get_cached_tokenizer(
                 tokenizer)
 
+    def shutdown(self) -> None:
+        """Saves the persistent prefix cache and shuts down the engine.
+
+        The LLM can't be used afterwards. Without `persistent_prefix_cache`,
+        dropping the LLM is enough.
+        """
+        self.llm_engine.shutdown()
+
     @overload  # LEGACY: single (prompt + optional token ids)
     def generate(
         self,
@@ -509,6 +530,16 @@ class LLM:
         if isinstance(params, list) and len(params) != num_requests:
             raise ValueError("The lengths of prompts and params "
                              "must be the same.")
+        for request_params in (params
+                               if isinstance(params, Sequence) else [params]):
+            if (isinstance(request_params, SamplingParams)
+                    and request_params.output_kind == RequestOutputKind.DELTA):
+                # Only the final outputs are returned.
+                raise ValueError("Delta outputs are not supported by LLM.")
+
+        # Tokenize the text prompts at once, which the tokenizer group
+        # parallelizes.
+        inputs = self._encode_prompts(inputs, lora_request)
 
         # Add requests to the engine.
         for i, request_inputs in enumerate(inputs):
@@ -518,6 +549,37 @@ class LLM:
                 lora_request=lora_request,
             )
 
+    def _encode_prompts(
+        self,
+        inputs: Sequence[PromptStrictInputs],
+        lora_request: Optional[LoRARequest],
+    ) -> List[PromptInputs]:
+        """Tokenize the text prompts of the inputs in a single call to the
+        tokenizer group, instead of a call per request."""
+        encoded_inputs: List[PromptInputs] = list(inputs)
+        text_indices = [
+            i for i, request_inputs in enumerate(inputs)
+            if isinstance(request_inputs, str)
+            or "prompt_token_ids" not in request_inputs
+        ]
+        if len(text_indices) < 2 or self.llm_engine.tokenizer is None:
+            return encoded_inputs
+
+        text_prompts: List[TextPrompt] = [
+            TextPrompt(prompt=request_inputs) if isinstance(
+                request_inputs, str) else cast(TextPrompt, request_inputs)
+            for request_inputs in (inputs[i] for i in text_indices)
+        ]
+        prompt_token_ids = self.llm_engine.get_tokenizer_group().encode_batch(
+            [text_prompt["prompt"] for text_prompt in text_prompts],
+            lora_request=lora_request)
+        for i, text_prompt, token_ids in zip(text_indices, text_prompts,
+                                             prompt_token_ids):
+            encoded_inputs[i] = cast(
+                TextTokensPrompt, dict(text_prompt,
+                                       prompt_token_ids=token_ids))
+        return encoded_inputs
+
     def _add_request(
         self,
         inputs: PromptInputs,
@@ -23,7 +23,8 @@ from vllm.entrypoints.openai.cli_args import make_arg_parser
 from vllm.entrypoints.openai.protocol import (ChatCompletionRequest,
                                               ChatCompletionResponse,
                                               CompletionRequest,
-                                              EmbeddingRequest, ErrorResponse)
+                                              EmbeddingRequest, ErrorResponse,
+                                              GuidedPrecompileRequest)
 from vllm.entrypoints.openai.serving_chat import OpenAIServingChat
 from vllm.entrypoints.openai.serving_completion import OpenAIServingCompletion
 from vllm.entrypoints.openai.serving_embedding import OpenAIServingEmbedding
@@ -56,6 +57,9 @@ async def lifespan(app: fastapi.FastAPI):
 
     yield
 
+    # Saves the persistent prefix cache, which needs the workers.
+    await engine.shutdown()
+
 
 app = fastapi.FastAPI(lifespan=lifespan)
 
@@ -138,6 +142,15 @@ async def create_embedding(request: EmbeddingRequest, raw_request: Request):
         return JSONResponse(content=generator.model_dump())
 
 
+@app.post("/v1/guided/precompile")
+async def precompile_guide(request: GuidedPrecompileRequest):
+    response = await openai_serving_completion.precompile_guide(request)
+    if isinstance(response, ErrorResponse):
+        return JSONResponse(content=response.model_dump(),
+                            status_code=response.code)
+    return JSONResponse(content=response.model_dump())
+
+
 if __name__ == "__main__":
     args = parse_args()
 
@@ -10,7 +10,7 @@ from pydantic import BaseModel, ConfigDict, Field, model_validator
 from typing_extensions import Annotated, Required, TypedDict
 
 from vllm.pooling_params import PoolingParams
-from vllm.sampling_params import SamplingParams
+from vllm.sampling_params import RequestOutputKind, SamplingParams
 from vllm.utils import random_uuid
 
 
@@ -47,6 +47,17 @@ ChatCompletionMessageParam = Union[
     CustomChatCompletionMessageParam]
 
 
+def _get_output_kind(stream: Optional[bool], n: Optional[int],
+                     best_of: Optional[int],
+                     use_beam_search: Optional[bool]) -> RequestOutputKind:
+    """Streamed requests get delta outputs, unless the returned sequences
+    may change from one step to the next, with beam search or with best_of
+    greater than n."""
+    if (stream and (best_of is None or best_of == n) and not use_beam_search):
+        return RequestOutputKind.DELTA
+    return RequestOutputKind.CUMULATIVE
+
+
 class OpenAIBaseModel(BaseModel):
     # OpenAI API does not allow extra fields
     model_config = ConfigDict(extra="forbid")
@@ -158,6 +169,8 @@ class ChatCompletionRequest(OpenAIBaseModel):
     ignore_eos: Optional[bool] = False
     min_tokens: Optional[int] = 0
     stop_token_ids: Optional[List[int]] = Field(default_factory=list)
+    stop_token_sequences: Optional[List[List[int]]] = Field(
+        default_factory=list)
     skip_special_tokens: Optional[bool] = True
     spaces_between_special_tokens: Optional[bool] = True
     # doc: end-chat-completion-sampling-params
@@ -221,6 +234,12 @@ class ChatCompletionRequest(OpenAIBaseModel):
         description=(
             "If specified, will override the default whitespace pattern "
             "for guided json decoding."))
+    priority: int = Field(
+        default=0,
+        description=(
+            "The priority of the request, lower values are scheduled first. "
+            "Only used when the server runs the 'priority' scheduling "
+            "policy."))
 
     # doc: end-chat-completion-extra-params
 
@@ -253,6 +272,7 @@ class ChatCompletionRequest(OpenAIBaseModel):
             seed=self.seed,
             stop=self.stop,
             stop_token_ids=self.stop_token_ids,
+            stop_token_sequences=self.stop_token_sequences,
             max_tokens=self.max_tokens,
             min_tokens=self.min_tokens,
             logprobs=self.top_logprobs if self.logprobs else None,
@@ -267,6 +287,9 @@ class ChatCompletionRequest(OpenAIBaseModel):
             include_stop_str_in_output=self.include_stop_str_in_output,
             length_penalty=self.length_penalty,
             logits_processors=logits_processors,
+            priority=self.priority,
+            output_kind=_get_output_kind(self.stream, self.n, self.best_of,
+                                         self.use_beam_search),
         )
 
     @model_validator(mode="before")
@@ -345,6 +368,8 @@ class CompletionRequest(OpenAIBaseModel):
     length_penalty: Optional[float] = 1.0
     early_stopping: Optional[bool] = False
     stop_token_ids: Optional[List[int]] = Field(default_factory=list)
+    stop_token_sequences: Optional[List[List[int]]] = Field(
+        default_factory=list)
     ignore_eos: Optional[bool] = False
     min_tokens: Optional[int] = 0
     skip_special_tokens: Optional[bool] = True
@@ -396,6 +421,12 @@ class CompletionRequest(OpenAIBaseModel):
         description=(
             "If specified, will override the default whitespace pattern "
             "for guided json decoding."))
+    priority: int = Field(
+        default=0,
+        description=(
+            "The priority of the request, lower values are scheduled first. "
+            "Only used when the server runs the 'priority' scheduling "
+            "policy."))
 
     # doc: end-completion-extra-params
 
@@ -430,6 +461,7 @@ class CompletionRequest(OpenAIBaseModel):
             seed=self.seed,
             stop=self.stop,
             stop_token_ids=self.stop_token_ids,
+            stop_token_sequences=self.stop_token_sequences,
             ignore_eos=self.ignore_eos,
             max_tokens=self.max_tokens if not echo_without_generation else 1,
             min_tokens=self.min_tokens,
@@ -443,6 +475,9 @@ class CompletionRequest(OpenAIBaseModel):
             length_penalty=self.length_penalty,
             logits_processors=logits_processors,
             truncate_prompt_tokens=self.truncate_prompt_tokens,
+            priority=self.priority,
+            output_kind=_get_output_kind(self.stream, self.n, self.best_of,
+                                         self.use_beam_search),
         )
 
     @model_validator(mode="before")
@@ -469,6 +504,32 @@ class CompletionRequest(OpenAIBaseModel):
         return data
 
 
+class GuidedPrecompileRequest(OpenAIBaseModel):
+    """Compiles the guide of the guided decoding parameters ahead of the
+    requests that use it, with the same parameters as the completions."""
+    guided_json: Optional[Union[str, dict, BaseModel]] = None
+    guided_regex: Optional[str] = None
+    guided_choice: Optional[List[str]] = None
+    guided_grammar: Optional[str] = None
+    guided_decoding_backend: Optional[str] = None
+    guided_whitespace_pattern: Optional[str] = None
+    response_format: Optional[ResponseFormat] = None
+
+    @model_validator(mode="before")
+    @classmethod
+    def check_guided_decoding_count(cls, data):
+        guide_count = sum([
+            "guided_json" in data and data["guided_json"] is not None,
+            "guided_regex" in data and data["guided_regex"] is not None,
+            "guided_choice" in data and data["guided_choice"] is not None
+        ])
+        if guide_count > 1:
+            raise ValueError(
+                "You can only use one kind of guided decoding "
+                "('guided_json', 'guided_regex' or 'guided_choice').")
+        return data
+
+
 class EmbeddingRequest(BaseModel):
     # Ordered by official OpenAI API documentation
     # https://platform.openai.com/docs/api-reference/embeddings
@@ -499,12 +560,12 @@ class CompletionResponseChoice(OpenAIBaseModel):
     text: str
     logprobs: Optional[CompletionLogProbs] = None
     finish_reason: Optional[str] = None
-    stop_reason: Optional[Union[int, str]] = Field(
+    stop_reason: Optional[Union[int, str, List[int]]] = Field(
         default=None,
         description=(
-            "The stop string or token id that caused the completion "
-            "to stop, None if the completion finished for some other reason "
-            "including encountering the EOS token"),
+            "The stop string, token id or token id sequence that caused the "
+            "completion to stop, None if the completion finished for some "
+            "other reason including encountering the EOS token"),
     )
 
 
@@ -522,12 +583,12 @@ class CompletionResponseStreamChoice(OpenAIBaseModel):
     text: str
     logprobs: Optional[CompletionLogProbs] = None
     finish_reason: Optional[str] = None
-    stop_reason: Optional[Union[int, str]] = Field(
+    stop_reason: Optional[Union[int, str, List[int]]] = Field(
         default=None,
         description=(
-            "The stop string or token id that caused the completion "
-            "to stop, None if the completion finished for some other reason "
-            "including encountering the EOS token"),
+            "The stop string, token id or token id sequence that caused the "
+            "completion to stop, None if the completion finished for some "
+            "other reason including encountering the EOS token"),
     )
 
 
@@ -555,6 +616,11 @@ class EmbeddingResponse(BaseModel):
     usage: UsageInfo
 
 
+class GuidedPrecompileResponse(OpenAIBaseModel):
+    object: str = "guided.precompile"
+    guided_decoding_backend: str
+
+
 class FunctionCall(OpenAIBaseModel):
     name: str
     arguments: str
@@ -591,7 +657,7 @@ class ChatCompletionResponseChoice(OpenAIBaseModel):
     message: ChatMessage
     logprobs: Optional[ChatCompletionLogProbs] = None
     finish_reason: Optional[Literal["stop", "length", "tool_calls"]] = None
-    stop_reason: Optional[Union[int, str]] = None
+    stop_reason: Optional[Union[int, str, List[int]]] = None
 
 
 class ChatCompletionResponse(OpenAIBaseModel):
@@ -614,7 +680,7 @@ class ChatCompletionResponseStreamChoice(OpenAIBaseModel):
     delta: DeltaMessage
     logprobs: Optional[ChatCompletionLogProbs] = None
     finish_reason: Optional[Literal["stop", "length", "tool_calls"]] = None
-    stop_reason: Optional[Union[int, str]] = None
+    stop_reason: Optional[Union[int, str, List[int]]] = None
 
 
 class ChatCompletionStreamResponse(OpenAIBaseModel):
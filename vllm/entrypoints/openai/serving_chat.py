@@ -1,4 +1,5 @@
 import codecs
+import itertools
 import time
 from dataclasses import dataclass
 from typing import (AsyncGenerator, AsyncIterator, Dict, Iterable, List,
@@ -25,6 +26,7 @@ from vllm.logger import init_logger
 from vllm.model_executor.guided_decoding import (
     get_guided_decoding_logits_processor)
 from vllm.outputs import RequestOutput
+from vllm.sampling_params import RequestOutputKind
 from vllm.sequence import Logprob
 from vllm.utils import random_uuid
 
@@ -195,7 +197,8 @@ class OpenAIServingChat(OpenAIServing):
         # Streaming response
         if request.stream:
             return self.chat_completion_stream_generator(
-                request, result_generator, request_id, conversation)
+                request, result_generator, request_id, conversation,
+                sampling_params.output_kind)
         else:
             try:
                 return await self.chat_completion_full_generator(
@@ -214,8 +217,8 @@ class OpenAIServingChat(OpenAIServing):
     async def chat_completion_stream_generator(
             self, request: ChatCompletionRequest,
             result_generator: AsyncIterator[RequestOutput], request_id: str,
-            conversation: List[ConversationMessage]
-    ) -> AsyncGenerator[str, None]:
+            conversation: List[ConversationMessage],
+            output_kind: RequestOutputKind) -> AsyncGenerator[str, None]:
         model_name = self.served_model_names[0]
         created_time = int(time.time())
         chunk_object_type = "chat.completion.chunk"
@@ -223,7 +226,7 @@ class OpenAIServingChat(OpenAIServing):
 
         # Send response for each token for each request.n (index)
         assert request.n is not None
-        previous_texts = [""] * request.n
+        previous_num_chars = [0] * request.n
         previous_num_tokens = [0] * request.n
         finish_reason_sent = [False] * request.n
         try:
@@ -285,9 +288,19 @@ class OpenAIServingChat(OpenAIServing):
                     if finish_reason_sent[i]:
                         continue
 
-                    delta_token_ids = output.token_ids[previous_num_tokens[i]:]
-                    top_logprobs = output.logprobs[
-                        previous_num_tokens[i]:] if output.logprobs else None
+                    if output_kind == RequestOutputKind.DELTA:
+                        delta_text = output.text
+                        delta_token_ids = output.token_ids
+                        top_logprobs = output.logprobs
+                    else:
+                        delta_text = output.text[previous_num_chars[i]:]
+                        delta_token_ids = output.token_ids[
+                            previous_num_tokens[i]:]
+                        top_logprobs = (
+                            output.logprobs[previous_num_tokens[i]:]
+                            if output.logprobs else None)
+                    previous_num_chars[i] += len(delta_text)
+                    previous_num_tokens[i] += len(delta_token_ids)
 
                     if request.logprobs:
                         logprobs = self._create_chat_logprobs(
@@ -298,10 +311,6 @@ class OpenAIServingChat(OpenAIServing):
                     else:
                         logprobs = None
 
-                    delta_text = output.text[len(previous_texts[i]):]
-                    previous_texts[i] = output.text
-                    previous_num_tokens[i] = len(output.token_ids)
-
                     if request.tool_choice and type(
                             request.tool_choice
                     ) is ChatCompletionNamedToolChoiceParam:
@@ -449,17 +458,19 @@ class OpenAIServingChat(OpenAIServing):
     def _get_top_logprobs(
             self, logprobs: Dict[int, Logprob],
             top_logprobs: Optional[int]) -> List[ChatCompletionLogProb]:
-        return [
-            ChatCompletionLogProb(
-                token=self._get_decoded_token(p[1], p[0]),
-                logprob=max(p[1].logprob, -9999.0),
-                bytes=list(
-                    self._get_decoded_token(p[1],
-                                            p[0]).encode("utf-8",
-                                                         errors="replace")))
-            for i, p in enumerate(logprobs.items())
-            if top_logprobs and i < top_logprobs
-        ]
+        # Only the text of the returned tokens is decoded, see
+        # `Logprob.set_lazy_decoded_token`.
+        chat_logprobs: List[ChatCompletionLogProb] = []
+        for token_id, logprob in itertools.islice(logprobs.items(),
+                                                  top_logprobs or 0):
+            token = self._get_decoded_token(logprob, token_id)
+            chat_logprobs.append(
+                ChatCompletionLogProb(token=token,
+                                      logprob=max(logprob.logprob, -9999.0),
+                                      bytes=list(
+                                          token.encode("utf-8",
+                                                       errors="replace"))))
+        return chat_logprobs
 
     def _create_chat_logprobs(
         self,
@@ -1,8 +1,9 @@
+import itertools
 import time
 from typing import (AsyncGenerator, AsyncIterator, Callable, Dict, List,
                     Optional)
 from typing import Sequence as GenericSequence
-from typing import Tuple
+from typing import Tuple, Union
 
 from fastapi import Request
 
@@ -15,13 +16,16 @@ from vllm.entrypoints.openai.protocol import (CompletionLogProbs,
                                               CompletionResponseChoice,
                                               CompletionResponseStreamChoice,
                                               CompletionStreamResponse,
+                                              ErrorResponse,
+                                              GuidedPrecompileRequest,
+                                              GuidedPrecompileResponse,
                                               UsageInfo)
 # yapf: enable
 from vllm.entrypoints.openai.serving_engine import (LoRAModulePath,
                                                     OpenAIServing)
 from vllm.logger import init_logger
 from vllm.model_executor.guided_decoding import (
-    get_guided_decoding_logits_processor)
+    get_guided_decoding_logits_processor, precompile_guided_decoding_guide)
 from vllm.outputs import RequestOutput
 from vllm.sequence import Logprob
 from vllm.utils import merge_async_iterators, random_uuid
@@ -188,6 +192,27 @@ class OpenAIServingCompletion(OpenAIServing):
 
         return response
 
+    async def precompile_guide(
+        self, request: GuidedPrecompileRequest
+    ) -> Union[GuidedPrecompileResponse, ErrorResponse]:
+        """Compile the guide of the guided decoding parameters before the
+        requests that use it arrive, so that their first token is not
+        delayed by the compilation."""
+        decoding_config = await self.engine.get_decoding_config()
+        guided_decoding_backend = request.guided_decoding_backend \
+            or decoding_config.guided_decoding_backend
+        try:
+            has_guide = await precompile_guided_decoding_guide(
+                guided_decoding_backend, request, await
+                self.engine.get_tokenizer())
+        except ValueError as e:
+            return self.create_error_response(str(e))
+        if not has_guide:
+            return self.create_error_response(
+                "No guided decoding parameters were given.")
+        return GuidedPrecompileResponse(
+            guided_decoding_backend=guided_decoding_backend)
+
     async def completion_stream_generator(
         self,
         request: CompletionRequest,
@@ -199,7 +224,8 @@ class OpenAIServingCompletion(OpenAIServing):
         num_prompts: int,
     ) -> AsyncGenerator[str, None]:
         assert request.n is not None
-        previous_texts = [""] * request.n * num_prompts
+        # The streamed outputs are deltas, see `RequestOutputKind.DELTA`.
+        previous_num_chars = [0] * request.n * num_prompts
         previous_num_tokens = [0] * request.n * num_prompts
         has_echoed = [False] * request.n * num_prompts
 
@@ -213,8 +239,6 @@ class OpenAIServingCompletion(OpenAIServing):
 
                 for output in res.outputs:
                     i = output.index + prompt_idx * request.n
-                    # TODO(simon): optimize the performance by avoiding full
-                    # text O(n^2) sending.
 
                     assert request.max_tokens is not None
                     if request.echo and request.max_tokens == 0:
@@ -233,30 +257,27 @@ class OpenAIServingCompletion(OpenAIServing):
                                                               or [])
                         has_echoed[i] = True
                     else:
-                        # return just the delta
-                        delta_text = output.text[len(previous_texts[i]):]
-                        delta_token_ids = output.token_ids[
-                            previous_num_tokens[i]:]
-                        top_logprobs = output.logprobs[previous_num_tokens[
-                            i]:] if output.logprobs else None
+                        delta_text = output.text
+                        delta_token_ids = output.token_ids
+                        top_logprobs = output.logprobs
 
                     if request.logprobs is not None:
                         logprobs = self._create_completion_logprobs(
                             token_ids=delta_token_ids,
                             top_logprobs=top_logprobs,
                             num_output_top_logprobs=request.logprobs,
-                            initial_text_offset=len(previous_texts[i]),
+                            initial_text_offset=previous_num_chars[i],
                         )
                     else:
                         logprobs = None
 
-                    previous_texts[i] = output.text
-                    previous_num_tokens[i] = len(output.token_ids)
+                    previous_num_chars[i] += len(output.text)
+                    previous_num_tokens[i] += len(output.token_ids)
                     finish_reason = output.finish_reason
                     stop_reason = output.stop_reason
                     if output.finish_reason is not None:  # return final usage
                         prompt_tokens = len(res.prompt_token_ids)
-                        completion_tokens = len(output.token_ids)
+                        completion_tokens = previous_num_tokens[i]
                         final_usage = UsageInfo(
                             prompt_tokens=prompt_tokens,
                             completion_tokens=completion_tokens,
@@ -397,8 +418,8 @@ class OpenAIServingCompletion(OpenAIServing):
                     # JSON-serializable float that OpenAI uses
                     self._get_decoded_token(top_lp[1], top_lp[0]):
                     max(top_lp[1].logprob, -9999.0)
-                    for i, top_lp in enumerate(step_top_logprobs.items())
-                    if num_output_top_logprobs >= i
+                    for top_lp in itertools.islice(step_top_logprobs.items(),
+                                                   num_output_top_logprobs + 1)
                 })
 
             if len(out_text_offset) == 0:
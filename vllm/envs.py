@@ -29,6 +29,9 @@ if TYPE_CHECKING:
     VLLM_CPU_KVCACHE_SPACE: int = 0
     VLLM_USE_RAY_COMPILED_DAG: bool = False
     VLLM_WORKER_MULTIPROC_METHOD: str = "spawn"
+    VLLM_GUIDED_DECODING_MASK_CACHE_SIZE: int = 4096
+    VLLM_GUIDED_DECODING_GUIDE_CACHE_MB: int = 4096
+    VLLM_GUIDED_DECODING_GUIDE_CACHE_DIR: Optional[str] = None
     VLLM_TARGET_DEVICE: str = "cuda"
     MAX_JOBS: Optional[str] = None
     NVCC_THREADS: Optional[str] = None
@@ -213,6 +216,22 @@ environment_variables: Dict[str, Callable[[], Any]] = {
     # Both spawn and fork work
     "VLLM_WORKER_MULTIPROC_METHOD":
     lambda: os.getenv("VLLM_WORKER_MULTIPROC_METHOD", "spawn"),
+
+    # The number of allowed-token bitmasks of guided decoding FSM states
+    # to cache, shared by all the requests with the same guide.
+    "VLLM_GUIDED_DECODING_MASK_CACHE_SIZE":
+    lambda: int(os.getenv("VLLM_GUIDED_DECODING_MASK_CACHE_SIZE", "4096")),
+
+    # The estimated memory, in MiB, of the compiled guided decoding guides
+    # to keep, shared by all the requests with the same guide.
+    "VLLM_GUIDED_DECODING_GUIDE_CACHE_MB":
+    lambda: int(os.getenv("VLLM_GUIDED_DECODING_GUIDE_CACHE_MB", "4096")),
+
+    # If set, the compiled guided decoding guides are also pickled to this
+    # directory and loaded from it by later servers, instead of compiled
+    # again. The directory must only be writable by trusted users.
+    "VLLM_GUIDED_DECODING_GUIDE_CACHE_DIR":
+    lambda: os.getenv("VLLM_GUIDED_DECODING_GUIDE_CACHE_DIR", None),
 }
 
 # end-env-vars-definition
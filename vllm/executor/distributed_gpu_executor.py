@@ -2,6 +2,7 @@ import asyncio
 from abc import abstractmethod
 from typing import Any, Awaitable, Dict, List, Optional, Set, Tuple, Union
 
+from vllm.core.preemption import PreemptionCostModel
 from vllm.executor.executor_base import ExecutorAsyncBase
 from vllm.executor.gpu_executor import GPUExecutor
 from vllm.logger import init_logger
@@ -63,6 +64,10 @@ class DistributedGPUExecutor(GPUExecutor):
                           num_gpu_blocks=num_gpu_blocks,
                           num_cpu_blocks=num_cpu_blocks)
 
+    def get_preemption_cost_model(self) -> Optional[PreemptionCostModel]:
+        # The costs measured by the driver worker, which is the first.
+        return self._run_workers("get_preemption_cost_model")[0]
+
     def execute_model(
             self,
             execute_model_req: ExecuteModelRequest) -> List[SamplerOutput]:
@@ -1,9 +1,11 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import List, Optional, Set, Tuple
 
 from vllm.config import (CacheConfig, DeviceConfig, LoadConfig, LoRAConfig,
                          ModelConfig, ParallelConfig, SchedulerConfig,
                          SpeculativeConfig, VisionLanguageConfig)
+from vllm.core.preemption import PreemptionCostModel
 from vllm.lora.request import LoRARequest
 from vllm.sequence import ExecuteModelRequest, SamplerOutput
 
@@ -37,6 +39,8 @@ class ExecutorBase(ABC):
         self.device_config = device_config
         self.vision_language_config = vision_language_config
         self.speculative_config = speculative_config
+        # Runs the model steps started by `execute_model_nonblocking`.
+        self._step_thread_pool: Optional[ThreadPoolExecutor] = None
 
         self._init_executor()
 
@@ -67,6 +71,13 @@ class ExecutorBase(ABC):
         """
         raise NotImplementedError
 
+    def get_preemption_cost_model(self) -> Optional[PreemptionCostModel]:
+        """Returns the costs of preempting sequences, which the driver worker
+        measures in `determine_num_available_blocks`, or None if the workers
+        do not measure them.
+        """
+        return None
+
     @abstractmethod
     def execute_model(
             self,
@@ -74,6 +85,19 @@ class ExecutorBase(ABC):
         """Executes at least one model step on the given sequences."""
         raise NotImplementedError
 
+    def execute_model_nonblocking(
+        self, execute_model_req: ExecuteModelRequest
+    ) -> "Future[List[SamplerOutput]]":
+        """Starts executing the model on the given sequences in a background
+        thread, and returns the future of the outputs. The workers release
+        the GIL while the model runs, so that the engine can meanwhile
+        prepare the next step. Only one step runs at a time."""
+        if self._step_thread_pool is None:
+            self._step_thread_pool = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="vllm-execute-model")
+        return self._step_thread_pool.submit(self.execute_model,
+                                             execute_model_req)
+
     def stop_remote_worker_execution_loop(self) -> None:
         """Releases parallel workers from model loop."""
         return
@@ -2,7 +2,7 @@ from typing import Optional, Union
 
 from vllm.entrypoints.openai.protocol import (
     ChatCompletionNamedToolChoiceParam, ChatCompletionRequest,
-    CompletionRequest)
+    CompletionRequest, GuidedPrecompileRequest)
 from vllm.model_executor.guided_decoding.lm_format_enforcer_decoding import (
     get_lm_format_enforcer_guided_decoding_logits_processor)
 from vllm.model_executor.guided_decoding.outlines_decoding import (
@@ -12,7 +12,8 @@ from vllm.sampling_params import LogitsProcessor
 
 async def get_guided_decoding_logits_processor(
         guided_decoding_backend: str, request: Union[CompletionRequest,
-                                                     ChatCompletionRequest],
+                                                     ChatCompletionRequest,
+                                                     GuidedPrecompileRequest],
         tokenizer) -> Optional[LogitsProcessor]:
     request = _adapt_request_for_tool_use(request)
 
@@ -28,10 +29,22 @@ async def get_guided_decoding_logits_processor(
         "Must be one of 'outlines, 'lm-format-enforcer'")
 
 
+async def precompile_guided_decoding_guide(guided_decoding_backend: str,
+                                           request: GuidedPrecompileRequest,
+                                           tokenizer) -> bool:
+    """Compile the guide of the guided decoding parameters of the request,
+    so that the requests with the same parameters find it compiled.
+    Returns False if the request has no guided decoding parameters."""
+    return await get_guided_decoding_logits_processor(guided_decoding_backend,
+                                                      request,
+                                                      tokenizer) is not None
+
+
 def _adapt_request_for_tool_use(request: Union[CompletionRequest,
-                                               ChatCompletionRequest]):
+                                               ChatCompletionRequest,
+                                               GuidedPrecompileRequest]):
     # the legacy completion API does not support tool use
-    if type(request) is CompletionRequest:
+    if type(request) is not ChatCompletionRequest:
         return request
 
     # user has chosen to not use any tool
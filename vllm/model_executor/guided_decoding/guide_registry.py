@@ -0,0 +1,222 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import itertools
+import os
+import pickle
+import threading
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import vllm.envs as envs
+from vllm.logger import init_logger
+from vllm.utils import LRUCache
+
+logger = init_logger(__name__)
+
+# The estimated bytes of a guide, and of each transition of its index, an
+# entry of a dict from a token id to the next FSM state.
+_BYTES_PER_GUIDE = 1 << 16
+_BYTES_PER_TRANSITION = 100
+
+
+def estimate_guide_size(guide: Any) -> int:
+    """Estimate the memory of a compiled guide from the size of its index.
+    The guides without an index, e.g. CFG guides, are counted as small."""
+    states_to_token_maps = getattr(guide, "states_to_token_maps", None)
+    if not isinstance(states_to_token_maps, dict):
+        return _BYTES_PER_GUIDE
+    num_transitions = sum(
+        len(token_map) for token_map in states_to_token_maps.values())
+    return _BYTES_PER_GUIDE + num_transitions * _BYTES_PER_TRANSITION
+
+
+class _GuideCache(LRUCache[Any]):
+    """An LRU cache of the guides whose capacity is the estimated bytes of
+    the guides, rather than their number. Each cached guide has an id, which
+    is not reused, and `on_remove` is called with it when the guide is
+    removed."""
+
+    def __init__(self, max_bytes: int, on_remove: Callable[[int], None]):
+        super().__init__(max_bytes)
+        self.sizes: Dict[Hashable, int] = {}
+        self.ids: Dict[Hashable, int] = {}
+        self.num_bytes = 0
+        self._on_remove_guide = on_remove
+        self._id_counter = itertools.count()
+
+    def put_guide(self, key: Hashable, guide: Any) -> None:
+        self.pop(key)
+        size = estimate_guide_size(guide)
+        self.sizes[key] = size
+        self.ids[key] = next(self._id_counter)
+        self.num_bytes += size
+        self.put(key, guide)
+
+    def _on_remove(self, key: Hashable, value: Optional[Any]):
+        self.num_bytes -= self.sizes.pop(key)
+        self._on_remove_guide(self.ids.pop(key))
+
+    def _remove_old_if_needed(self) -> None:
+        # The newest guide is kept even if it alone exceeds the capacity.
+        while self.num_bytes > self.capacity and len(self.cache) > 1:
+            self.remove_oldest()
+
+
+class GuideRegistry:
+    """A process-wide registry of the compiled guided decoding guides,
+    shared by all the requests, keyed by the normalized guide and the
+    tokenizer.
+
+    The guides are kept in an LRU cache bounded by their estimated memory.
+    The requests for a guide that is being compiled wait for the same
+    compilation instead of compiling it again. If a cache directory is
+    given, the compiled guides are also pickled to it, and later loaded
+    from it instead of compiled, e.g. after a restart of the server.
+
+    The caches derived from the guides are keyed by the ids of the guides
+    rather than the guides, so that they do not keep evicted guides alive,
+    and drop their entries from the removal callbacks.
+    """
+
+    def __init__(self, max_bytes: int, cache_dir: Optional[str] = None):
+        self._guides = _GuideCache(max_bytes, self._on_remove_guide)
+        self._removal_callbacks: List[Callable[[int], None]] = []
+        # The futures of the guides being built.
+        self._pending: Dict[Hashable, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+        self._cache_dir = cache_dir
+        self.num_hits = 0
+        self.num_builds = 0
+        self.num_loads = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._guides
+
+    @property
+    def num_bytes(self) -> int:
+        return self._guides.num_bytes
+
+    def get_guide_id(self, key: Hashable) -> Optional[int]:
+        """Get the id of the guide of the key, None if it is not in the
+        registry."""
+        with self._lock:
+            return self._guides.ids.get(key)
+
+    def add_removal_callback(self, callback: Callable[[int], None]) -> None:
+        """Call `callback` with the id of each guide removed from the
+        registry. It is called with the lock of the registry held, from the
+        thread adding a guide."""
+        self._removal_callbacks.append(callback)
+
+    def _on_remove_guide(self, guide_id: int) -> None:
+        for callback in self._removal_callbacks:
+            callback(guide_id)
+
+    def get_guide(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        """Get the guide of the key, building it with `build` in this thread
+        unless another thread is building it already. This is blocking."""
+        future, is_builder = self._get_future(key)
+        if is_builder:
+            self._build(key, build, future)
+        return future.result()
+
+    async def get_guide_async(
+            self,
+            key: Hashable,
+            build: Callable[[], Any],
+            executor: Optional[concurrent.futures.Executor] = None) -> Any:
+        """Get the guide of the key, building it with `build` on the executor
+        unless it is being built already. This is non-blocking."""
+        future, is_builder = self._get_future(key)
+        if is_builder:
+            asyncio.get_running_loop().run_in_executor(executor, self._build,
+                                                       key, build, future)
+        return await asyncio.wrap_future(future)
+
+    def _get_future(self,
+                    key: Hashable) -> Tuple[concurrent.futures.Future, bool]:
+        """Get the future of the guide of the key, and whether the caller
+        must build it."""
+        with self._lock:
+            future: concurrent.futures.Future = concurrent.futures.Future()
+            guide = self._guides.get(key)
+            if guide is not None:
+                self.num_hits += 1
+                future.set_result(guide)
+                return future, False
+            if key in self._pending:
+                self.num_hits += 1
+                return self._pending[key], False
+            self._pending[key] = future
+            return future, True
+
+    def _build(self, key: Hashable, build: Callable[[], Any],
+               future: concurrent.futures.Future) -> None:
+        try:
+            guide = self._load(key)
+            is_loaded = guide is not None
+            if guide is None:
+                guide = build()
+                self._save(key, guide)
+        except Exception as e:
+            with self._lock:
+                del self._pending[key]
+            future.set_exception(e)
+            return
+        with self._lock:
+            if is_loaded:
+                self.num_loads += 1
+            else:
+                self.num_builds += 1
+            self._guides.put_guide(key, guide)
+            del self._pending[key]
+        future.set_result(guide)
+
+    def _get_path(self, key: Hashable) -> str:
+        assert self._cache_dir is not None
+        digest = hashlib.sha256(repr(key).encode()).hexdigest()
+        return os.path.join(self._cache_dir, f"{digest}.pkl")
+
+    def _load(self, key: Hashable) -> Optional[Any]:
+        if self._cache_dir is None:
+            return None
+        path = self._get_path(key)
+        try:
+            with open(path, "rb") as f:
+                cached_key, guide = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logger.warning("Failed to load the guide from %s.",
+                           path,
+                           exc_info=True)
+            return None
+        if cached_key != repr(key):
+            return None
+        return guide
+
+    def _save(self, key: Hashable, guide: Any) -> None:
+        if self._cache_dir is None:
+            return
+        path = self._get_path(key)
+        # Write to a file of this process and rename it, so that the other
+        # processes never load a partial file.
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self._cache_dir, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                pickle.dump((repr(key), guide), f)
+            os.replace(tmp_path, path)
+        except Exception:
+            logger.warning("Failed to save the guide to %s.",
+                           path,
+                           exc_info=True)
+
+
+_guide_registry = GuideRegistry(envs.VLLM_GUIDED_DECODING_GUIDE_CACHE_MB << 20,
+                                envs.VLLM_GUIDED_DECODING_GUIDE_CACHE_DIR)
+
+
+def get_guide_registry() -> GuideRegistry:
+    return _guide_registry
@@ -3,15 +3,19 @@ import concurrent.futures
 from enum import Enum
 from json import dumps as json_dumps
 from re import escape as regex_escape
-from typing import Tuple, Union
+from typing import Optional, Tuple, Union
 
 from pydantic import BaseModel
 from transformers import PreTrainedTokenizerBase
 
 from vllm.entrypoints.openai.protocol import (ChatCompletionRequest,
-                                              CompletionRequest)
+                                              CompletionRequest,
+                                              GuidedPrecompileRequest)
+from vllm.model_executor.guided_decoding.guide_registry import (
+    get_guide_registry)
 from vllm.model_executor.guided_decoding.outlines_logits_processors import (
-    CFGLogitsProcessor, JSONLogitsProcessor, RegexLogitsProcessor)
+    CFGLogitsProcessor, GuideSpec, JSONLogitsProcessor, RegexLogitsProcessor,
+    get_json_guide_spec, get_regex_guide_spec)
 
 
 class GuidedDecodingMode(Enum):
@@ -52,15 +56,15 @@ global_thread_pool = None  # used for generating logits processor fsm
 
 
 async def get_outlines_guided_decoding_logits_processor(
-    request: Union[CompletionRequest,
-                   ChatCompletionRequest], tokenizer: PreTrainedTokenizerBase
+    request: Union[CompletionRequest, ChatCompletionRequest,
+                   GuidedPrecompileRequest], tokenizer: PreTrainedTokenizerBase
 ) -> Union[JSONLogitsProcessor, RegexLogitsProcessor, CFGLogitsProcessor,
            None]:
     """
     Given an OpenAI-compatible request, check for guided decoding parameters
     and get the necessary logits processor for the given guide.
-    We cache logit processors by (guide, tokenizer), and on cache hit
-    we make a shallow copy to reuse the same underlying FSM.
+    The regex and JSON guides are compiled on the thread pool once for all
+    the requests with them, and shared through the guide registry.
     """
     global global_thread_pool
     guide, mode = _get_guide_and_mode(request)
@@ -72,13 +76,22 @@ async def get_outlines_guided_decoding_logits_processor(
             max_workers=2)
     loop = asyncio.get_running_loop()
 
+    guide_spec = _get_guide_spec(guide, mode, tokenizer,
+                                 request.guided_whitespace_pattern)
+    if guide_spec is not None:
+        # Wait for the guide without holding a thread of the pool while
+        # another request compiles it.
+        await get_guide_registry().get_guide_async(*guide_spec,
+                                                   executor=global_thread_pool)
+
     return await loop.run_in_executor(global_thread_pool,
                                       _get_logits_processor, guide, tokenizer,
                                       mode, request.guided_whitespace_pattern)
 
 
 def _get_guide_and_mode(
-    request: Union[CompletionRequest, ChatCompletionRequest]
+    request: Union[CompletionRequest, ChatCompletionRequest,
+                   GuidedPrecompileRequest]
 ) -> Union[Tuple[str, GuidedDecodingMode], Tuple[None, None]]:
 
     if request.guided_json:
@@ -109,6 +122,18 @@ def _get_guide_and_mode(
         return None, None
 
 
+def _get_guide_spec(
+        guide: str, mode: GuidedDecodingMode,
+        tokenizer: PreTrainedTokenizerBase,
+        whitespace_pattern: Union[str, None]) -> Optional[GuideSpec]:
+    if mode == GuidedDecodingMode.JSON:
+        return get_json_guide_spec(guide, tokenizer, whitespace_pattern)
+    elif mode == GuidedDecodingMode.REGEX or mode == GuidedDecodingMode.CHOICE:
+        return get_regex_guide_spec(guide, tokenizer)
+    # The CFG guides are not in the registry.
+    return None
+
+
 def _get_logits_processor(
     guide: str, tokenizer: PreTrainedTokenizerBase, mode: GuidedDecodingMode,
     whitespace_pattern: Union[str, None]
@@ -14,68 +14,235 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import copy
+import hashlib
 import json
-import math
-from collections import defaultdict
-from functools import lru_cache
-from typing import Callable, DefaultDict, Dict, List, Union
+from functools import lru_cache, partial
+from importlib.metadata import version
+from typing import (Callable, Dict, Hashable, List, Optional, Sequence, Tuple,
+                    Union)
 
-import torch
 from outlines.fsm.guide import CFGGuide, Generate, Guide, RegexGuide, Write
 from outlines.fsm.json_schema import build_regex_from_schema
 from pydantic import BaseModel
 from transformers import PreTrainedTokenizerBase
 
+import vllm.envs as envs
+from vllm.model_executor.guided_decoding.guide_registry import (
+    get_guide_registry)
+from vllm.model_executor.layers.logits_processor import pack_token_bitmask
+from vllm.sampling_params import BatchedLogitsProcessor
+from vllm.utils import LRUCache
 
-class BaseLogitsProcessor:
 
-    def __init__(self, guide: Guide):
+def _get_allowed_tokens(guide: Guide, state: int) -> List[int]:
+    """Get the tokens the guide allows in the FSM state."""
+    instruction = guide.get_next_instruction(state=state)
+
+    if type(instruction) == Generate:
+        return instruction.tokens
+    elif type(instruction) == Write:
+        # The tokens are written one at a time. The engine can append all
+        # of them at once, see `BaseLogitsProcessor.get_forced_token_ids`.
+        return [instruction.tokens[0]]
+    else:
+        raise TypeError(f"Unsupported instruction type {type(instruction)}")
+
+
+class TokenBitmaskCache:
+    """An LRU cache of the allowed-token bitmasks of the FSM states of the
+    guides, shared by all the logits processors, so that the requests with
+    the same guide pack the bitmask of a state once.
+
+    The bitmasks are keyed by the id of the guide in the guide registry, so
+    that the cache does not keep the evicted guides alive. The bitmasks of
+    the guides removed from the registry are dropped at the next miss, in
+    the thread using the cache.
+
+    Counts the lookups that hit and missed the cache.
+    """
+
+    def __init__(self, capacity: int):
+        self._cache: LRUCache[bytes] = LRUCache(capacity)
+        # The ids of the guides removed from the registry since the last
+        # miss. Appended from the threads adding guides to the registry.
+        self._removed_guide_ids: List[int] = []
+        self.num_hits = 0
+        self.num_misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        num_lookups = self.num_hits + self.num_misses
+        return self.num_hits / num_lookups if num_lookups else 0.0
+
+    def get_bitmask(self, guide_id: int, guide: Guide, state: int,
+                    vocab_size: int) -> bytes:
+        key = (guide_id, state, vocab_size)
+        bitmask = self._cache.get(key)
+        if bitmask is not None:
+            self.num_hits += 1
+            return bitmask
+        self.num_misses += 1
+        if self._removed_guide_ids:
+            self._drop_removed_guides()
+        bitmask = pack_token_bitmask(_get_allowed_tokens(guide, state),
+                                     vocab_size)
+        self._cache.put(key, bitmask)
+        return bitmask
+
+    def remove_guide(self, guide_id: int) -> None:
+        """Drop the bitmasks of the guide, which was removed from the guide
+        registry."""
+        self._removed_guide_ids.append(guide_id)
+
+    def _drop_removed_guides(self) -> None:
+        # Only the ids read here are dropped from the list, as more may be
+        # appended meanwhile.
+        num_removed = len(self._removed_guide_ids)
+        removed_guide_ids = set(self._removed_guide_ids[:num_removed])
+        del self._removed_guide_ids[:num_removed]
+        for key in [
+                key for key in self._cache.cache if key[0] in removed_guide_ids
+        ]:
+            self._cache.pop(key)
+
+
+_token_bitmask_cache = TokenBitmaskCache(
+    envs.VLLM_GUIDED_DECODING_MASK_CACHE_SIZE)
+get_guide_registry().add_removal_callback(_token_bitmask_cache.remove_guide)
+
+
+def get_token_bitmask_cache() -> TokenBitmaskCache:
+    return _token_bitmask_cache
+
+
+class BaseLogitsProcessor(BatchedLogitsProcessor):
+
+    def __init__(self, guide: Guide, guide_id: Optional[int] = None):
+        """The bitmasks of the states are cached if the guide has an id in
+        the guide registry."""
         self._guide: Guide = guide
-        self._fsm_state: DefaultDict[int, int] = defaultdict(int)
-
-    def __call__(self, input_ids: List[int],
-                 scores: torch.Tensor) -> torch.Tensor:
-        """Use the FSM to bias the logits before sampling the next token."""
-        seq_id = hash(tuple(input_ids))
-
-        if len(input_ids) > 0:
-            last_token = input_ids[-1]
-            last_seq_id = hash(tuple(input_ids[:-1]))
-            self._fsm_state[seq_id] = self._guide.get_next_state(
-                state=self._fsm_state[last_seq_id], token_id=last_token)
-
-        instruction = self._guide.get_next_instruction(
-            state=self._fsm_state[seq_id])
-
-        if type(instruction) == Generate:
-            allowed_tokens = instruction.tokens
-        elif type(instruction) == Write:
-            # TODO: support fast forward tokens
-            allowed_tokens = [instruction.tokens[0]]
-        else:
-            raise TypeError(
-                f"Unsupported instruction type {type(instruction)}")
-
-        mask = torch.full((scores.shape[-1], ),
-                          -math.inf,
-                          device=scores.device)
-        mask[allowed_tokens] = 0
-        scores.add_(mask)
-        return scores
+        self._guide_id = guide_id
+        # seq_id -> (the number of output tokens the FSM has consumed, the
+        # FSM state).
+        self._fsm_states: Dict[int, Tuple[int, int]] = {}
+
+    def get_allowed_token_bitmasks(self, seq_ids: List[int],
+                                   output_token_ids: List[Sequence[int]],
+                                   vocab_size: int) -> Optional[List[bytes]]:
+        """Use the FSM to get the tokens each sequence can sample next."""
+        return [
+            self._get_bitmask(self._get_fsm_state(seq_id, token_ids),
+                              vocab_size)
+            for seq_id, token_ids in zip(seq_ids, output_token_ids)
+        ]
+
+    def _get_fsm_state(self, seq_id: int, token_ids: Sequence[int]) -> int:
+        """Advance the FSM of the sequence with the tokens it has not
+        consumed, usually the last one, and get its state."""
+        num_consumed, state = self._fsm_states.get(seq_id, (0, 0))
+        if num_consumed > len(token_ids):
+            # The output was rolled back, start over.
+            num_consumed, state = 0, 0
+        for token_id in token_ids[num_consumed:]:
+            state = self._guide.get_next_state(state=state, token_id=token_id)
+        self._fsm_states[seq_id] = (len(token_ids), state)
+        return state
+
+    def get_forced_token_ids(self, seq_id: int,
+                             output_token_ids: Sequence[int],
+                             max_num_tokens: int) -> List[int]:
+        """Follow the FSM from the state of the sequence while a single
+        token is allowed, e.g. the literal keys of a JSON schema. The EOS
+        token is not forced, so that it is sampled and stops the sequence
+        as usual."""
+        state = self._get_fsm_state(seq_id, output_token_ids)
+        forced_token_ids: List[int] = []
+        while len(forced_token_ids) < max_num_tokens:
+            allowed_tokens = _get_allowed_tokens(self._guide, state)
+            if (len(allowed_tokens) != 1
+                    or allowed_tokens[0] == self._guide.eos_token_id):
+                break
+            forced_token_ids.append(allowed_tokens[0])
+            state = self._guide.get_next_state(state=state,
+                                               token_id=allowed_tokens[0])
+        return forced_token_ids
+
+    def _get_bitmask(self, state: int, vocab_size: int) -> bytes:
+        if self._guide_id is None:
+            return pack_token_bitmask(_get_allowed_tokens(self._guide, state),
+                                      vocab_size)
+        return _token_bitmask_cache.get_bitmask(self._guide_id, self._guide,
+                                                state, vocab_size)
+
+
+# The compiled guides are only loaded by the version of outlines that
+# compiled them.
+_OUTLINES_VERSION = version("outlines")
+
+# The registry key and the builder of a guide.
+GuideSpec = Tuple[Hashable, Callable[[], Guide]]
+
+
+def get_regex_guide_spec(regex_string: str,
+                         tokenizer: PreTrainedTokenizerBase) -> GuideSpec:
+    """Get the registry key and the builder of the guide of a regex."""
+    key = ("regex", _OUTLINES_VERSION, regex_string,
+           _get_tokenizer_fingerprint(tokenizer))
+    return key, partial(_build_regex_guide, regex_string, tokenizer)
+
+
+def get_json_guide_spec(schema: Union[str, Dict, BaseModel],
+                        tokenizer: PreTrainedTokenizerBase,
+                        whitespace_pattern: Union[str, None]) -> GuideSpec:
+    """Get the registry key and the builder of the guide of a JSON schema.
+
+    The schemas that differ only in their formatting share the key. The
+    order of the properties is kept, since it is the order of the fields
+    of the output.
+    """
+    if isinstance(schema, type(BaseModel)):
+        schema = schema.model_json_schema()
+    elif isinstance(schema, str):
+        schema = json.loads(schema)
+    elif not isinstance(schema, Dict):
+        raise ValueError(
+            f"Cannot parse schema {schema}. The schema must be either "
+            f"a Pydantic object, a dictionary or a string that contains "
+            f"the JSON Schema specification")
+    schema_str = json.dumps(schema, separators=(",", ":"))
+    key = ("json", _OUTLINES_VERSION, schema_str, whitespace_pattern,
+           _get_tokenizer_fingerprint(tokenizer))
+    return key, partial(_build_json_guide, schema_str, whitespace_pattern,
+                        tokenizer)
 
 
-class RegexLogitsProcessor(BaseLogitsProcessor):
+def _get_registry_guide(guide_spec: GuideSpec) -> Tuple[Guide, Optional[int]]:
+    """Get the guide of the spec from the guide registry, and its id. The id
+    is None if the guide was already evicted again."""
+    registry = get_guide_registry()
+    guide = registry.get_guide(*guide_spec)
+    return guide, registry.get_guide_id(guide_spec[0])
 
-    @classmethod
-    @lru_cache(maxsize=32)
-    def _get_guide(cls, regex_string: str,
-                   tokenizer: PreTrainedTokenizerBase) -> Guide:
-        tokenizer = _adapt_tokenizer(tokenizer)
-        return RegexGuide(regex_string, tokenizer)
+
+def _build_regex_guide(regex_string: str,
+                       tokenizer: PreTrainedTokenizerBase) -> Guide:
+    return RegexGuide(regex_string, _adapt_tokenizer(tokenizer))
+
+
+def _build_json_guide(schema_str: str, whitespace_pattern: Union[str, None],
+                      tokenizer: PreTrainedTokenizerBase) -> Guide:
+    regex_string = build_regex_from_schema(schema_str, whitespace_pattern)
+    return _build_regex_guide(regex_string, tokenizer)
+
+
+class RegexLogitsProcessor(BaseLogitsProcessor):
 
     def __init__(self, regex_string: str, tokenizer: PreTrainedTokenizerBase):
         """Compile the FSM that drives the regex-structured generation.
 
+        The guide is shared through the guide registry with the other
+        processors of the regex.
+
         Parameters
         ----------
         regex_string
@@ -84,17 +251,20 @@ class RegexLogitsProcessor(BaseLogitsProcessor):
             The model's tokenizer
 
         """
-        super().__init__(
-            RegexLogitsProcessor._get_guide(regex_string, tokenizer))
+        super().__init__(*_get_registry_guide(
+            get_regex_guide_spec(regex_string, tokenizer)))
 
 
-class JSONLogitsProcessor(RegexLogitsProcessor):
+class JSONLogitsProcessor(BaseLogitsProcessor):
 
     def __init__(self, schema: Union[str, Dict, BaseModel],
                  tokenizer: PreTrainedTokenizerBase,
                  whitespace_pattern: Union[str, None]):
         """Compile the FSM that drives the JSON-guided generation.
 
+        The guide is shared through the guide registry with the other
+        processors of the schema.
+
         Parameters
         ----------
         schema
@@ -108,19 +278,8 @@ class JSONLogitsProcessor(RegexLogitsProcessor):
             Example: allow only a single space or newline with
             `whitespace_pattern=r"[\n ]?"`
         """
-        if isinstance(schema, type(BaseModel)):
-            schema_str = json.dumps(schema.model_json_schema())
-        elif isinstance(schema, Dict):
-            schema_str = json.dumps(schema)
-        elif isinstance(schema, str):
-            schema_str = schema
-        else:
-            raise ValueError(
-                f"Cannot parse schema {schema}. The schema must be either "
-                f"a Pydantic object, a dictionary or a string that contains "
-                f"the JSON Schema specification")
-        regex_string = build_regex_from_schema(schema_str, whitespace_pattern)
-        super().__init__(regex_string, tokenizer)
+        super().__init__(*_get_registry_guide(
+            get_json_guide_spec(schema, tokenizer, whitespace_pattern)))
 
 
 class CFGLogitsProcessor(BaseLogitsProcessor):
@@ -142,9 +301,32 @@ class CFGLogitsProcessor(BaseLogitsProcessor):
             The model's tokenizer
 
         """
+        # The state of a CFG guide is not only its FSM state, so the guide
+        # has no id and its bitmasks are not cached.
         super().__init__(CFGLogitsProcessor._get_guide(cfg, tokenizer))
         self._guide = self._guide.copy()
 
+    def get_forced_token_ids(self, seq_id: int,
+                             output_token_ids: Sequence[int],
+                             max_num_tokens: int) -> List[int]:
+        # Advancing a CFG guide changes its parser state, so it cannot look
+        # ahead of the sequence.
+        return []
+
+
+@lru_cache(maxsize=32)
+def _get_tokenizer_fingerprint(tokenizer: PreTrainedTokenizerBase) -> str:
+    """Get a digest of the vocabulary and the special tokens of the
+    tokenizer, which identifies it in the keys of the guides across
+    processes."""
+    fingerprint = json.dumps([
+        type(tokenizer).__name__,
+        sorted(tokenizer.get_vocab().items()),
+        sorted(tokenizer.all_special_tokens),
+        tokenizer.eos_token_id,
+    ])
+    return hashlib.sha256(fingerprint.encode()).hexdigest()
+
 
 @lru_cache(maxsize=32)
 def _adapt_tokenizer(tokenizer: PreTrainedTokenizerBase):
@@ -1,12 +1,17 @@
 """A layer that compute logits from hidden_stats."""
 import inspect
-from typing import Optional
+from typing import Dict, Iterable, List, Optional, Tuple
 
 import torch
 import torch.nn as nn
 
 from vllm.distributed import tensor_model_parallel_gather
-from vllm.model_executor.sampling_metadata import SamplingMetadata
+from vllm.model_executor.sampling_metadata import (SamplingMetadata,
+                                                   SequenceGroupToSample)
+from vllm.sampling_params import BatchedLogitsProcessor
+from vllm.sampling_params import LogitsProcessor as LogitsProcessorFn
+from vllm.sequence import SequenceData
+from vllm.utils import async_tensor_h2d, is_pin_memory_available
 
 
 class LogitsProcessor(nn.Module):
@@ -87,36 +92,202 @@ def _prune_hidden_states(
                                       sampling_metadata.selected_token_indices)
 
 
+def pack_token_bitmask(token_ids: Iterable[int], vocab_size: int) -> bytes:
+    """Pack the token ids into a bitmask of ceil(vocab_size / 8) bytes, in
+    which bit j of byte i is set if token 8 * i + j is in token_ids. Token
+    ids out of the vocabulary are left out."""
+    bitmask = bytearray((vocab_size + 7) // 8)
+    for token_id in token_ids:
+        if token_id < vocab_size:
+            bitmask[token_id >> 3] |= 1 << (token_id & 7)
+    return bytes(bitmask)
+
+
+def _apply_token_bitmasks(logits: torch.Tensor, logits_row_idxs: List[int],
+                          bitmasks: List[bytes]) -> None:
+    """Set the logits of the tokens that the bitmasks do not allow to -inf,
+    in the given rows, with a single masked fill."""
+    num_rows = len(logits_row_idxs)
+    vocab_size = logits.shape[-1]
+    pin_memory = is_pin_memory_available()
+    packed = torch.frombuffer(bytearray(b"".join(bitmasks)), dtype=torch.uint8)
+    if pin_memory:
+        packed = packed.pin_memory()
+    packed = packed.to(device=logits.device,
+                       non_blocking=True).view(num_rows, -1)
+    # Unpack the bits, the lowest first.
+    shifts = torch.arange(8, dtype=torch.uint8, device=logits.device)
+    allowed = ((packed.unsqueeze(-1) >> shifts) & 1).view(
+        num_rows, -1)[:, :vocab_size].bool()
+    rows = async_tensor_h2d(logits_row_idxs, torch.long, logits.device,
+                            pin_memory)
+    logits[rows] = logits[rows].masked_fill_(~allowed, -float("inf"))
+
+
+def _apply_row_logits_processors(
+        logits: torch.Tensor, seq_group: SequenceGroupToSample,
+        logits_processors: List[LogitsProcessorFn]) -> None:
+    """Apply the logits processors to the rows of the sequence group, one
+    row at a time."""
+    for seq_id, logits_row_idx in zip(seq_group.seq_ids,
+                                      seq_group.sample_indices):
+        logits_row = logits[logits_row_idx]
+        # The logits processors take lists of token ids.
+        seq_data = seq_group.seq_data[seq_id]
+        past_tokens_ids = seq_data.output_token_ids.tolist()
+        prompt_tokens_ids = seq_data.prompt_token_ids.tolist()
+
+        for logits_processor in logits_processors:
+            parameters = inspect.signature(logits_processor).parameters
+            if len(parameters) == 3:
+                logits_row = logits_processor(prompt_tokens_ids,
+                                              past_tokens_ids, logits_row)
+            else:
+                logits_row = logits_processor(past_tokens_ids, logits_row)
+
+        logits[logits_row_idx] = logits_row
+
+
+def _is_batchable(logits_processors: List[LogitsProcessorFn]) -> bool:
+    """Returns True if no function comes after a batched logits processor in
+    the list, so that the batched processors can be applied after the
+    functions of all the sequence groups without changing their order."""
+    found_batched = False
+    for logits_processor in logits_processors:
+        if isinstance(logits_processor, BatchedLogitsProcessor):
+            found_batched = True
+        elif found_batched:
+            return False
+    return True
+
+
+def _add_batched_rows(
+    batched_logits_processors: Dict[int,
+                                    Tuple[BatchedLogitsProcessor, List[int],
+                                          List[int], List[SequenceData]]],
+    logits_processor: BatchedLogitsProcessor,
+    seq_group: SequenceGroupToSample,
+) -> None:
+    _, batch_seq_ids, batch_row_idxs, batch_seq_data = (
+        batched_logits_processors.setdefault(id(logits_processor),
+                                             (logits_processor, [], [], [])))
+    for seq_id, logits_row_idx in zip(seq_group.seq_ids,
+                                      seq_group.sample_indices):
+        batch_seq_ids.append(seq_id)
+        batch_row_idxs.append(logits_row_idx)
+        batch_seq_data.append(seq_group.seq_data[seq_id])
+
+
+def _apply_batched_logits_processors(
+    logits: torch.Tensor,
+    batched_logits_processors: Iterable[Tuple[BatchedLogitsProcessor,
+                                              List[int], List[int],
+                                              List[SequenceData]]],
+) -> None:
+    """Apply the batched logits processors to their rows. The bitmasks of
+    the processors that restrict the tokens are applied at once, after the
+    other processors."""
+    bitmask_row_idxs: List[int] = []
+    bitmasks: List[bytes] = []
+    # logits row -> the index of its bitmask.
+    bitmask_idxs: Dict[int, int] = {}
+    for (logits_processor, seq_ids, logits_row_idxs,
+         seq_data_list) in batched_logits_processors:
+        if not logits_row_idxs:
+            continue
+        output_token_ids = [
+            seq_data.output_token_ids for seq_data in seq_data_list
+        ]
+        processor_bitmasks = logits_processor.get_allowed_token_bitmasks(
+            seq_ids, output_token_ids, logits.shape[-1])
+        if processor_bitmasks is not None:
+            for logits_row_idx, bitmask in zip(logits_row_idxs,
+                                               processor_bitmasks):
+                i = bitmask_idxs.get(logits_row_idx)
+                if i is None:
+                    bitmask_idxs[logits_row_idx] = len(bitmasks)
+                    bitmask_row_idxs.append(logits_row_idx)
+                    bitmasks.append(bitmask)
+                else:
+                    # Another processor of the sequence restricts the
+                    # tokens too, allow the tokens both allow.
+                    bitmasks[i] = (
+                        int.from_bytes(bitmasks[i], "little")
+                        & int.from_bytes(bitmask, "little")).to_bytes(
+                            len(bitmask), "little")
+            continue
+        prompt_token_ids = [
+            seq_data.prompt_token_ids for seq_data in seq_data_list
+        ]
+        rows = torch.tensor(logits_row_idxs, device=logits.device)
+        logits[rows] = logits_processor(seq_ids, prompt_token_ids,
+                                        output_token_ids, logits[rows])
+    if bitmasks:
+        _apply_token_bitmasks(logits, bitmask_row_idxs, bitmasks)
+
+
+def _apply_ordered_logits_processors(
+        logits: torch.Tensor, seq_group: SequenceGroupToSample,
+        logits_processors: List[LogitsProcessorFn]) -> None:
+    """Apply the logits processors to the rows of the sequence group in the
+    order of the list. The batched processors are only called with the
+    sequences of this group."""
+    i = 0
+    while i < len(logits_processors):
+        is_batched = isinstance(logits_processors[i], BatchedLogitsProcessor)
+        j = i + 1
+        while j < len(logits_processors) and isinstance(
+                logits_processors[j], BatchedLogitsProcessor) == is_batched:
+            j += 1
+        if is_batched:
+            batched_logits_processors: Dict[int,
+                                            Tuple[BatchedLogitsProcessor,
+                                                  List[int], List[int],
+                                                  List[SequenceData]]] = {}
+            for logits_processor in logits_processors[i:j]:
+                assert isinstance(logits_processor, BatchedLogitsProcessor)
+                _add_batched_rows(batched_logits_processors, logits_processor,
+                                  seq_group)
+            _apply_batched_logits_processors(
+                logits, batched_logits_processors.values())
+        else:
+            _apply_row_logits_processors(logits, seq_group,
+                                         logits_processors[i:j])
+        i = j
+
+
 def _apply_logits_processors(
     logits: torch.Tensor,
     sampling_metadata: SamplingMetadata,
 ) -> torch.Tensor:
     found_logits_processors = False
     logits_processed = 0
+    # The batched logits processors, with the ids, the logits rows and the
+    # data of their sequences.
+    batched_logits_processors: Dict[int,
+                                    Tuple[BatchedLogitsProcessor, List[int],
+                                          List[int], List[SequenceData]]] = {}
     for seq_group in sampling_metadata.seq_groups:
-        seq_ids = seq_group.seq_ids
         sampling_params = seq_group.sampling_params
         logits_processors = sampling_params.logits_processors
         if logits_processors:
             found_logits_processors = True
 
-            for seq_id, logits_row_idx in zip(seq_ids,
-                                              seq_group.sample_indices):
-                logits_row = logits[logits_row_idx]
-                past_tokens_ids = seq_group.seq_data[seq_id].output_token_ids
-                prompt_tokens_ids = seq_group.seq_data[seq_id].prompt_token_ids
-
+            if not _is_batchable(logits_processors):
+                _apply_ordered_logits_processors(logits, seq_group,
+                                                 logits_processors)
+            else:
+                row_logits_processors: List[LogitsProcessorFn] = []
                 for logits_processor in logits_processors:
-                    parameters = inspect.signature(logits_processor).parameters
-                    if len(parameters) == 3:
-                        logits_row = logits_processor(prompt_tokens_ids,
-                                                      past_tokens_ids,
-                                                      logits_row)
+                    if isinstance(logits_processor, BatchedLogitsProcessor):
+                        _add_batched_rows(batched_logits_processors,
+                                          logits_processor, seq_group)
                     else:
-                        logits_row = logits_processor(past_tokens_ids,
-                                                      logits_row)
+                        row_logits_processors.append(logits_processor)
 
-                logits[logits_row_idx] = logits_row
+                if row_logits_processors:
+                    _apply_row_logits_processors(logits, seq_group,
+                                                 row_logits_processors)
 
         logits_processed += len(seq_group.sample_indices) + len(
             seq_group.prompt_logprob_indices)
@@ -124,4 +295,7 @@ def _apply_logits_processors(
     if found_logits_processors:
         # verifies that no rows in logits were missed unexpectedly
         assert logits_processed == logits.shape[0]
+
+    _apply_batched_logits_processors(logits,
+                                     batched_logits_processors.values())
     return logits
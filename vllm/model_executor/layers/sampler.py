@@ -6,7 +6,8 @@ import torch
 import torch.nn as nn
 
 from vllm.model_executor.layers.ops.sample import sample as sample_triton
-from vllm.model_executor.sampling_metadata import (SamplingMetadata,
+from vllm.model_executor.sampling_metadata import (PersistentSamplingState,
+                                                   SamplingMetadata,
                                                    SamplingTensors,
                                                    SequenceGroupToSample)
 from vllm.sampling_params import SamplingType
@@ -47,6 +48,13 @@ class Sampler(nn.Module):
         # speculative decoding.
         self.include_gpu_probs_tensor = False
 
+        # The largest number of sequences in a step, which bounds the rows of
+        # the sampling state. Set by the model runner.
+        self.max_num_seqs: Optional[int] = None
+
+        # The sampling tensors kept on the device across the steps.
+        self._sampling_state: Optional[PersistentSamplingState] = None
+
     def forward(
         self,
         logits: torch.Tensor,
@@ -64,20 +72,28 @@ class Sampler(nn.Module):
 
         # Prepare sampling tensors with pinned memory to avoid blocking.
         (sampling_tensors, do_penalties, do_top_p_top_k,
-         do_min_p) = SamplingTensors.from_sampling_metadata(
-             sampling_metadata, vocab_size, logits.device, logits.dtype)
+         do_min_p) = self._get_sampling_tensors(logits, sampling_metadata)
 
         # Apply presence and frequency penalties.
         if do_penalties:
-            logits = _apply_penalties(logits, sampling_tensors.prompt_tokens,
-                                      sampling_tensors.output_tokens,
+            prompt_mask = sampling_tensors.prompt_mask
+            output_bin_counts = sampling_tensors.output_bin_counts
+            if prompt_mask is None or output_bin_counts is None:
+                assert sampling_tensors.prompt_tokens is not None
+                assert sampling_tensors.output_tokens is not None
+                num_seqs = logits.shape[0]
+                _, prompt_mask = _get_bin_counts_and_mask(
+                    sampling_tensors.prompt_tokens, vocab_size, num_seqs)
+                output_bin_counts, _ = _get_bin_counts_and_mask(
+                    sampling_tensors.output_tokens, vocab_size, num_seqs)
+            logits = _apply_penalties(logits, prompt_mask, output_bin_counts,
                                       sampling_tensors.presence_penalties,
                                       sampling_tensors.frequency_penalties,
                                       sampling_tensors.repetition_penalties)
 
         # Apply temperature scaling.
         # Use in-place division to avoid creating a new tensor.
-        logits.div_(sampling_tensors.temperatures.unsqueeze_(dim=1))
+        logits.div_(sampling_tensors.temperatures.unsqueeze(dim=1))
 
         if do_top_p_top_k:
             logits = _apply_top_k_top_p(logits, sampling_tensors.top_ps,
@@ -117,6 +133,35 @@ class Sampler(nn.Module):
                                      sample_logprobs,
                                      on_device_tensors=on_device_tensors)
 
+    def _get_sampling_tensors(
+        self, logits: torch.Tensor, sampling_metadata: SamplingMetadata
+    ) -> Tuple[SamplingTensors, bool, bool, bool]:
+        """Get the sampling tensors of the step from the persistent sampling
+        state, or build them from the sampling metadata when the state does
+        not handle the step.
+
+        Speculative decoding rolls the sequences back, which the state does
+        not support, so its samplers always build the tensors.
+        """
+        _, vocab_size = logits.shape
+        if not self.include_gpu_probs_tensor:
+            if (self._sampling_state is None
+                    or not self._sampling_state.matches(
+                        vocab_size, logits.device, logits.dtype)):
+                self._sampling_state = PersistentSamplingState(
+                    vocab_size,
+                    logits.device,
+                    logits.dtype,
+                    max_num_seqs=self.max_num_seqs)
+            sampling_result = self._sampling_state.get_sampling_tensors(
+                sampling_metadata)
+            if sampling_result is not None:
+                return sampling_result
+        return SamplingTensors.from_sampling_metadata(sampling_metadata,
+                                                      vocab_size,
+                                                      logits.device,
+                                                      logits.dtype)
+
     @property
     def _should_modify_greedy_probs_inplace(self) -> bool:
         """Whether or not the sampler should modify the probability distribution
@@ -197,16 +242,13 @@ def _apply_min_tokens_penalty(
     return logits
 
 
-def _apply_penalties(logits: torch.Tensor, prompt_tokens_tensor: torch.Tensor,
-                     output_tokens_tensor: torch.Tensor,
+def _apply_penalties(logits: torch.Tensor, prompt_mask: torch.Tensor,
+                     output_bin_counts: torch.Tensor,
                      presence_penalties: torch.Tensor,
                      frequency_penalties: torch.Tensor,
                      repetition_penalties: torch.Tensor) -> torch.Tensor:
-    num_seqs, vocab_size = logits.shape
-    _, prompt_mask = _get_bin_counts_and_mask(prompt_tokens_tensor, vocab_size,
-                                              num_seqs)
-    output_bin_counts, output_mask = _get_bin_counts_and_mask(
-        output_tokens_tensor, vocab_size, num_seqs)
+    _, vocab_size = logits.shape
+    output_mask = output_bin_counts > 0
 
     repetition_penalties = repetition_penalties[:, None].repeat(1, vocab_size)
     repetition_penalties[~(prompt_mask | output_mask)] = 1.0
@@ -215,8 +257,8 @@ def _apply_penalties(logits: torch.Tensor, prompt_tokens_tensor: torch.Tensor,
 
     # We follow the definition in OpenAI API.
     # Refer to https://platform.openai.com/docs/api-reference/parameter-details
-    logits -= frequency_penalties.unsqueeze_(dim=1) * output_bin_counts
-    logits -= presence_penalties.unsqueeze_(dim=1) * output_mask
+    logits -= frequency_penalties.unsqueeze(dim=1) * output_bin_counts
+    logits -= presence_penalties.unsqueeze(dim=1) * output_mask
     return logits
 
 
@@ -262,7 +304,7 @@ def _apply_min_p(
     """
     probs = torch.softmax(logits, dim=-1)
     top_probs, _ = probs.max(dim=-1, keepdim=True)
-    scaled_min_p = min_p.unsqueeze_(dim=1) * top_probs
+    scaled_min_p = min_p.unsqueeze(dim=1) * top_probs
     tokens_to_remove = probs < scaled_min_p
     logits = logits.masked_fill_(tokens_to_remove, -float("inf"))
 
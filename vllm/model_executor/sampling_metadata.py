@@ -1,12 +1,14 @@
 import random
+from array import array
 from dataclasses import dataclass
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, OrderedDict, Set, Tuple
 
 import torch
 
 from vllm.model_executor.layers.ops.sample import get_num_triton_sampler_splits
 from vllm.sampling_params import SamplingParams, SamplingType
-from vllm.sequence import SequenceData, SequenceGroupMetadata
+from vllm.sequence import (TOKEN_ID_TYPECODE, SequenceData,
+                           SequenceGroupMetadata)
 from vllm.utils import (async_tensor_h2d, is_pin_memory_available,
                         maybe_expand_dim)
 
@@ -205,7 +207,13 @@ def _prepare_seq_groups(
         do_sample = seq_group_metadata.do_sample
 
         if seq_group_metadata.is_prompt:
-            if sampling_params.seed is not None:
+            # The sequences prefilled again for the tokens forced by guided
+            # decoding keep their generator. The others, e.g. recomputed
+            # after a preemption, are reseeded.
+            is_fast_forwarded = (
+                seq_group_metadata.state.generator is not None
+                and seq_group_metadata.seq_data[seq_ids[0]].is_fast_forwarded)
+            if sampling_params.seed is not None and not is_fast_forwarded:
                 seq_group_metadata.state.generator = torch.Generator(
                     device=device).manual_seed(sampling_params.seed)
 
@@ -300,8 +308,12 @@ class SamplingTensors:
     sampling_seeds: torch.Tensor
     sample_indices: torch.Tensor
     extra_seeds: Optional[torch.Tensor]
-    prompt_tokens: torch.Tensor
-    output_tokens: torch.Tensor
+    # The padded token ids of the prompts and outputs, or None if the masks
+    # of the prompt tokens and the counts of the output tokens are given.
+    prompt_tokens: Optional[torch.Tensor]
+    output_tokens: Optional[torch.Tensor]
+    prompt_mask: Optional[torch.Tensor] = None
+    output_bin_counts: Optional[torch.Tensor] = None
 
     @classmethod
     def from_sampling_metadata(
@@ -343,33 +355,19 @@ class SamplingTensors:
         for seq_group in sampling_metadata.seq_groups:
             seq_ids = seq_group.seq_ids
             sampling_params = seq_group.sampling_params
-            temperature = sampling_params.temperature
             p = sampling_params.presence_penalty
             f = sampling_params.frequency_penalty
             r = sampling_params.repetition_penalty
-            top_p = sampling_params.top_p
-            min_p = sampling_params.min_p
             seed = sampling_params.seed
 
             is_greedy = sampling_params.sampling_type == SamplingType.GREEDY
 
-            # k should not be greater than the vocab size.
-            top_k = min(sampling_params.top_k, vocab_size)
-            top_k = vocab_size if top_k == -1 else top_k
-            if temperature < _SAMPLING_EPS:
-                # NOTE: Zero temperature means deterministic sampling
-                # (i.e., greedy sampling or beam search).
-                # Set the temperature to 1 to avoid division by zero.
-                temperature = 1.0
-            if not do_top_p_top_k and (top_p < 1.0 - _SAMPLING_EPS
-                                       or top_k != vocab_size):
-                do_top_p_top_k = True
-            if not do_min_p and min_p > _SAMPLING_EPS:
-                do_min_p = True
-            if not do_penalties and (abs(p) >= _SAMPLING_EPS
-                                     or abs(f) >= _SAMPLING_EPS
-                                     or abs(r - 1.0) >= _SAMPLING_EPS):
-                do_penalties = True
+            (temperature, top_p, top_k, min_p, group_do_penalties,
+             group_do_top_p_top_k, group_do_min_p) = cls._get_sampling_values(
+                 sampling_params, vocab_size)
+            do_penalties = do_penalties or group_do_penalties
+            do_top_p_top_k = do_top_p_top_k or group_do_top_p_top_k
+            do_min_p = do_min_p or group_do_min_p
 
             is_prompt = seq_group.is_prompt
             if (seq_group.is_prompt
@@ -394,8 +392,8 @@ class SamplingTensors:
                 assert sample_lens == len(seq_ids)
                 for seq_id in seq_ids:
                     seq_data = seq_group.seq_data[seq_id]
-                    prompt_tokens.append(seq_data.prompt_token_ids)
-                    output_tokens.append(seq_data.output_token_ids)
+                    prompt_tokens.append(seq_data.prompt_token_ids.tolist())
+                    output_tokens.append(seq_data.output_token_ids.tolist())
                 temperatures += [temperature] * len(seq_ids)
                 top_ps += [top_p] * len(seq_ids)
                 top_ks += [top_k] * len(seq_ids)
@@ -557,6 +555,34 @@ class SamplingTensors:
             extra_seeds=extra_seeds_gpu,
         )
 
+    @staticmethod
+    def _get_sampling_values(
+            sampling_params: SamplingParams, vocab_size: int
+    ) -> Tuple[float, float, int, float, bool, bool, bool]:
+        """Get the temperature, top-p, top-k and min-p to sample with, and
+        whether the penalties, top-p/top-k and min-p are to be applied."""
+        temperature = sampling_params.temperature
+        top_p = sampling_params.top_p
+        min_p = sampling_params.min_p
+        p = sampling_params.presence_penalty
+        f = sampling_params.frequency_penalty
+        r = sampling_params.repetition_penalty
+
+        # k should not be greater than the vocab size.
+        top_k = min(sampling_params.top_k, vocab_size)
+        top_k = vocab_size if top_k == -1 else top_k
+        if temperature < _SAMPLING_EPS:
+            # NOTE: Zero temperature means deterministic sampling
+            # (i.e., greedy sampling or beam search).
+            # Set the temperature to 1 to avoid division by zero.
+            temperature = 1.0
+        do_top_p_top_k = top_p < 1.0 - _SAMPLING_EPS or top_k != vocab_size
+        do_min_p = min_p > _SAMPLING_EPS
+        do_penalties = (abs(p) >= _SAMPLING_EPS or abs(f) >= _SAMPLING_EPS
+                        or abs(r - 1.0) >= _SAMPLING_EPS)
+        return (temperature, top_p, top_k, min_p, do_penalties, do_top_p_top_k,
+                do_min_p)
+
     @staticmethod
     def _get_sequence_seeds(
         seed: int,
@@ -586,3 +612,369 @@ class SamplingTensors:
             # For the kernel, seed == 0 means greedy decoding.
             seq_seeds = [0] * seeds_to_generate
         return seq_seeds
+
+
+class _RowTable:
+    """Maps the ids of sequences to the rows of persistent buffers.
+
+    When a sequence needs a row and none is free, the row of the least
+    recently used sequence is reused if that sequence is not in the current
+    step, else the number of rows doubles. The first `num_reserved` rows are
+    never given to a sequence. With `max_num_rows`, all the rows exist from
+    the start and their number never grows, so a step must not have more
+    than `max_num_rows - num_reserved` sequences.
+    """
+
+    def __init__(self,
+                 num_reserved: int = 0,
+                 max_num_rows: Optional[int] = None):
+        self.num_rows = num_reserved
+        self._num_reserved = num_reserved
+        self._max_num_rows = max_num_rows
+        # seq_id -> row, from the least to the most recently used.
+        self._rows: OrderedDict[int, int] = OrderedDict()
+        # seq_id -> the last step the sequence was in.
+        self._last_steps: Dict[int, int] = {}
+        self._free_rows: List[int] = []
+        if max_num_rows is not None:
+            self._add_rows(max_num_rows)
+
+    def get(self, seq_id: int, step: int) -> Optional[int]:
+        """Get the row of the sequence, if it has one, and mark it as used in
+        the step."""
+        row = self._rows.get(seq_id)
+        if row is not None:
+            self._rows.move_to_end(seq_id)
+            self._last_steps[seq_id] = step
+        return row
+
+    def allocate(self, seq_id: int, step: int) -> int:
+        """Give a row to the sequence, which has none, for the step."""
+        if not self._free_rows and self._rows:
+            lru_seq_id = next(iter(self._rows))
+            if self._last_steps[lru_seq_id] < step:
+                self._free_rows.append(self._rows.pop(lru_seq_id))
+                del self._last_steps[lru_seq_id]
+        if not self._free_rows:
+            assert self._max_num_rows is None, (
+                "More sequences in the step than rows")
+            self._add_rows(max(2 * self.num_rows, self._num_reserved + 16))
+        row = self._free_rows.pop()
+        self._rows[seq_id] = row
+        self._last_steps[seq_id] = step
+        return row
+
+    def _add_rows(self, num_rows: int) -> None:
+        self._free_rows.extend(reversed(range(self.num_rows, num_rows)))
+        self.num_rows = num_rows
+
+
+def _get_sampling_params_key(
+        sampling_params: SamplingParams) -> Tuple[float, ...]:
+    """The values of the sampling params the rows of the persistent sampling
+    state are written from. Rows are checked by value, as the sampling params
+    are new objects in every step when the metadata is sent to the workers."""
+    return (sampling_params.temperature, sampling_params.top_p,
+            sampling_params.top_k, sampling_params.min_p,
+            sampling_params.presence_penalty,
+            sampling_params.frequency_penalty,
+            sampling_params.repetition_penalty)
+
+
+def _grow(buffer: torch.Tensor, num_rows: int) -> torch.Tensor:
+    """Grow the buffer to num_rows rows, zero-filled."""
+    if buffer.shape[0] >= num_rows:
+        return buffer
+    grown = buffer.new_zeros((num_rows, ) + buffer.shape[1:])
+    grown[:buffer.shape[0]] = buffer
+    return grown
+
+
+class PersistentSamplingState:
+    """Sampling tensors kept on the device across the steps.
+
+    The sampling parameters of a sequence are written to a row of a device
+    buffer when the sequence is first sampled, and gathered by row in every
+    step. For the sequences with presence, frequency or repetition penalties,
+    the masks of the prompt tokens and the counts of the output tokens are
+    kept on the device too. They are built from all the tokens of a sequence
+    once, then only the tokens sampled since the previous step are added, so
+    the tokens of the sequences are not copied to the device in every step.
+
+    The output of a sequence must only grow between the steps, which holds
+    unless speculative decoding rolls it back. A sequence whose output
+    shrank, or whose prompt changed length, has its rows rebuilt.
+
+    With `max_num_seqs`, the buffers have rows for that many sequences from
+    the start and never grow. The state is created by the first step, the
+    profile run, so the KV cache is sized without their memory. Steps with
+    more sequences are not handled by the state.
+    """
+
+    def __init__(self,
+                 vocab_size: int,
+                 device: torch.device,
+                 dtype: torch.dtype,
+                 max_num_seqs: Optional[int] = None):
+        self.vocab_size = vocab_size
+        self.device = device
+        self.dtype = dtype
+        self.max_num_seqs = max_num_seqs
+        self._pin_memory = is_pin_memory_available()
+        self._step = 0
+
+        self._param_rows = _RowTable(max_num_rows=max_num_seqs)
+        # The values of the sampling params the rows were written from, and
+        # whether they need penalties, top-p/top-k and min-p.
+        self._row_keys: Dict[int, Tuple[float, ...]] = {}
+        self._row_flags: Dict[int, Tuple[bool, bool, bool]] = {}
+        # The temperature, top-p, min-p, and presence, frequency and
+        # repetition penalties of the rows.
+        num_param_rows = self._param_rows.num_rows
+        self._params = torch.zeros((num_param_rows, 6),
+                                   dtype=dtype,
+                                   device=device)
+        self._top_ks = torch.zeros((num_param_rows, ),
+                                   dtype=torch.int,
+                                   device=device)
+
+        # Row 0 holds no tokens, for the sequences without penalties.
+        self._penalty_rows = _RowTable(
+            num_reserved=1,
+            max_num_rows=None if max_num_seqs is None else max_num_seqs + 1)
+        self._prompt_lens: Dict[int, int] = {}
+        self._output_lens: Dict[int, int] = {}
+        num_penalty_rows = self._penalty_rows.num_rows
+        self._prompt_masks = torch.zeros((num_penalty_rows, vocab_size),
+                                         dtype=torch.bool,
+                                         device=device)
+        self._output_bin_counts = torch.zeros((num_penalty_rows, vocab_size),
+                                              dtype=torch.int,
+                                              device=device)
+
+    def matches(self, vocab_size: int, device: torch.device,
+                dtype: torch.dtype) -> bool:
+        return (self.vocab_size == vocab_size and self.device == device
+                and self.dtype == dtype)
+
+    def get_sampling_tensors(
+        self, sampling_metadata: "SamplingMetadata"
+    ) -> Optional[Tuple[SamplingTensors, bool, bool, bool]]:
+        """Update the state with the sequences of the step and get the
+        sampling tensors of the step, like
+        `SamplingTensors.from_sampling_metadata`.
+
+        Returns None, without updating the state, if the step has prompt
+        logprobs, a sequence in more than one group or more than
+        `max_num_seqs` sequences.
+        """
+        assert sampling_metadata.seq_groups is not None
+        seq_ids: Set[int] = set()
+        num_seqs = 0
+        for seq_group in sampling_metadata.seq_groups:
+            if seq_group.prompt_logprob_indices:
+                return None
+            seq_ids.update(seq_group.seq_ids)
+            num_seqs += len(seq_group.seq_ids)
+        if len(seq_ids) != num_seqs:
+            return None
+        if self.max_num_seqs is not None and num_seqs > self.max_num_seqs:
+            return None
+
+        self._step += 1
+        step = self._step
+        # We need one base seed per Triton slice.
+        seeds_to_generate = get_num_triton_sampler_splits(self.vocab_size)
+
+        rows: List[int] = []
+        penalty_rows: List[int] = []
+        sampling_seeds: List[List[int]] = []
+        sample_indices: List[int] = []
+        new_rows: List[int] = []
+        new_params: List[List[float]] = []
+        new_top_ks: List[int] = []
+        # The penalty rows to clear, and the (row, token ids) to add to them.
+        cleared_rows: List[int] = []
+        prompt_updates: List[Tuple[int, "array[int]"]] = []
+        output_updates: List[Tuple[int, "array[int]"]] = []
+        do_penalties = False
+        do_top_p_top_k = False
+        do_min_p = False
+
+        for seq_group in sampling_metadata.seq_groups:
+            sampling_params = seq_group.sampling_params
+            if seq_group.do_sample:
+                params_key = _get_sampling_params_key(sampling_params)
+                for seq_id in seq_group.seq_ids:
+                    row = self._param_rows.get(seq_id, step)
+                    if row is None:
+                        row = self._param_rows.allocate(seq_id, step)
+                        self._row_keys.pop(row, None)
+                    if self._row_keys.get(row) != params_key:
+                        (temperature, top_p, top_k, min_p, seq_do_penalties,
+                         seq_do_top_p_top_k,
+                         seq_do_min_p) = SamplingTensors._get_sampling_values(
+                             sampling_params, self.vocab_size)
+                        self._row_keys[row] = params_key
+                        self._row_flags[row] = (seq_do_penalties,
+                                                seq_do_top_p_top_k,
+                                                seq_do_min_p)
+                        new_rows.append(row)
+                        new_params.append([
+                            temperature, top_p, min_p,
+                            sampling_params.presence_penalty,
+                            sampling_params.frequency_penalty,
+                            sampling_params.repetition_penalty
+                        ])
+                        new_top_ks.append(top_k)
+                    (seq_do_penalties, seq_do_top_p_top_k,
+                     seq_do_min_p) = self._row_flags[row]
+                    do_penalties = do_penalties or seq_do_penalties
+                    do_top_p_top_k = do_top_p_top_k or seq_do_top_p_top_k
+                    do_min_p = do_min_p or seq_do_min_p
+
+                    rows.append(row)
+                    if seq_do_penalties:
+                        penalty_rows.append(
+                            self._get_penalty_row(seq_id,
+                                                  seq_group.seq_data[seq_id],
+                                                  step, cleared_rows,
+                                                  prompt_updates,
+                                                  output_updates))
+                    else:
+                        penalty_rows.append(0)
+
+            is_greedy = sampling_params.sampling_type == SamplingType.GREEDY
+            for seq_id in seq_group.seq_ids:
+                seq_data = seq_group.seq_data[seq_id]
+                sampling_seeds.append(
+                    SamplingTensors._get_sequence_seeds(
+                        sampling_params.seed,
+                        seq_data.get_len(),
+                        seq_id,
+                        seeds_to_generate=seeds_to_generate,
+                        is_greedy=is_greedy))
+            sample_indices.extend(seq_group.sample_indices)
+
+        if new_rows:
+            self._params = _grow(self._params, self._param_rows.num_rows)
+            self._top_ks = _grow(self._top_ks, self._param_rows.num_rows)
+            new_rows_t = self._to_device(new_rows)
+            self._params[new_rows_t] = async_tensor_h2d(
+                new_params, self.dtype, self.device, self._pin_memory)
+            self._top_ks[new_rows_t] = async_tensor_h2d(
+                new_top_ks, torch.int, self.device, self._pin_memory)
+        rows_t = self._to_device(rows)
+        (temperatures, top_ps, min_ps, presence_penalties, frequency_penalties,
+         repetition_penalties) = self._params.index_select(0, rows_t).unbind(1)
+        top_ks = self._top_ks.index_select(0, rows_t)
+
+        prompt_mask: Optional[torch.Tensor] = None
+        output_bin_counts: Optional[torch.Tensor] = None
+        if do_penalties:
+            self._update_penalties(cleared_rows, prompt_updates,
+                                   output_updates)
+            penalty_rows_t = self._to_device(penalty_rows)
+            prompt_mask = self._prompt_masks.index_select(0, penalty_rows_t)
+            output_bin_counts = self._output_bin_counts.index_select(
+                0, penalty_rows_t)
+
+        # [batch_size, n_seeds] -> [n_seeds, batch_size]
+        sampling_seeds_t = torch.tensor(
+            sampling_seeds,
+            device="cpu",
+            dtype=torch.long,
+            pin_memory=self._pin_memory,
+        ).T.contiguous()
+
+        sampling_tensors = SamplingTensors(
+            temperatures=temperatures,
+            top_ps=top_ps,
+            top_ks=top_ks,
+            min_ps=min_ps,
+            presence_penalties=presence_penalties,
+            frequency_penalties=frequency_penalties,
+            repetition_penalties=repetition_penalties,
+            sampling_seeds=sampling_seeds_t.to(device=self.device,
+                                               non_blocking=True),
+            sample_indices=self._to_device(sample_indices),
+            extra_seeds=None,
+            prompt_tokens=None,
+            output_tokens=None,
+            prompt_mask=prompt_mask,
+            output_bin_counts=output_bin_counts,
+        )
+        return (sampling_tensors, do_penalties, do_top_p_top_k, do_min_p)
+
+    def _get_penalty_row(
+            self, seq_id: int, seq_data: SequenceData, step: int,
+            cleared_rows: List[int], prompt_updates: List[Tuple[int,
+                                                                "array[int]"]],
+            output_updates: List[Tuple[int, "array[int]"]]) -> int:
+        """Get the penalty row of the sequence, and queue the updates that
+        bring the row up to date with the tokens of the sequence."""
+        row = self._penalty_rows.get(seq_id, step)
+        prompt_len = seq_data.get_prompt_len()
+        output_len = seq_data.get_output_len()
+        if (row is None or self._prompt_lens[row] != prompt_len
+                or self._output_lens[row] > output_len):
+            if row is None:
+                row = self._penalty_rows.allocate(seq_id, step)
+            cleared_rows.append(row)
+            if prompt_len:
+                prompt_updates.append(
+                    (row, seq_data.get_token_ids_in_range(0, prompt_len)))
+            self._prompt_lens[row] = prompt_len
+            num_counted = 0
+        else:
+            num_counted = self._output_lens[row]
+        if output_len > num_counted:
+            output_updates.append(
+                (row,
+                 seq_data.get_token_ids_in_range(prompt_len + num_counted,
+                                                 prompt_len + output_len)))
+        self._output_lens[row] = output_len
+        return row
+
+    def _update_penalties(
+            self, cleared_rows: List[int],
+            prompt_updates: List[Tuple[int, "array[int]"]],
+            output_updates: List[Tuple[int, "array[int]"]]) -> None:
+        num_rows = self._penalty_rows.num_rows
+        self._prompt_masks = _grow(self._prompt_masks, num_rows)
+        self._output_bin_counts = _grow(self._output_bin_counts, num_rows)
+        if cleared_rows:
+            cleared_rows_t = self._to_device(cleared_rows)
+            self._prompt_masks[cleared_rows_t] = False
+            self._output_bin_counts[cleared_rows_t] = 0
+        if prompt_updates:
+            rows_t, token_ids_t = self._flatten(prompt_updates)
+            self._prompt_masks[rows_t, token_ids_t] = True
+        if output_updates:
+            rows_t, token_ids_t = self._flatten(output_updates)
+            self._output_bin_counts.index_put_(
+                (rows_t, token_ids_t),
+                torch.ones_like(token_ids_t, dtype=torch.int),
+                accumulate=True)
+
+    def _flatten(
+        self, updates: List[Tuple[int, "array[int]"]]
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Flatten the (row, token ids) into the device tensors of the rows
+        and the token ids of all the tokens."""
+        rows = array(TOKEN_ID_TYPECODE)
+        token_ids = array(TOKEN_ID_TYPECODE)
+        for row, row_token_ids in updates:
+            rows.extend(array(TOKEN_ID_TYPECODE, [row]) * len(row_token_ids))
+            token_ids.extend(row_token_ids)
+        return self._array_to_device(rows), self._array_to_device(token_ids)
+
+    def _array_to_device(self, data: "array[int]") -> torch.Tensor:
+        tensor = torch.frombuffer(data, dtype=torch.long)
+        if self._pin_memory:
+            tensor = tensor.pin_memory()
+        return tensor.to(device=self.device, non_blocking=True)
+
+    def _to_device(self, data: List[int]) -> torch.Tensor:
+        return async_tensor_h2d(data, torch.long, self.device,
+                                self._pin_memory)
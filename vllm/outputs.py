@@ -3,6 +3,7 @@ from dataclasses import dataclass
 from typing import List, Optional, Union
 
 from vllm.lora.request import LoRARequest
+from vllm.sampling_params import RequestOutputKind
 from vllm.sequence import (PromptLogprobs, RequestMetrics, SampleLogprobs,
                            SequenceGroup, SequenceStatus)
 
@@ -20,9 +21,9 @@ class CompletionOutput:
         logprobs: The log probabilities of the top probability words at each
             position if the logprobs are requested.
         finish_reason: The reason why the sequence is finished.
-        stop_reason: The stop string or token id that caused the completion
-            to stop, None if the completion finished for some other reason
-            including encountering the EOS token.
+        stop_reason: The stop string, token id or token id sequence that
+            caused the completion to stop, None if the completion finished for
+            some other reason including encountering the EOS token.
         lora_request: The LoRA request that was used to generate the output.
     """
 
@@ -32,7 +33,7 @@ class CompletionOutput:
     cumulative_logprob: float
     logprobs: Optional[SampleLogprobs]
     finish_reason: Optional[str] = None
-    stop_reason: Union[int, str, None] = None
+    stop_reason: Union[int, str, List[int], None] = None
     lora_request: Optional[LoRARequest] = None
 
     def finished(self) -> bool:
@@ -76,6 +77,9 @@ class RequestOutput:
         finished: Whether the whole request is finished.
         metrics: Metrics associated with the request.
         lora_request: The LoRA request that was used to generate the output.
+
+    With `RequestOutputKind.DELTA`, the outputs only hold the text, token IDs
+    and logprobs generated since the previous RequestOutput of the request.
     """
 
     def __init__(
@@ -98,6 +102,26 @@ class RequestOutput:
         self.metrics = metrics
         self.lora_request = lora_request
 
+    def add(self, next_output: "RequestOutput") -> None:
+        """Merges the next delta output of the request into this one."""
+        outputs = {output.index: output for output in self.outputs}
+        for next_completion in next_output.outputs:
+            completion = outputs.get(next_completion.index)
+            if completion is None:
+                self.outputs.append(next_completion)
+                continue
+            completion.text += next_completion.text
+            completion.token_ids.extend(next_completion.token_ids)
+            if (completion.logprobs is not None
+                    and next_completion.logprobs is not None):
+                completion.logprobs.extend(next_completion.logprobs)
+            completion.cumulative_logprob = next_completion.cumulative_logprob
+            completion.finish_reason = next_completion.finish_reason
+            completion.stop_reason = next_completion.stop_reason
+        self.prompt_logprobs = next_output.prompt_logprobs
+        self.finished = next_output.finished
+        self.metrics = next_output.metrics
+
     @classmethod
     def from_seq_group(cls, seq_group: SequenceGroup) -> "RequestOutput":
         if seq_group.sampling_params is None:
@@ -123,15 +147,24 @@ class RequestOutput:
         # logprobs are not requested.
         include_logprobs = seq_group.sampling_params.logprobs is not None
         text_buffer_length = seq_group.sampling_params.output_text_buffer_length
-        outputs = [
-            CompletionOutput(seqs.index(seq),
-                             seq.get_output_text_to_return(text_buffer_length),
-                             seq.get_output_token_ids(),
-                             seq.get_cumulative_logprob(),
-                             seq.output_logprobs if include_logprobs else None,
-                             SequenceStatus.get_finished_reason(seq.status),
-                             seq.stop_reason) for seq in top_n_seqs
-        ]
+        delta = (
+            seq_group.sampling_params.output_kind == RequestOutputKind.DELTA)
+        outputs: List[CompletionOutput] = []
+        for seq in top_n_seqs:
+            if delta:
+                text, token_ids, logprobs = seq.get_output_delta_to_return(
+                    text_buffer_length)
+            else:
+                text = seq.get_output_text_to_return(text_buffer_length)
+                token_ids = seq.get_output_token_ids().tolist()
+                logprobs = seq.output_logprobs
+            outputs.append(
+                CompletionOutput(
+                    seqs.index(seq), text, token_ids,
+                    seq.get_cumulative_logprob(),
+                    logprobs if include_logprobs else None,
+                    SequenceStatus.get_finished_reason(seq.status),
+                    seq.stop_reason))
 
         # Every sequence in the sequence group should have the same prompt.
         prompt = seq_group.prompt
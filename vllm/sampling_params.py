@@ -2,7 +2,7 @@
 import copy
 from enum import IntEnum
 from functools import cached_property
-from typing import Any, Callable, Dict, List, Optional, Union
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
 
 import torch
 from pydantic import Field
@@ -18,14 +18,78 @@ class SamplingType(IntEnum):
     BEAM = 3
 
 
+class RequestOutputKind(IntEnum):
+    # The text, token IDs and logprobs generated so far.
+    CUMULATIVE = 0
+    # Only the text, token IDs and logprobs generated since the previous
+    # output of the request.
+    DELTA = 1
+
+
+class BatchedLogitsProcessor:
+    """A logits processor that is called once per step for all the sequences
+    it applies to, rather than once per sequence.
+
+    A processor that only restricts the tokens that can be sampled should
+    implement `get_allowed_token_bitmasks`. The bitmasks of all such
+    processors in a step are applied to the logits together, with a single
+    masked fill, after the other batched processors of the sequence. Other
+    processors should override `__call__`.
+    """
+
+    def __call__(self, seq_ids: List[int],
+                 prompt_token_ids: List[Sequence[int]],
+                 output_token_ids: List[Sequence[int]],
+                 logits: torch.Tensor) -> torch.Tensor:
+        """Process the logits of the sequences.
+
+        Args:
+            seq_ids: The ids of the sequences.
+            prompt_token_ids: The prompt token ids of each sequence.
+            output_token_ids: The generated token ids of each sequence.
+            logits: (num_seqs, vocab_size). The logits of the next token of
+                each sequence.
+
+        Returns:
+            The processed logits.
+        """
+        raise NotImplementedError
+
+    def get_allowed_token_bitmasks(self, seq_ids: List[int],
+                                   output_token_ids: List[Sequence[int]],
+                                   vocab_size: int) -> Optional[List[bytes]]:
+        """Get the tokens each sequence is allowed to sample next, as a
+        bitmask of ceil(vocab_size / 8) bytes per sequence, in which bit j
+        of byte i is set if token 8 * i + j is allowed.
+
+        Returns None if the processor does not use bitmasks, in which case
+        it is called instead.
+        """
+        return None
+
+    def get_forced_token_ids(self, seq_id: int,
+                             output_token_ids: Sequence[int],
+                             max_num_tokens: int) -> List[int]:
+        """Get the tokens the sequence is forced to generate after its
+        output tokens, i.e. the longest run of next tokens that are the only
+        tokens allowed, up to max_num_tokens of them.
+
+        The engine can append these tokens without sampling them when
+        fast-forwarding is enabled. Returns an empty list by default.
+        """
+        return []
+
+
 LogitsProcessor = Union[Callable[[List[int], torch.Tensor], torch.Tensor],
                         Callable[[List[int], List[int], torch.Tensor],
-                                 torch.Tensor]]
+                                 torch.Tensor], BatchedLogitsProcessor]
 """LogitsProcessor is a function that takes a list
 of previously generated tokens, the logits tensor
 for the next token and, optionally, prompt tokens as a
 first argument, and returns a modified tensor of logits
-to sample from."""
+to sample from. It can also be a BatchedLogitsProcessor,
+which processes the logits of all its sequences in a step
+at once."""
 
 
 class SamplingParams:
@@ -100,10 +164,22 @@ class SamplingParams:
             tokens in the output.  Defaults to True.
         logits_processors: List of functions that modify logits based on
             previously generated tokens, and optionally prompt tokens as
-            a first argument.
+            a first argument, or BatchedLogitsProcessors. They are applied
+            in the order of the list.
         truncate_prompt_tokens: If set to an integer k, will use only the last k
             tokens from the prompt (i.e., left truncation). Defaults to None
             (i.e., no truncation).
+        priority: The priority of the request, lower values are scheduled
+            first. Only used by the "priority" scheduling policy.
+        stop_token_sequences: List of token id sequences that stop the
+            generation when the output token ids end with them, before the
+            tokens are detokenized. The returned output will contain the
+            stop sequences.
+        output_kind: Whether the outputs of the request hold the whole text,
+            token IDs and logprobs generated so far, or only the ones
+            generated since the previous output, which saves copying the
+            whole generation at every step when streaming. Delta outputs
+            require `best_of` to be `n` and no beam search.
     """
 
     def __init__(
@@ -134,6 +210,9 @@ class SamplingParams:
         spaces_between_special_tokens: bool = True,
         logits_processors: Optional[List[LogitsProcessor]] = None,
         truncate_prompt_tokens: Optional[Annotated[int, Field(ge=1)]] = None,
+        priority: int = 0,
+        stop_token_sequences: Optional[List[List[int]]] = None,
+        output_kind: RequestOutputKind = RequestOutputKind.CUMULATIVE,
     ) -> None:
         self.n = n
         self.best_of = best_of if best_of is not None else n
@@ -161,6 +240,13 @@ class SamplingParams:
             self.stop_token_ids = []
         else:
             self.stop_token_ids = list(stop_token_ids)
+        if stop_token_sequences is None:
+            self.stop_token_sequences = []
+        else:
+            self.stop_token_sequences = [
+                list(stop_token_sequence)
+                for stop_token_sequence in stop_token_sequences
+            ]
         self.ignore_eos = ignore_eos
         self.max_tokens = max_tokens
         self.min_tokens = min_tokens
@@ -175,6 +261,8 @@ class SamplingParams:
         self.logits_processors = logits_processors
         self.include_stop_str_in_output = include_stop_str_in_output
         self.truncate_prompt_tokens = truncate_prompt_tokens
+        self.priority = priority
+        self.output_kind = output_kind
         # Number of characters to hold back for stop string evaluation
         # until sequence is finished.
         if self.stop and not include_stop_str_in_output:
@@ -244,10 +332,18 @@ class SamplingParams:
                              f"got {self.truncate_prompt_tokens}")
         if any(not stop_str for stop_str in self.stop):
             raise ValueError("stop cannot contain an empty string.")
+        if any(not stop_token_sequence
+               for stop_token_sequence in self.stop_token_sequences):
+            raise ValueError(
+                "stop_token_sequences cannot contain an empty sequence.")
         if self.stop and not self.detokenize:
             raise ValueError(
                 "stop strings are only supported when detokenize is True. "
                 "Set detokenize=True to use stop.")
+        if (self.output_kind == RequestOutputKind.DELTA
+                and self.best_of != self.n):
+            raise ValueError("best_of must be equal to n with delta outputs, "
+                             f"got n={self.n} and best_of={self.best_of}.")
 
     def _verify_beam_search(self) -> None:
         if self.best_of == 1:
@@ -263,6 +359,9 @@ class SamplingParams:
             raise ValueError(
                 f"early_stopping must be True, False, or 'never', "
                 f"got {self.early_stopping}.")
+        if self.output_kind == RequestOutputKind.DELTA:
+            raise ValueError(
+                "Delta outputs are not supported with beam search.")
 
     def _verify_non_beam_search(self) -> None:
         if self.early_stopping is not False:
@@ -333,6 +432,7 @@ class SamplingParams:
             f"early_stopping={self.early_stopping}, "
             f"stop={self.stop}, "
             f"stop_token_ids={self.stop_token_ids}, "
+            f"stop_token_sequences={self.stop_token_sequences}, "
             f"include_stop_str_in_output={self.include_stop_str_in_output}, "
             f"ignore_eos={self.ignore_eos}, "
             f"max_tokens={self.max_tokens}, "
@@ -342,4 +442,6 @@ class SamplingParams:
             f"skip_special_tokens={self.skip_special_tokens}, "
             "spaces_between_special_tokens="
             f"{self.spaces_between_special_tokens}, "
-            f"truncate_prompt_tokens={self.truncate_prompt_tokens})")
+            f"truncate_prompt_tokens={self.truncate_prompt_tokens}, "
+            f"priority={self.priority}, "
+            f"output_kind={self.output_kind.name})")
@@ -1,13 +1,21 @@
 """Sequence and its related classes."""
 import copy
 import enum
+import functools
+import itertools
 from abc import ABC, abstractmethod
+from array import array
 from dataclasses import dataclass, field
-from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
+from typing import (TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List,
+                    Optional)
+from typing import Sequence as GenericSequence
+from typing import Tuple, Union, overload
 
 import torch
 
 from vllm.block import LogicalTokenBlock
+from vllm.core.block.hashing import hash_block_tokens
+from vllm.core.block.transfers import OffloadTransfers
 from vllm.inputs import LLMInputs
 from vllm.lora.request import LoRARequest
 from vllm.pooling_params import PoolingParams
@@ -16,20 +24,58 @@ from vllm.sampling_params import SamplingParams
 if TYPE_CHECKING:
     from vllm.multimodal import MultiModalData
     from vllm.spec_decode.metrics import SpecDecodeWorkerMetrics
+    from vllm.transformers_utils.detokenizer import (
+        ByteLevelDetokenizationState)
 
 
-@dataclass
 class Logprob:
     """Infos for supporting OpenAI compatible logprobs and token ranks.
 
     Attributes:
         logprob: The logprob of chosen token
         rank: The vocab rank of chosen token (>=1)
-        decoded_token: The decoded chosen token index
+        decoded_token: The decoded chosen token index. The detokenizer may
+            set it lazily, see `set_lazy_decoded_token`.
     """
-    logprob: float
-    rank: Optional[int] = None
-    decoded_token: Optional[str] = None
+    __slots__ = ("logprob", "rank", "_decoded_token")
+
+    def __init__(self,
+                 logprob: float,
+                 rank: Optional[int] = None,
+                 decoded_token: Optional[str] = None):
+        self.logprob = logprob
+        self.rank = rank
+        self._decoded_token: Union[str, Callable[[], str],
+                                   None] = decoded_token
+
+    @property
+    def decoded_token(self) -> Optional[str]:
+        if callable(self._decoded_token):
+            self._decoded_token = self._decoded_token()
+        return self._decoded_token
+
+    @decoded_token.setter
+    def decoded_token(self, decoded_token: Optional[str]) -> None:
+        self._decoded_token = decoded_token
+
+    def set_lazy_decoded_token(self, decode: Callable[[], str]) -> None:
+        """Sets the decoded token to be computed by `decode` when it is
+        first read, e.g. when the OpenAI server serializes the logprobs, so
+        that the text of the alternative tokens nobody reads is never
+        decoded. `decode` has to be picklable, to send the logprobs to
+        other processes."""
+        self._decoded_token = decode
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Logprob):
+            return NotImplemented
+        return (self.logprob, self.rank,
+                self.decoded_token) == (other.logprob, other.rank,
+                                        other.decoded_token)
+
+    def __repr__(self) -> str:
+        return (f"Logprob(logprob={self.logprob}, rank={self.rank}, "
+                f"decoded_token={self.decoded_token!r})")
 
 
 # {token_id -> logprob} per each sequence group. None if the corresponding
@@ -38,6 +84,9 @@ PromptLogprobs = List[Optional[Dict[int, Logprob]]]
 # {token_id -> logprob} for each sequence group.
 SampleLogprobs = List[Dict[int, Logprob]]
 
+# Typecode of the arrays of token IDs, 64-bit like torch.long.
+TOKEN_ID_TYPECODE = "q"
+
 
 class SequenceStatus(enum.Enum):
     """Status of a sequence."""
@@ -81,6 +130,117 @@ class SequenceStage(enum.Enum):
     DECODE = enum.auto()
 
 
+_EMPTY_TOKEN_IDS = array(TOKEN_ID_TYPECODE)
+
+
+def _slice_token_ids(head: "array[int]", head_len: int, tail: "array[int]",
+                     start: int, end: int) -> "array[int]":
+    """Copies the token IDs from `start` to `end` out of the first `head_len`
+    tokens of `head` followed by `tail`, where 0 <= start <= end."""
+    if start >= head_len:
+        return tail[start - head_len:end - head_len]
+    if end <= head_len:
+        return head[start:end]
+    return head[start:head_len] + tail[:end - head_len]
+
+
+@functools.total_ordering
+class TokenIdsView(GenericSequence[int]):
+    """Read-only view of the token IDs of a sequence, returned by the getters
+    of `SequenceData` instead of a copy of its arrays.
+
+    The view covers the tokens of the arrays when it was created; tokens
+    appended later are not part of it. It compares equal to the lists and
+    arrays of the same tokens, and slicing it or concatenating it with a list
+    returns a list. As its tokens do not change, it is hashable like a tuple.
+    """
+
+    __slots__ = ("_head", "_head_len", "_tail", "_tail_len")
+
+    def __init__(self,
+                 head: "array[int]",
+                 tail: "array[int]" = _EMPTY_TOKEN_IDS) -> None:
+        self._head = head
+        self._head_len = len(head)
+        self._tail = tail
+        self._tail_len = len(tail)
+
+    def __len__(self) -> int:
+        return self._head_len + self._tail_len
+
+    @overload
+    def __getitem__(self, index: int) -> int:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[int]:
+        ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[int, List[int]]:
+        if isinstance(index, slice):
+            start, end, step = index.indices(len(self))
+            if step != 1:
+                return self.tolist()[index]
+            if start >= end:
+                return []
+            return _slice_token_ids(self._head, self._head_len, self._tail,
+                                    start, end).tolist()
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("token index out of range")
+        if index < self._head_len:
+            return self._head[index]
+        return self._tail[index - self._head_len]
+
+    def __iter__(self) -> Iterator[int]:
+        return itertools.chain(itertools.islice(self._head, self._head_len),
+                               itertools.islice(self._tail, self._tail_len))
+
+    def tolist(self) -> List[int]:
+        return _slice_token_ids(self._head, self._head_len, self._tail, 0,
+                                len(self)).tolist()
+
+    def _to_comparable(self, other: object) -> Optional[List[int]]:
+        if isinstance(other, TokenIdsView):
+            return other.tolist()
+        if isinstance(other, array):
+            return other.tolist()
+        if isinstance(other, list):
+            return other
+        return None
+
+    def __eq__(self, other: object) -> bool:
+        other_list = self._to_comparable(other)
+        if other_list is None:
+            return NotImplemented
+        return len(self) == len(other_list) and self.tolist() == other_list
+
+    def __lt__(self, other: object) -> bool:
+        other_list = self._to_comparable(other)
+        if other_list is None:
+            return NotImplemented
+        return self.tolist() < other_list
+
+    def __hash__(self) -> int:
+        return hash(tuple(self))
+
+    def __add__(self, other: object) -> List[int]:
+        other_list = self._to_comparable(other)
+        if other_list is None:
+            return NotImplemented
+        return self.tolist() + other_list
+
+    def __radd__(self, other: object) -> List[int]:
+        other_list = self._to_comparable(other)
+        if other_list is None:
+            return NotImplemented
+        return other_list + self.tolist()
+
+    def __repr__(self) -> str:
+        return repr(self.tolist())
+
+
 @dataclass
 class RequestMetrics:
     """Metrics associated with a request.
@@ -103,6 +263,12 @@ class RequestMetrics:
 class SequenceData:
     """Data associated with a sequence.
 
+    The token IDs are stored in growable arrays of 64-bit integers, which take
+    8 bytes per token instead of a pointer to an int object each, and which
+    are pickled as raw bytes when the data is sent to the workers.
+    `prompt_token_ids`, `output_token_ids` and the getters return read-only
+    `TokenIdsView`s of the arrays, without copying them.
+
     Args:
         prompt_token_ids: The token IDs of the prompt.
         output_token_ids: The token IDs of the output. Set to an empty list if
@@ -114,48 +280,71 @@ class SequenceData:
         cumulative_logprob: The cumulative log probability of the output.
     """
 
+    __slots__ = ("_prompt_token_ids", "_output_token_ids",
+                 "cumulative_logprob", "_num_computed_tokens", "_stage",
+                 "_fast_forwarded")
+
     def __init__(
         self,
-        prompt_token_ids: List[int],
-        output_token_ids: Optional[List[int]] = None,
+        prompt_token_ids: Iterable[int],
+        output_token_ids: Optional[Iterable[int]] = None,
     ) -> None:
-        if output_token_ids is None:
-            output_token_ids = []
-
-        self.prompt_token_ids = prompt_token_ids
-        self._prompt_token_ids_tuple: Tuple[int, ...] = tuple(prompt_token_ids)
-        self.output_token_ids = output_token_ids
+        self._prompt_token_ids = array(TOKEN_ID_TYPECODE, prompt_token_ids)
+        self._output_token_ids = array(TOKEN_ID_TYPECODE, output_token_ids
+                                       or ())
         self.cumulative_logprob = 0.0
         # The number of tokens that are computed (that run against the model).
         self._num_computed_tokens = 0
         self._stage: SequenceStage = SequenceStage.PREFILL
+        # Whether the sequence is in the prefill stage for the tokens
+        # fast-forwarded after its last sampled one.
+        self._fast_forwarded = False
+
+    @property
+    def prompt_token_ids(self) -> TokenIdsView:
+        return TokenIdsView(self._prompt_token_ids)
+
+    @property
+    def output_token_ids(self) -> TokenIdsView:
+        return TokenIdsView(self._output_token_ids)
+
+    @output_token_ids.setter
+    def output_token_ids(self, new_output_token_ids: Iterable[int]) -> None:
+        self._output_token_ids = array(TOKEN_ID_TYPECODE, new_output_token_ids)
 
     def append_token_id(self, token_id: int, logprob: float) -> None:
-        self.output_token_ids.append(token_id)
+        self._output_token_ids.append(token_id)
         self.cumulative_logprob += logprob
 
     def get_len(self) -> int:
-        return len(self.output_token_ids) + len(self.prompt_token_ids)
+        return len(self._output_token_ids) + len(self._prompt_token_ids)
 
     def get_prompt_len(self) -> int:
-        return len(self.prompt_token_ids)
+        return len(self._prompt_token_ids)
 
     def get_output_len(self) -> int:
-        return len(self.output_token_ids)
+        return len(self._output_token_ids)
 
-    def get_token_ids(self) -> List[int]:
-        return self.prompt_token_ids + self.output_token_ids
+    def get_token_ids(self) -> TokenIdsView:
+        return TokenIdsView(self._prompt_token_ids, self._output_token_ids)
+
+    def get_token_ids_in_range(self, start: int, end: int) -> "array[int]":
+        """Get a copy of the token IDs from `start` to `end`, where
+        0 <= start <= end <= len, without copying the other tokens."""
+        return _slice_token_ids(self._prompt_token_ids,
+                                len(self._prompt_token_ids),
+                                self._output_token_ids, start, end)
 
     def get_prefix_token_ids(
             self, num_tokens: int
     ) -> Tuple[Tuple[int, ...], Optional[Tuple[int, ...]]]:
         """Get prefix tokens, and make the return value hashable"""
-        prompt_length = len(self.prompt_token_ids)
+        prompt_length = len(self._prompt_token_ids)
         if num_tokens > prompt_length:
-            return (self._prompt_token_ids_tuple,
-                    tuple(self.output_token_ids[:num_tokens - prompt_length]))
+            return (tuple(self._prompt_token_ids),
+                    tuple(self._output_token_ids[:num_tokens - prompt_length]))
         else:
-            return (self._prompt_token_ids_tuple[:num_tokens], None)
+            return (tuple(self._prompt_token_ids[:num_tokens]), None)
 
     def get_num_computed_tokens(self) -> int:
         """Return the number of prefill tokens that are already computed."""
@@ -169,6 +358,29 @@ class SequenceData:
         # If all tokens are computed, it means it is in decoding phase.
         if self.get_num_uncomputed_tokens() == 0:
             self._stage = SequenceStage.DECODE
+            self._fast_forwarded = False
+
+    def set_prefill_in_flight(self) -> None:
+        """Move the sequence to the decoding phase while its last prefill
+        chunk is still being computed, so that the pipelined engine step can
+        schedule its first decoding step meanwhile. The number of computed
+        tokens, which the workers read, is updated with the outputs."""
+        self._stage = SequenceStage.DECODE
+
+    def set_fast_forwarded(self) -> None:
+        """Move the sequence back to the prefill phase after tokens were
+        appended to it without being sampled, e.g. the tokens forced by
+        guided decoding, so that they are computed along with its last
+        sampled token in a single prefill chunk."""
+        self._stage = SequenceStage.PREFILL
+        self._fast_forwarded = True
+
+    def snapshot(self) -> "SequenceData":
+        """Return a copy of the sequence data for a batch which executes while
+        the scheduler updates the sequence, e.g. resets it for recompute. The
+        token ids are shared, since they only change once the outputs of the
+        batch are processed."""
+        return copy.copy(self)
 
     def reset_state_for_recompute(self) -> None:
         """Reset the number of computed tokens from this sequence. It is
@@ -177,6 +389,7 @@ class SequenceData:
         """
         self._num_computed_tokens = 0
         self._stage = SequenceStage.PREFILL
+        self._fast_forwarded = False
 
     def get_num_uncomputed_tokens(self) -> int:
         """Return the number of prefill tokens that are not computed."""
@@ -186,24 +399,28 @@ class SequenceData:
         return self.get_len() - self.get_num_computed_tokens()
 
     def get_last_token_id(self) -> int:
-        if not self.output_token_ids:
-            return self.prompt_token_ids[-1]
-        return self.output_token_ids[-1]
+        if not self._output_token_ids:
+            return self._prompt_token_ids[-1]
+        return self._output_token_ids[-1]
 
-    def get_prompt_token_ids(self) -> List[int]:
-        return self.prompt_token_ids
+    def get_prompt_token_ids(self) -> TokenIdsView:
+        return TokenIdsView(self._prompt_token_ids)
 
-    def get_output_token_ids(self) -> List[int]:
-        return self.output_token_ids
+    def get_output_token_ids(self) -> TokenIdsView:
+        return TokenIdsView(self._output_token_ids)
 
     @property
     def stage(self) -> SequenceStage:
         return self._stage
 
+    @property
+    def is_fast_forwarded(self) -> bool:
+        return self._fast_forwarded
+
     def __repr__(self) -> str:
         return (f"SequenceData("
-                f"prompt_token_ids={self.prompt_token_ids}, "
-                f"output_token_ids={self.output_token_ids}, "
+                f"prompt_token_ids={self._prompt_token_ids.tolist()}, "
+                f"output_token_ids={self._output_token_ids.tolist()}, "
                 f"cumulative_logprob={self.cumulative_logprob})")
 
 
@@ -218,6 +435,14 @@ class Sequence:
         lora_request: LoRA request.
     """
 
+    __slots__ = ("seq_id", "inputs", "block_size", "eos_token_id",
+                 "lora_request", "data", "output_logprobs", "output_text",
+                 "logical_token_blocks", "_block_hashes", "status",
+                 "stop_reason", "stop_string_state",
+                 "stop_token_sequence_state", "prefix_offset", "read_offset",
+                 "tokens", "detokenization_state", "num_returned_chars",
+                 "num_returned_tokens")
+
     def __init__(
         self,
         seq_id: int,
@@ -237,16 +462,30 @@ class Sequence:
         self.output_text = ""
 
         self.logical_token_blocks: List[LogicalTokenBlock] = []
+        # Chained content hashes of the full logical blocks, extended lazily
+        # by hash_of_block as the sequence grows.
+        self._block_hashes: List[int] = []
         # Initialize the logical token blocks with the prompt token ids.
         self._append_tokens_to_blocks(self.prompt_token_ids)
         self.status = SequenceStatus.WAITING
-        self.stop_reason: Union[int, str, None] = None
+        self.stop_reason: Union[int, str, List[int], None] = None
+        # States of the stop string and stop token sequence automata, see
+        # `StopMatcher`, set at the first stop check.
+        self.stop_string_state: Optional[int] = None
+        self.stop_token_sequence_state: Optional[int] = None
 
         # Used for incremental detokenization
         self.prefix_offset = 0
         self.read_offset = 0
         # Input + output tokens
         self.tokens: Optional[List[str]] = None
+        # Used instead of the above with byte-level BPE tokenizers
+        self.detokenization_state: Optional[
+            "ByteLevelDetokenizationState"] = None
+        # Length of the output text and number of output tokens already
+        # returned, with delta outputs.
+        self.num_returned_chars = 0
+        self.num_returned_tokens = 0
 
     @property
     def prompt(self) -> Optional[str]:
@@ -270,15 +509,50 @@ class Sequence:
         return self.output_text[:-buffer_length] if truncate else (
             self.output_text)
 
+    def get_output_delta_to_return(
+            self, buffer_length: int) -> Tuple[str, List[int], SampleLogprobs]:
+        """Get the output text, token IDs and logprobs that were not returned
+        yet, and mark them as returned."""
+        num_chars = len(self.output_text)
+        if buffer_length and not self.is_finished():
+            num_chars = max(num_chars - buffer_length, self.num_returned_chars)
+        text = self.output_text[self.num_returned_chars:num_chars]
+        token_ids = self.data.output_token_ids[self.num_returned_tokens:]
+        logprobs = self.output_logprobs[self.num_returned_tokens:]
+        self.num_returned_chars = num_chars
+        self.num_returned_tokens += len(token_ids)
+        return text, token_ids, logprobs
+
     def hash_of_block(self, logical_idx: int) -> int:
-        # TODO This can produce incorrect hash when block size > prompt size
+        """Return the prefix hash of the given logical block.
 
-        # Compute the number of tokens in the sequence
-        # TODO: The current hashing function is O(L^2). We should optimize
-        # this in the future.
-        num_tokens = self.num_hashed_tokens_of_block(logical_idx)
-        hashed_tokens = self.data.get_prefix_token_ids(num_tokens)
-        return hash((hashed_tokens, self.lora_int_id))
+        The hash of a block covers the block's tokens and, through the hash of
+        the previous block, all tokens before it. Hashes of full blocks are
+        cached and chained, so hashing a new block is O(block_size) instead of
+        O(prefix length). The hash of a partially filled block is not cached
+        since its content may still change.
+        """
+        # TODO This can produce incorrect hash when block size > prompt size
+        num_full_blocks = self.get_len() // self.block_size
+        while len(self._block_hashes) < min(logical_idx + 1, num_full_blocks):
+            idx = len(self._block_hashes)
+            self._block_hashes.append(self._hash_block_tokens(idx))
+        if logical_idx < len(self._block_hashes):
+            return self._block_hashes[logical_idx]
+        return self._hash_block_tokens(logical_idx)
+
+    def _hash_block_tokens(self, logical_idx: int) -> int:
+        # Same chaining scheme as the content hash of PrefixCachingBlock, so
+        # both block managers agree on the hash of a block. The LoRA id is
+        # folded into the first block and hence propagates to all the others.
+        is_first_block = logical_idx == 0
+        block_hash = hash_block_tokens(
+            is_first_block,
+            None if is_first_block else self._block_hashes[logical_idx - 1],
+            self.logical_token_blocks[logical_idx].get_token_ids())
+        if is_first_block and self.lora_int_id:
+            block_hash = hash((block_hash, self.lora_int_id))
+        return block_hash
 
     def num_hashed_tokens_of_block(self, logical_idx: int):
         return logical_idx * self.block_size + self.block_size
@@ -329,16 +603,16 @@ class Sequence:
     def get_output_len(self) -> int:
         return self.data.get_output_len()
 
-    def get_token_ids(self) -> List[int]:
+    def get_token_ids(self) -> TokenIdsView:
         return self.data.get_token_ids()
 
-    def get_prompt_token_ids(self) -> List[int]:
+    def get_prompt_token_ids(self) -> TokenIdsView:
         return self.data.get_prompt_token_ids()
 
     def get_last_token_id(self) -> int:
         return self.data.get_last_token_id()
 
-    def get_output_token_ids(self) -> List[int]:
+    def get_output_token_ids(self) -> TokenIdsView:
         return self.data.output_token_ids
 
     def get_cumulative_logprob(self) -> float:
@@ -414,6 +688,8 @@ class SequenceGroup:
             for an embedding model.
         encoder_seq: Optional, the single encoder sequence. Should be None
                      unless you are working with an encoder/decoder model.
+        priority: The priority of the request, lower values are scheduled
+            first. Defaults to the priority of the sampling parameters.
     """
 
     def __init__(
@@ -426,6 +702,7 @@ class SequenceGroup:
         embeddings: Optional[List[float]] = None,
         pooling_params: Optional[PoolingParams] = None,
         encoder_seq: Optional[Sequence] = None,
+        priority: Optional[int] = None,
     ) -> None:
         self.request_id = request_id
         self.seqs_dict = {seq.seq_id: seq for seq in seqs}
@@ -441,6 +718,13 @@ class SequenceGroup:
         self.embeddings = embeddings
         self.pooling_params = pooling_params
         self.encoder_seq = encoder_seq
+        self._priority = priority
+        # Ordering key cached by the scheduling policy, see
+        # vllm.core.policy.Policy.
+        self.scheduling_sort_key: Optional[Tuple[float, ...]] = None
+        # Number of scheduling steps in which prefix-aware admission admitted
+        # later sequence groups ahead of this one.
+        self.num_admission_skips = 0
 
     @property
     def prompt(self) -> Optional[str]:
@@ -464,6 +748,12 @@ class SequenceGroup:
     def lora_int_id(self) -> int:
         return self.lora_request.lora_int_id if self.lora_request else 0
 
+    @property
+    def priority(self) -> int:
+        if self._priority is not None:
+            return self._priority
+        return self.sampling_params.priority if self.sampling_params else 0
+
     def get_last_latency(self, now: float) -> Optional[float]:
         """Sets the last token time for Request level timings."""
         # If still in prefill phase, raise Error.
@@ -850,10 +1140,15 @@ class ExecuteModelRequest:
     blocks_to_swap_out: List[Tuple[int, int]] = field(default_factory=list)
     # Blocks to copy. Source to dest block.
     blocks_to_copy: List[Tuple[int, int]] = field(default_factory=list)
+    # Copies between the KV cache and its offload tiers.
+    offload_transfers: OffloadTransfers = field(
+        default_factory=OffloadTransfers)
     # The number of slots for lookahead decoding.
     num_lookahead_slots: int = 0
     # The number of requests in the running queue.
     running_queue_size: int = 0
+    # The number of decoding steps to run back-to-back on the batch.
+    num_steps: int = 1
 
     def clone(
         self, seq_group_metadata_list: List[SequenceGroupMetadata]
@@ -864,6 +1159,8 @@ class ExecuteModelRequest:
             blocks_to_swap_in=self.blocks_to_swap_in.copy(),
             blocks_to_swap_out=self.blocks_to_swap_out.copy(),
             blocks_to_copy=self.blocks_to_copy.copy(),
+            offload_transfers=self.offload_transfers,
             num_lookahead_slots=self.num_lookahead_slots,
             running_queue_size=self.running_queue_size,
+            num_steps=self.num_steps,
         )
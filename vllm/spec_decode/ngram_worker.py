@@ -64,10 +64,11 @@ class NGramWorker(NonLLMProposerWorkerBase, LoraNotSupportedWorkerBase):
                 execute_model_req.seq_group_metadata_list):
             seq_data = next(iter(seq_group_metadata.seq_data.values()))
 
-            input_ids = torch.as_tensor(seq_data.get_token_ids(),
-                                        dtype=torch.long,
-                                        device=self.device)
+            # The tensor is created over a copy of the array of token ids.
             input_length = seq_data.get_len()
+            token_ids = seq_data.get_token_ids_in_range(0, input_length)
+            input_ids = torch.frombuffer(token_ids,
+                                         dtype=torch.long).to(self.device)
 
             for ngram_size in range(
                     min(self.ngram_prompt_lookup_max, input_length - 1),
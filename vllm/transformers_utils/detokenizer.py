@@ -1,6 +1,10 @@
-from typing import Dict, List, Optional, Tuple, Union
+import weakref
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple, Union
 
+from tokenizers import decoders
 from transformers import PreTrainedTokenizer, PreTrainedTokenizerFast
+from transformers.models.gpt2.tokenization_gpt2 import bytes_to_unicode
 
 from vllm.sequence import Logprob, SamplingParams, Sequence, SequenceGroup
 from vllm.transformers_utils.tokenizer_group.base_tokenizer_group import (
@@ -15,12 +19,25 @@ class Detokenizer:
 
     def __init__(self, tokenizer_group: BaseTokenizerGroup):
         self.tokenizer_group = tokenizer_group
+        # The token bytes of each tokenizer, or None if it is not a
+        # byte-level BPE tokenizer. Computed on first use.
+        self._token_bytes: weakref.WeakKeyDictionary = (
+            weakref.WeakKeyDictionary())
 
     def get_tokenizer_for_seq(self,
                               sequence: Sequence) -> "PreTrainedTokenizer":
         """Returns the HF tokenizer to use for a given sequence."""
         return self.tokenizer_group.get_lora_tokenizer(sequence.lora_request)
 
+    def get_token_bytes(
+        self, tokenizer: Union[PreTrainedTokenizer, PreTrainedTokenizerFast]
+    ) -> Optional["TokenBytes"]:
+        """Returns the bytes of the tokens of a byte-level BPE tokenizer, or
+        None for the other tokenizers."""
+        if tokenizer not in self._token_bytes:
+            self._token_bytes[tokenizer] = TokenBytes.from_tokenizer(tokenizer)
+        return self._token_bytes[tokenizer]
+
     def decode_prompt_logprobs_inplace(
             self, seq_group: SequenceGroup,
             prompt_logprobs: List[Optional[Dict[int, Logprob]]]) -> None:
@@ -97,9 +114,45 @@ class Detokenizer:
         Returns:
             The number of characters added to the output text.
         """
-        all_input_ids = seq.get_token_ids()
-        token_id_generated_this_iteration = all_input_ids[-1]
-        tokenizer = self.get_tokenizer_for_seq(seq)
+        return self.decode_sequences_inplace([(seq, prms)])[0]
+
+    def decode_sequences_inplace(
+            self, seqs: List[Tuple[Sequence, SamplingParams]]) -> List[int]:
+        """Decodes the new token for each of a batch of sequences, e.g. the
+        sequences of a step. In-place operation.
+
+        With a byte-level BPE tokenizer, the text of the new token and of
+        the logprobs is decoded from the bytes of the tokens, see
+        `ByteLevelDetokenizationState`, instead of converting the tokens of
+        the detokenization window of each to a string. The text is the same.
+
+        Args:
+            seqs: The sequences to decode, with the sampling parameters used
+                to generate them.
+
+        Returns:
+            The number of characters added to the output text of each
+            sequence.
+        """
+        new_char_counts: List[int] = []
+        for seq, prms in seqs:
+            tokenizer = self.get_tokenizer_for_seq(seq)
+            token_bytes = self.get_token_bytes(tokenizer)
+            if token_bytes is None:
+                new_char_count = self._decode_tokens_inplace(
+                    seq, prms, tokenizer)
+            else:
+                new_char_count = _decode_bytes_inplace(seq, prms, token_bytes)
+            new_char_counts.append(new_char_count)
+        return new_char_counts
+
+    def _decode_tokens_inplace(
+        self,
+        seq: Sequence,
+        prms: SamplingParams,
+        tokenizer: Union[PreTrainedTokenizer, PreTrainedTokenizerFast],
+    ) -> int:
+        token_id_generated_this_iteration = seq.get_last_token_id()
 
         # Convert prompt token IDs to tokens if necessary.
         # Do it here so that we don't have to repeat this
@@ -108,17 +161,25 @@ class Detokenizer:
             (seq.tokens, seq.prefix_offset,
              seq.read_offset) = convert_prompt_ids_to_tokens(
                  tokenizer=tokenizer,
-                 prompt_ids=all_input_ids[:-1],
+                 prompt_ids=seq.get_token_ids()[:-1],
                  skip_special_tokens=prms.skip_special_tokens,
              )
 
+        # Only the tokens from the prefix offset are decoded, so only they
+        # are passed, with the offsets relative to them, instead of copying
+        # all the tokens for the new token and for each logprob. Likewise,
+        # only the last input id is used when the previous tokens are given.
+        window_offset = seq.prefix_offset
+        window_tokens = seq.tokens[window_offset:]
+        window_read_offset = seq.read_offset - window_offset
+
         (new_tokens, new_decoded_token_text, prefix_offset,
          read_offset) = detokenize_incrementally(
              tokenizer=tokenizer,
-             all_input_ids=all_input_ids,
-             prev_tokens=seq.tokens,
-             prefix_offset=seq.prefix_offset,
-             read_offset=seq.read_offset,
+             all_input_ids=[token_id_generated_this_iteration],
+             prev_tokens=window_tokens,
+             prefix_offset=0,
+             read_offset=window_read_offset,
              skip_special_tokens=prms.skip_special_tokens,
              spaces_between_special_tokens=prms.spaces_between_special_tokens,
          )
@@ -126,7 +187,6 @@ class Detokenizer:
         # Decode logprobs
         logprobs = seq.output_logprobs[-1]
         if logprobs:
-            previous_tokens = all_input_ids[:-1]
             for token_id, sample_logprob in logprobs.items():
                 # If the token was generated this iteration,
                 # use the provided text.
@@ -136,13 +196,12 @@ class Detokenizer:
 
                 if (sample_logprob.decoded_token is None
                         and token_id != INVALID_TOKEN_ID):
-                    all_input_ids_with_logprob = previous_tokens + [token_id]
                     (_, new_text, _, _) = detokenize_incrementally(
                         tokenizer=tokenizer,
-                        all_input_ids=all_input_ids_with_logprob,
-                        prev_tokens=seq.tokens,
-                        prefix_offset=seq.prefix_offset,
-                        read_offset=seq.read_offset,
+                        all_input_ids=[token_id],
+                        prev_tokens=window_tokens,
+                        prefix_offset=0,
+                        read_offset=window_read_offset,
                         skip_special_tokens=prms.skip_special_tokens,
                         spaces_between_special_tokens=prms.
                         spaces_between_special_tokens,
@@ -150,13 +209,42 @@ class Detokenizer:
                     sample_logprob.decoded_token = new_text
 
         seq.tokens.extend(new_tokens)
-        seq.prefix_offset = prefix_offset
-        seq.read_offset = read_offset
+        seq.prefix_offset = window_offset + prefix_offset
+        seq.read_offset = window_offset + read_offset
         seq.output_text += new_decoded_token_text
 
         return len(new_decoded_token_text)
 
 
+def _decode_bytes_inplace(seq: Sequence, prms: SamplingParams,
+                          token_bytes: "TokenBytes") -> int:
+    new_token_id = seq.get_last_token_id()
+    skip_special_tokens = prms.skip_special_tokens
+    state = seq.detokenization_state
+    if state is None:
+        state = ByteLevelDetokenizationState.from_prompt(
+            token_bytes,
+            seq.get_token_ids()[:-1], skip_special_tokens)
+    new_text, seq.detokenization_state = state.decode(
+        token_bytes.get(new_token_id, skip_special_tokens))
+
+    # The other tokens of the logprobs are decoded from the state before the
+    # new token, when their text is read.
+    logprobs = seq.output_logprobs[-1]
+    if logprobs:
+        for token_id, sample_logprob in logprobs.items():
+            if token_id == new_token_id:
+                sample_logprob.decoded_token = new_text
+            elif (sample_logprob.decoded_token is None
+                  and token_id != INVALID_TOKEN_ID):
+                sample_logprob.set_lazy_decoded_token(
+                    LazyTokenText(
+                        state, token_bytes.get(token_id, skip_special_tokens)))
+
+    seq.output_text += new_text
+    return len(new_text)
+
+
 def _convert_tokens_to_string_with_added_encoders(
     tokenizer: Union[PreTrainedTokenizer, PreTrainedTokenizerFast],
     output_tokens: List[str],
@@ -218,6 +306,151 @@ def convert_prompt_ids_to_tokens(
     return new_tokens, prefix_offset, read_offset
 
 
+class TokenBytes:
+    """The bytes of the tokens of a byte-level BPE tokenizer, e.g. of GPT-2
+    or Llama 3, whose tokens are strings of characters that each stand for a
+    byte.
+
+    Decoding the joined bytes of tokens gives the same text as
+    `tokenizer.convert_tokens_to_string`, without converting the ids to
+    token strings first.
+    """
+
+    def __init__(self, token_bytes: List[bytes], special_ids: Set[int]):
+        self.token_bytes = token_bytes
+        self.special_ids = special_ids
+
+    @classmethod
+    def from_tokenizer(
+        cls, tokenizer: Union[PreTrainedTokenizer, PreTrainedTokenizerFast]
+    ) -> Optional["TokenBytes"]:
+        """Returns None if the tokenizer is not a byte-level BPE tokenizer."""
+        if (not tokenizer.is_fast or not isinstance(
+                tokenizer.backend_tokenizer.decoder, decoders.ByteLevel)
+                or type(tokenizer).convert_tokens_to_string
+                is not PreTrainedTokenizerFast.convert_tokens_to_string):
+            return None
+        byte_decoder = {
+            char: byte
+            for byte, char in bytes_to_unicode().items()
+        }
+        token_bytes: List[bytes] = []
+        for token in tokenizer.convert_ids_to_tokens(
+                list(range(len(tokenizer)))):
+            if token is None:
+                return None
+            if all(char in byte_decoder for char in token):
+                token_bytes.append(bytes(byte_decoder[char] for char in token))
+            else:
+                # Like the ByteLevel decoder, which keeps the tokens with
+                # other characters, e.g. added tokens, as they are.
+                token_bytes.append(token.encode("utf-8"))
+        return cls(token_bytes, set(tokenizer.all_special_ids))
+
+    def get(self, token_id: int, skip_special_tokens: bool) -> bytes:
+        """Returns the bytes of a token, or no bytes if the token id is out of
+        bounds or a skipped special token."""
+        if skip_special_tokens and token_id in self.special_ids:
+            return b""
+        if 0 <= token_id < len(self.token_bytes):
+            return self.token_bytes[token_id]
+        return b""
+
+    def convert_ids_to_bytes(self, token_ids: List[int],
+                             skip_special_tokens: bool) -> List[bytes]:
+        """Like `tokenizer.convert_ids_to_tokens`."""
+        return [
+            self.get(token_id, False) for token_id in token_ids
+            if not (skip_special_tokens and token_id in self.special_ids)
+        ]
+
+
+def _is_valid_utf8(data: bytes) -> bool:
+    try:
+        data.decode("utf-8")
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+@dataclass(frozen=True)
+class ByteLevelDetokenizationState:
+    """State of the incremental detokenization of a sequence with
+    `TokenBytes`, equivalent to the tokens and offsets of
+    `detokenize_incrementally`.
+
+    The new text is decoded from the bytes of the tokens which were not
+    turned into text yet (`pending`), after the bytes of the tokens which
+    were turned into text last (`prefix`), which is the window of tokens of
+    `detokenize_incrementally`. Once the prefix is known to end with a
+    complete character, it cannot change the decoding of the bytes after it,
+    so only the pending bytes are decoded.
+
+    Args:
+        prefix: The bytes of the tokens from the prefix offset to the read
+            offset.
+        prefix_is_valid: Whether the prefix is known to be valid UTF-8.
+        pending: The bytes of the tokens after the read offset.
+    """
+    prefix: bytes
+    prefix_is_valid: bool
+    pending: bytes = b""
+
+    @classmethod
+    def from_prefix(cls, prefix: bytes) -> "ByteLevelDetokenizationState":
+        return cls(prefix, _is_valid_utf8(prefix))
+
+    @classmethod
+    def from_prompt(
+            cls, token_bytes: TokenBytes, prompt_ids: List[int],
+            skip_special_tokens: bool) -> "ByteLevelDetokenizationState":
+        """Like `convert_prompt_ids_to_tokens`."""
+        prompt_bytes = token_bytes.convert_ids_to_bytes(
+            prompt_ids[-INITIAL_INCREMENTAL_DETOKENIZATION_OFFSET - 2:],
+            skip_special_tokens)
+        prefix_offset = max(
+            len(prompt_bytes) - INITIAL_INCREMENTAL_DETOKENIZATION_OFFSET, 0)
+        return cls.from_prefix(b"".join(prompt_bytes[prefix_offset:]))
+
+    def decode(self,
+               new_bytes: bytes) -> Tuple[str, "ByteLevelDetokenizationState"]:
+        """Decodes the bytes of a new token, like `detokenize_incrementally`.
+
+        Returns:
+            The new text, empty while it may end with an incomplete
+            character, and the state after the new token.
+        """
+        pending = self.pending + new_bytes
+        if self.prefix_is_valid:
+            new_text = pending.decode("utf-8", errors="replace")
+            if not new_text or new_text.endswith("�"):
+                return "", ByteLevelDetokenizationState(
+                    self.prefix, True, pending)
+            # Replacement characters only come from invalid bytes, unless
+            # they were generated, which just takes the slower path below.
+            return new_text, ByteLevelDetokenizationState(
+                pending, "�" not in new_text)
+
+        prefix_text = self.prefix.decode("utf-8", errors="replace")
+        new_text = (self.prefix + pending).decode("utf-8", errors="replace")
+        if len(new_text) <= len(prefix_text) or new_text.endswith("�"):
+            return "", ByteLevelDetokenizationState(self.prefix, False,
+                                                    pending)
+        return (new_text[len(prefix_text):],
+                ByteLevelDetokenizationState.from_prefix(pending))
+
+
+@dataclass(frozen=True)
+class LazyTokenText:
+    """Decodes the text of a token after the tokens of a sequence when it is
+    called, see `Logprob.set_lazy_decoded_token`."""
+    state: ByteLevelDetokenizationState
+    token_bytes: bytes
+
+    def __call__(self) -> str:
+        return self.state.decode(self.token_bytes)[0]
+
+
 # Based on
 # https://github.com/huggingface/text-generation-inference/blob/v0.9.4/server/text_generation_server/models/model.py#L62C9-L62C15
 # under Apache 2.0 license
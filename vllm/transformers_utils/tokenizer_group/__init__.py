@@ -4,6 +4,8 @@ from vllm.config import TokenizerPoolConfig
 from vllm.executor.ray_utils import ray
 from vllm.transformers_utils.tokenizer_group.base_tokenizer_group import (
     BaseTokenizerGroup)
+from vllm.transformers_utils.tokenizer_group.process_tokenizer_group import (
+    ProcessTokenizerGroupPool)
 from vllm.transformers_utils.tokenizer_group.tokenizer_group import (
     TokenizerGroup)
 
@@ -25,6 +27,9 @@ def get_tokenizer_group(tokenizer_pool_config: Optional[TokenizerPoolConfig],
                 "the ray package to use the Ray tokenizer group pool.")
         return RayTokenizerGroupPool.from_config(tokenizer_pool_config,
                                                  **init_kwargs)
+    elif tokenizer_pool_config.pool_type == "process":
+        return ProcessTokenizerGroupPool.from_config(tokenizer_pool_config,
+                                                     **init_kwargs)
     else:
         raise ValueError(
             f"Unknown pool type: {tokenizer_pool_config.pool_type}")
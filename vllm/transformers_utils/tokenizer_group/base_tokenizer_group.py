@@ -1,3 +1,4 @@
+import asyncio
 from abc import ABC, abstractmethod
 from typing import List, Optional
 
@@ -38,6 +39,26 @@ class BaseTokenizerGroup(ABC):
         """Encode a prompt using the tokenizer group."""
         pass
 
+    def encode_batch(
+            self,
+            prompts: List[str],
+            lora_request: Optional[LoRARequest] = None) -> List[List[int]]:
+        """Encode several prompts using the tokenizer group."""
+        return [
+            self.encode(prompt=prompt, lora_request=lora_request)
+            for prompt in prompts
+        ]
+
+    async def encode_batch_async(
+            self,
+            prompts: List[str],
+            lora_request: Optional[LoRARequest] = None) -> List[List[int]]:
+        """Encode several prompts using the tokenizer group."""
+        return list(await asyncio.gather(*[
+            self.encode_async(prompt=prompt, lora_request=lora_request)
+            for prompt in prompts
+        ]))
+
     @abstractmethod
     def get_lora_tokenizer(
             self,
@@ -0,0 +1,185 @@
+import asyncio
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from transformers import PreTrainedTokenizer
+
+import vllm.envs as envs
+from vllm.config import TokenizerPoolConfig
+from vllm.lora.request import LoRARequest
+from vllm.transformers_utils.tokenizer_group.base_tokenizer_group import (
+    BaseTokenizerGroup)
+from vllm.transformers_utils.tokenizer_group.tokenizer_group import (
+    TokenizerGroup)
+
+# The TokenizerGroup of the current pool process.
+_worker_tokenizer_group: Optional[TokenizerGroup] = None
+
+
+def _init_worker(init_kwargs: Dict[str, Any]) -> None:
+    global _worker_tokenizer_group
+    _worker_tokenizer_group = TokenizerGroup(**init_kwargs)
+
+
+def _ping() -> bool:
+    assert _worker_tokenizer_group is not None
+    return _worker_tokenizer_group.ping()
+
+
+def _encode(prompt: str, request_id: Optional[str],
+            lora_request: Optional[LoRARequest]) -> List[int]:
+    assert _worker_tokenizer_group is not None
+    return _worker_tokenizer_group.encode(prompt=prompt,
+                                          request_id=request_id,
+                                          lora_request=lora_request)
+
+
+def _encode_batch(prompts: List[str],
+                  lora_request: Optional[LoRARequest]) -> List[List[int]]:
+    assert _worker_tokenizer_group is not None
+    return _worker_tokenizer_group.encode_batch(prompts=prompts,
+                                                lora_request=lora_request)
+
+
+class ProcessTokenizerGroupPool(BaseTokenizerGroup):
+    """A pool of TokenizerGroups in local processes for async tokenization.
+
+    The prompts are encoded in the processes, so that long prompts neither
+    block the event loop nor hold the GIL of the engine, and several prompts
+    are encoded in parallel. The processes are started with the method of
+    VLLM_WORKER_MULTIPROC_METHOD.
+    """
+
+    @classmethod
+    def from_config(cls, tokenizer_pool_config: TokenizerPoolConfig,
+                    **init_kwargs) -> "ProcessTokenizerGroupPool":
+        init_kwargs["num_processes"] = tokenizer_pool_config.pool_size
+        return cls(**init_kwargs)
+
+    def __init__(self, tokenizer_id: str, enable_lora: bool, max_num_seqs: int,
+                 max_input_length: Optional[int], num_processes: int,
+                 **tokenizer_config):
+        init_kwargs = dict(tokenizer_id=tokenizer_id,
+                           enable_lora=enable_lora,
+                           max_num_seqs=max_num_seqs,
+                           max_input_length=max_input_length,
+                           **tokenizer_config)
+        # Store a local copy of the TokenizerGroup for quick access
+        # to underlying HF tokenizers.
+        self._local_tokenizer_group = TokenizerGroup(**init_kwargs)
+
+        self._num_processes = num_processes
+        self._executor = ProcessPoolExecutor(
+            max_workers=num_processes,
+            mp_context=multiprocessing.get_context(
+                envs.VLLM_WORKER_MULTIPROC_METHOD),
+            initializer=_init_worker,
+            initargs=(init_kwargs, ))
+        # Start the processes now, before the engine starts any thread.
+        self.ping()
+
+    @property
+    def pool_size(self) -> int:
+        return self._num_processes
+
+    def ping(self) -> bool:
+        futures = [
+            self._executor.submit(_ping) for _ in range(self._num_processes)
+        ]
+        return all(future.result() for future in futures)
+
+    def encode(self,
+               prompt: str,
+               request_id: Optional[str] = None,
+               lora_request: Optional[LoRARequest] = None) -> List[int]:
+        """Encode a prompt using the tokenizer group.
+
+        The prompt is encoded by an idle process. This is blocking.
+        """
+        return self._executor.submit(_encode, prompt, request_id,
+                                     lora_request).result()
+
+    async def encode_async(
+            self,
+            prompt: str,
+            request_id: Optional[str] = None,
+            lora_request: Optional[LoRARequest] = None) -> List[int]:
+        """Encode a prompt using the tokenizer group.
+
+        The prompt is encoded by an idle process, or waits for one to become
+        idle. This is non-blocking.
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor,
+            functools.partial(_encode, prompt, request_id, lora_request))
+
+    def encode_batch(
+            self,
+            prompts: List[str],
+            lora_request: Optional[LoRARequest] = None) -> List[List[int]]:
+        """Encode several prompts using the tokenizer group.
+
+        The prompts are split into a chunk per process, which the processes
+        encode in parallel. This is blocking.
+        """
+        futures = [
+            self._executor.submit(_encode_batch, chunk, lora_request)
+            for chunk in self._split(prompts)
+        ]
+        return [
+            token_ids for future in futures for token_ids in future.result()
+        ]
+
+    async def encode_batch_async(
+            self,
+            prompts: List[str],
+            lora_request: Optional[LoRARequest] = None) -> List[List[int]]:
+        """Encode several prompts using the tokenizer group.
+
+        The prompts are split into a chunk per process, which the processes
+        encode in parallel. This is non-blocking.
+        """
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*[
+            loop.run_in_executor(
+                self._executor,
+                functools.partial(_encode_batch, chunk, lora_request))
+            for chunk in self._split(prompts)
+        ])
+        return [token_ids for result in results for token_ids in result]
+
+    def _split(self, prompts: List[str]) -> List[List[str]]:
+        """Split the prompts into up to a contiguous chunk per process."""
+        if not prompts:
+            return []
+        chunk_size = -(-len(prompts) // self._num_processes)
+        return [
+            prompts[i:i + chunk_size]
+            for i in range(0, len(prompts), chunk_size)
+        ]
+
+    def get_max_input_len(self,
+                          lora_request: Optional[LoRARequest] = None
+                          ) -> Optional[int]:
+        """Get the maximum input length for the LoRA request."""
+        return self._local_tokenizer_group.get_max_input_len(lora_request)
+
+    def get_lora_tokenizer(
+            self,
+            lora_request: Optional[LoRARequest] = None
+    ) -> "PreTrainedTokenizer":
+        return self._local_tokenizer_group.get_lora_tokenizer(lora_request)
+
+    async def get_lora_tokenizer_async(
+            self,
+            lora_request: Optional[LoRARequest] = None
+    ) -> "PreTrainedTokenizer":
+        return await self._local_tokenizer_group.get_lora_tokenizer_async(
+            lora_request)
+
+    def __del__(self):
+        executor = getattr(self, "_executor", None)
+        if executor is not None:
+            executor.shutdown(wait=False)
@@ -65,6 +65,27 @@ class TokenizerGroup(BaseTokenizerGroup):
         self._raise_if_input_too_long(ret, lora_request)
         return ret
 
+    def encode_batch(
+            self,
+            prompts: List[str],
+            lora_request: Optional[LoRARequest] = None) -> List[List[int]]:
+        tokenizer = self.get_lora_tokenizer(lora_request)
+        # The fast tokenizers encode the prompts of a batch in parallel.
+        ret = tokenizer(prompts).input_ids
+        for token_ids in ret:
+            self._raise_if_input_too_long(token_ids, lora_request)
+        return ret
+
+    async def encode_batch_async(
+            self,
+            prompts: List[str],
+            lora_request: Optional[LoRARequest] = None) -> List[List[int]]:
+        tokenizer = await self.get_lora_tokenizer_async(lora_request)
+        ret = tokenizer(prompts).input_ids
+        for token_ids in ret:
+            self._raise_if_input_too_long(token_ids, lora_request)
+        return ret
+
     def get_lora_tokenizer(
             self,
             lora_request: Optional[LoRARequest] = None
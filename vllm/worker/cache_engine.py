@@ -1,12 +1,15 @@
 """CacheEngine class for managing the KV cache."""
-from typing import List
+from typing import List, Optional, Tuple
 
 import torch
 
 from vllm.attention import get_attn_backend
 from vllm.config import CacheConfig, ModelConfig, ParallelConfig
+from vllm.core.block.transfers import OffloadTransfers
 from vllm.logger import init_logger
 from vllm.utils import STR_DTYPE_TO_TORCH_DTYPE, is_pin_memory_available
+from vllm.worker.kv_offload import (KVCacheOffloader, get_kv_cache_block_dim,
+                                    get_prefix_cache_data_file)
 
 logger = init_logger(__name__)
 
@@ -57,14 +60,51 @@ class CacheEngine:
         self.gpu_cache = self._allocate_kv_cache(self.num_gpu_blocks, "cuda")
         self.cpu_cache = self._allocate_kv_cache(self.num_cpu_blocks, "cpu")
 
+        # Views of the caches in which ranges of blocks are contiguous, used
+        # to swap extents of blocks with bulk copies.
+        block_dim = get_kv_cache_block_dim(self._get_kv_cache_shape)
+        self.gpu_block_views = [
+            get_block_major_views(layer, block_dim) for layer in self.gpu_cache
+        ]
+        self.cpu_block_views = [
+            get_block_major_views(layer, block_dim) for layer in self.cpu_cache
+        ]
+
+        # Initialize the offload tiers of the prefix cache.
+        self.offloader: Optional[KVCacheOffloader] = None
+        if cache_config.offload_enabled:
+            cache_config.set_num_offload_blocks(
+                self.get_cache_block_size(cache_config, model_config,
+                                          parallel_config))
+            disk_file = None
+            if cache_config.persistent_prefix_cache:
+                disk_file = get_prefix_cache_data_file(model_config,
+                                                       cache_config,
+                                                       parallel_config)
+            self.offloader = KVCacheOffloader(
+                self._get_kv_cache_shape,
+                num_layers=self.num_layers,
+                dtype=self.dtype,
+                num_host_blocks=cache_config.num_host_offload_blocks,
+                num_disk_blocks=cache_config.num_disk_offload_blocks,
+                disk_path=cache_config.kv_offload_path,
+                disk_file=disk_file,
+                pin_memory=is_pin_memory_available(),
+            )
+
+    def _get_kv_cache_shape(self, num_blocks: int) -> Tuple[int, ...]:
+        return self.attn_backend.get_kv_cache_shape(num_blocks,
+                                                    self.block_size,
+                                                    self.num_kv_heads,
+                                                    self.head_size)
+
     def _allocate_kv_cache(
         self,
         num_blocks: int,
         device: str,
     ) -> List[torch.Tensor]:
         """Allocates KV cache on the specified device."""
-        kv_cache_shape = self.attn_backend.get_kv_cache_shape(
-            num_blocks, self.block_size, self.num_kv_heads, self.head_size)
+        kv_cache_shape = self._get_kv_cache_shape(num_blocks)
         pin_memory = is_pin_memory_available() if device == "cpu" else False
         kv_cache: List[torch.Tensor] = []
         for _ in range(self.num_layers):
@@ -78,19 +118,40 @@ class CacheEngine:
                             device=device))
         return kv_cache
 
-    def swap_in(self, src_to_dst: torch.Tensor) -> None:
-        for i in range(self.num_layers):
-            self.attn_backend.swap_blocks(self.cpu_cache[i], self.gpu_cache[i],
-                                          src_to_dst)
-
-    def swap_out(self, src_to_dst: torch.Tensor) -> None:
+    def swap_in(self, extents: torch.Tensor) -> None:
+        self._swap(self.cpu_cache, self.gpu_cache, self.cpu_block_views,
+                   self.gpu_block_views, extents)
+
+    def swap_out(self, extents: torch.Tensor) -> None:
+        self._swap(self.gpu_cache, self.cpu_cache, self.gpu_block_views,
+                   self.cpu_block_views, extents)
+
+    def _swap(self, src_cache: List[torch.Tensor],
+              dst_cache: List[torch.Tensor],
+              src_block_views: List[List[torch.Tensor]],
+              dst_block_views: List[List[torch.Tensor]],
+              extents: torch.Tensor) -> None:
+        """Swaps the given (src, dst, num_blocks) extents of blocks. Single
+        blocks are left to the swap kernel of the attention backend, which
+        copies them in one call per layer, while longer extents are copied
+        with one bulk copy each."""
+        src_to_dst, runs = split_block_extents(extents)
         for i in range(self.num_layers):
-            self.attn_backend.swap_blocks(self.gpu_cache[i], self.cpu_cache[i],
-                                          src_to_dst)
+            if src_to_dst.numel() > 0:
+                self.attn_backend.swap_blocks(src_cache[i], dst_cache[i],
+                                              src_to_dst)
+            copy_block_runs(src_block_views[i],
+                            dst_block_views[i],
+                            runs,
+                            non_blocking=True)
 
     def copy(self, src_to_dsts: torch.Tensor) -> None:
         self.attn_backend.copy_blocks(self.gpu_cache, src_to_dsts)
 
+    def transfer_offloaded(self, transfers: OffloadTransfers) -> None:
+        assert self.offloader is not None
+        self.offloader.transfer(transfers, self.gpu_cache)
+
     @staticmethod
     def get_cache_block_size(
         cache_config: CacheConfig,
@@ -112,5 +173,37 @@ class CacheEngine:
         return dtype_size * total
 
 
+def get_block_major_views(kv_cache: torch.Tensor,
+                          block_dim: int) -> List[torch.Tensor]:
+    """Splits the KV cache of a layer along the dimensions preceding the block
+    dimension, so that the first dimension of each view indexes the blocks and
+    a range of blocks is contiguous in memory."""
+    views = [kv_cache]
+    for _ in range(block_dim):
+        views = [sub_view for view in views for sub_view in view.unbind(0)]
+    return views
+
+
+def split_block_extents(
+        extents: torch.Tensor) -> Tuple[torch.Tensor, List[List[int]]]:
+    """Splits (src, dst, num_blocks) extents of blocks into the (src, dst)
+    pairs of the single blocks and the list of the longer extents."""
+    is_single = extents[:, 2] == 1
+    return extents[is_single, :2].contiguous(), extents[~is_single].tolist()
+
+
+def copy_block_runs(src_block_views: List[torch.Tensor],
+                    dst_block_views: List[torch.Tensor],
+                    runs: List[List[int]],
+                    non_blocking: bool = False) -> None:
+    """Copies each (src, dst, num_blocks) extent of blocks with one slice copy
+    per view, see get_block_major_views."""
+    for src, dst, num_blocks in runs:
+        for src_view, dst_view in zip(src_block_views, dst_block_views):
+            src_blocks = src_view[src:src + num_blocks]
+            dst_view[dst:dst + num_blocks].copy_(src_blocks,
+                                                 non_blocking=non_blocking)
+
+
 def _get_dtype_size(dtype: torch.dtype) -> int:
     return torch.tensor([], dtype=dtype).element_size()
@@ -8,6 +8,8 @@ from vllm.attention import get_attn_backend
 from vllm.config import (CacheConfig, DeviceConfig, LoadConfig, LoRAConfig,
                          ModelConfig, ParallelConfig, SchedulerConfig,
                          VisionLanguageConfig)
+from vllm.core.block.common import coalesce_block_copies
+from vllm.core.block.transfers import OffloadTransfers
 from vllm.distributed import (broadcast_tensor_dict,
                               ensure_model_parallel_initialized,
                               init_distributed_environment)
@@ -15,7 +17,11 @@ from vllm.logger import init_logger
 from vllm.model_executor import set_random_seed
 from vllm.sequence import ExecuteModelRequest, SamplerOutput
 from vllm.utils import STR_DTYPE_TO_TORCH_DTYPE
+from vllm.worker.cache_engine import (copy_block_runs, get_block_major_views,
+                                      split_block_extents)
 from vllm.worker.cpu_model_runner import CPUModelRunner
+from vllm.worker.kv_offload import (KVCacheOffloader, get_kv_cache_block_dim,
+                                    get_prefix_cache_data_file)
 from vllm.worker.worker_base import LoraNotSupportedWorkerBase
 
 logger = init_logger(__name__)
@@ -65,14 +71,45 @@ class CPUCacheEngine:
 
         # Initialize the cache.
         self.cpu_cache = self._allocate_kv_cache(self.num_cpu_blocks)
+        block_dim = get_kv_cache_block_dim(self._get_kv_cache_shape)
+        self.block_views = [
+            get_block_major_views(layer, block_dim) for layer in self.cpu_cache
+        ]
+
+        # Initialize the offload tiers of the prefix cache.
+        self.offloader: Optional[KVCacheOffloader] = None
+        if cache_config.offload_enabled:
+            cache_config.set_num_offload_blocks(
+                self.get_cache_block_size(self.block_size,
+                                          cache_config.cache_dtype,
+                                          model_config, parallel_config))
+            disk_file = None
+            if cache_config.persistent_prefix_cache:
+                disk_file = get_prefix_cache_data_file(model_config,
+                                                       cache_config,
+                                                       parallel_config)
+            self.offloader = KVCacheOffloader(
+                self._get_kv_cache_shape,
+                num_layers=self.num_layers,
+                dtype=self.dtype,
+                num_host_blocks=cache_config.num_host_offload_blocks,
+                num_disk_blocks=cache_config.num_disk_offload_blocks,
+                disk_path=cache_config.kv_offload_path,
+                disk_file=disk_file,
+            )
+
+    def _get_kv_cache_shape(self, num_blocks: int) -> Tuple[int, ...]:
+        return self.attn_backend.get_kv_cache_shape(num_blocks,
+                                                    self.block_size,
+                                                    self.num_heads,
+                                                    self.head_size)
 
     def _allocate_kv_cache(
         self,
         num_blocks: int,
     ) -> List[torch.Tensor]:
         """Allocates KV cache on CPU."""
-        kv_cache_shape = self.attn_backend.get_kv_cache_shape(
-            num_blocks, self.block_size, self.num_heads, self.head_size)
+        kv_cache_shape = self._get_kv_cache_shape(num_blocks)
         kv_cache: List[torch.Tensor] = []
         for _ in range(self.num_layers):
             kv_cache.append(
@@ -85,8 +122,21 @@ class CPUCacheEngine:
     def swap_out(self, src_to_dst: Dict[int, int]) -> None:
         raise NotImplementedError("Swap is not supported in CPUCacheEngine.")
 
-    def copy(self, src_to_dsts: Dict[int, List[int]]) -> None:
-        self.attn_backend.copy_blocks(self.cpu_cache, src_to_dsts)
+    def copy(self, extents: torch.Tensor) -> None:
+        """Copies the given (src, dst, num_blocks) extents of blocks. Single
+        blocks are gathered and scattered with one indexed copy per view of
+        the cache, longer extents are copied by slicing."""
+        src_to_dst, runs = split_block_extents(extents)
+        src_ids, dst_ids = src_to_dst[:, 0], src_to_dst[:, 1]
+        for views in self.block_views:
+            if src_to_dst.numel() > 0:
+                for view in views:
+                    view.index_copy_(0, dst_ids, view.index_select(0, src_ids))
+            copy_block_runs(views, views, runs)
+
+    def transfer_offloaded(self, transfers: OffloadTransfers) -> None:
+        assert self.offloader is not None
+        self.offloader.transfer(transfers, self.cpu_cache)
 
     @staticmethod
     def get_cache_block_size(
@@ -258,7 +308,10 @@ class CPUWorker(LoraNotSupportedWorkerBase):
     def cache_copy(
         self,
         blocks_to_copy: torch.Tensor,
+        offload_transfers: Optional[OffloadTransfers] = None,
     ) -> None:
+        if offload_transfers is not None and not offload_transfers.is_empty():
+            self.cache_engine.transfer_offloaded(offload_transfers)
         if blocks_to_copy.numel() > 0:
             self.cache_engine.copy(blocks_to_copy)
 
@@ -277,23 +330,26 @@ class CPUWorker(LoraNotSupportedWorkerBase):
             assert seq_group_metadata_list is not None
             num_seq_groups: int = len(seq_group_metadata_list)
             assert execute_model_req is not None
-            blocks_to_copy = execute_model_req.blocks_to_copy
-            blocks_to_copy = torch.tensor(execute_model_req.blocks_to_copy,
+            blocks_to_copy = torch.tensor(coalesce_block_copies(
+                execute_model_req.blocks_to_copy),
                                           device="cpu",
-                                          dtype=torch.int64).view(-1, 2)
+                                          dtype=torch.int64).view(-1, 3)
             assert len(execute_model_req.blocks_to_swap_in) == 0
             assert len(execute_model_req.blocks_to_swap_out) == 0
+            offload_transfers = execute_model_req.offload_transfers
             data: Dict[str, Any] = {
                 "num_seq_groups": num_seq_groups,
-                "blocks_to_copy": execute_model_req.blocks_to_copy,
+                "blocks_to_copy": blocks_to_copy,
+                "offload_transfers": offload_transfers,
             }
             broadcast_tensor_dict(data, src=0)
         else:
             data = broadcast_tensor_dict(src=0)
             num_seq_groups = data["num_seq_groups"]
             blocks_to_copy = data["blocks_to_copy"]
+            offload_transfers = data["offload_transfers"]
 
-        self.cache_copy(blocks_to_copy)
+        self.cache_copy(blocks_to_copy, offload_transfers)
 
         # If there is no input, we don't need to execute the model.
         if num_seq_groups == 0:
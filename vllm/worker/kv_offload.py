@@ -0,0 +1,193 @@
+"""Host memory and disk tiers of the prefix cache."""
+import os
+import tempfile
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import torch
+
+from vllm.attention import get_attn_backend
+from vllm.config import CacheConfig, ModelConfig, ParallelConfig
+from vllm.core.block.prefix_cache_store import PrefixCacheStore
+from vllm.core.block.transfers import (BlockCopies, OffloadCopy,
+                                       OffloadTransfers)
+from vllm.distributed import get_tensor_model_parallel_rank
+from vllm.logger import init_logger
+
+logger = init_logger(__name__)
+
+
+class KVCacheOffloader:
+    """Stores KV cache blocks evicted from the device cache in host memory
+    and in a memory-mapped file, and copies them back on request.
+
+    The tiers use the same layout as the device cache, so that the blocks
+    are copied with a single indexed copy per layer. Which blocks go where
+    is decided by the `TieredBlockCache` of the scheduler; this class only
+    executes the resulting `OffloadTransfers`.
+
+    Args:
+        get_kv_cache_shape: Returns the shape of the KV cache of one layer
+            given a number of blocks.
+        num_layers: The number of layers.
+        dtype: The data type of the KV cache.
+        num_host_blocks: The number of blocks in the host memory tier.
+        num_disk_blocks: The number of blocks in the disk tier.
+        disk_path: Directory of the file backing the disk tier, defaults to
+            the system temporary directory.
+        disk_file: The file backing the disk tier, if it is persistent. It
+            is kept, and its content reused, unlike the temporary file
+            created in disk_path otherwise.
+        pin_memory: Whether to pin the host memory tier.
+    """
+
+    def __init__(
+        self,
+        get_kv_cache_shape: Callable[[int], Tuple[int, ...]],
+        num_layers: int,
+        dtype: torch.dtype,
+        num_host_blocks: int,
+        num_disk_blocks: int,
+        disk_path: Optional[str] = None,
+        disk_file: Optional[str] = None,
+        pin_memory: bool = False,
+    ) -> None:
+        self.num_layers = num_layers
+        self.dtype = dtype
+        self.block_dim = get_kv_cache_block_dim(get_kv_cache_shape)
+
+        self.host_cache: List[torch.Tensor] = [
+            torch.zeros(get_kv_cache_shape(num_host_blocks),
+                        dtype=dtype,
+                        pin_memory=pin_memory) for _ in range(num_layers)
+        ]
+        self.disk_cache = self._map_disk_cache(
+            get_kv_cache_shape(num_disk_blocks), disk_path, disk_file)
+
+    def _map_disk_cache(self, kv_cache_shape: Tuple[int, ...],
+                        disk_path: Optional[str],
+                        disk_file: Optional[str]) -> List[torch.Tensor]:
+        numel = self.num_layers
+        for dim in kv_cache_shape:
+            numel *= dim
+        if numel == 0:
+            return [
+                torch.empty(kv_cache_shape, dtype=self.dtype)
+                for _ in range(self.num_layers)
+            ]
+
+        if disk_file is not None:
+            # The blocks are read straight from the page cache of the file
+            # written by the previous engine, without loading it upfront.
+            os.makedirs(os.path.dirname(disk_file), exist_ok=True)
+            filename = disk_file
+            mapped = torch.from_file(filename,
+                                     shared=True,
+                                     size=numel,
+                                     dtype=self.dtype)
+        else:
+            fd, filename = tempfile.mkstemp(prefix="vllm_kv_offload_",
+                                            suffix=".bin",
+                                            dir=disk_path)
+            os.close(fd)
+            try:
+                # The file is mapped in shared mode, so that the pages of the
+                # tier are backed by the file rather than by swap space.
+                mapped = torch.from_file(filename,
+                                         shared=True,
+                                         size=numel,
+                                         dtype=self.dtype)
+            finally:
+                # The mapping outlives the directory entry, which ensures
+                # that the file is removed when the process exits.
+                os.unlink(filename)
+        logger.info("Mapped %.2f GiB of KV cache offload space in %s",
+                    numel * mapped.element_size() / (1 << 30),
+                    os.path.dirname(filename))
+
+        disk_cache = mapped.view(self.num_layers, *kv_cache_shape)
+        return [disk_cache[i] for i in range(self.num_layers)]
+
+    def transfer(self, transfers: OffloadTransfers,
+                 device_cache: List[torch.Tensor]) -> None:
+        """Executes the given transfers between the device cache and the
+        offload tiers."""
+        caches = {
+            OffloadCopy.GPU_TO_HOST: (device_cache, self.host_cache),
+            OffloadCopy.HOST_TO_DISK: (self.host_cache, self.disk_cache),
+            OffloadCopy.HOST_TO_GPU: (self.host_cache, device_cache),
+            OffloadCopy.DISK_TO_GPU: (self.disk_cache, device_cache),
+            OffloadCopy.GPU_TO_DISK: (device_cache, self.disk_cache),
+        }
+        for kind, src_to_dst in transfers.get_batches():
+            src_cache, dst_cache = caches[kind]
+            self._copy(src_cache, dst_cache, src_to_dst)
+
+    def _copy(self, src_cache: List[torch.Tensor],
+              dst_cache: List[torch.Tensor], src_to_dst: BlockCopies) -> None:
+        src_device = src_cache[0].device
+        dst_device = dst_cache[0].device
+        src_ids = torch.tensor([src for src, _ in src_to_dst],
+                               dtype=torch.int64,
+                               device=src_device)
+        dst_ids = torch.tensor([dst for _, dst in src_to_dst],
+                               dtype=torch.int64,
+                               device=dst_device)
+        for src, dst in zip(src_cache, dst_cache):
+            blocks = src.index_select(self.block_dim, src_ids)
+            dst.index_copy_(self.block_dim, dst_ids, blocks.to(dst_device))
+
+
+def get_kv_cache_block_dim(
+        get_kv_cache_shape: Callable[[int], Tuple[int, ...]]) -> int:
+    """Returns the dimension indexing the blocks in the KV cache layout of
+    the attention backend."""
+    for dim, (one, two) in enumerate(
+            zip(get_kv_cache_shape(1), get_kv_cache_shape(2))):
+        if one != two:
+            return dim
+    raise ValueError("The KV cache shape does not depend on the number of "
+                     "blocks.")
+
+
+def get_prefix_cache_fingerprint(
+        model_config: ModelConfig, cache_config: CacheConfig,
+        parallel_config: ParallelConfig) -> Dict[str, Any]:
+    """Returns the properties determining the content and the layout of the
+    KV cache blocks of a worker, which the persistent prefix cache has to
+    match to be reused."""
+    num_kv_heads = model_config.get_num_kv_heads(parallel_config)
+    attn_backend = get_attn_backend(
+        model_config.get_num_attention_heads(parallel_config),
+        model_config.get_head_size(),
+        num_kv_heads,
+        model_config.get_sliding_window(),
+        model_config.dtype,
+        cache_config.cache_dtype,
+        cache_config.block_size,
+    )
+    return {
+        "model": model_config.model,
+        "revision": model_config.revision,
+        "quantization": model_config.quantization,
+        "dtype": str(model_config.dtype),
+        "kv_cache_dtype": cache_config.cache_dtype,
+        "block_size": cache_config.block_size,
+        "num_layers": model_config.get_num_layers(parallel_config),
+        "num_kv_heads": num_kv_heads,
+        "head_size": model_config.get_head_size(),
+        "tensor_parallel_size": parallel_config.tensor_parallel_size,
+        "attn_backend": attn_backend.get_name(),
+    }
+
+
+def get_prefix_cache_data_file(model_config: ModelConfig,
+                               cache_config: CacheConfig,
+                               parallel_config: ParallelConfig) -> str:
+    """Returns the file backing the persistent disk tier of this worker."""
+    assert cache_config.kv_offload_path is not None
+    directory = PrefixCacheStore.get_directory(
+        cache_config.kv_offload_path,
+        get_prefix_cache_fingerprint(model_config, cache_config,
+                                     parallel_config))
+    return PrefixCacheStore.get_data_file(directory,
+                                          get_tensor_model_parallel_rank())
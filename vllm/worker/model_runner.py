@@ -18,6 +18,7 @@ from vllm.lora.layers import LoRAMapping
 from vllm.lora.request import LoRARequest
 from vllm.lora.worker_manager import LRUCacheWorkerLoRAManager
 from vllm.model_executor import SamplingMetadata
+from vllm.model_executor.layers.sampler import Sampler
 from vllm.model_executor.model_loader import get_model
 from vllm.multimodal import MULTIMODAL_REGISTRY
 from vllm.sampling_params import SamplingParams
@@ -179,6 +180,11 @@ class ModelRunner:
             )
             self.model = self.lora_manager.create_lora_manager(self.model)
 
+        if isinstance(getattr(self.model, "sampler", None), Sampler):
+            # Bound the persistent sampling buffers, so that the profile run,
+            # which creates them, accounts for their memory.
+            self.model.sampler.max_num_seqs = self.scheduler_config.max_num_seqs
+
         if self.kv_cache_dtype == "fp8" and is_hip():
             # Currently only ROCm accepts kv-cache scaling factors
             # via quantization_param_path and this will be deprecated
@@ -314,7 +320,8 @@ class ModelRunner:
                     seq_data.get_len(),
                     context_len + seq_group_metadata.token_chunk_size)
                 if is_prompt:
-                    tokens = seq_data.get_token_ids()[context_len:seq_len]
+                    tokens = seq_data.get_token_ids_in_range(
+                        context_len, seq_len)
                 else:
                     # Optimization. get_token_ids requires the entire copy of
                     # tokens.
@@ -1,6 +1,8 @@
 """A GPU worker class."""
+import copy
 import gc
 import os
+import time
 from typing import Any, Dict, List, Optional, Set, Tuple, Union
 
 import torch
@@ -9,18 +11,26 @@ import torch.distributed
 from vllm.config import (CacheConfig, DeviceConfig, LoadConfig, LoRAConfig,
                          ModelConfig, ParallelConfig, SchedulerConfig,
                          SpeculativeConfig, VisionLanguageConfig)
+from vllm.core.block.common import coalesce_block_copies
+from vllm.core.block.transfers import OffloadTransfers
+from vllm.core.preemption import PreemptionCostModel
 from vllm.distributed import (broadcast_tensor_dict,
                               ensure_model_parallel_initialized,
                               init_distributed_environment,
                               set_custom_all_reduce)
 from vllm.lora.request import LoRARequest
 from vllm.model_executor import set_random_seed
-from vllm.sequence import ExecuteModelRequest, PoolerOutput, SamplerOutput
+from vllm.sequence import (ExecuteModelRequest, PoolerOutput, SamplerOutput,
+                           SequenceGroupMetadata)
+from vllm.utils import is_pin_memory_available
 from vllm.worker.cache_engine import CacheEngine
 from vllm.worker.embedding_model_runner import EmbeddingModelRunner
 from vllm.worker.model_runner import ModelRunner
 from vllm.worker.worker_base import WorkerBase
 
+# The size of the copies timed to measure the swap bandwidth.
+_SWAP_PROFILE_BYTES = 64 * (1 << 20)
+
 
 class Worker(WorkerBase):
     """A worker class that executes (a partition of) the model on a GPU.
@@ -88,6 +98,8 @@ class Worker(WorkerBase):
         self.cache_engine: CacheEngine
         # Initialize gpu_cache as embedding models don't initialize kv_caches
         self.gpu_cache: Optional[List[torch.tensor]] = None
+        # Measured by determine_num_available_blocks.
+        self.preemption_cost_model: Optional[PreemptionCostModel] = None
 
     def init_device(self) -> None:
         if self.device_config.device.type == "cuda":
@@ -150,12 +162,15 @@ class Worker(WorkerBase):
         torch.cuda.empty_cache()
 
         # Execute a forward pass with dummy inputs to profile the memory usage
-        # of the model.
+        # of the model. It is also timed for the preemption cost model.
+        torch.cuda.synchronize()
+        start = time.perf_counter()
         self.model_runner.profile_run()
 
         # Calculate the number of blocks that can be allocated with the
         # profiled peak memory.
         torch.cuda.synchronize()
+        profile_run_time = time.perf_counter() - start
         free_gpu_memory, total_gpu_memory = torch.cuda.mem_get_info()
         # NOTE(woosuk): Here we assume that the other processes using the same
         # GPU did not change their memory usage during the profiling.
@@ -172,12 +187,70 @@ class Worker(WorkerBase):
                              cache_block_size)
         num_gpu_blocks = max(num_gpu_blocks, 0)
         num_cpu_blocks = max(num_cpu_blocks, 0)
+        self.preemption_cost_model = self._profile_preemption_costs(
+            cache_block_size, profile_run_time)
         if self.model_runner.lora_manager:
             self.model_runner.remove_all_loras()
         gc.collect()
         torch.cuda.empty_cache()
         return num_gpu_blocks, num_cpu_blocks
 
+    def _profile_preemption_costs(
+            self, cache_block_size: int,
+            profile_run_time: float) -> PreemptionCostModel:
+        """Measures the prefill throughput and the swap bandwidth, which the
+        scheduler weighs to choose between recomputing and swapping the
+        preempted sequences."""
+        model_config = self.model_config
+        num_params = sum(param.numel()
+                         for param in self.model_runner.model.parameters())
+        num_layers = model_config.get_num_layers(self.parallel_config)
+        num_heads = model_config.get_num_attention_heads(self.parallel_config)
+        cost_model = PreemptionCostModel(
+            flops_per_token=2 * num_params,
+            # QK^T and the product with V, per layer and head.
+            attention_flops_per_token_pair=(4 * num_layers * num_heads *
+                                            model_config.get_head_size()),
+            flops_per_second=0.0,
+            kv_cache_bytes_per_token=(cache_block_size /
+                                      self.cache_config.block_size),
+            swap_bytes_per_second=0.0)
+
+        # The profile run splits max_num_batched_tokens between max_num_seqs
+        # prompts. Being the first run, it also includes the warm-up of the
+        # kernels, which underestimates the throughput and leans towards
+        # swapping.
+        max_num_seqs = self.scheduler_config.max_num_seqs
+        seq_len, remainder = divmod(
+            self.scheduler_config.max_num_batched_tokens, max_num_seqs)
+        flops = sum(
+            cost_model.get_prefill_flops(seq_len + (i < remainder))
+            for i in range(max_num_seqs))
+        cost_model.flops_per_second = flops / profile_run_time
+
+        num_bytes = min(self.cache_config.swap_space_bytes,
+                        _SWAP_PROFILE_BYTES)
+        if num_bytes > 0:
+            device_buffer = torch.empty(num_bytes,
+                                        dtype=torch.uint8,
+                                        device="cuda")
+            host_buffer = torch.empty(num_bytes,
+                                      dtype=torch.uint8,
+                                      pin_memory=is_pin_memory_available())
+            host_buffer.copy_(device_buffer)
+            torch.cuda.synchronize()
+            start = time.perf_counter()
+            host_buffer.copy_(device_buffer, non_blocking=True)
+            device_buffer.copy_(host_buffer, non_blocking=True)
+            torch.cuda.synchronize()
+            cost_model.swap_bytes_per_second = (2 * num_bytes /
+                                                (time.perf_counter() - start))
+            del device_buffer, host_buffer
+        return cost_model
+
+    def get_preemption_cost_model(self) -> Optional[PreemptionCostModel]:
+        return self.preemption_cost_model
+
     def initialize_cache(self, num_gpu_blocks: int,
                          num_cpu_blocks: int) -> None:
         """Allocate GPU and CPU KV cache with the specified number of blocks.
@@ -212,8 +285,13 @@ class Worker(WorkerBase):
         blocks_to_swap_in: torch.Tensor,
         blocks_to_swap_out: torch.Tensor,
         blocks_to_copy: torch.Tensor,
+        offload_transfers: Optional[OffloadTransfers] = None,
     ) -> None:
         # Issue cache operations.
+        # The offload transfers go first, as they read blocks evicted from the
+        # GPU which may be overwritten by the other operations.
+        if offload_transfers is not None and not offload_transfers.is_empty():
+            self.cache_engine.transfer_offloaded(offload_transfers)
         if blocks_to_swap_in.numel() > 0:
             self.cache_engine.swap_in(blocks_to_swap_in)
         if blocks_to_swap_out.numel() > 0:
@@ -242,13 +320,17 @@ class Worker(WorkerBase):
         seq_group_metadata_list = execute_model_req.seq_group_metadata_list
         num_seq_groups = len(seq_group_metadata_list)
         # `blocks_to_swap_in` and `blocks_to_swap_out` are cpu tensors.
-        # they contain parameters to launch cudamemcpyasync.
-        blocks_to_swap_in = torch.tensor(execute_model_req.blocks_to_swap_in,
+        # they contain parameters to launch cudamemcpyasync. The swaps are
+        # coalesced into (src, dst, num_blocks) extents, so that consecutive
+        # blocks are copied at once.
+        blocks_to_swap_in = torch.tensor(coalesce_block_copies(
+            execute_model_req.blocks_to_swap_in),
                                          device="cpu",
-                                         dtype=torch.int64).view(-1, 2)
-        blocks_to_swap_out = torch.tensor(execute_model_req.blocks_to_swap_out,
+                                         dtype=torch.int64).view(-1, 3)
+        blocks_to_swap_out = torch.tensor(coalesce_block_copies(
+            execute_model_req.blocks_to_swap_out),
                                           device="cpu",
-                                          dtype=torch.int64).view(-1, 2)
+                                          dtype=torch.int64).view(-1, 3)
         # `blocks_to_copy` is a gpu tensor. The src and tgt of
         # blocks to copy are in the same device, and `blocks_to_copy`
         # can be used directly within cuda kernels.
@@ -260,22 +342,104 @@ class Worker(WorkerBase):
             "blocks_to_swap_in": blocks_to_swap_in,
             "blocks_to_swap_out": blocks_to_swap_out,
             "blocks_to_copy": blocks_to_copy,
+            "offload_transfers": execute_model_req.offload_transfers,
+            "num_steps": execute_model_req.num_steps,
         }
         broadcast_tensor_dict(data, src=0)
 
-        self.cache_swap(blocks_to_swap_in, blocks_to_swap_out, blocks_to_copy)
+        self.cache_swap(blocks_to_swap_in, blocks_to_swap_out, blocks_to_copy,
+                        execute_model_req.offload_transfers)
 
         # If there is no input, we don't need to execute the model.
         if num_seq_groups == 0:
             return []
 
+        if execute_model_req.num_steps > 1:
+            return self._execute_model_multi_step(seq_group_metadata_list,
+                                                  execute_model_req.num_steps)
+
         output = self.model_runner.execute_model(seq_group_metadata_list,
                                                  self.gpu_cache)
 
-        # Worker only supports single-step execution. Wrap the output in a list
-        # to conform to interface.
+        # Wrap the output of the single step in a list to conform to
+        # interface.
         return [output]
 
+    def _execute_model_multi_step(
+            self, seq_group_metadata_list: List[SequenceGroupMetadata],
+            num_steps: int) -> List[SamplerOutput]:
+        """Run num_steps decoding steps on the batch, each on the tokens
+        sampled by the previous one. The scheduler allocated the KV slots of
+        the new tokens ahead as lookahead slots.
+        """
+        # The new tokens are appended to copies of the inputs, since the
+        # scheduler shares them when it runs in the same process.
+        seq_group_metadata_list = self._shallow_copy_inputs(
+            seq_group_metadata_list)
+        outputs: List[SamplerOutput] = []
+        for step in range(num_steps):
+            output = self.model_runner.execute_model(seq_group_metadata_list,
+                                                     self.gpu_cache)
+            outputs.append(output)
+            if step < num_steps - 1:
+                self._append_new_tokens(output, seq_group_metadata_list)
+        return outputs
+
+    @staticmethod
+    def _append_new_tokens(
+            model_output: SamplerOutput,
+            seq_group_metadata_list: List[SequenceGroupMetadata]) -> None:
+        """Given model output from a single run, append the tokens to the
+        sequences. This is normally done outside of the worker, but it is
+        required if the worker is to perform multiple forward passes.
+        """
+        for seq_group_metadata, sequence_group_outputs in zip(
+                seq_group_metadata_list, model_output):
+            seq_group_metadata.is_prompt = False
+
+            for seq_output in sequence_group_outputs.samples:
+                # NOTE: Beam search is not supported, so we can assume that
+                # parent_seq_id == seq_id.
+                seq = seq_group_metadata.seq_data[seq_output.parent_seq_id]
+
+                token_id = seq_output.output_token
+                token_logprob = seq_output.logprobs[token_id]
+
+                seq.append_token_id(token_id, token_logprob.logprob)
+                seq.update_num_computed_tokens(1)
+
+    @staticmethod
+    def _shallow_copy_inputs(
+        seq_group_metadata_list: List[SequenceGroupMetadata]
+    ) -> List[SequenceGroupMetadata]:
+        """Copy input data structures to remove side-effects when input data
+        structures are shared with other modules.
+
+        Helpful when the vLLM scheduler runs in the same process as the worker.
+        The alternative is deep-copying (or other form of deep copy); this has
+        performance downsides.
+        """
+
+        # Shallow-copy the list of SequenceGroupMetadata. This allows us to
+        # append tokens and change is_prompt without external side-effects.
+        new_seq_group_metadata_list = []
+
+        for old_seq_group_metadata in seq_group_metadata_list:
+            # We must shallow-copy seq_group_metadata as is_prompt could change.
+            seq_group_metadata = copy.copy(old_seq_group_metadata)
+            new_seq_group_metadata_list.append(seq_group_metadata)
+
+            # We must shallow-copy seq_data as we will append token ids
+            new_seq_data = {}
+            for seq_id, old_seq_data in seq_group_metadata.seq_data.items():
+                new_seq_data[seq_id] = copy.copy(old_seq_data)
+                new_seq_data[
+                    seq_id].output_token_ids = old_seq_data.output_token_ids[:]
+
+            seq_group_metadata.seq_data = new_seq_data
+
+        return new_seq_group_metadata_list
+
     @torch.inference_mode()
     def start_worker_execution_loop(self) -> None:
         """Execute model loop in parallel worker.
@@ -289,7 +453,7 @@ class Worker(WorkerBase):
     def _execute_model_non_driver(self) -> bool:
         """Execute model in parallel worker.
 
-        Returns True iff there are remaining sequences to process.
+        Returns False once the driver stopped the loop.
         """
         assert not self.is_driver_worker
         data = broadcast_tensor_dict(src=0)
@@ -300,13 +464,17 @@ class Worker(WorkerBase):
         blocks_to_swap_in = data.get("blocks_to_swap_in")
         blocks_to_swap_out = data.get("blocks_to_swap_out")
         blocks_to_copy = data.get("blocks_to_copy")
-        self.cache_swap(blocks_to_swap_in, blocks_to_swap_out, blocks_to_copy)
+        offload_transfers = data.get("offload_transfers")
+        self.cache_swap(blocks_to_swap_in, blocks_to_swap_out, blocks_to_copy,
+                        offload_transfers)
 
-        # If there is no input, we don't need to execute the model.
+        # If there is no input, we don't need to execute the model. The loop
+        # goes on though, as the driver only stops it with an empty input.
         if num_seq_groups == 0:
-            return False
+            return True
 
-        self.model_runner.execute_model(None, self.gpu_cache)
+        for _ in range(data.get("num_steps", 1)):
+            self.model_runner.execute_model(None, self.gpu_cache)
         return True
 
     def add_lora(self, lora_request: LoRARequest) -> bool:
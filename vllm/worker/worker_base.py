@@ -3,6 +3,7 @@ import os
 from abc import ABC, abstractmethod
 from typing import Dict, List, Optional, Set, Tuple
 
+from vllm.core.preemption import PreemptionCostModel
 from vllm.logger import init_logger
 from vllm.lora.request import LoRARequest
 from vllm.sequence import ExecuteModelRequest, SamplerOutput
@@ -62,6 +63,12 @@ class WorkerBase(ABC):
         """
         raise NotImplementedError
 
+    def get_preemption_cost_model(self) -> Optional[PreemptionCostModel]:
+        """Returns the costs of preempting sequences measured by
+        `determine_num_available_blocks`, or None if they were not
+        measured."""
+        return None
+
     @abstractmethod
     def add_lora(self, lora_request: LoRARequest) -> bool:
         raise NotImplementedError